@@ -14,10 +14,12 @@
 # Copyright Buildbot Team Members
 
 from twisted.internet import defer
+from twisted.internet import reactor
 from twisted.python import log
 from zope.interface import implements
 
 from buildbot.interfaces import IChangeSource
+from buildbot.process import metrics
 from buildbot.util import service
 from buildbot.util.poll import method as poll_method
 
@@ -60,17 +62,48 @@ class PollingChangeSource(ChangeSource):
     def poll(self):
         pass
 
+    def getProcessHost(self):
+        """Return the name of the host that this source's processes talk to,
+        or None; the master limits the processes run for each host."""
+        return None
+
+    def runProcess(self, fn, *args, **kwargs):
+        """Call C{fn}, which starts a process and returns a Deferred that
+        fires when it is finished, once the master's limits on the processes
+        run by change sources allow.  The time spent waiting is reported as
+        a histogram metric."""
+        pool = getattr(self.parent, 'processPool', None)
+        if pool is None:
+            return defer.maybeDeferred(fn, *args, **kwargs)
+
+        queued = reactor.seconds()
+
+        def start():
+            metrics.MetricHistogramEvent.log(
+                'PollingChangeSource.queue-wait.' + self.name,
+                reactor.seconds() - queued)
+            return fn(*args, **kwargs)
+        return pool.run(self.getProcessHost(), start)
+
     @poll_method
     def doPoll(self):
+        started = reactor.seconds()
         d = defer.maybeDeferred(self.poll)
         d.addErrback(log.err, 'while polling for changes')
+
+        @d.addCallback
+        def recordTime(_):
+            metrics.MetricHistogramEvent.log(
+                'PollingChangeSource.poll-time.' + self.name,
+                reactor.seconds() - started)
         return d
 
     def force(self):
         self.doPoll()
 
     def activate(self):
-        self.doPoll.start(interval=self.pollInterval, now=self.pollAtLaunch)
+        self.doPoll.start(interval=self.pollInterval, now=self.pollAtLaunch,
+                          jitter=getattr(self.parent, 'pollJitter', 0))
 
     def deactivate(self):
         return self.doPoll.stop()
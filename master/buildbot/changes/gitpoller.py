@@ -13,21 +13,170 @@
 #
 # Copyright Buildbot Team Members
 
-import itertools
 import os
-import re
 import urllib
 
 from twisted.internet import defer
+from twisted.internet import error
+from twisted.internet import protocol
+from twisted.internet import reactor
 from twisted.internet import utils
+from twisted.python import failure
 from twisted.python import log
 
 from buildbot import config
 from buildbot.changes import base
 from buildbot.util import ascii2unicode
+from buildbot.util import processpool
 from buildbot.util.state import StateMixin
 
 
+class _GitLogParser(object):
+
+    """Parses the output of C{git log -z --name-only} with L{LOG_FORMAT}
+    incrementally, as it is read from git.  Each commit starts with an empty
+    field, followed by its fixed fields and then the names of the files it
+    changed.  As file names are never empty, the empty field marks the start
+    of the next commit."""
+
+    LOG_FORMAT = r'--format=%x00%H%x00%ct%x00%aN <%aE>%x00%s%n%b'
+    FIXED_FIELDS = 4
+
+    def __init__(self):
+        self.buffer = ''
+        # fields of the commit being parsed, or None before the first one
+        self.fields = None
+
+    def feed(self, data):
+        """Parse C{data}, returning a list of the commits that it completed,
+        as (revision, timestamp, author, comments, files) tuples of
+        bytestrings."""
+        tokens = (self.buffer + data).split('\0')
+        # the last token is incomplete until its terminator is read
+        self.buffer = tokens.pop()
+        commits = []
+        for token in tokens:
+            if self.fields is not None and \
+                    (token or len(self.fields) < self.FIXED_FIELDS):
+                self.fields.append(token)
+            elif token:
+                raise ValueError('unexpected output from git log: %r'
+                                 % (token,))
+            else:
+                if self.fields is not None:
+                    commits.append(self._commit())
+                self.fields = []
+        return commits
+
+    def finish(self):
+        """Return the commits completed by the end of the output."""
+        commits = []
+        if self.buffer:
+            commits.extend(self.feed('\0'))
+        if self.fields is not None:
+            commits.append(self._commit())
+            self.fields = None
+        return commits
+
+    def _commit(self):
+        if len(self.fields) < self.FIXED_FIELDS:
+            raise ValueError('truncated output from git log')
+        rev, timestamp, author, comments = self.fields[:self.FIXED_FIELDS]
+        files = self.fields[self.FIXED_FIELDS:]
+        # git separates the file names from the log message with a newline
+        if files and files[0].startswith('\n'):
+            files[0] = files[0][1:]
+        return rev, timestamp, author, comments, files
+
+
+class _GitLogProtocol(protocol.ProcessProtocol):
+
+    """Collects the commits output by C{git log} into batches, which are
+    handed out by L{nextBatch}.  Reading from git is paused while a full
+    batch waits to be taken, so that a long log is never held in memory."""
+
+    def __init__(self, repourl, batchSize):
+        self.repourl = repourl
+        self.batchSize = batchSize
+        self.parser = _GitLogParser()
+        self.commits = []
+        self.stderr = []
+        self.waiting = None
+        self.ended = False
+        self.failure = None
+        # fires when git has finished
+        self.finished = defer.Deferred()
+
+    def outReceived(self, data):
+        if self.failure:
+            return
+        try:
+            self.commits.extend(self.parser.feed(data))
+        except ValueError:
+            self.failure = failure.Failure()
+            self.transport.loseConnection()
+        self._check()
+
+    def errReceived(self, data):
+        self.stderr.append(data)
+
+    def processEnded(self, reason):
+        self.ended = True
+        if self.failure:
+            pass
+        elif reason.check(error.ProcessDone):
+            try:
+                self.commits.extend(self.parser.finish())
+            except ValueError:
+                self.failure = failure.Failure()
+        else:
+            self.failure = failure.Failure(EnvironmentError(
+                'command on repourl %s failed with exit code %s: %s'
+                % (self.repourl, reason.value.exitCode,
+                   ''.join(self.stderr))))
+        self._check()
+        self.finished.callback(None)
+
+    def spawnFailed(self, f):
+        """Note that git could not be started."""
+        self.ended = True
+        self.failure = f
+        self._check()
+        self.finished.callback(None)
+
+    def nextBatch(self):
+        """Return a Deferred that fires with the next batch of commits, or
+        with an empty list once they have all been returned."""
+        assert not self.waiting
+        self.waiting = defer.Deferred()
+        d = self.waiting
+        self._check()
+        # git may not have started yet
+        if self.waiting and self.transport:
+            self.transport.resumeProducing()
+        return d
+
+    def stop(self):
+        """Stop git, if it is still running."""
+        if not self.ended and self.transport:
+            self.transport.loseConnection()
+
+    def _check(self):
+        full = len(self.commits) >= self.batchSize
+        if not self.waiting:
+            if full and not self.ended:
+                self.transport.pauseProducing()
+            return
+        if self.failure:
+            d, self.waiting = self.waiting, None
+            d.errback(self.failure)
+        elif full or self.ended:
+            d, self.waiting = self.waiting, None
+            batch = self.commits[:self.batchSize]
+            del self.commits[:self.batchSize]
+            d.callback(batch)
+
+
 class GitPoller(base.PollingChangeSource, StateMixin):
 
     """This source will poll a remote git repo for changes and submit
@@ -37,6 +186,9 @@ class GitPoller(base.PollingChangeSource, StateMixin):
                      "pollInterval", "gitbin", "usetimestamps",
                      "category", "project", "pollAtLaunch")
 
+    # number of changes read from git before they are added to the database
+    changeBatchSize = 100
+
     def __init__(self, repourl, branches=None, branch=None,
                  workdir=None, pollInterval=10 * 60,
                  gitbin='git', usetimestamps=True,
@@ -114,6 +266,9 @@ class GitPoller(base.PollingChangeSource, StateMixin):
 
         return str
 
+    def getProcessHost(self):
+        return processpool.hostFromUrl(self.repourl)
+
     def _getBranches(self):
         d = self._dovccmd('ls-remote', [self.repourl])
 
@@ -178,67 +333,32 @@ class GitPoller(base.PollingChangeSource, StateMixin):
     def _decode(self, git_output):
         return git_output.decode(self.encoding)
 
-    def _get_commit_comments(self, rev):
-        args = ['--no-walk', r'--format=%s%n%b', rev, '--']
-        d = self._dovccmd('log', args, path=self.workdir)
-        d.addCallback(self._decode)
-        return d
-
-    def _get_commit_timestamp(self, rev):
-        # unix timestamp
-        args = ['--no-walk', r'--format=%ct', rev, '--']
-        d = self._dovccmd('log', args, path=self.workdir)
-
-        def process(git_output):
-            if self.usetimestamps:
-                try:
-                    stamp = int(git_output)
-                except Exception, e:
-                    log.msg('gitpoller: caught exception converting output \'%s\' to timestamp' % git_output)
-                    raise e
-                return stamp
-            else:
-                return None
-        d.addCallback(process)
-        return d
-
-    def _get_commit_files(self, rev):
-        args = ['--name-only', '--no-walk', r'--format=%n', rev, '--']
-        d = self._dovccmd('log', args, path=self.workdir)
-
-        def decode_file(file):
-            # git use octal char sequences in quotes when non ASCII
-            match = re.match('^"(.*)"$', file)
-            if match:
-                file = match.groups()[0].decode('string_escape')
-            return self._decode(file)
-
-        def process(git_output):
-            fileList = [decode_file(file) for file in itertools.ifilter(lambda s: len(s), git_output.splitlines())]
-            return fileList
-        d.addCallback(process)
-        return d
-
-    def _get_commit_author(self, rev):
-        args = ['--no-walk', r'--format=%aN <%aE>', rev, '--']
-        d = self._dovccmd('log', args, path=self.workdir)
-
-        def process(git_output):
-            git_output = self._decode(git_output)
-            if len(git_output) == 0:
-                raise EnvironmentError('could not get commit author for rev')
-            return git_output
-        d.addCallback(process)
-        return d
+    def _decode_commit(self, commit):
+        rev, timestamp, author, comments, files = commit
+        if self.usetimestamps:
+            try:
+                timestamp = int(timestamp)
+            except Exception:
+                log.msg('gitpoller: caught exception converting output '
+                        '\'%s\' to timestamp' % timestamp)
+                raise
+        else:
+            timestamp = None
+        author = self._decode(author)
+        if len(author) == 0:
+            raise EnvironmentError('could not get commit author for rev')
+        return (unicode(rev), timestamp, author,
+                self._decode(comments).strip(),
+                [self._decode(f) for f in files])
 
     @defer.inlineCallbacks
     def _process_changes(self, newRev, branch):
         """
         Read changes since last change.
 
-        - Read list of commit hashes.
-        - Extract details from each commit.
-        - Add changes to database.
+        - Read the details of every new commit, oldest first, from a single
+          C{git log}, in batches of C{changeBatchSize}.
+        - Add each batch of changes to the database.
         """
 
         lastRev = self.lastRev.get(branch)
@@ -246,51 +366,45 @@ class GitPoller(base.PollingChangeSource, StateMixin):
         if not lastRev:
             return
 
-        # get the change list
-        revListArgs = [r'--format=%H', '%s..%s' % (lastRev, newRev), '--']
         self.changeCount = 0
-        results = yield self._dovccmd('log', revListArgs, path=self.workdir)
-
-        # process oldest change first
-        revList = results.split()
-        revList.reverse()
-        self.changeCount = len(revList)
-
-        log.msg('gitpoller: processing %d changes: %s from "%s"'
-                % (self.changeCount, revList, self.repourl))
-
-        for rev in revList:
-            dl = defer.DeferredList([
-                self._get_commit_timestamp(rev),
-                self._get_commit_author(rev),
-                self._get_commit_files(rev),
-                self._get_commit_comments(rev),
-            ], consumeErrors=True)
-
-            results = yield dl
-
-            # check for failures
-            failures = [r[1] for r in results if not r[0]]
-            if failures:
-                # just fail on the first error; they're probably all related!
-                raise failures[0]
-
-            timestamp, author, files, comments = [r[1] for r in results]
-            yield self.master.data.updates.addChange(
-                author=author,
-                revision=unicode(rev),
-                files=files,
-                comments=comments,
-                when_timestamp=timestamp,
-                branch=ascii2unicode(self._removeHeads(branch)),
-                category=self.category,
-                project=self.project,
-                repository=ascii2unicode(self.repourl),
-                src=u'git')
+        args = ['log', '--reverse', '-z', '--name-only',
+                _GitLogParser.LOG_FORMAT, '%s..%s' % (lastRev, newRev), '--']
+        proto = _GitLogProtocol(self.repourl, self.changeBatchSize)
+
+        def spawn():
+            reactor.spawnProcess(proto, self.gitbin, [self.gitbin] + args,
+                                 path=self.workdir, env=os.environ)
+            return proto.finished
+        self.runProcess(spawn).addErrback(proto.spawnFailed)
+        try:
+            while True:
+                batch = yield proto.nextBatch()
+                if not batch:
+                    break
+                changes = [self._decode_commit(c) for c in batch]
+                log.msg('gitpoller: processing %d changes: %s from "%s"'
+                        % (len(changes), [c[0] for c in changes],
+                           self.repourl))
+
+                for rev, timestamp, author, comments, files in changes:
+                    yield self.master.data.updates.addChange(
+                        author=author,
+                        revision=rev,
+                        files=files,
+                        comments=comments,
+                        when_timestamp=timestamp,
+                        branch=ascii2unicode(self._removeHeads(branch)),
+                        category=self.category,
+                        project=self.project,
+                        repository=ascii2unicode(self.repourl),
+                        src=u'git')
+                    self.changeCount += 1
+        finally:
+            proto.stop()
 
     def _dovccmd(self, command, args, path=None):
-        d = utils.getProcessOutputAndValue(self.gitbin,
-                                           [command] + args, path=path, env=os.environ)
+        d = self.runProcess(utils.getProcessOutputAndValue, self.gitbin,
+                            [command] + args, path=path, env=os.environ)
 
         def _convert_nonzero_to_failure(res):
             "utility to handle the result of getProcessOutputAndValue"
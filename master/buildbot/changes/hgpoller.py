@@ -24,6 +24,7 @@ from buildbot import config
 from buildbot.changes import base
 from buildbot.util import ascii2unicode
 from buildbot.util import deferredLocked
+from buildbot.util import processpool
 
 
 class HgPoller(base.PollingChangeSource):
@@ -68,6 +69,9 @@ class HgPoller(base.PollingChangeSource):
         if self.workdir is None:
             config.error("workdir is mandatory for now in HgPoller")
 
+    def getProcessHost(self):
+        return processpool.hostFromUrl(self.repourl)
+
     def describe(self):
         status = ""
         if not self.master:
@@ -100,8 +104,9 @@ class HgPoller(base.PollingChangeSource):
             "{files % '{file}" + os.pathsep + "'}",
             '{desc|strip}'))]
         # Mercurial fails with status 255 if rev is unknown
-        d = utils.getProcessOutput(self.hgbin, args, path=self._absWorkdir(),
-                                   env=os.environ, errortoo=False)
+        d = self.runProcess(utils.getProcessOutput, self.hgbin, args,
+                            path=self._absWorkdir(), env=os.environ,
+                            errortoo=False)
 
         def process(output):
             # all file names are on one line
@@ -134,9 +139,8 @@ class HgPoller(base.PollingChangeSource):
         if self._isRepositoryReady():
             return defer.succeed(None)
         log.msg('hgpoller: initializing working dir from %s' % self.repourl)
-        d = utils.getProcessOutputAndValue(self.hgbin,
-                                           ['init', self._absWorkdir()],
-                                           env=os.environ)
+        d = self.runProcess(utils.getProcessOutputAndValue, self.hgbin,
+                            ['init', self._absWorkdir()], env=os.environ)
         d.addCallback(self._convertNonZeroToFailure)
         d.addErrback(self._stopOnFailure)
         d.addCallback(lambda _: log.msg(
@@ -158,9 +162,9 @@ class HgPoller(base.PollingChangeSource):
         # We set errortoo=True to avoid an errback from the deferred.
         # The callback which will be added to this
         # deferred will not use the response.
-        d.addCallback(lambda _: utils.getProcessOutput(
-            self.hgbin, args, path=self._absWorkdir(),
-            env=os.environ, errortoo=True))
+        d.addCallback(lambda _: self.runProcess(
+            utils.getProcessOutput, self.hgbin, args,
+            path=self._absWorkdir(), env=os.environ, errortoo=True))
 
         return d
 
@@ -215,9 +219,9 @@ class HgPoller(base.PollingChangeSource):
         (if really buildbotting a branch that does not have any changeset
         yet, one shouldn't be surprised to get errors)
         """
-        d = utils.getProcessOutput(self.hgbin,
-                                   ['heads', self.branch, '--template={rev}' + os.linesep],
-                                   path=self._absWorkdir(), env=os.environ, errortoo=False)
+        d = self.runProcess(utils.getProcessOutput, self.hgbin,
+                            ['heads', self.branch, '--template={rev}' + os.linesep],
+                            path=self._absWorkdir(), env=os.environ, errortoo=False)
 
         def no_head_err(exc):
             log.err("hgpoller: could not find branch %r in repository %r" % (
@@ -269,8 +273,9 @@ class HgPoller(base.PollingChangeSource):
         # two passes for hg log makes parsing simpler (comments is multi-lines)
         revListArgs = ['log', '-b', self.branch, '-r', revrange,
                        r'--template={rev}:{node}\n']
-        results = yield utils.getProcessOutput(self.hgbin, revListArgs,
-                                               path=self._absWorkdir(), env=os.environ, errortoo=False)
+        results = yield self.runProcess(utils.getProcessOutput, self.hgbin,
+                                        revListArgs, path=self._absWorkdir(),
+                                        env=os.environ, errortoo=False)
 
         revNodeList = [rn.split(':', 1) for rn in results.strip().split()]
 
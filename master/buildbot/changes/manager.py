@@ -17,6 +17,7 @@ from buildbot import config
 from buildbot import interfaces
 from buildbot import util
 from buildbot.process import metrics
+from buildbot.util import processpool
 from buildbot.util import service
 from twisted.internet import defer
 from twisted.python import log
@@ -32,6 +33,10 @@ class ChangeManager(config.ReconfigurableServiceMixin, service.AsyncMultiService
     It is a Twisted service, which has instances of
     L{buildbot.interfaces.IChangeSource} as child services. These are added by
     the master with C{addSource}.
+
+    The processes that polling change sources run are limited by
+    C{processPool}, and their polls are spread out by C{pollJitter}, both
+    configured by C{c['changeSourcePolling']}.
     """
 
     implements(interfaces.IEventSource)
@@ -42,12 +47,19 @@ class ChangeManager(config.ReconfigurableServiceMixin, service.AsyncMultiService
         service.AsyncMultiService.__init__(self)
         self.setName('change_manager')
         self.master = master
+        self.processPool = processpool.ProcessPool()
+        self.pollJitter = 0
 
     @defer.inlineCallbacks
     def reconfigService(self, new_config):
         timer = metrics.Timer("ChangeManager.reconfigService")
         timer.start()
 
+        polling = new_config.changeSourcePolling
+        self.processPool.setLimits(polling['max_processes'],
+                                   polling['max_processes_per_host'])
+        self.pollJitter = polling['jitter']
+
         removed, added = util.diffSets(
             set(self),
             new_config.change_sources)
@@ -33,6 +33,7 @@ from twisted.python import log
 from buildbot import config
 from buildbot import util
 from buildbot.changes import base
+from buildbot.util import processpool
 
 
 debug_logging = False
@@ -156,6 +157,15 @@ class P4Source(base.PollingChangeSource, util.ComparableMixin):
     def describe(self):
         return "p4source %s %s" % (self.p4port, self.p4base)
 
+    def getProcessHost(self):
+        if not self.p4port:
+            return None
+        port = self.p4port
+        if port.count(':') > 1:
+            # strip the protocol prefix, as in ssl:perforce:1666
+            port = port.split(':', 1)[1]
+        return processpool.hostFromUrl(port)
+
     def poll(self):
         d = self._poll()
         d.addErrback(log.err, 'P4 poll failed on %s, %s' % (self.p4port, self.p4base))
@@ -163,7 +173,7 @@ class P4Source(base.PollingChangeSource, util.ComparableMixin):
 
     def _get_process_output(self, args):
         env = dict([(e, os.environ.get(e)) for e in self.env_vars if os.environ.get(e)])
-        d = utils.getProcessOutput(self.p4bin, args, env)
+        d = self.runProcess(utils.getProcessOutput, self.p4bin, args, env)
         return d
 
     def _acquireTicket(self, protocol):
@@ -176,6 +186,7 @@ class P4Source(base.PollingChangeSource, util.ComparableMixin):
         command = [c.encode('utf-8') for c in command]
 
         reactor.spawnProcess(protocol, self.p4bin, command, env=os.environ)
+        return protocol.deferred
 
     def _parseTicketPassword(self, text):
         lines = text.split("\n")
@@ -196,8 +207,7 @@ class P4Source(base.PollingChangeSource, util.ComparableMixin):
                 # Re-acquire the ticket and reset the counter.
                 log.msg("P4Poller: (re)acquiring P4 ticket for %s..." % self.p4base)
                 protocol = TicketLoginProtocol(self.p4passwd + "\n", self.p4base)
-                self._acquireTicket(protocol)
-                yield protocol.deferred
+                yield self.runProcess(self._acquireTicket, protocol)
 
                 self._ticket_passwd = self._parseTicketPassword(protocol.stdout)
                 self._ticket_login_counter = max(self.ticket_login_interval / self.pollInterval, 1)
@@ -26,6 +26,7 @@ from twisted.python import log
 
 from buildbot import util
 from buildbot.changes import base
+from buildbot.util import processpool
 
 import os
 import urllib
@@ -142,6 +143,9 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
     def describe(self):
         return "SVNPoller: watching %s" % self.svnurl
 
+    def getProcessHost(self):
+        return processpool.hostFromUrl(self.svnurl)
+
     def poll(self):
         # Our return value is only used for unit testing.
 
@@ -199,7 +203,8 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
 
     def getProcessOutput(self, args):
         # this exists so we can override it during the unit tests
-        d = utils.getProcessOutput(self.svnbin, args, self.environ)
+        d = self.runProcess(utils.getProcessOutput, self.svnbin, args,
+                            self.environ)
         return d
 
     def get_prefix(self):
@@ -87,6 +87,17 @@ class MasterConfig(util.ComparableMixin):
         self.mergeRequests = None
         self.codebaseGenerator = None
         self.prioritizeBuilders = None
+        self.builderDistributionConcurrency = 1
+        self.retention = dict(
+            enabled=False,
+            batch_size=100,
+            dry_run=False,
+        )
+        self.changeSourcePolling = dict(
+            max_processes=None,
+            max_processes_per_host=None,
+            jitter=0,
+        )
         self.multiMaster = False
         self.manhole = None
         self.protocols = {}
@@ -107,7 +118,9 @@ class MasterConfig(util.ComparableMixin):
         self.caches = dict(
             Builds=15,
             Changes=10,
+            logchunks=10,
         )
+        self.cacheAutoTune = None
         self.schedulers = {}
         self.builders = []
         self.slaves = []
@@ -124,13 +137,15 @@ class MasterConfig(util.ComparableMixin):
         )
 
     _known_config_keys = set([
-        "buildbotURL", "buildCacheSize", "builders", "buildHorizon", "caches",
-        "change_source", "codebaseGenerator", "changeCacheSize", "changeHorizon",
+        "buildbotURL", "buildCacheSize", "builderDistributionConcurrency",
+        "builders", "buildHorizon", "cacheAutoTune", "caches",
+        "change_source", "changeSourcePolling", "codebaseGenerator",
+        "changeCacheSize", "changeHorizon",
         'db', "db_poll_interval", "db_url", "eventHorizon",
         "logCompressionLimit", "logCompressionMethod", "logEncoding",
         "logHorizon", "logMaxSize", "logMaxTailSize", "manhole",
         "mergeRequests", "metrics", "mq", "multiMaster", "prioritizeBuilders",
-        "projectName", "projectURL", "properties", "protocols", "revlink",
+        "projectName", "projectURL", "properties", "protocols", "retention", "revlink",
         "schedulers", "slavePortnum", "slaves", "status", "title", "titleURL",
         "user_managers", "validation", 'www'
     ])
@@ -312,6 +327,55 @@ class MasterConfig(util.ComparableMixin):
         else:
             self.prioritizeBuilders = prioritizeBuilders
 
+        if 'builderDistributionConcurrency' in config_dict:
+            concurrency = config_dict['builderDistributionConcurrency']
+            if not isinstance(concurrency, int) or concurrency < 1:
+                error("c['builderDistributionConcurrency'] must be a "
+                      "positive integer")
+            else:
+                self.builderDistributionConcurrency = concurrency
+
+        if 'changeSourcePolling' in config_dict:
+            polling = config_dict['changeSourcePolling']
+            if not isinstance(polling, dict):
+                error("c['changeSourcePolling'] must be a dictionary")
+            else:
+                unknown = set(polling) - set(self.changeSourcePolling)
+                if unknown:
+                    error("unknown c['changeSourcePolling'] keys %s"
+                          % (', '.join(sorted(unknown)),))
+                for key in 'max_processes', 'max_processes_per_host':
+                    value = polling.get(key)
+                    if value is not None and \
+                            (not isinstance(value, int) or value < 1):
+                        error("c['changeSourcePolling']['%s'] must be a "
+                              "positive integer or None" % (key,))
+                jitter = polling.get('jitter', 0)
+                if not isinstance(jitter, (int, float)) \
+                        or not 0 <= jitter <= 1:
+                    error("c['changeSourcePolling']['jitter'] must be a "
+                          "number between 0 and 1")
+                self.changeSourcePolling.update(polling)
+
+        if 'retention' in config_dict:
+            retention = config_dict['retention']
+            if not isinstance(retention, dict):
+                error("c['retention'] must be a dictionary")
+            else:
+                unknown = set(retention) - set(self.retention)
+                if unknown:
+                    error("unknown c['retention'] keys %s"
+                          % (', '.join(sorted(unknown)),))
+                batch_size = retention.get('batch_size', 1)
+                if not isinstance(batch_size, int) or batch_size < 1:
+                    error("c['retention']['batch_size'] must be a positive "
+                          "integer")
+                for key in ('enabled', 'dry_run'):
+                    if not isinstance(retention.get(key, False), bool):
+                        error("c['retention'][%r] must be True or False"
+                              % (key,))
+                self.retention.update(retention)
+
         protocols = config_dict.get('protocols', {})
         if isinstance(protocols, dict):
             for proto, options in protocols.iteritems():
@@ -374,7 +438,9 @@ class MasterConfig(util.ComparableMixin):
     def load_db(self, filename, config_dict):
         if 'db' in config_dict:
             db = config_dict['db']
-            if set(db.keys()) - set(['db_url', 'db_poll_interval']):
+            if set(db.keys()) - set(['db_url', 'db_poll_interval',
+                                     'log_compression', 'pool_size',
+                                     'pool_max_size']):
                 error("unrecognized keys in c['db']")
             self.db.update(db)
         if 'db_url' in config_dict:
@@ -385,6 +451,28 @@ class MasterConfig(util.ComparableMixin):
         # we don't attempt to parse db URLs here - the engine strategy will do
         # so.
 
+        if 'log_compression' in self.db:
+            from buildbot.db import logs  # avoid circular imports
+            if self.db['log_compression'] not in logs.COMPRESSION_MODES:
+                if self.db['log_compression'] == 'lz4':
+                    error("c['db']['log_compression'] 'lz4' requires the "
+                          "lz4 package to be installed")
+                else:
+                    error("c['db']['log_compression'] must be one of %s" %
+                          (", ".join(sorted(logs.COMPRESSION_MODES)),))
+
+        pool_size = self.db.get('pool_size')
+        if pool_size is not None and (not isinstance(pool_size, int)
+                                      or pool_size < 1):
+            error("c['db']['pool_size'] must be a positive integer")
+        pool_max_size = self.db.get('pool_max_size')
+        if pool_max_size is not None:
+            if not isinstance(pool_max_size, int) or pool_max_size < 1:
+                error("c['db']['pool_max_size'] must be a positive integer")
+            elif isinstance(pool_size, int) and pool_max_size < pool_size:
+                error("c['db']['pool_max_size'] must not be less than "
+                      "c['db']['pool_size']")
+
         # db_poll_interval is deprecated
         if 'db_poll_interval' in self.db:
             warnDeprecated("0.8.7", "db_poll_interval is deprecated and will be ignored")
@@ -407,6 +495,16 @@ class MasterConfig(util.ComparableMixin):
             error("unrecognized keys in c['mq']: %s"
                   % (', '.join(unk),))
 
+        queue_size = self.mq.get('persistent_queue_size')
+        if queue_size is not None and (not isinstance(queue_size, int)
+                                       or isinstance(queue_size, bool)
+                                       or queue_size < 0):
+            error("c['mq']['persistent_queue_size'] must be a non-negative "
+                  "integer")
+        queue_dir = self.mq.get('persistent_queue_dir')
+        if queue_dir is not None and not isinstance(queue_dir, basestring):
+            error("c['mq']['persistent_queue_dir'] must be a directory name")
+
     def load_metrics(self, filename, config_dict):
         # we don't try to validate metrics keys
         if 'metrics' in config_dict:
@@ -445,6 +543,29 @@ class MasterConfig(util.ComparableMixin):
                 error(msg)
             self.caches['Changes'] = config_dict['changeCacheSize']
 
+        if 'cacheAutoTune' in config_dict:
+            autotune = config_dict['cacheAutoTune']
+            if autotune is None:
+                self.cacheAutoTune = None
+            elif not isinstance(autotune, dict):
+                error("c['cacheAutoTune'] must be a dictionary")
+            else:
+                unknown = set(autotune) - set(['memory_budget', 'interval'])
+                if unknown:
+                    error("unknown c['cacheAutoTune'] keys %s"
+                          % (', '.join(sorted(unknown)),))
+                budget = autotune.get('memory_budget')
+                if not isinstance(budget, (int, long)) or budget < 1:
+                    error("c['cacheAutoTune']['memory_budget'] must be a "
+                          "positive integer")
+                interval = autotune.get('interval', 300)
+                if not isinstance(interval, (int, long, float)) \
+                        or interval <= 0:
+                    error("c['cacheAutoTune']['interval'] must be a "
+                          "positive number")
+                self.cacheAutoTune = dict(memory_budget=budget,
+                                          interval=interval)
+
     def load_schedulers(self, filename, config_dict):
         if 'schedulers' not in config_dict:
             return
@@ -669,6 +790,19 @@ class MasterConfig(util.ComparableMixin):
         if self.logHorizon is not None and self.buildHorizon is not None:
             if self.logHorizon > self.buildHorizon:
                 error("logHorizon must be less than or equal to buildHorizon")
+        for b in self.builders:
+            if b.logHorizon is None and b.buildHorizon is None:
+                continue
+            logHorizon = b.logHorizon
+            if logHorizon is None:
+                logHorizon = self.logHorizon
+            buildHorizon = b.buildHorizon
+            if buildHorizon is None:
+                buildHorizon = self.buildHorizon
+            if logHorizon is not None and buildHorizon is not None:
+                if logHorizon > buildHorizon:
+                    error("builder '%s': logHorizon must be less than or "
+                          "equal to buildHorizon" % (b.name,))
 
     def check_ports(self):
         ports = set()
@@ -697,7 +831,7 @@ class BuilderConfig(util_config.ConfiguredMixin):
                  tags=None, category=None,
                  nextSlave=None, nextBuild=None, locks=None, env=None,
                  properties=None, mergeRequests=None, description=None,
-                 canStartBuild=None):
+                 canStartBuild=None, buildHorizon=None, logHorizon=None):
 
         # name is required, and can't start with '_'
         if not name or type(name) not in (str, unicode):
@@ -785,6 +919,15 @@ class BuilderConfig(util_config.ConfiguredMixin):
         self.properties = properties or {}
         self.mergeRequests = mergeRequests
 
+        for horizon, value in [('buildHorizon', buildHorizon),
+                               ('logHorizon', logHorizon)]:
+            if value is not None and (not isinstance(value, int)
+                                      or value < 0):
+                error("builder '%s': %s must be a non-negative integer"
+                      % (name, horizon))
+        self.buildHorizon = buildHorizon
+        self.logHorizon = logHorizon
+
         self.description = description
 
     def getConfigDict(self):
@@ -811,6 +954,10 @@ class BuilderConfig(util_config.ConfiguredMixin):
             rv['properties'] = self.properties
         if self.mergeRequests is not None:
             rv['mergeRequests'] = self.mergeRequests
+        if self.buildHorizon is not None:
+            rv['buildHorizon'] = self.buildHorizon
+        if self.logHorizon is not None:
+            rv['logHorizon'] = self.logHorizon
         if self.description:
             rv['description'] = self.description
         return rv
@@ -73,6 +73,10 @@ class Endpoint(object):
     pathPatterns = ""
     rootLinkName = None
     isCollection = False
+    # whether the data only changes when the database does, so that the REST
+    # API can derive its ETag from the database generation without reading
+    # the data; endpoints serving data from elsewhere must set this to False
+    etagFromGeneration = True
 
     def __init__(self, rtype, master):
         self.rtype = rtype
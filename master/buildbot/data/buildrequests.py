@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 from buildbot.data import base
+from buildbot.data import resultspec
 from buildbot.data import types
 from buildbot.db.buildrequests import AlreadyClaimedError
 
@@ -105,17 +106,23 @@ class BuildRequestsEndpoint(Db2DataMixin, base.Endpoint):
             claimed = resultSpec.popBooleanFilter('claimed')
 
         bsid = resultSpec.popOneFilter('buildsetid', 'eq')
+        brids = resultSpec.popFilter('buildrequestid', 'eq')
         buildrequests = yield self.master.db.buildrequests.getBuildRequests(
             buildername=buildername,
             complete=complete,
             claimed=claimed,
-            bsid=bsid)
+            bsid=bsid,
+            brids=brids)
         if buildrequests:
+            # look up each builder only once
+            builderids = {}
 
             @defer.inlineCallbacks
             def appendBuilderid(br):
                 buildername = br['buildername']
-                br['builderid'] = yield self.master.db.builders.findBuilderId(buildername)
+                if buildername not in builderids:
+                    builderids[buildername] = yield self.master.db.builders.findBuilderId(buildername)
+                br['builderid'] = builderids[buildername]
                 defer.returnValue(br)
             buildrequests = [(yield appendBuilderid(br)) for br in buildrequests]
         defer.returnValue(
@@ -154,9 +161,12 @@ class BuildRequest(base.ResourceType):
 
     @defer.inlineCallbacks
     def generateEvent(self, brids, event):
-        for _id in brids:
-            # get the build and munge the result for the notification
-            br = yield self.master.data.get(('buildrequests', str(_id)))
+        # get all of the buildrequests at once and munge the results for the
+        # notifications
+        brs = yield self.master.data.get(
+            ('buildrequests',),
+            filters=[resultspec.Filter('buildrequestid', 'eq', brids)])
+        for br in brs:
             self.produceEvent(br, event)
 
     @defer.inlineCallbacks
@@ -20,6 +20,18 @@ from twisted.internet import defer
 
 class Db2DataMixin(object):
 
+    # data API fields that can be filtered and ordered on in the database,
+    # mapped to the corresponding columns of the builds table
+    fieldMapping = {
+        'buildid': 'id',
+        'number': 'number',
+        'builderid': 'builderid',
+        'buildrequestid': 'buildrequestid',
+        'buildslaveid': 'buildslaveid',
+        'masterid': 'masterid',
+        'results': 'results',
+    }
+
     def db2data(self, dbdict):
         data = {
             'buildid': dbdict['id'],
@@ -80,11 +92,16 @@ class BuildsEndpoint(Db2DataMixin, base.Endpoint):
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
+        resultSpec.fieldMapping = self.fieldMapping
         builds = yield self.master.db.builds.getBuilds(
             builderid=kwargs.get('builderid'),
-            buildrequestid=kwargs.get('buildrequestid'))
-        defer.returnValue(
-            [(yield self.db2data(dbdict)) for dbdict in builds])
+            buildrequestid=kwargs.get('buildrequestid'),
+            resultSpec=resultSpec)
+        data = [(yield self.db2data(dbdict)) for dbdict in builds]
+        if isinstance(builds, base.ListResult):
+            data = base.ListResult(data, offset=builds.offset,
+                                   total=builds.total, limit=builds.limit)
+        defer.returnValue(data)
 
     def startConsuming(self, callback, options, kwargs):
         builderid = kwargs.get('builderid')
@@ -0,0 +1,82 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from buildbot.data import base
+from buildbot.data import types
+from twisted.internet import defer
+
+
+def _metrics2data(name, metrics):
+    return dict(name=unicode(name),
+                size=metrics['size'],
+                max_size=metrics['max_size'],
+                hits=metrics['hits'],
+                refhits=metrics['refhits'],
+                misses=metrics['misses'],
+                evictions=metrics['evictions'],
+                miss_latency=metrics['miss_latency'],
+                memory=metrics['memory'])
+
+
+class CacheEndpoint(base.Endpoint):
+
+    isCollection = False
+    # the metrics are kept in memory, and change without database writes
+    etagFromGeneration = False
+    pathPatterns = """
+        /caches/i:cachename
+    """
+
+    def get(self, resultSpec, kwargs):
+        name = kwargs['cachename']
+        metrics = self.master.caches.get_metrics().get(name)
+        if metrics is None:
+            return defer.succeed(None)
+        return defer.succeed(_metrics2data(name, metrics))
+
+
+class CachesEndpoint(base.Endpoint):
+
+    isCollection = True
+    etagFromGeneration = False
+    pathPatterns = """
+        /caches
+    """
+    rootLinkName = 'caches'
+
+    def get(self, resultSpec, kwargs):
+        return defer.succeed([
+            _metrics2data(name, metrics) for name, metrics
+            in sorted(self.master.caches.get_metrics().iteritems())])
+
+
+class Cache(base.ResourceType):
+
+    name = "cache"
+    plural = "caches"
+    endpoints = [CacheEndpoint, CachesEndpoint]
+    keyFields = []
+
+    class EntityType(types.Entity):
+        name = types.Identifier(50)
+        size = types.Integer()
+        max_size = types.Integer()
+        hits = types.Integer()
+        refhits = types.Integer()
+        misses = types.Integer()
+        evictions = types.Integer()
+        miss_latency = types.NoneOk(types.Float())
+        memory = types.Integer()
+    entityType = EntityType(name)
@@ -63,10 +63,23 @@ class ChangesEndpoint(FixerMixin, base.Endpoint):
     """
     rootLinkName = 'change'
 
+    # data API fields that can be filtered and ordered on in the database,
+    # mapped to the corresponding columns of the changes table.  String
+    # columns are left out, as some databases compare them case-insensitively.
+    fieldMapping = {
+        'changeid': 'changeid',
+        'when_timestamp': 'when_timestamp',
+    }
+
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
-        changes = yield self.master.db.changes.getChanges()
-        changes = [(yield self._fixChange(ch)) for ch in changes]
+        resultSpec.fieldMapping = self.fieldMapping
+        chdicts = yield self.master.db.changes.getChanges(
+            resultSpec=resultSpec)
+        changes = [(yield self._fixChange(ch)) for ch in chdicts]
+        if isinstance(chdicts, base.ListResult):
+            changes = base.ListResult(changes, offset=chdicts.offset,
+                                      total=chdicts.total, limit=chdicts.limit)
         defer.returnValue(changes)
 
     def startConsuming(self, callback, options, kwargs):
@@ -33,6 +33,8 @@ def forceScheduler2Data(sched):
 class ForceSchedulerEndpoint(base.Endpoint):
 
     isCollection = False
+    # the schedulers come from the configuration, not the database
+    etagFromGeneration = False
     pathPatterns = """
         /forceschedulers/i:schedulername
     """
@@ -59,6 +61,7 @@ class ForceSchedulerEndpoint(base.Endpoint):
 class ForceSchedulersEndpoint(base.Endpoint):
 
     isCollection = True
+    etagFromGeneration = False
     pathPatterns = """
         /forceschedulers
         /builders/:builderid/forceschedulers
@@ -23,6 +23,9 @@ class LogChunkEndpoint(base.BuildNestingMixin, base.Endpoint):
     # Note that this is a singular endpoint, even though it overrides the
     # offset/limit query params in ResultSpec
     isCollection = False
+    # lines held in the log append buffer are served without a database
+    # write, so the database generation does not track the contents
+    etagFromGeneration = False
     pathPatterns = """
         /logs/n:logid/contents
         /steps/n:stepid/logs/i:log_slug/contents
@@ -16,6 +16,7 @@
 from buildbot.data import base
 from buildbot.data import types
 from buildbot.util import identifiers
+from buildbot.util import subscription
 from twisted.internet import defer
 
 
@@ -37,6 +38,9 @@ class EndpointMixin(object):
 class LogEndpoint(EndpointMixin, base.BuildNestingMixin, base.Endpoint):
 
     isCollection = False
+    # num_lines includes appends still held in the append buffer, which
+    # change without a database write
+    etagFromGeneration = False
     pathPatterns = """
         /logs/n:logid
         /steps/n:stepid/logs/i:log_slug
@@ -67,6 +71,8 @@ class LogEndpoint(EndpointMixin, base.BuildNestingMixin, base.Endpoint):
 class LogsEndpoint(EndpointMixin, base.BuildNestingMixin, base.Endpoint):
 
     isCollection = True
+    # see LogEndpoint
+    etagFromGeneration = False
     pathPatterns = """
         /steps/n:stepid/logs
         /builds/n:buildid/steps/i:step_name/logs
@@ -85,6 +91,25 @@ class LogsEndpoint(EndpointMixin, base.BuildNestingMixin, base.Endpoint):
         defer.returnValue([(yield self.db2data(dbdict)) for dbdict in logs])
 
 
+class LogFollowers(subscription.SubscriptionPoint):
+
+    """
+    The subscriptions to the lines appended to a log, which forgets itself
+    once the last of them is unsubscribed.
+    """
+
+    def __init__(self, rtype, logid):
+        subscription.SubscriptionPoint.__init__(self, "log %d lines" % (logid,))
+        self.rtype = rtype
+        self.logid = logid
+
+    def _unsubscribe(self, sub):
+        subscription.SubscriptionPoint._unsubscribe(self, sub)
+        if not self.subscriptions \
+                and self.rtype._followers.get(self.logid) is self:
+            del self.rtype._followers[self.logid]
+
+
 class Log(base.ResourceType):
 
     name = "log"
@@ -106,6 +131,31 @@ class Log(base.ResourceType):
         type = types.Identifier(1)
     entityType = EntityType(name)
 
+    def __init__(self, master):
+        base.ResourceType.__init__(self, master)
+        # logid -> SubscriptionPoint, for the logs that are being followed
+        self._followers = {}
+
+    def followLog(self, logid, callback):
+        """
+        Call C{callback(first_line, content)} with each batch of lines
+        appended to the given log by this master, as it is appended.
+        C{content} is formatted as the content of a logchunk.  Lines appended
+        by other masters are not delivered; their C{append} events must be
+        followed by reading the lines.
+
+        @returns: subscription
+        """
+        subpt = self._followers.get(logid)
+        if subpt is None:
+            subpt = self._followers[logid] = LogFollowers(self, logid)
+        return subpt.subscribe(callback)
+
+    def _deliverLines(self, logid, first_line, content):
+        subpt = self._followers.get(logid)
+        if subpt is not None:
+            subpt.deliver(first_line, content)
+
     @defer.inlineCallbacks
     def generateEvent(self, _id, event):
         # get the build and munge the result for the notification
@@ -130,6 +180,11 @@ class Log(base.ResourceType):
     @defer.inlineCallbacks
     def appendLog(self, logid, content):
         res = yield self.master.db.logs.appendLog(logid=logid, content=content)
+        if res:
+            # deliver the lines, as they were stored, before the event that
+            # announces them
+            first_line, last_line, stored = res
+            self._deliverLines(logid, first_line, stored)
         self.generateEvent(logid, "append")
         defer.returnValue(res)
 
@@ -137,6 +192,7 @@ class Log(base.ResourceType):
     @defer.inlineCallbacks
     def finishLog(self, logid):
         res = yield self.master.db.logs.finishLog(logid=logid)
+        self._followers.pop(logid, None)
         self.generateEvent(logid, "finished")
         defer.returnValue(res)
 
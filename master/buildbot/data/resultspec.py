@@ -13,7 +13,10 @@
 #
 # Copyright Buildbot Team Members
 
+import sqlalchemy as sa
+
 from buildbot.data import base
+from buildbot.db import NULL
 
 
 class Filter(object):
@@ -50,10 +53,28 @@ class Filter(object):
         f = ops[self.op]
         return (d for d in data if f(d[fld], v))
 
+    def _sqlClause(self, col):
+        # returns None if this filter cannot be expressed in SQL with the same
+        # results as _apply
+        v = self.values
+        if None in v:
+            return None
+        if len(v) == 1:
+            clause = self.singular_operators[self.op](col, v)
+        elif self.op == 'eq':
+            clause = col.in_(v)
+        else:
+            clause = ~col.in_(v)
+        # Python considers None to be less than, and unequal to, everything
+        if col.nullable and self.op in ('ne', 'lt', 'le'):
+            clause = sa.or_(clause, col == NULL)
+        return clause
+
 
 class ResultSpec(object):
 
-    __slots__ = ['filters', 'fields', 'order', 'limit', 'offset']
+    __slots__ = ['filters', 'fields', 'order', 'limit', 'offset',
+                 'fieldMapping']
 
     def __init__(self, filters=None, fields=None, order=None,
                  limit=None, offset=None):
@@ -62,6 +83,9 @@ class ResultSpec(object):
         self.order = order
         self.limit = limit
         self.offset = offset
+        # set by endpoints that support pushing this spec down into SQL; maps
+        # data API field names to column names in the queried table
+        self.fieldMapping = None
 
     def popFilter(self, field, op):
         for f in self.filters:
@@ -100,6 +124,82 @@ class ResultSpec(object):
         del self.fields[i]
         return True
 
+    def applyToSQLQuery(self, query, table):
+        """
+        Add the filters, ordering, and pagination in this spec that can be
+        expressed against C{table} to the select C{query}, removing them from
+        the spec.  Whatever remains is left for L{apply}.
+
+        Returns a tuple (query, countQuery), where countQuery counts the
+        unpaginated results, or is None if pagination was not applied.
+        """
+        mapping = self.fieldMapping or {}
+
+        def column(field):
+            if field in mapping:
+                return table.c[mapping[field]]
+
+        for f in self.filters[:]:
+            col = column(f.field)
+            if col is None:
+                continue
+            clause = f._sqlClause(col)
+            if clause is not None:
+                query = query.where(clause)
+                self.filters.remove(f)
+
+        if self.order:
+            # ordering of NULLs varies between databases, so only push
+            # ordering on non-nullable columns
+            order_by = []
+            for k in self.order:
+                col = column(k.lstrip('-'))
+                if col is None or col.nullable:
+                    order_by = None
+                    break
+                order_by.append(sa.desc(col) if k[0] == '-' else col)
+            if order_by:
+                query = query.order_by(*order_by)
+                self.order = None
+
+        countQuery = None
+        if (self.limit is not None or self.offset is not None) \
+                and not self.filters and not self.order:
+            countQuery = sa.select([sa.func.count()]).select_from(
+                query.order_by(None).alias('q'))
+            if self.offset is not None:
+                query = query.offset(self.offset)
+            if self.limit is not None:
+                query = query.limit(self.limit)
+        return query, countQuery
+
+    def executeSQLQuery(self, pool, query, table, dictFromRow):
+        """
+        Apply this spec to C{query} as in L{applyToSQLQuery}, execute it in a
+        thread from C{pool}, and return a Deferred firing with the rows
+        converted with C{dictFromRow}.  If pagination was applied, the result
+        is a L{base.ListResult} with its offset, limit and total set, and the
+        spec's pagination is cleared.
+
+        The spec is updated before this method returns, so the database
+        thread never touches it.
+        """
+        offset, limit = self.offset, self.limit
+        query, countQuery = self.applyToSQLQuery(query, table)
+        if countQuery is not None:
+            self.removePagination()
+
+        def thd(conn):
+            res = conn.execute(query)
+            rv = [dictFromRow(row) for row in res.fetchall()]
+            res.close()
+            if countQuery is None:
+                return rv
+            return base.ListResult(rv, offset=offset,
+                                   total=conn.execute(countQuery).scalar(),
+                                   limit=limit)
+        return pool.do(thd)
+
     def apply(self, data):
         if data is None:
             return data
@@ -125,9 +225,10 @@ class ResultSpec(object):
 
             # item collection
             if isinstance(data, base.ListResult):
-                # if pagination was applied, then fields, etc. must be empty
-                assert not fields and not order and not filters, \
-                    "endpoint must apply fields, order, and filters if it performs pagination"
+                # if pagination was applied, then order and filters must be
+                # empty; fields can still be selected from each item
+                assert not order and not filters, \
+                    "endpoint must apply order and filters if it performs pagination"
                 offset, total = data.offset, data.total
                 limit = data.limit
             else:
@@ -91,6 +91,15 @@ class Integer(Instance):
         return int(arg)
 
 
+class Float(Instance):
+
+    name = "float"
+    types = (float,)
+
+    def valueFromString(self, arg):
+        return float(arg)
+
+
 class DateTime(Instance):
     name = "datetime"
     types = (datetime.datetime)
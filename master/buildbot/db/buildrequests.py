@@ -73,7 +73,7 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
         return self.db.pool.do(thd)
 
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-                         bsid=None, branch=None, repository=None):
+                         bsid=None, branch=None, repository=None, brids=None):
         def thd(conn):
             reqs_tbl = self.db.model.buildrequests
             claims_tbl = self.db.model.buildrequest_claims
@@ -106,10 +106,52 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
             if repository is not None:
                 q = q.where(sstamps_tbl.c.repository == repository)
 
-            res = conn.execute(q)
+            if brids is None:
+                rows = conn.execute(q).fetchall()
+            else:
+                # we'll need to batch the brids into groups of 100, so that
+                # the parameter lists supported by the DBAPI aren't exhausted
+                rows = []
+                iterator = iter(brids)
+                while True:
+                    batch = list(itertools.islice(iterator, 100))
+                    if not batch:
+                        break
+                    res = conn.execute(q.where(reqs_tbl.c.id.in_(batch)))
+                    rows.extend(res.fetchall())
 
             return [self._brdictFromRow(row, self.db.master.masterid)
-                    for row in res.fetchall()]
+                    for row in rows]
+        return self.db.pool.do(thd)
+
+    def getOldestRequestTimes(self, buildernames=None):
+        def thd(conn):
+            reqs_tbl = self.db.model.buildrequests
+            claims_tbl = self.db.model.buildrequest_claims
+            from_clause = reqs_tbl.outerjoin(claims_tbl,
+                                             reqs_tbl.c.id == claims_tbl.c.brid)
+            q = sa.select([reqs_tbl.c.buildername,
+                           sa.func.min(reqs_tbl.c.submitted_at)],
+                          from_obj=[from_clause])
+            q = q.where((claims_tbl.c.claimed_at == NULL) &
+                        (reqs_tbl.c.complete == 0))
+            q = q.group_by(reqs_tbl.c.buildername)
+
+            if buildernames is None:
+                rows = conn.execute(q).fetchall()
+            else:
+                # batch the names as getBuildRequests batches brids
+                rows = []
+                iterator = iter(buildernames)
+                while True:
+                    batch = list(itertools.islice(iterator, 100))
+                    if not batch:
+                        break
+                    res = conn.execute(
+                        q.where(reqs_tbl.c.buildername.in_(batch)))
+                    rows.extend(res.fetchall())
+
+            return dict((row[0], epoch2datetime(row[1])) for row in rows)
         return self.db.pool.do(thd)
 
     def claimBuildRequests(self, brids, claimed_at=None, _reactor=reactor):
@@ -46,14 +46,18 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
             (self.db.model.builds.c.builderid == builderid)
             & (self.db.model.builds.c.number == number))
 
-    def getBuilds(self, builderid=None, buildrequestid=None):
+    def getBuilds(self, builderid=None, buildrequestid=None, resultSpec=None):
+        tbl = self.db.model.builds
+        q = tbl.select()
+        if builderid:
+            q = q.where(tbl.c.builderid == builderid)
+        if buildrequestid:
+            q = q.where(tbl.c.buildrequestid == buildrequestid)
+        if resultSpec is not None:
+            return resultSpec.executeSQLQuery(self.db.pool, q, tbl,
+                                              self._builddictFromRow)
+
         def thd(conn):
-            tbl = self.db.model.builds
-            q = tbl.select()
-            if builderid:
-                q = q.where(tbl.c.builderid == builderid)
-            if buildrequestid:
-                q = q.where(tbl.c.buildrequestid == buildrequestid)
             res = conn.execute(q)
             return [self._builddictFromRow(row) for row in res.fetchall()]
         return self.db.pool.do(thd)
@@ -19,6 +19,7 @@ Support for changes in the database
 
 import sqlalchemy as sa
 
+from buildbot.data.base import ListResult
 from buildbot.db import base
 from buildbot.util import datetime2epoch
 from buildbot.util import epoch2datetime
@@ -35,6 +36,9 @@ class ChDict(dict):
 class ChangesConnectorComponent(base.DBConnectorComponent):
     # Documentation is in developer/db.rst
 
+    # number of changes loaded by each set of queries in getChangesByIds
+    BULK_LOAD_BATCH_SIZE = 100
+
     @defer.inlineCallbacks
     def addChange(self, author=None, files=None, comments=None, is_dir=None,
                   revision=None, when_timestamp=None, branch=None,
@@ -127,18 +131,33 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
         assert changeid >= 0
 
         def thd(conn):
-            # get the row from the 'changes' table
-            changes_tbl = self.db.model.changes
-            q = changes_tbl.select(whereclause=(changes_tbl.c.changeid == changeid))
-            rp = conn.execute(q)
-            row = rp.fetchone()
-            if not row:
-                return None
-            # and fetch the ancillary data (files, properties)
-            return self._chdict_from_change_row_thd(conn, row)
+            chdicts = self._getChangesByIds_thd(conn, [changeid])
+            return chdicts.get(changeid)
         d = self.db.pool.do(thd)
         return d
 
+    @defer.inlineCallbacks
+    def getChangesByIds(self, changeids):
+        # changes already in the cache (or being fetched for it) come from
+        # there; the others are loaded together, and added to the cache
+        cache = self.getChange.cache
+        missing = set(changeid for changeid in changeids
+                      if changeid not in cache)
+        loaded = {}
+        if missing:
+            loaded = yield self.db.pool.do(self._getChangesByIds_thd,
+                                           sorted(missing))
+            for changeid, chdict in loaded.iteritems():
+                cache.put(changeid, chdict)
+
+        chdicts = []
+        for changeid in changeids:
+            if changeid in missing:
+                chdicts.append(loaded.get(changeid))
+            else:
+                chdicts.append((yield cache.get(changeid)))
+        defer.returnValue(chdicts)
+
     def getChangeUids(self, changeid):
         assert changeid >= 0
 
@@ -166,27 +185,33 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
         d = self.db.pool.do(thd)
 
         # then turn those into changes, using the cache
-        def get_changes(changeids):
-            return defer.gatherResults([self.getChange(changeid)
-                                        for changeid in changeids])
-        d.addCallback(get_changes)
+        d.addCallback(self.getChangesByIds)
         return d
 
-    def getChanges(self):
-        def thd(conn):
-            # get the changeids from the 'changes' table
-            changes_tbl = self.db.model.changes
-            q = sa.select([changes_tbl.c.changeid])
-            rp = conn.execute(q)
-            changeids = [row.changeid for row in rp]
-            rp.close()
-            return list(changeids)
-        d = self.db.pool.do(thd)
+    def getChanges(self, resultSpec=None):
+        # get the changeids from the 'changes' table
+        changes_tbl = self.db.model.changes
+        q = sa.select([changes_tbl.c.changeid])
+        if resultSpec is not None:
+            d = resultSpec.executeSQLQuery(self.db.pool, q, changes_tbl,
+                                           lambda row: row.changeid)
+        else:
+            def thd(conn):
+                rp = conn.execute(q)
+                changeids = [row.changeid for row in rp]
+                rp.close()
+                return list(changeids)
+            d = self.db.pool.do(thd)
 
         # then turn those into changes, using the cache
         def get_changes(changeids):
-            return defer.gatherResults([self.getChange(changeid)
-                                        for changeid in changeids])
+            d = self.getChangesByIds(changeids)
+            if isinstance(changeids, ListResult):
+                # keep the pagination applied by the resultSpec
+                d.addCallback(lambda chdicts: ListResult(
+                    chdicts, offset=changeids.offset, total=changeids.total,
+                    limit=changeids.limit))
+            return d
         d.addCallback(get_changes)
         return d
 
@@ -249,36 +274,69 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
                         table.delete(table.c.changeid.in_(batch)))
         return self.db.pool.do(thd)
 
-    def _chdict_from_change_row_thd(self, conn, ch_row):
-        # This method must be run in a db.pool thread, and returns a chdict
-        # given a row from the 'changes' table
+    def _getChangesByIds_thd(self, conn, changeids):
+        # This method must be run in a db.pool thread, and returns a dictionary
+        # mapping the given changeids to chdicts, leaving out any that do not
+        # exist.  Each batch of changes is loaded with three queries: one for
+        # each of the 'changes', 'change_files', and 'change_properties'
+        # tables.
+        changes_tbl = self.db.model.changes
         change_files_tbl = self.db.model.change_files
         change_properties_tbl = self.db.model.change_properties
 
-        chdict = ChDict(
+        chdicts = {}
+        remaining = list(changeids)
+        while remaining:
+            batch = remaining[:self.BULK_LOAD_BATCH_SIZE]
+            remaining = remaining[self.BULK_LOAD_BATCH_SIZE:]
+
+            q = changes_tbl.select(
+                whereclause=changes_tbl.c.changeid.in_(batch))
+            found = {}
+            for row in conn.execute(q):
+                found[row.changeid] = self._chdict_from_change_row(row)
+            if not found:
+                continue
+
+            q = sa.select([change_files_tbl.c.changeid,
+                           change_files_tbl.c.filename],
+                          whereclause=change_files_tbl.c.changeid.in_(found))
+            for row in conn.execute(q):
+                found[row.changeid]['files'].append(row.filename)
+
+            q = sa.select([change_properties_tbl.c.changeid,
+                           change_properties_tbl.c.property_name,
+                           change_properties_tbl.c.property_value],
+                          whereclause=change_properties_tbl.c.changeid.in_(
+                              found))
+            for row in conn.execute(q):
+                self._add_change_property(found[row.changeid], row)
+
+            chdicts.update(found)
+        return chdicts
+
+    def _chdict_from_change_row(self, ch_row):
+        # returns a chdict with empty files and properties, given a row from
+        # the 'changes' table
+        return ChDict(
             changeid=ch_row.changeid,
             author=ch_row.author,
-            files=[],  # see below
+            files=[],
             comments=ch_row.comments,
             revision=ch_row.revision,
             when_timestamp=epoch2datetime(ch_row.when_timestamp),
             branch=ch_row.branch,
             category=ch_row.category,
             revlink=ch_row.revlink,
-            properties={},  # see below
+            properties={},
             repository=ch_row.repository,
             codebase=ch_row.codebase,
             project=ch_row.project,
             sourcestampid=int(ch_row.sourcestampid))
 
-        query = change_files_tbl.select(
-            whereclause=(change_files_tbl.c.changeid == ch_row.changeid))
-        rows = conn.execute(query)
-        for r in rows:
-            chdict['files'].append(r.filename)
-
-        # and properties must be given without a source, so strip that, but
-        # be flexible in case users have used a development version where the
+    def _add_change_property(self, chdict, prop_row):
+        # properties must be given without a source, so strip that, but be
+        # flexible in case users have used a development version where the
         # change properties were recorded incorrectly
         def split_vs(vs):
             try:
@@ -289,14 +347,8 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
                 v, s = vs, "Change"
             return v, s
 
-        query = change_properties_tbl.select(
-            whereclause=(change_properties_tbl.c.changeid == ch_row.changeid))
-        rows = conn.execute(query)
-        for r in rows:
-            try:
-                v, s = split_vs(json.loads(r.property_value))
-                chdict['properties'][r.property_name] = (v, s)
-            except ValueError:
-                pass
-
-        return chdict
+        try:
+            v, s = split_vs(json.loads(prop_row.property_value))
+            chdict['properties'][prop_row.property_name] = (v, s)
+        except ValueError:
+            pass
@@ -29,6 +29,7 @@ from buildbot.db import logs
 from buildbot.db import masters
 from buildbot.db import model
 from buildbot.db import pool
+from buildbot.db import retention
 from buildbot.db import schedulers
 from buildbot.db import sourcestamps
 from buildbot.db import state
@@ -91,6 +92,7 @@ class DBConnector(config.ReconfigurableServiceMixin, service.AsyncMultiService):
         self.builders = builders.BuildersConnectorComponent(self)
         self.steps = steps.StepsConnectorComponent(self)
         self.logs = logs.LogsConnectorComponent(self)
+        self.retention = retention.RetentionConnectorComponent(self)
 
         self.cleanup_timer = internet.TimerService(self.CLEANUP_PERIOD,
                                                    self._doCleanup)
@@ -104,7 +106,10 @@ class DBConnector(config.ReconfigurableServiceMixin, service.AsyncMultiService):
         # set up the engine and pool
         self._engine = enginestrategy.create_engine(db_url,
                                                     basedir=self.basedir)
-        self.pool = pool.DBThreadPool(self._engine, verbose=verbose)
+        self.pool = pool.DBThreadPool(
+            self._engine, verbose=verbose,
+            size=self.master.config.db.get('pool_size'),
+            max_size=self.master.config.db.get('pool_max_size'))
 
         # make sure the db is up to date, unless specifically asked not to
         if check_version:
@@ -121,13 +126,35 @@ class DBConnector(config.ReconfigurableServiceMixin, service.AsyncMultiService):
 
         return d
 
+    @defer.inlineCallbacks
+    def stopService(self):
+        # write out any log content that is still buffered
+        if self.pool:
+            yield self.logs._flushAppends()
+        yield service.AsyncMultiService.stopService(self)
+
     def reconfigService(self, new_config):
         # double-check -- the master ensures this in config checks
         assert self.configured_url == new_config.db['db_url']
 
+        if self.pool:
+            self.pool.setSize(new_config.db.get('pool_size'),
+                              new_config.db.get('pool_max_size'))
+
         return config.ReconfigurableServiceMixin.reconfigService(self,
                                                                  new_config)
 
+    def getGeneration(self):
+        """
+        Return a number that increases after each database write made by this
+        master completes, or None if the database is not set up.  Data read
+        while this number is unchanged is still current, unless another master
+        wrote to the database.
+        """
+        if not self.pool:
+            return None
+        return self.pool.generation
+
     def _doCleanup(self):
         """
         Perform any periodic database cleanup tasks.
@@ -140,4 +167,45 @@ class DBConnector(config.ReconfigurableServiceMixin, service.AsyncMultiService):
 
         d = self.changes.pruneChanges(self.master.config.changeHorizon)
         d.addErrback(log.err, 'while pruning changes')
+        d.addCallback(lambda _: self._pruneBuilds())
+        d.addErrback(log.err, 'while pruning builds')
         return d
+
+    @defer.inlineCallbacks
+    def _pruneBuilds(self):
+        # prune the history of each builder according to its horizons, which
+        # default to the global ones.  The horizons used to apply only to
+        # the status pickles, so the database is pruned only on request.
+        config = self.master.config
+        if not config.retention['enabled']:
+            return
+        policies = []
+        for builder_config in config.builders:
+            buildHorizon = builder_config.buildHorizon
+            if buildHorizon is None:
+                buildHorizon = config.buildHorizon
+            logHorizon = builder_config.logHorizon
+            if logHorizon is None:
+                logHorizon = config.logHorizon
+            if buildHorizon is not None or logHorizon is not None:
+                policies.append((builder_config.name, buildHorizon,
+                                 logHorizon))
+        if not policies:
+            return
+
+        builderids = dict((bldr['name'], bldr['id'])
+                          for bldr in (yield self.builders.getBuilders()))
+        dryRun = config.retention['dry_run']
+        for name, buildHorizon, logHorizon in policies:
+            if name not in builderids:
+                continue
+            counts = yield self.retention.pruneBuilder(
+                builderids[name], name, buildHorizon=buildHorizon,
+                logHorizon=logHorizon,
+                batchSize=config.retention['batch_size'], dryRun=dryRun)
+            pruned = ['%d %s' % (counts[table], table)
+                      for table in retention.PRUNED_TABLES if counts[table]]
+            if pruned:
+                log.msg("builder %r: %s %s"
+                        % (name, "would prune" if dryRun else "pruned",
+                           ', '.join(pruned)))
@@ -13,12 +13,115 @@
 #
 # Copyright Buildbot Team Members
 
+import array
+import bz2
+import re
 import sqlalchemy as sa
+import zlib
 
 from buildbot.db import base
 from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import threads
 from twisted.python import log
 
+try:
+    import lz4
+    [lz4]
+except ImportError:
+    lz4 = None
+
+
+def _identity(x):
+    return x
+
+# Codecs for log chunk content, keyed by the name used in
+# c['db']['log_compression'].  The id is what is stored in the 'compressed'
+# column of the logchunks table; id 0 always means uncompressed.
+COMPRESSION_MODES = {
+    'raw': dict(id=0, dumps=_identity, read=_identity),
+    'gz': dict(id=1, dumps=zlib.compress, read=zlib.decompress),
+    'bz2': dict(id=2, dumps=bz2.compress, read=bz2.decompress),
+}
+if lz4:
+    COMPRESSION_MODES['lz4'] = dict(id=3, dumps=lz4.dumps, read=lz4.loads)
+COMPRESSION_BYID = dict((m['id'], m) for m in COMPRESSION_MODES.itervalues())
+DEFAULT_COMPRESSION = 'gz'
+
+
+class LogChunkIndex(object):
+
+    """
+    The uncompressed, utf-8 encoded content of a log chunk, together with
+    the offset at which every C{STRIDE}th line begins.  The offsets are found
+    as lines are read, so the chunk is scanned no further than the last line
+    read, and any line is found from the nearest known offset.  Chunks never
+    change once written, so these are cached, and lines that have been
+    reached once can be read again without scanning the chunk.
+    """
+
+    __slots__ = ('content', 'offsets', 'scanned', '__weakref__')
+
+    STRIDE = 64
+    _stride = re.compile('(?:[^\n]*\n){%d}' % STRIDE)
+
+    def __init__(self, content):
+        self.content = content
+        # offsets[i] is the offset of line i * STRIDE
+        self.offsets = array.array('L', [0])
+        # true once every such offset is known
+        self.scanned = False
+
+    def _findLine(self, line):
+        # return the offset of LINE, or None if there is no such line
+        offsets = self.offsets
+        i = line // self.STRIDE
+        while len(offsets) <= i and not self.scanned:
+            m = self._stride.match(self.content, offsets[-1])
+            if m:
+                offsets.append(m.end())
+            else:
+                self.scanned = True
+        if i >= len(offsets):
+            return None
+        offset = offsets[i]
+        find = self.content.find
+        for _ in xrange(line - i * self.STRIDE):
+            offset = find('\n', offset)
+            if offset == -1:
+                return None
+            offset += 1
+        return offset
+
+    def getLines(self, first, last):
+        """
+        Return lines FIRST through LAST (inclusive, and relative to the start
+        of the chunk) as a unicode string, without a trailing newline.
+        """
+        start = self._findLine(first)
+        end = self._findLine(last + 1)
+        if end is None:
+            end = len(self.content)
+        else:
+            end -= 1
+        return self.content[start:end].decode('utf-8')
+
+
+class LogAppendBuffer(object):
+
+    """
+    Lines appended to a log that have not yet been written to the database.
+    C{num_lines} is the total number of lines in the log, including the
+    buffered ones; C{segments} is a list of (first_line, last_line, content)
+    tuples, where content is utf-8 encoded and has no trailing newline.
+    """
+
+    __slots__ = ('num_lines', 'segments')
+
+    def __init__(self, num_lines):
+        self.num_lines = num_lines
+        self.segments = []
+
 
 class LogsConnectorComponent(base.DBConnectorComponent):
 
@@ -26,6 +129,29 @@ class LogsConnectorComponent(base.DBConnectorComponent):
     # for MySQL appears to be max_packet_size (default 1M).
     MAX_CHUNK_SIZE = 65536
 
+    # When compressing a finished log, consecutive chunks are gathered into
+    # groups of at most this many uncompressed bytes before being compressed,
+    # as long as the compressed result still fits in MAX_CHUNK_SIZE.
+    MAX_COMPRESSED_GROUP_SIZE = MAX_CHUNK_SIZE * 16
+
+    # Appended content is buffered in memory and written out for all logs at
+    # once, in a single transaction, this many seconds after the first
+    # buffered append, or as soon as this many bytes are buffered.
+    APPEND_FLUSH_DELAY = 0.1
+    APPEND_FLUSH_SIZE = 1024 * 1024
+
+    def __init__(self, connector):
+        base.DBConnectorComponent.__init__(self, connector)
+        self._appendBuffers = {}  # logid -> LogAppendBuffer
+        self._bufferedSize = 0
+        self._flushTimer = None
+        self._flushLock = defer.DeferredLock()
+        # (logid, first_line, last_line, compressed) -> content, for the
+        # chunks getLogLines has just read, while it looks them up
+        self._fetchedChunks = {}
+        # for tests
+        self._reactor = reactor
+
     def _getLog(self, whereclause):
         def thd(conn):
             q = self.db.model.logs.select(whereclause=whereclause)
@@ -40,11 +166,15 @@ class LogsConnectorComponent(base.DBConnectorComponent):
         return self.db.pool.do(thd)
 
     def getLog(self, logid):
-        return self._getLog(self.db.model.logs.c.id == logid)
+        d = self._getLog(self.db.model.logs.c.id == logid)
+        d.addCallback(self._addBufferedLines)
+        return d
 
     def getLogBySlug(self, stepid, slug):
         tbl = self.db.model.logs
-        return self._getLog((tbl.c.slug == slug) & (tbl.c.stepid == stepid))
+        d = self._getLog((tbl.c.slug == slug) & (tbl.c.stepid == stepid))
+        d.addCallback(self._addBufferedLines)
+        return d
 
     def getLogs(self, stepid):
         def thd(conn):
@@ -54,37 +184,89 @@ class LogsConnectorComponent(base.DBConnectorComponent):
             q = q.order_by(tbl.c.id)
             res = conn.execute(q)
             return [self._logdictFromRow(row) for row in res.fetchall()]
-        return self.db.pool.do(thd)
+        d = self.db.pool.do(thd)
+
+        @d.addCallback
+        def addBufferedLines(logdicts):
+            return [self._addBufferedLines(logdict) for logdict in logdicts]
+        return d
 
+    def _addBufferedLines(self, logdict):
+        # count lines that are still buffered for this log
+        if logdict:
+            buf = self._appendBuffers.get(logdict['id'])
+            if buf:
+                logdict['num_lines'] = buf.num_lines
+        return logdict
+
+    @defer.inlineCallbacks
     def getLogLines(self, logid, first_line, last_line):
+        # lines that are still buffered are taken from the buffer; the
+        # segments are copied before querying the database, so that lines
+        # flushed in the meantime are neither missed nor repeated
+        buf = self._appendBuffers.get(logid)
+        segments = list(buf.segments) if buf else []
+        buffered = []
+        if segments:
+            for seg_first, seg_last, content in segments:
+                if seg_first > last_line or seg_last < first_line:
+                    continue
+                index = LogChunkIndex(content)
+                buffered.append(
+                    index.getLines(max(first_line, seg_first) - seg_first,
+                                   min(last_line, seg_last) - seg_first))
+            last_line = min(last_line, segments[0][0] - 1)
+
         def thd(conn):
-            # get a set of chunks that completely cover the requested range
+            # get a set of chunks that completely cover the requested range,
+            # with their content, so that they are all read at once
             tbl = self.db.model.logchunks
             q = sa.select([tbl.c.first_line, tbl.c.last_line,
-                           tbl.c.content, tbl.c.compressed])
+                           tbl.c.compressed, tbl.c.content])
             q = q.where(tbl.c.logid == logid)
             q = q.where(tbl.c.first_line <= last_line)
             q = q.where(tbl.c.last_line >= first_line)
             q = q.order_by(tbl.c.first_line)
-            rv = []
-            for row in conn.execute(q):
-                assert not row.compressed, "compressed rows not supported yet"
-                content = row.content.decode('utf-8')
-                if row.first_line < first_line:
-                    idx = -1
-                    count = first_line - row.first_line
-                    for _ in xrange(count):
-                        idx = content.index('\n', idx + 1)
-                    content = content[idx + 1:]
-                if row.last_line > last_line:
-                    idx = len(content) + 1
-                    count = row.last_line - last_line
-                    for _ in xrange(count):
-                        idx = content.rindex('\n', 0, idx - 1)
-                    content = content[:idx]
-                rv.append(content)
-            return u'\n'.join(rv) + u'\n' if rv else u''
-        return self.db.pool.do(thd)
+            res = conn.execute(q)
+            rows = res.fetchall()
+            res.close()
+            return rows
+        rows = yield self.db.pool.do(thd)
+
+        # each chunk is looked up in the logchunks cache, which holds it
+        # decompressed, along with an index of its lines, so slicing out the
+        # requested lines does not require scanning the chunk again.  The
+        # content that was just read is handed to the cache as it looks up
+        # the chunks that are not cached.
+        self._fetchedChunks = dict(
+            ((logid, row.first_line, row.last_line, row.compressed),
+             row.content)
+            for row in rows)
+        try:
+            dl = [self._getLogChunkIndex((logid, row.first_line,
+                                          row.last_line, row.compressed))
+                  for row in rows]
+        finally:
+            self._fetchedChunks = {}
+        indexes = yield defer.gatherResults(dl)
+
+        rv = []
+        for row, index in zip(rows, indexes):
+            rv.append(index.getLines(max(first_line, row.first_line) - row.first_line,
+                                     min(last_line, row.last_line) - row.first_line))
+        rv.extend(buffered)
+        defer.returnValue(u'\n'.join(rv) + u'\n' if rv else u'')
+
+    @base.cached("logchunks")
+    def _getLogChunkIndex(self, key):
+        # getLogLines reads the content of the chunks it looks up
+        logid, first_line, last_line, compressed = key
+        content = self._fetchedChunks[key]
+        if not compressed:
+            return defer.succeed(LogChunkIndex(content))
+        # decompressing may take a while; do not block the reactor
+        return threads.deferToThread(
+            lambda: LogChunkIndex(self._decompressChunk(content, compressed)))
 
     def addLog(self, stepid, name, slug, type):
         assert type in 'tsh', "Log type must be one of t, s, or h"
@@ -100,40 +282,119 @@ class LogsConnectorComponent(base.DBConnectorComponent):
                     "log with slug '%r' already exists in this step" % (slug,))
         return self.db.pool.do(thd)
 
+    @defer.inlineCallbacks
     def appendLog(self, logid, content):
         # check for trailing newline and strip it for storage -- chunks omit
         # the trailing newline
         assert content[-1] == u'\n'
-        content = content[:-1]
+        num_new_lines = content.count(u'\n')
+        stored = content
+        content = content[:-1].encode('utf-8')
+        if len(content) >= self.MAX_CHUNK_SIZE:
+            # truncate any overlong lines now, so that readers see the same
+            # lines before and after they are written
+            chunks = []
+            remaining = content
+            while remaining is not None:
+                chunk, remaining = self._splitBigChunk(remaining, logid)
+                chunks.append(chunk)
+            content = '\n'.join(chunks)
+            stored = content.decode('utf-8') + u'\n'
 
-        def thd(conn):
-            q = sa.select([self.db.model.logs.c.num_lines])
-            q = q.where(self.db.model.logs.c.id == logid)
-            res = conn.execute(q)
-            row = res.fetchone()
-            res.close()
-            if not row:
-                return  # ignore a missing log
+        buf = self._appendBuffers.get(logid)
+        if buf is None:
+            # a log's buffer is dropped once it has been written, so read the
+            # number of lines while no flush can write or drop it
+            yield self._flushLock.acquire()
+            try:
+                logdict = yield self.getLog(logid)
+                if not logdict:
+                    return  # ignore a missing log
+                # another append may have created the buffer in the meantime
+                buf = self._appendBuffers.setdefault(
+                    logid, LogAppendBuffer(logdict['num_lines']))
+            finally:
+                self._flushLock.release()
 
-            # Break the content up into chunks.  This takes advantage of the
-            # fact that no character but u'\n' maps to b'\n' in UTF-8.
+        first_line = buf.num_lines
+        last_line = first_line + num_new_lines - 1
+        buf.segments.append((first_line, last_line, content))
+        buf.num_lines = last_line + 1
+        self._bufferedSize += len(content) + 1
 
-            first_line = chunk_first_line = row[0]
-            remaining = content.encode('utf-8')
-            while remaining:
-                chunk, remaining = self._splitBigChunk(remaining, logid)
+        if self._bufferedSize >= self.APPEND_FLUSH_SIZE:
+            # the database is not keeping up; make the caller wait
+            yield self._flushAppends()
+        elif not self._flushTimer:
+            self._flushTimer = self._reactor.callLater(
+                self.APPEND_FLUSH_DELAY, self._flushAppendsLater)
+        defer.returnValue((first_line, last_line, stored))
+
+    def _flushAppendsLater(self):
+        self._flushTimer = None
+        d = self._flushAppends()
+        d.addErrback(log.err, 'while writing buffered log lines')
+
+    @defer.inlineCallbacks
+    def _flushAppends(self):
+        """
+        Write all buffered log content to the database, in a single
+        transaction.  The returned Deferred fires once everything that was
+        buffered when this method was called has been written.
+        """
+        if self._flushTimer:
+            self._flushTimer.cancel()
+            self._flushTimer = None
 
+        yield self._flushLock.acquire()
+        try:
+            batch = [(logid, list(buf.segments))
+                     for logid, buf in self._appendBuffers.iteritems()
+                     if buf.segments]
+            if batch:
+                yield self.db.pool.do(self._thdWriteSegments, batch)
+
+            # forget the segments that are now in the database, and the
+            # buffers that have nothing more to write, so that logs which are
+            # never finished do not keep theirs
+            for logid, segments in batch:
+                buf = self._appendBuffers.get(logid)
+                if buf:
+                    del buf.segments[:len(segments)]
+                    if not buf.segments:
+                        del self._appendBuffers[logid]
+                self._bufferedSize -= sum(len(seg[2]) + 1 for seg in segments)
+        finally:
+            self._flushLock.release()
+
+    def _thdWriteSegments(self, conn, batch):
+        chunks = []
+        num_lines = []
+        for logid, segments in batch:
+            # consecutive segments are coalesced into as few chunks as
+            # possible.  This takes advantage of the fact that no character
+            # but u'\n' maps to b'\n' in UTF-8.
+            chunk_first_line = segments[0][0]
+            remaining = '\n'.join(seg[2] for seg in segments)
+            while True:
+                chunk, remaining = self._splitBigChunk(remaining, logid)
                 last_line = chunk_first_line + chunk.count('\n')
-                conn.execute(self.db.model.logchunks.insert(),
-                             dict(logid=logid, first_line=chunk_first_line,
-                                  last_line=last_line, content=chunk,
-                                  compressed=0))
+                chunks.append(dict(logid=logid, first_line=chunk_first_line,
+                                   last_line=last_line, content=chunk,
+                                   compressed=0))
                 chunk_first_line = last_line + 1
+                if remaining is None:
+                    break
+            num_lines.append(dict(_logid=logid,
+                                  _num_lines=segments[-1][1] + 1))
 
-            conn.execute(self.db.model.logs.update(whereclause=(self.db.model.logs.c.id == logid)),
-                         num_lines=last_line + 1)
-            return (first_line, last_line)
-        return self.db.pool.do(thd)
+        tbl = self.db.model.logs
+        transaction = conn.begin()
+        conn.execute(self.db.model.logchunks.insert(), chunks)
+        q = tbl.update(whereclause=(tbl.c.id == sa.bindparam('_logid')))
+        q = q.values(num_lines=sa.bindparam('_num_lines'))
+        conn.execute(q, num_lines)
+        transaction.commit()
 
     def _splitBigChunk(self, content, logid):
         """
@@ -167,16 +428,118 @@ class LogsConnectorComponent(base.DBConnectorComponent):
         else:
             return truncline, content[i + 1:]
 
+    @defer.inlineCallbacks
     def finishLog(self, logid):
+        # flushing drops the log's buffer once it is written; lines appended
+        # during a flush are written by the next one
+        buf = self._appendBuffers.get(logid)
+        while buf and buf.segments:
+            yield self._flushAppends()
+            buf = self._appendBuffers.get(logid)
+
         def thd(conn):
             tbl = self.db.model.logs
             q = tbl.update(whereclause=(tbl.c.id == logid))
             conn.execute(q, complete=1)
-        return self.db.pool.do(thd)
+        yield self.db.pool.do(thd)
 
     def compressLog(self, logid):
-        # TODO: compression not supported yet
-        return defer.succeed(None)
+        mode = self.db.master.config.db.get('log_compression',
+                                            DEFAULT_COMPRESSION)
+        codec = COMPRESSION_MODES[mode]
+        if codec['id'] == 0:
+            return defer.succeed(0)
+
+        def thd(conn):
+            tbl = self.db.model.logchunks
+            q = sa.select([tbl.c.first_line, tbl.c.last_line,
+                           sa.func.length(tbl.c.content).label('length'),
+                           tbl.c.compressed])
+            q = q.where(tbl.c.logid == logid)
+            q = q.order_by(tbl.c.first_line)
+            res = conn.execute(q)
+            rows = res.fetchall()
+            res.close()
+
+            # gather runs of consecutive uncompressed chunks into groups;
+            # chunks that are already compressed are left alone
+            groups = []
+            group = []
+            group_size = 0
+            for row in rows:
+                if row.compressed:
+                    group = []
+                    continue
+                if group and \
+                        group_size + row.length + 1 > self.MAX_COMPRESSED_GROUP_SIZE:
+                    group = []
+                if not group:
+                    group_size = 0
+                    groups.append(group)
+                group.append(row)
+                group_size += row.length + 1
+
+            saved = 0
+            for group in groups:
+                saved += self._compressChunkGroup(conn, logid, group, codec)
+            return saved
+        return self.db.pool.do(thd)
+
+    def _compressChunkGroup(self, conn, logid, group, codec):
+        """
+        Replace the chunks in GROUP, a list of consecutive uncompressed
+        chunk rows, with a single chunk compressed with CODEC.  If the result
+        is too big for one chunk, the group is split in two and each half is
+        tried separately.  Chunks that do not compress are left untouched.
+        Returns the number of bytes saved.
+        """
+        tbl = self.db.model.logchunks
+        first_line = group[0].first_line
+        last_line = group[-1].last_line
+
+        q = sa.select([tbl.c.content])
+        q = q.where(tbl.c.logid == logid)
+        q = q.where(tbl.c.first_line >= first_line)
+        q = q.where(tbl.c.last_line <= last_line)
+        q = q.order_by(tbl.c.first_line)
+        res = conn.execute(q)
+        raw = '\n'.join(row.content for row in res.fetchall())
+        res.close()
+
+        compressed = codec['dumps'](raw)
+        if len(compressed) > self.MAX_CHUNK_SIZE:
+            if len(group) == 1:
+                return 0
+            mid = len(group) // 2
+            return (self._compressChunkGroup(conn, logid, group[:mid], codec) +
+                    self._compressChunkGroup(conn, logid, group[mid:], codec))
+        if len(compressed) >= len(raw):
+            return 0
+
+        # replace the chunks in a transaction, so that readers never see
+        # the lines disappear
+        transaction = conn.begin()
+        q = tbl.delete()
+        q = q.where(tbl.c.logid == logid)
+        q = q.where(tbl.c.first_line >= first_line)
+        q = q.where(tbl.c.last_line <= last_line)
+        conn.execute(q)
+        conn.execute(tbl.insert(),
+                     dict(logid=logid, first_line=first_line,
+                          last_line=last_line, content=compressed,
+                          compressed=codec['id']))
+        transaction.commit()
+        return len(raw) - len(compressed)
+
+    def _decompressChunk(self, content, compressed):
+        if not compressed:
+            return content
+        try:
+            codec = COMPRESSION_BYID[compressed]
+        except KeyError:
+            raise RuntimeError("log chunk compressed with unknown codec %d"
+                               % (compressed,))
+        return codec['read'](content)
 
     def _logdictFromRow(self, row):
         rv = dict(row)
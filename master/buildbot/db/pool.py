@@ -18,11 +18,13 @@ import os
 import shutil
 import sqlalchemy as sa
 import tempfile
+import threading
 import time
 import traceback
 
 from buildbot.process import metrics
 from twisted.internet import reactor
+from twisted.internet import task
 from twisted.internet import threads
 from twisted.python import log
 from twisted.python import threadpool
@@ -95,7 +97,16 @@ class DBThreadPool(threadpool.ThreadPool):
     # in bug #1810.
     __broken_sqlite = None
 
-    def __init__(self, engine, verbose=False):
+    # When the pool is adaptive (max_size > size), then every ADAPT_INTERVAL
+    # seconds it grows by half if queries spent more than ADAPT_WAIT_THRESHOLD
+    # seconds waiting for a thread on average, unless their execution time
+    # has doubled since the last resize (meaning the database, not the pool,
+    # is the bottleneck).  It shrinks by one thread toward size when no query
+    # waited and threads are idle.
+    ADAPT_INTERVAL = 10
+    ADAPT_WAIT_THRESHOLD = 0.01
+
+    def __init__(self, engine, verbose=False, size=None, max_size=None):
         # verbose is used by upgrade scripts, and if it is set we should print
         # messages about versions and other warnings
         log_msg = log.msg
@@ -104,20 +115,19 @@ class DBThreadPool(threadpool.ThreadPool):
                 print m
             log_msg = _log_msg
 
-        pool_size = 5
-
-        # If the engine has an C{optimal_thread_pool_size} attribute, then the
-        # maxthreads of the thread pool will be set to that value.  This is
-        # most useful for SQLite in-memory connections, where exactly one
-        # connection (and thus thread) should be used.
-        if hasattr(engine, 'optimal_thread_pool_size'):
-            pool_size = engine.optimal_thread_pool_size
-
         threadpool.ThreadPool.__init__(self,
                                        minthreads=1,
-                                       maxthreads=pool_size,
+                                       maxthreads=5,
                                        name='DBThreadPool')
         self.engine = engine
+        self.generation = 0
+        self._thread_state = threading.local()
+        sa.event.listen(engine, 'after_execute', self._afterExecute)
+        self.size = self.max_size = None
+        self._adapt_task = None
+        self._resetAdaptStats()
+        self._exec_mean_at_resize = None
+        self.setSize(size, max_size)
         if engine.dialect.name == 'sqlite':
             vers = self.get_sqlite_version()
             if vers < (3, 7):
@@ -148,12 +158,93 @@ class DBThreadPool(threadpool.ThreadPool):
             self._stop_evt = reactor.addSystemEventTrigger(
                 'during', 'shutdown', self._stop)
             self.running = True
+            self._updateAdaptTask()
 
     def _stop(self):
         self._stop_evt = None
         self.stop()
         self.engine.dispose()
         self.running = False
+        self._updateAdaptTask()
+
+    def setSize(self, size=None, max_size=None):
+        """Set the number of threads (and thus database connections) in the
+        pool.  If C{max_size} is larger than C{size}, the pool adapts its
+        size between the two according to how long queries wait for a
+        thread.  The default size is the engine's
+        C{optimal_thread_pool_size}, which is also the largest size allowed;
+        for SQLite in-memory databases, for example, it is 1."""
+        limit = getattr(self.engine, 'optimal_thread_pool_size', None)
+        if size is None:
+            size = limit or 5
+        max_size = max(size, max_size or size)
+        if limit is not None and max_size > limit:
+            log.msg("DBThreadPool: limiting pool size to %d, the number of "
+                    "connections the database engine allows" % (limit,))
+            size = min(size, limit)
+            max_size = limit
+
+        # an adaptive pool keeps its current size if it is still in range
+        if self.size is None or not (size <= self.max <= max_size):
+            self.adjustPoolsize(maxthreads=size)
+            self._exec_mean_at_resize = None
+        self.size = size
+        self.max_size = max_size
+        self._updateAdaptTask()
+
+    def _afterExecute(self, conn, clauseelement, multiparams, params, result):
+        # note whether the current thread has modified the database
+        if isinstance(clauseelement, basestring):
+            write = not clauseelement.lstrip().lower().startswith('select')
+        else:
+            write = isinstance(clauseelement, (sa.sql.expression.UpdateBase,
+                                               sa.schema.DDLElement))
+        if write:
+            self._thread_state.wrote = True
+
+    def _updateAdaptTask(self):
+        adaptive = self.running and self.max_size > self.size
+        if adaptive and not self._adapt_task:
+            self._adapt_task = task.LoopingCall(self._adapt)
+            self._adapt_task.start(self.ADAPT_INTERVAL, now=False)
+        elif not adaptive and self._adapt_task:
+            self._adapt_task.stop()
+            self._adapt_task = None
+
+    def _resetAdaptStats(self):
+        self._adapt_count = 0
+        self._adapt_wait_total = 0
+        self._adapt_exec_total = 0
+
+    def _adapt(self):
+        count = self._adapt_count
+        if count:
+            wait_mean = self._adapt_wait_total / count
+            exec_mean = self._adapt_exec_total / count
+        else:
+            wait_mean = exec_mean = 0
+        self._resetAdaptStats()
+
+        new_size = current = self.max
+        if wait_mean > self.ADAPT_WAIT_THRESHOLD:
+            saturated = (self._exec_mean_at_resize is not None
+                         and exec_mean > 2 * self._exec_mean_at_resize)
+            if saturated:
+                new_size = current - 1
+            else:
+                new_size = current + max(1, current // 2)
+        elif self.waiters and not self.q.qsize():
+            new_size = current - 1
+        new_size = max(self.size, min(self.max_size, new_size))
+
+        if new_size != current:
+            log.msg("DBThreadPool: resizing from %d to %d threads (mean "
+                    "queue wait %.3fs, mean execution time %.3fs)"
+                    % (current, new_size, wait_mean, exec_mean))
+            self.adjustPoolsize(maxthreads=new_size)
+            self._exec_mean_at_resize = exec_mean or None
+        metrics.MetricCountEvent.log('DBThreadPool.size', self.max,
+                                     absolute=True)
 
     def shutdown(self):
         """Manually stop the pool.  This is only necessary from tests, as the
@@ -172,12 +263,22 @@ class DBThreadPool(threadpool.ThreadPool):
     BACKOFF_MULT = 1.05
     MAX_OPERATIONALERROR_TIME = 3600 * 24  # one day
 
-    def __thd(self, with_engine, callable, args, kwargs):
+    def __thd(self, with_engine, callable, args, kwargs, times):
         # try to call callable(arg, *args, **kwargs) repeatedly until no
         # OperationalErrors occur, where arg is either the engine (with_engine)
         # or a connection (not with_engine)
         backoff = self.BACKOFF_START
-        start = time.time()
+        start = times[1] = time.time()
+        self._thread_state.wrote = False
+        try:
+            return self.__thd_retry(with_engine, callable, args, kwargs,
+                                    backoff, start)
+        finally:
+            times[2] = time.time()
+            times[3] = self._thread_state.wrote
+
+    def __thd_retry(self, with_engine, callable, args, kwargs, backoff,
+                    start):
         while True:
             if with_engine:
                 arg = self.engine
@@ -223,12 +324,43 @@ class DBThreadPool(threadpool.ThreadPool):
         return rv
 
     def do(self, callable, *args, **kwargs):
-        return threads.deferToThreadPool(reactor, self,
-                                         self.__thd, False, callable, args, kwargs)
+        return self.__defer(False, callable, args, kwargs)
 
     def do_with_engine(self, callable, *args, **kwargs):
-        return threads.deferToThreadPool(reactor, self,
-                                         self.__thd, True, callable, args, kwargs)
+        return self.__defer(True, callable, args, kwargs)
+
+    def __defer(self, with_engine, callable, args, kwargs):
+        # name the query after the callable and its module; most are nested
+        # functions named 'thd', so these are usually per-component
+        name = "%s.%s" % (
+            (getattr(callable, '__module__', None) or '').split('.')[-1],
+            getattr(callable, '__name__', type(callable).__name__))
+        # times the query was queued, started, and finished, and whether it
+        # wrote to the database
+        times = [time.time(), None, None, False]
+        d = threads.deferToThreadPool(reactor, self, self.__thd,
+                                      with_engine, callable, args, kwargs,
+                                      times)
+        d.addBoth(self.__recordTimes, name, times)
+        return d
+
+    def __recordTimes(self, res, name, times):
+        queued, started, finished, wrote = times
+        if wrote:
+            # the write is complete (committed or rolled back) by now, so
+            # anything read after this will see its effects
+            self.generation += 1
+        if started is not None and finished is not None:
+            wait = started - queued
+            elapsed = finished - started
+            metrics.MetricHistogramEvent.log(
+                'DBThreadPool.queue-wait.' + name, wait)
+            metrics.MetricHistogramEvent.log(
+                'DBThreadPool.exec-time.' + name, elapsed)
+            self._adapt_count += 1
+            self._adapt_wait_total += wait
+            self._adapt_exec_total += elapsed
+        return res
 
     def detect_bug1810(self):
         # detect buggy SQLite implementations; call only for a known-sqlite
@@ -0,0 +1,259 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import sqlalchemy as sa
+
+from buildbot.db import base
+from buildbot.process import metrics
+from twisted.internet import defer
+
+# the tables that pruneBuilder deletes from, in the order they are reported
+PRUNED_TABLES = ('builds', 'steps', 'logs', 'logchunks', 'buildrequests',
+                 'buildsets')
+
+# the number of ids given in each IN clause, well below SQLite's limit on the
+# number of parameters in a query
+IN_CLAUSE_SIZE = 100
+
+
+def _chunks(ids):
+    ids = list(ids)
+    while ids:
+        chunk, ids = ids[:IN_CLAUSE_SIZE], ids[IN_CLAUSE_SIZE:]
+        yield chunk
+
+
+class RetentionConnectorComponent(base.DBConnectorComponent):
+    # Deletes the history that lies beyond a builder's horizons: its oldest
+    # builds, with their steps and logs, beyond the build horizon; the logs of
+    # its builds beyond the log horizon; and the completed build requests and
+    # buildsets that are older than any build that is kept.  Rows are found
+    # through the tables' indexes, and deleted in batches, each in its own
+    # transaction, so that pruning a large history never holds locks for long.
+
+    def __init__(self, connector):
+        base.DBConnectorComponent.__init__(self, connector)
+        # builderid -> number of the newest build whose logs have been pruned,
+        # so that each pass only looks at builds that have crossed the log
+        # horizon since the last one
+        self._logsPrunedThrough = {}
+
+    @defer.inlineCallbacks
+    def pruneBuilder(self, builderid, buildername, buildHorizon=None,
+                     logHorizon=None, batchSize=100, dryRun=False):
+        """
+        Delete the history of the given builder that lies beyond its
+        horizons: the completed builds other than the newest C{buildHorizon},
+        with their steps, logs and log chunks; the logs and log chunks of the
+        completed builds other than the newest C{logHorizon}; and the
+        completed build requests older than the oldest build that is kept,
+        with their claims and, once all of their requests are gone, their
+        completed buildsets.  A horizon of None keeps everything.
+
+        Each batch of at most C{batchSize} builds or build requests is
+        deleted in a transaction of its own.  With C{dryRun}, nothing is
+        deleted, and the counts are of the rows that would be.
+
+        @returns: dictionary mapping each of L{PRUNED_TABLES} to the number of
+        rows deleted, via Deferred
+        """
+        counts = dict.fromkeys(PRUNED_TABLES, 0)
+
+        def add(batchCounts):
+            for table, count in batchCounts.iteritems():
+                counts[table] += count
+                if count and not dryRun:
+                    metrics.MetricCountEvent.log(
+                        'RetentionConnectorComponent.deleted.' + table, count)
+
+        buildCutoff = None
+        if buildHorizon is not None:
+            buildCutoff = yield self.db.pool.do(
+                self._findCutoff_thd, builderid, buildHorizon)
+            after = None
+            while buildCutoff is not None:
+                buildids, after = yield self.db.pool.do(
+                    self._nextBuilds_thd, builderid, after, buildCutoff,
+                    batchSize)
+                if not buildids:
+                    break
+                add((yield self.db.pool.do(
+                    self._pruneBuilds_thd, buildids, False, dryRun)))
+
+        if logHorizon is not None:
+            logCutoff = yield self.db.pool.do(
+                self._findCutoff_thd, builderid, logHorizon)
+            after = self._logsPrunedThrough.get(builderid)
+            # the builds up to the build cutoff are already gone
+            if buildCutoff is not None and (after is None
+                                            or after < buildCutoff):
+                after = buildCutoff
+            while logCutoff is not None:
+                buildids, last = yield self.db.pool.do(
+                    self._nextBuilds_thd, builderid, after, logCutoff,
+                    batchSize)
+                if not buildids:
+                    break
+                add((yield self.db.pool.do(
+                    self._pruneBuilds_thd, buildids, True, dryRun)))
+                after = last
+            # builds that were still running when they crossed the horizon
+            # are passed over, and keep their logs
+            if not dryRun and after is not None:
+                self._logsPrunedThrough[builderid] = after
+
+        if buildHorizon is not None:
+            beforeBrid = yield self.db.pool.do(
+                self._findRequestCutoff_thd, builderid, buildCutoff)
+            after = None
+            while beforeBrid is not None:
+                requests = yield self.db.pool.do(
+                    self._nextRequests_thd, buildername, after, beforeBrid,
+                    batchSize)
+                if not requests:
+                    break
+                add((yield self.db.pool.do(
+                    self._pruneRequests_thd, requests, dryRun)))
+                after = requests[-1][0]
+
+        defer.returnValue(counts)
+
+    def _findCutoff_thd(self, conn, builderid, horizon):
+        # return the number of the newest build beyond the horizon, or None
+        tbl = self.db.model.builds
+        q = sa.select([tbl.c.number],
+                      whereclause=(tbl.c.builderid == builderid),
+                      order_by=[sa.desc(tbl.c.number)],
+                      offset=horizon, limit=1)
+        row = conn.execute(q).fetchone()
+        return row.number if row else None
+
+    def _nextBuilds_thd(self, conn, builderid, after, through, limit):
+        # return the ids of the next batch of completed builds numbered from
+        # after (exclusive) to through (inclusive), and the number of the last
+        tbl = self.db.model.builds
+        whereclause = ((tbl.c.builderid == builderid)
+                       & (tbl.c.number <= through)
+                       & (tbl.c.complete_at != None))
+        if after is not None:
+            whereclause &= (tbl.c.number > after)
+        q = sa.select([tbl.c.id, tbl.c.number], whereclause=whereclause,
+                      order_by=[tbl.c.number], limit=limit)
+        rows = conn.execute(q).fetchall()
+        if not rows:
+            return [], after
+        return [row.id for row in rows], rows[-1].number
+
+    def _findRequestCutoff_thd(self, conn, builderid, buildCutoff):
+        # return the id of the oldest build request with a build that is kept,
+        # or None if no builds are kept
+        tbl = self.db.model.builds
+        whereclause = (tbl.c.builderid == builderid)
+        if buildCutoff is not None:
+            whereclause &= ((tbl.c.number > buildCutoff)
+                            | (tbl.c.complete_at == None))
+        q = sa.select([sa.func.min(tbl.c.buildrequestid)],
+                      whereclause=whereclause)
+        return conn.execute(q).scalar()
+
+    def _nextRequests_thd(self, conn, buildername, after, before, limit):
+        tbl = self.db.model.buildrequests
+        whereclause = ((tbl.c.buildername == buildername)
+                       & (tbl.c.complete == 1)
+                       & (tbl.c.id < before))
+        if after is not None:
+            whereclause &= (tbl.c.id > after)
+        q = sa.select([tbl.c.id, tbl.c.buildsetid], whereclause=whereclause,
+                      order_by=[tbl.c.id], limit=limit)
+        return [tuple(row) for row in conn.execute(q)]
+
+    def _selectIds_thd(self, conn, idColumn, column, values):
+        ids = []
+        for chunk in _chunks(values):
+            q = sa.select([idColumn], whereclause=column.in_(chunk))
+            ids.extend(row[0] for row in conn.execute(q))
+        return ids
+
+    def _delete_thd(self, conn, table, column, values, dryRun):
+        count = 0
+        for chunk in _chunks(values):
+            if dryRun:
+                q = sa.select([sa.func.count()], from_obj=[table],
+                              whereclause=column.in_(chunk))
+                count += conn.execute(q).scalar()
+            else:
+                res = conn.execute(table.delete(whereclause=column.in_(chunk)))
+                count += res.rowcount
+        return count
+
+    def _pruneBuilds_thd(self, conn, buildids, logsOnly, dryRun):
+        model = self.db.model
+        counts = {}
+        transaction = conn.begin()
+        stepids = self._selectIds_thd(conn, model.steps.c.id,
+                                      model.steps.c.buildid, buildids)
+        logids = self._selectIds_thd(conn, model.logs.c.id,
+                                     model.logs.c.stepid, stepids)
+        counts['logchunks'] = self._delete_thd(
+            conn, model.logchunks, model.logchunks.c.logid, logids, dryRun)
+        counts['logs'] = self._delete_thd(
+            conn, model.logs, model.logs.c.id, logids, dryRun)
+        if not logsOnly:
+            counts['steps'] = self._delete_thd(
+                conn, model.steps, model.steps.c.id, stepids, dryRun)
+            if not dryRun:
+                # buildsets triggered by these builds outlive them
+                for chunk in _chunks(buildids):
+                    conn.execute(model.buildsets.update(
+                        whereclause=model.buildsets.c.parent_buildid.in_(
+                            chunk)), parent_buildid=None)
+            counts['builds'] = self._delete_thd(
+                conn, model.builds, model.builds.c.id, buildids, dryRun)
+        transaction.commit()
+        return counts
+
+    def _pruneRequests_thd(self, conn, requests, dryRun):
+        model = self.db.model
+        brids = [brid for brid, bsid in requests]
+        bsids = set(bsid for brid, bsid in requests)
+        transaction = conn.begin()
+        self._delete_thd(conn, model.buildrequest_claims,
+                         model.buildrequest_claims.c.brid, brids, dryRun)
+        counts = dict(buildrequests=self._delete_thd(
+            conn, model.buildrequests, model.buildrequests.c.id, brids,
+            dryRun))
+
+        # buildsets that have no other requests left, and are complete
+        tbl = model.buildrequests
+        pruned = set(brids)
+        remaining = set()
+        for chunk in _chunks(bsids):
+            q = sa.select([tbl.c.id, tbl.c.buildsetid],
+                          whereclause=tbl.c.buildsetid.in_(chunk))
+            remaining.update(row.buildsetid for row in conn.execute(q)
+                             if row.id not in pruned)
+        tbl = model.buildsets
+        done = []
+        for chunk in _chunks(bsids - remaining):
+            q = sa.select([tbl.c.id],
+                          whereclause=(tbl.c.id.in_(chunk)
+                                       & (tbl.c.complete == 1)))
+            done.extend(row.id for row in conn.execute(q))
+        for table in model.buildset_properties, model.buildset_sourcestamps:
+            self._delete_thd(conn, table, table.c.buildsetid, done, dryRun)
+        counts['buildsets'] = self._delete_thd(
+            conn, model.buildsets, model.buildsets.c.id, done, dryRun)
+        transaction.commit()
+        return counts
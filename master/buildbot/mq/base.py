@@ -36,15 +36,18 @@ class QueueRef(object):
     def invoke(self, routing_key, data):
         if not self.callback:
             return
-
-        try:
-            x = self.callback(routing_key, data)
-        except Exception:
-            log.err(failure.Failure(), 'while invoking %r' % (self.callback,))
-            return
-        if isinstance(x, defer.Deferred):
-            x.addErrback(log.err, 'while invoking %r' % (self.callback,))
+        invokeCallback(self.callback, routing_key, data)
 
     def stopConsuming(self):
         # subclasses should set self.callback to None in this method
         raise NotImplementedError
+
+
+def invokeCallback(callback, routing_key, data):
+    try:
+        x = callback(routing_key, data)
+    except Exception:
+        log.err(failure.Failure(), 'while invoking %r' % (callback,))
+        return
+    if isinstance(x, defer.Deferred):
+        x.addErrback(log.err, 'while invoking %r' % (callback,))
@@ -23,7 +23,8 @@ class MQConnector(config.ReconfigurableServiceMixin, service.AsyncMultiService):
     classes = {
         'simple': {
             'class': "buildbot.mq.simple.SimpleMQ",
-            'keys': set(['debug']),
+            'keys': set(['debug', 'persistent_queue_size',
+                         'persistent_queue_dir']),
         },
     }
 
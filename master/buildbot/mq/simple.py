@@ -13,10 +13,13 @@
 #
 # Copyright Buildbot Team Members
 
+import cPickle
 import pprint
+import tempfile
 
 from buildbot import config
 from buildbot.mq import base
+from buildbot.process import metrics
 from buildbot.util import tuplematch
 from twisted.internet import defer
 from twisted.python import log
@@ -24,23 +27,33 @@ from twisted.python import log
 
 class SimpleMQ(config.ReconfigurableServiceMixin, base.MQBase):
 
+    # number of messages a stopped persistent consumer keeps in memory, by
+    # default; further messages are spilled to a file
+    DEFAULT_PERSISTENT_QUEUE_SIZE = 10000
+
     def __init__(self, master):
         base.MQBase.__init__(self, master)
-        self.qrefs = []
+        self.qrefs = tuplematch.FilterIndex()
         self.persistent_qrefs = {}
         self.debug = False
+        self.persistent_queue_size = self.DEFAULT_PERSISTENT_QUEUE_SIZE
+        self.persistent_queue_dir = None
 
     def reconfigService(self, new_config):
         self.debug = new_config.mq.get('debug', False)
+        self.persistent_queue_size = new_config.mq.get(
+            'persistent_queue_size', self.DEFAULT_PERSISTENT_QUEUE_SIZE)
+        # the basedir is also the default when the key is given as None
+        self.persistent_queue_dir = (new_config.mq.get('persistent_queue_dir')
+                                     or self.master.basedir)
         return config.ReconfigurableServiceMixin.reconfigService(self,
                                                                  new_config)
 
     def produce(self, routingKey, data):
         if self.debug:
             log.msg("MSG: %s\n%s" % (routingKey, pprint.pformat(data)))
-        for qref in self.qrefs:
-            if tuplematch.matchTuple(routingKey, qref.filter):
-                qref.invoke(routingKey, data)
+        for qref in self.qrefs.match(routingKey):
+            qref.invoke(routingKey, data)
 
     def startConsuming(self, callback, filter, persistent_name=None):
         if persistent_name:
@@ -48,12 +61,13 @@ class SimpleMQ(config.ReconfigurableServiceMixin, base.MQBase):
                 qref = self.persistent_qrefs[persistent_name]
                 qref.startConsuming(callback)
             else:
-                qref = PersistentQueueRef(self, callback, filter)
-                self.qrefs.append(qref)
+                qref = PersistentQueueRef(self, callback, filter,
+                                          persistent_name)
+                self.qrefs.add(filter, qref)
                 self.persistent_qrefs[persistent_name] = qref
         else:
             qref = QueueRef(self, callback, filter)
-            self.qrefs.append(qref)
+            self.qrefs.add(filter, qref)
         return defer.succeed(qref)
 
 
@@ -68,32 +82,80 @@ class QueueRef(base.QueueRef):
 
     def stopConsuming(self):
         self.callback = None
-        try:
-            self.mq.qrefs.remove(self)
-        except ValueError:
-            pass
+        self.mq.qrefs.remove(self.filter, self)
 
 
 class PersistentQueueRef(QueueRef):
 
-    __slots__ = ['active', 'queue']
+    """
+    A queue that keeps the messages that arrive while its consumer is
+    stopped, and delivers them in order when consuming starts again.  The
+    first C{mq.persistent_queue_size} messages are kept in memory; any more
+    are appended to a temporary file in C{mq.persistent_queue_dir}.
 
-    def __init__(self, mq, callback, filter):
+    The number of messages queued and the number of bytes spilled to the
+    file are published as the C{SimpleMQ.<name>.queued} and
+    C{SimpleMQ.<name>.spilled_bytes} metrics.
+    """
+
+    __slots__ = ['active', 'name', 'queue', 'spool', 'spooled']
+
+    def __init__(self, mq, callback, filter, name):
         QueueRef.__init__(self, mq, callback, filter)
+        self.name = name
         self.queue = []
+        self.spool = None
+        self.spooled = 0
 
     def startConsuming(self, callback):
+        # invoke for every message that was missed, including those that
+        # arrive meanwhile, before invoking the callback directly
+        while self.queue or self.spool:
+            for routingKey, data in self._takeQueued():
+                base.invokeCallback(callback, routingKey, data)
+
         self.callback = callback
         self.active = True
-
-        # invoke for every message that was missed
-        queue, self.queue = self.queue, []
-        for routingKey, data in queue:
-            self.invoke(routingKey, data)
+        metrics.MetricCountEvent.log('SimpleMQ.%s.queued' % (self.name,),
+                                     0, absolute=True)
+        metrics.MetricCountEvent.log('SimpleMQ.%s.spilled_bytes'
+                                     % (self.name,), 0, absolute=True)
 
     def stopConsuming(self):
         self.callback = self.addToQueue
         self.active = False
 
     def addToQueue(self, routingKey, data):
-        self.queue.append((routingKey, data))
+        if self.spool is None and \
+                len(self.queue) < self.mq.persistent_queue_size:
+            self.queue.append((routingKey, data))
+        else:
+            # once spilling, every message goes to the file, to keep them
+            # in order
+            if self.spool is None:
+                self.spool = tempfile.TemporaryFile(
+                    prefix='mq-', dir=self.mq.persistent_queue_dir)
+            start = self.spool.tell()
+            cPickle.dump((routingKey, data), self.spool,
+                         cPickle.HIGHEST_PROTOCOL)
+            self.spooled += 1
+            metrics.MetricCountEvent.log('SimpleMQ.%s.spilled_bytes'
+                                         % (self.name,),
+                                         self.spool.tell() - start)
+        metrics.MetricCountEvent.log('SimpleMQ.%s.queued' % (self.name,), 1)
+
+    def _takeQueued(self):
+        # yield the queued messages, in order, leaving the queue empty; the
+        # spilled messages are read back one at a time
+        queue, self.queue = self.queue, []
+        spool, self.spool = self.spool, None
+        spooled, self.spooled = self.spooled, 0
+        for msg in queue:
+            yield msg
+        if spool:
+            try:
+                spool.seek(0)
+                for _ in xrange(spooled):
+                    yield cPickle.load(spool)
+            finally:
+                spool.close()
@@ -18,7 +18,6 @@ import weakref
 
 from buildbot import config
 from buildbot import interfaces
-from buildbot.data import resultspec
 from buildbot.process import buildrequest
 from buildbot.process import slavebuilder
 from buildbot.process.build import Build
@@ -144,21 +143,6 @@ class Builder(config.ReconfigurableServiceMixin,
             return builderid
         return d
 
-    @defer.inlineCallbacks
-    def getOldestRequestTime(self):
-        """Returns the submitted_at of the oldest unclaimed build request for
-        this builder, or None if there are no build requests.
-
-        @returns: datetime instance or None, via Deferred
-        """
-        unclaimed = yield self.master.data.get(('builders', ascii2unicode(self.name), 'buildrequests'),
-                                               [resultspec.Filter('claimed', 'eq', [False])])
-        if unclaimed:
-            unclaimed = sorted([brd['submitted_at'] for brd in unclaimed])
-            defer.returnValue(unclaimed[0])
-        else:
-            defer.returnValue(None)
-
     def reclaimAllBuilds(self):
         brids = set()
         for b in self.building:
@@ -335,6 +335,12 @@ class BuildRequestDistributor(service.AsyncService):
         self.activity_lock = defer.DeferredLock()
         self.active = False
 
+        # builders that are currently starting builds, mapping each name to a
+        # tuple (Deferred that fires when done, set of slave names)
+        self._activeBuilders = {}
+        # fired to make a waiting activity loop look for more work
+        self._activityWakeup = None
+
         self._pendingMSBOCalls = []
 
     @defer.inlineCallbacks
@@ -345,6 +351,11 @@ class BuildRequestDistributor(service.AsyncService):
         # self.running is false.
         yield self.activity_lock.run(service.AsyncService.stopService, self)
 
+        # let any builders that are already starting builds finish
+        if self._activeBuilders:
+            yield defer.DeferredList(
+                [d for d, _ in self._activeBuilders.values()])
+
         # now let any outstanding calls to maybeStartBuildsOn to finish, so
         # they don't get interrupted in mid-stride.  This tends to be
         # particularly painful because it can occur when a generator is gc'd.
@@ -398,6 +409,8 @@ class BuildRequestDistributor(service.AsyncService):
                 # working on that.
                 if not self.active:
                     self._activityLoop()
+                else:
+                    self._wakeActivityLoop()
             except Exception:
                 log.err(Failure(),
                         "while attempting to start builds on %s" % self.name)
@@ -409,17 +422,13 @@ class BuildRequestDistributor(service.AsyncService):
     def _defaultSorter(self, master, builders):
         timer = metrics.Timer("BuildRequestDistributor._defaultSorter()")
         timer.start()
-        # perform an asynchronous schwarzian transform, transforming None
-        # into sys.maxint so that it sorts to the end
-
-        def xform(bldr):
-            d = defer.maybeDeferred(lambda:
-                                    bldr.getOldestRequestTime())
-            d.addCallback(lambda time:
-                          (((time is None) and None or time), bldr))
-            return d
-        xformed = yield defer.gatherResults(
-            [xform(bldr) for bldr in builders])
+        # fetch the oldest unclaimed request time for every builder in a
+        # single query, rather than querying each builder in turn, then
+        # perform a schwarzian transform, leaving None for builders with no
+        # unclaimed requests
+        oldest = yield master.db.buildrequests.getOldestRequestTimes(
+            [bldr.name for bldr in builders])
+        xformed = [(oldest.get(bldr.name), bldr) for bldr in builders]
 
         # sort the transformed list synchronously, comparing None to the end of
         # the list
@@ -478,23 +487,38 @@ class BuildRequestDistributor(service.AsyncService):
             # lock pending_builders, pop an element from it, and release
             yield self.pending_builders_lock.acquire()
 
-            # bail out if we shouldn't keep looping
-            if not self.running or not self._pending_builders:
+            # bail out if we shouldn't keep looping, once any builders that
+            # are already running are finished
+            if not self._activeBuilders and \
+                    (not self.running or not self._pending_builders):
                 self.pending_builders_lock.release()
                 self.activity_lock.release()
                 break
 
-            bldr_name = self._pending_builders.pop(0)
+            next_builder = None
+            if self.running:
+                next_builder = self._popNextBuilder()
             self.pending_builders_lock.release()
 
-            # get the actual builder object
-            bldr = self.botmaster.builders.get(bldr_name)
-            try:
-                if bldr:
-                    yield self._maybeStartBuildsOnBuilder(bldr)
-            except Exception:
-                log.err(Failure(),
-                        "from maybeStartBuild for builder '%s'" % (bldr_name,))
+            if next_builder is None:
+                # wait for a builder to finish, or for more pending builders
+                self._activityWakeup = defer.Deferred()
+                waits = [d for d, _ in self._activeBuilders.itervalues()]
+                self.activity_lock.release()
+                yield defer.DeferredList(waits + [self._activityWakeup],
+                                         fireOnOneCallback=True)
+                self._activityWakeup = None
+                continue
+
+            bldr_name, slavenames = next_builder
+            done = defer.Deferred()
+            self._activeBuilders[bldr_name] = (done, slavenames)
+            d = self._startBuildsOnBuilderNamed(bldr_name)
+
+            @d.addCallback
+            def finished(_, bldr_name=bldr_name, done=done):
+                del self._activeBuilders[bldr_name]
+                done.callback(None)
 
             self.activity_lock.release()
 
@@ -503,6 +527,51 @@ class BuildRequestDistributor(service.AsyncService):
         self.active = False
         self._quiet()
 
+    def _popNextBuilder(self):
+        # return the name and slavenames of the highest-priority pending
+        # builder that can start builds now, or None; call this with
+        # pending_builders_lock held
+        concurrency = self.master.config.builderDistributionConcurrency
+        if len(self._activeBuilders) >= concurrency:
+            return None
+        if concurrency == 1:
+            return self._pending_builders.pop(0), frozenset()
+
+        busy_slaves = set()
+        for _, slavenames in self._activeBuilders.itervalues():
+            busy_slaves.update(slavenames)
+        for i, bldr_name in enumerate(self._pending_builders):
+            slavenames = self._getSlavenames(bldr_name)
+            if bldr_name not in self._activeBuilders \
+                    and not slavenames & busy_slaves:
+                del self._pending_builders[i]
+                return bldr_name, slavenames
+            # keep lower-priority builders from taking this builder's slaves
+            busy_slaves.update(slavenames)
+        return None
+
+    def _getSlavenames(self, bldr_name):
+        bldr = self.botmaster.builders.get(bldr_name)
+        if not bldr:
+            return frozenset()
+        return frozenset(bldr.config.slavenames)
+
+    def _wakeActivityLoop(self):
+        if self._activityWakeup:
+            d, self._activityWakeup = self._activityWakeup, None
+            d.callback(None)
+
+    @defer.inlineCallbacks
+    def _startBuildsOnBuilderNamed(self, bldr_name):
+        # get the actual builder object
+        bldr = self.botmaster.builders.get(bldr_name)
+        try:
+            if bldr:
+                yield self._maybeStartBuildsOnBuilder(bldr)
+        except Exception:
+            log.err(Failure(),
+                    "from maybeStartBuild for builder '%s'" % (bldr_name,))
+
     @defer.inlineCallbacks
     def _maybeStartBuildsOnBuilder(self, bldr, _reactor=reactor):
         # create a chooser to give us our next builds
@@ -514,6 +583,7 @@ class BuildRequestDistributor(service.AsyncService):
             slave, breqs = yield bc.chooseNextBuild()
             if not slave or not breqs:
                 break
+            chosen_at = _reactor.seconds()
 
             # claim brid's
             brids = [br.id for br in breqs]
@@ -525,17 +595,16 @@ class BuildRequestDistributor(service.AsyncService):
                 bc = self.createBuildChooser(bldr, self.master)
                 continue
 
-            # the claim was successful, so publish a message for each brid
-            for brid in brids:
-                # TODO: inefficient..
-                brdict = yield self.master.db.buildrequests.getBuildRequest(brid)
-                key = ('buildsets', str(brdict['buildsetid']),
+            # the claim was successful, so publish a message for each brid;
+            # the chooser has already loaded everything we need
+            for breq in breqs:
+                key = ('buildsets', str(breq.bsid),
                        'builders', str(-1),
-                       'buildrequests', str(brdict['buildrequestid']), 'claimed')
+                       'buildrequests', str(breq.id), 'claimed')
                 msg = dict(
-                    bsid=brdict['buildsetid'],
-                    brid=brdict['buildrequestid'],
-                    buildername=brdict['buildername'],
+                    bsid=breq.bsid,
+                    brid=breq.id,
+                    buildername=ascii2unicode(breq.buildername),
                     builderid=-1,
                     # TODO:
                     # claimed_at=claimed_at_epoch,
@@ -545,16 +614,20 @@ class BuildRequestDistributor(service.AsyncService):
 
             buildStarted = yield bldr.maybeStartBuild(slave, breqs)
 
-            if not buildStarted:
+            if buildStarted:
+                metrics.MetricTimeEvent.log(
+                    'BuildRequestDistributor.chosenToStarted',
+                    _reactor.seconds() - chosen_at)
+            else:
                 yield self.master.data.updates.unclaimBuildRequests(brids)
 
                 for breq in breqs:
                     bsid = breq.bsid
                     buildername = ascii2unicode(breq.buildername)
                     brid = breq.id
-                    key = ('buildsets', str(brdict['buildsetid']),
+                    key = ('buildsets', str(bsid),
                            'builders', str(-1),
-                           'buildrequests', str(brdict['buildrequestid']), 'unclaimed')
+                           'buildrequests', str(brid), 'unclaimed')
                     msg = dict(brid=brid, bsid=bsid, buildername=buildername,
                                builderid=-1)
                     self.master.mq.produce(key, msg)
@@ -13,9 +13,38 @@
 #
 # Copyright Buildbot Team Members
 
+import sys
+
 from buildbot import config
 from buildbot.util import lru
 from buildbot.util import service
+from itertools import islice
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.python import log
+
+_containers = (dict, list, tuple, set, frozenset)
+
+
+def _sizeOf(obj, seen, top=True):
+    """
+    Estimate the memory used by C{obj}, including the contents of containers
+    and, for the top-level object only, its instance attributes.  Other
+    objects it refers to are likely shared, so they are not counted.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        for k, v in obj.iteritems():
+            size += _sizeOf(k, seen, False) + _sizeOf(v, seen, False)
+    elif isinstance(obj, _containers):
+        for v in obj:
+            size += _sizeOf(v, seen, False)
+    elif top and hasattr(obj, '__dict__'):
+        size += _sizeOf(obj.__dict__, seen, False)
+    return size
 
 
 class CacheManager(config.ReconfigurableServiceMixin, service.AsyncService):
@@ -33,10 +62,27 @@ class CacheManager(config.ReconfigurableServiceMixin, service.AsyncService):
     # miss function; and it will optimize repeated fetches of the same object.
     DEFAULT_CACHE_SIZE = 1
 
+    # number of entries sampled to estimate the memory used by a cache
+    MEMORY_SAMPLE_SIZE = 10
+
+    # auto-tuning only judges a cache's hit rate over at least this many
+    # lookups, and only keeps a larger size if it improved the hit rate by at
+    # least AUTOTUNE_MIN_IMPROVEMENT
+    AUTOTUNE_MIN_LOOKUPS = 100
+    AUTOTUNE_MIN_IMPROVEMENT = 0.01
+
+    # for tests
+    _reactor = reactor
+
     def __init__(self):
         self.setName('caches')
         self.config = {}
         self._caches = {}
+        self.autotune_config = None
+        self.autotune_task = None
+        # sizes chosen by auto-tuning, and its state for each cache
+        self._tuned = {}
+        self._tuning = {}
 
     def get_cache(self, cache_name, miss_fn):
         """
@@ -54,22 +100,142 @@ class CacheManager(config.ReconfigurableServiceMixin, service.AsyncService):
         try:
             return self._caches[cache_name]
         except KeyError:
-            max_size = self.config.get(cache_name, self.DEFAULT_CACHE_SIZE)
+            max_size = self._max_size(cache_name)
             assert max_size >= 1
             c = self._caches[cache_name] = lru.AsyncLRUCache(miss_fn, max_size)
             return c
 
+    def _max_size(self, cache_name):
+        return max(self.config.get(cache_name, self.DEFAULT_CACHE_SIZE),
+                   self._tuned.get(cache_name, 0))
+
     def reconfigService(self, new_config):
         self.config = new_config.caches
+        # start tuning afresh, keeping the sizes that were chosen so far
+        # unless auto-tuning is disabled
+        self._tuning = {}
+        if not new_config.cacheAutoTune:
+            self._tuned = {}
         for name, cache in self._caches.iteritems():
-            cache.set_max_size(new_config.caches.get(name,
-                                                     self.DEFAULT_CACHE_SIZE))
+            cache.set_max_size(self._max_size(name))
+        self._reconfigAutoTune(new_config.cacheAutoTune)
 
         return config.ReconfigurableServiceMixin.reconfigService(self,
                                                                  new_config)
 
+    def _reconfigAutoTune(self, autotune_config):
+        interval = autotune_config and autotune_config['interval']
+        if self.autotune_task and self.autotune_task.interval != interval:
+            self.autotune_task.stop()
+            self.autotune_task = None
+        self.autotune_config = autotune_config
+        if interval and not self.autotune_task:
+            self.autotune_task = LoopingCall(self.autotune)
+            self.autotune_task.clock = self._reactor
+            # the first run needs a baseline to compare against
+            self.autotune_task.start(interval, now=False)
+
+    def stopService(self):
+        if self.autotune_task:
+            self.autotune_task.stop()
+            self.autotune_task = None
+        return service.AsyncService.stopService(self)
+
+    def estimate_memory(self, cache):
+        """
+        Estimate the memory, in bytes, used by the entries of the given
+        cache, from the size of a sample of them.
+        """
+        size = len(cache.cache)
+        if not size:
+            return 0
+        sample = list(islice(cache.cache.itervalues(),
+                             self.MEMORY_SAMPLE_SIZE))
+        total = sum(_sizeOf(v, set()) for v in sample)
+        return total * size // len(sample)
+
     def get_metrics(self):
-        return dict([
-            (n, dict(hits=c.hits, refhits=c.refhits,
-                     misses=c.misses, max_size=c.max_size))
-            for n, c in self._caches.iteritems()])
+        metrics = {}
+        for n, c in self._caches.iteritems():
+            if c.fetches:
+                miss_latency = c.fetch_time / c.fetches
+            else:
+                miss_latency = None
+            metrics[n] = dict(hits=c.hits, refhits=c.refhits,
+                              misses=c.misses, max_size=c.max_size,
+                              size=len(c.cache), evictions=c.evictions,
+                              miss_latency=miss_latency,
+                              memory=self.estimate_memory(c))
+        return metrics
+
+    def autotune(self):
+        """
+        Adjust the cache sizes, within C{c['cacheAutoTune']['memory_budget']}:
+        a full cache with misses is doubled in size, and keeps its new size
+        only if its hit rate improves.  Caches never shrink below their
+        configured size.
+        """
+        budget = self.autotune_config['memory_budget']
+        memory = dict((n, self.estimate_memory(c))
+                      for n, c in self._caches.iteritems())
+
+        candidates = []
+        for name, c in sorted(self._caches.iteritems()):
+            state = self._tuning.setdefault(
+                name, dict(lookups=0, hits=0, rate=None, grown_from=None,
+                           settled=False))
+            hits = c.hits + c.refhits
+            lookups = hits + c.misses
+            if lookups - state['lookups'] < self.AUTOTUNE_MIN_LOOKUPS:
+                continue
+            rate = float(hits - state['hits']) / (lookups - state['lookups'])
+            state.update(lookups=lookups, hits=hits)
+
+            if state['grown_from'] is not None:
+                if rate < state['rate'] + self.AUTOTUNE_MIN_IMPROVEMENT:
+                    # growing did not help, so give the memory back
+                    self._resize(name, state['grown_from'])
+                    state['settled'] = True
+                    memory[name] = self.estimate_memory(c)
+                    continue
+                state['grown_from'] = None
+            state['rate'] = rate
+
+            if not state['settled'] and rate < 1.0 \
+                    and len(c.cache) >= c.max_size:
+                candidates.append((rate, name))
+
+        total = sum(memory.itervalues())
+        if total > budget:
+            # shrink the caches that were grown, largest first
+            for name in sorted(self._tuned, key=memory.get, reverse=True):
+                if total <= budget:
+                    break
+                c = self._caches[name]
+                size = max(c.max_size // 2,
+                           self.config.get(name, self.DEFAULT_CACHE_SIZE))
+                self._resize(name, size)
+                self._tuning[name]['grown_from'] = None
+                new_memory = self.estimate_memory(c)
+                total -= memory[name] - new_memory
+                memory[name] = new_memory
+            return
+
+        # grow the caches with the lowest hit rates first
+        for rate, name in sorted(candidates):
+            c = self._caches[name]
+            entry_size = memory[name] // max(len(c.cache), 1)
+            growth = entry_size * c.max_size
+            if total + growth > budget:
+                continue
+            total += growth
+            self._tuning[name]['grown_from'] = c.max_size
+            self._resize(name, c.max_size * 2)
+
+    def _resize(self, name, size):
+        log.msg("auto-tuning: setting size of cache %r to %d" % (name, size))
+        if size > self.config.get(name, self.DEFAULT_CACHE_SIZE):
+            self._tuned[name] = size
+        else:
+            self._tuned.pop(name, None)
+        self._caches[name].set_max_size(size)
@@ -161,7 +161,7 @@ class StreamLog(Log):
                 self.subPoint.deliver(stream, lines)
                 # strip the last character, as the regexp will add a
                 # prefix character after the trailing newline
-                self.addRawLines(self.pat.sub(stream, lines)[:-1])
+                return self.addRawLines(self.pat.sub(stream, lines)[:-1])
             lbf = self.lbfs[stream] = \
                 lineboundaries.LineBoundaryFinder(wholeLines)
             return lbf
@@ -43,6 +43,7 @@ from twisted.internet import reactor
 from twisted.internet.task import LoopingCall
 from twisted.python import log
 
+import bisect
 import gc
 import os
 import sys
@@ -75,6 +76,13 @@ class MetricTimeEvent(MetricEvent):
         self.timer = timer
         self.elapsed = elapsed
 
+
+class MetricHistogramEvent(MetricEvent):
+
+    def __init__(self, histogram, value):
+        self.histogram = histogram
+        self.value = value
+
 ALARM_OK, ALARM_WARN, ALARM_CRIT = range(3)
 ALARM_TEXT = ["OK", "WARN", "CRIT"]
 
@@ -174,6 +182,52 @@ class AveragingFiniteList(FiniteList):
         return self.average
 
 
+class Histogram(object):
+
+    """Counts of values falling into each of a fixed set of buckets, suited
+    to durations in seconds.  Unlike L{AveragingFiniteList}, this summarizes
+    every value since the last reset, and shows the spread as well as the
+    average."""
+
+    # upper bounds of the buckets; the last bucket holds everything larger
+    bounds = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+              1, 2, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0
+
+    def percentile(self, pct):
+        """Return the upper bound of the bucket holding the given percentile
+        of the values, or the largest value if that is smaller."""
+        if not self.count:
+            return 0
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen * 100 >= self.count * pct:
+                return min(bound, self.max)
+        return self.max
+
+    def asDict(self):
+        return dict(count=self.count, mean=self.mean, max=self.max,
+                    p50=self.percentile(50), p90=self.percentile(90),
+                    p99=self.percentile(99),
+                    buckets=zip(self.bounds + (None,), self.buckets))
+
+
 class MetricHandler(object):
 
     def __init__(self, metrics):
@@ -267,6 +321,38 @@ class MetricTimeHandler(MetricHandler):
         return dict(timers=retval)
 
 
+class MetricHistogramHandler(MetricHandler):
+    _histograms = None
+
+    def reset(self):
+        self._histograms = defaultdict(Histogram)
+
+    def handle(self, eventDict, metric):
+        self._histograms[metric.histogram].add(metric.value)
+
+    def keys(self):
+        return self._histograms.keys()
+
+    def get(self, histogram):
+        return self._histograms[histogram]
+
+    def report(self):
+        retval = []
+        for name in sorted(self.keys()):
+            h = self.get(name)
+            retval.append("Histogram %s: count %d, mean %.3g, p50 %.3g, "
+                          "p90 %.3g, p99 %.3g, max %.3g"
+                          % (name, h.count, h.mean, h.percentile(50),
+                             h.percentile(90), h.percentile(99), h.max))
+        return "\n".join(retval)
+
+    def asDict(self):
+        retval = {}
+        for name in sorted(self.keys()):
+            retval[name] = self.get(name).asDict()
+        return dict(histograms=retval)
+
+
 class MetricAlarmHandler(MetricHandler):
     _alarms = None
 
@@ -370,6 +456,19 @@ def periodicCheck(_reactor=reactor):
         log.err(None, "while collecting VM metrics")
 
 
+def cacheCheck(caches):
+    # publish the metrics of each of the master's caches as counters named
+    # 'caches.<cache name>.<metric>'
+    try:
+        for name, cache_metrics in caches.get_metrics().iteritems():
+            for metric, value in cache_metrics.iteritems():
+                if value is not None:
+                    MetricCountEvent.log('caches.%s.%s' % (name, metric),
+                                         value, absolute=True)
+    except Exception:
+        log.err(None, "while collecting cache metrics")
+
+
 class MetricLogObserver(config.ReconfigurableServiceMixin,
                         service.MultiService):
     _reactor = reactor
@@ -390,6 +489,8 @@ class MetricLogObserver(config.ReconfigurableServiceMixin,
         # Register our default handlers
         self.registerHandler(MetricCountEvent, MetricCountHandler(self))
         self.registerHandler(MetricTimeEvent, MetricTimeHandler(self))
+        self.registerHandler(MetricHistogramEvent,
+                             MetricHistogramHandler(self))
         self.registerHandler(MetricAlarmEvent, MetricAlarmHandler(self))
 
         self.getHandler(MetricCountEvent).addWatcher(
@@ -422,8 +523,7 @@ class MetricLogObserver(config.ReconfigurableServiceMixin,
                     self.periodic_task.stop()
                     self.periodic_task = None
                 if periodic_interval:
-                    self.periodic_task = LoopingCall(periodicCheck,
-                                                     self._reactor)
+                    self.periodic_task = LoopingCall(self.periodicCheck)
                     self.periodic_task.clock = self._reactor
                     self.periodic_task.start(periodic_interval)
 
@@ -435,6 +535,11 @@ class MetricLogObserver(config.ReconfigurableServiceMixin,
         self.disable()
         service.MultiService.stopService(self)
 
+    def periodicCheck(self):
+        periodicCheck(self._reactor)
+        if self.parent is not None:
+            cacheCheck(self.parent.caches)
+
     def enable(self):
         if self.enabled:
             return
@@ -13,6 +13,8 @@
 #
 # Copyright Buildbot Team Members
 
+import zlib
+
 from buildbot import util
 from buildbot.process import metrics
 from buildbot.status.results import FAILURE
@@ -24,6 +26,10 @@ from twisted.python import log
 from twisted.python.failure import Failure
 from twisted.spread import pb
 
+# slaves with at least this command version accept an 'update_compression'
+# argument for any command, and compress the strings in its updates
+COMPRESSED_UPDATES_VERSION = "2.19"
+
 
 class RemoteCommand(pb.Referenceable):
 
@@ -34,6 +40,10 @@ class RemoteCommand(pb.Referenceable):
     rc = None
     debug = False
 
+    # the compression method for updates that is asked of slaves that support
+    # it, or None to never ask for compression
+    updateCompression = 'zlib'
+
     def __init__(self, remote_command, args, ignore_updates=False,
                  collectStdout=False, collectStderr=False, decodeRC={0: SUCCESS},
                  stdioLogName='stdio'):
@@ -52,6 +62,7 @@ class RemoteCommand(pb.Referenceable):
         self.args = args
         self.ignore_updates = ignore_updates
         self.decodeRC = decodeRC
+        self._decompressor = None
 
     def __repr__(self):
         return "<RemoteCommand '%s' at %d>" % (self.remote_command, id(self))
@@ -105,9 +116,16 @@ class RemoteCommand(pb.Referenceable):
         # We will receive remote_update messages as the command runs.
         # We will get a single remote_complete when it finishes.
         # We should fire self.deferred when the command is done.
+        args = self.args
+        if self.updateCompression and not self.step.slaveVersionIsOlderThan(
+                self.remote_command, COMPRESSED_UPDATES_VERSION):
+            # the slave compresses the strings in this command's updates
+            # with a stream of its own, which _decompressUpdate follows
+            args = dict(args, update_compression=self.updateCompression)
+            self._decompressor = zlib.decompressobj()
         d = self.conn.remoteStartCommand(self, self.builder_name,
                                          self.commandID, self.remote_command,
-                                         self.args)
+                                         args)
         return d
 
     def _finished(self, failure=None):
@@ -163,10 +181,13 @@ class RemoteCommand(pb.Referenceable):
         """
         self.buildslave.messageReceivedFromSlave()
         max_updatenum = 0
+        sizes = [0, 0]
         for (update, num) in updates:
             # log.msg("update[%d]:" % num)
             try:
                 if self.active and not self.ignore_updates:
+                    if 'compressed' in update:
+                        update = self._decompressUpdate(update, sizes)
                     self.remoteUpdate(update)
             except:
                 # log failure, terminate build, let slave retire the update
@@ -175,8 +196,36 @@ class RemoteCommand(pb.Referenceable):
                 # skip the rest but ack them all
             if num > max_updatenum:
                 max_updatenum = num
+        if sizes[0]:
+            # the bytes saved on the wire are the difference
+            metrics.MetricCountEvent.log(
+                'RemoteCommand.update-bytes.compressed', sizes[0])
+            metrics.MetricCountEvent.log(
+                'RemoteCommand.update-bytes.uncompressed', sizes[1])
         return max_updatenum
 
+    def _decompressUpdate(self, update, sizes):
+        # the strings under the keys listed in 'compressed' are decompressed
+        # in the order the slave compressed them in, which is fixed; sizes
+        # accumulates the compressed and uncompressed lengths of the strings
+        update = update.copy()
+        keys = update.pop('compressed')
+        for key in ('stdout', 'stderr', 'header', 'log'):
+            if key not in keys:
+                continue
+            if key == 'log':
+                name, data = update[key]
+            else:
+                data = update[key]
+            sizes[0] += len(data)
+            data = self._decompressor.decompress(data)
+            sizes[1] += len(data)
+            if key == 'log':
+                update[key] = (name, data)
+            else:
+                update[key] = data
+        return update
+
     def remote_complete(self, failure=None):
         """
         Called by the slave's L{buildbot.slave.bot.SlaveBuilder} to
@@ -169,15 +169,16 @@ class BaseBasicScheduler(base.BaseScheduler):
             yield self.master.db.schedulers.getChangeClassifications(
                 self.objectid)
 
-        # call gotChange for each change, after first fetching it from the db
-        for changeid, important in classifications.iteritems():
-            chdict = yield self.master.db.changes.getChange(changeid)
-
+        # call gotChange for each change, after first fetching them all from
+        # the db
+        changeids = sorted(classifications)
+        chdicts = yield self.master.db.changes.getChangesByIds(changeids)
+        for changeid, chdict in zip(changeids, chdicts):
             if not chdict:
                 continue
 
             change = yield changes.Change.fromChdict(self.master, chdict)
-            yield self.gotChange(change, important)
+            yield self.gotChange(change, classifications[changeid])
 
     def getTimerNameForChange(self, change):
         raise NotImplementedError  # see subclasses
@@ -119,7 +119,7 @@ class DebPbuilder(WarningCountingShellCommand):
         if self.extrapackages:
             self.command += ['--extrapackages', " ".join(self.extrapackages)]
 
-        self.suppressions.append((None, re.compile(r"\.pbuilderrc does not exist"), None, None))
+        self.addSuppression([(None, r"\.pbuilderrc does not exist", None, None)])
 
         self.addLogObserver(
             'stdio', logobserver.LineConsumerLogObserver(self.logConsumer))
@@ -16,6 +16,8 @@
 
 import inspect
 import re
+import sre_constants
+import sre_parse
 
 from buildbot import config
 from buildbot.process import buildstep
@@ -25,6 +27,7 @@ from buildbot.status.results import FAILURE
 from buildbot.status.results import SUCCESS
 from buildbot.status.results import WARNINGS
 from buildbot.util import flatten
+from twisted.internet import defer
 from twisted.python import failure
 from twisted.python import log
 from twisted.python.deprecate import deprecatedModuleAttribute
@@ -397,6 +400,159 @@ class StringFileWriter(pb.Referenceable):
         pass
 
 
+def _literalPattern(regex):
+    """
+    Return the string matched by a compiled regular expression if it only
+    matches a literal string, such as C{src/main\.c}, else None.
+    """
+    if regex.flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+    if parsed.pattern.flags & re.IGNORECASE:
+        return None
+    char = unichr if isinstance(regex.pattern, unicode) else chr
+    literal = []
+    for op, av in parsed:
+        if op != sre_constants.LITERAL:
+            return None
+        literal.append(char(av))
+    return ''.join(literal)
+
+
+class _SuppressionGroup(object):
+
+    """
+    Suppressions which apply to the same files.  Those without a line range
+    are combined into a few alternations, so that a warning is checked
+    against all of them with a few regular expression searches.
+    """
+
+    # the number of warning patterns combined into one regular expression
+    combineLimit = 50
+
+    def __init__(self):
+        # true if there is a suppression with no WARN-RE and no line range
+        self.matchesAll = False
+        self.patterns = []
+        self.ranged = []
+        self.regexps = None
+
+    def add(self, warnRe, start, end):
+        if start is not None or end is not None:
+            self.ranged.append((warnRe, start, end))
+        elif warnRe is None:
+            self.matchesAll = True
+        else:
+            self.patterns.append(warnRe)
+            self.regexps = None
+
+    def compile(self):
+        self.regexps = []
+        combinable = []
+        for warnRe in self.patterns:
+            # patterns with groups (which may be referred to by number),
+            # flags, or inline flags (which would apply to all of the
+            # alternatives) are searched for on their own
+            if (warnRe.groups or warnRe.flags
+                    or re.search(r"\(\?[iLmsux]+\)", warnRe.pattern)):
+                self.regexps.append(warnRe)
+            else:
+                combinable.append(warnRe)
+        for i in range(0, len(combinable), self.combineLimit):
+            chunk = combinable[i:i + self.combineLimit]
+            try:
+                self.regexps.append(re.compile(
+                    "|".join("(?:%s)" % r.pattern for r in chunk)))
+            except Exception:
+                self.regexps.extend(chunk)
+
+    def matches(self, text, lineNo):
+        if self.matchesAll:
+            return True
+        if self.regexps is None:
+            self.compile()
+        for regexp in self.regexps:
+            if regexp.search(text):
+                return True
+        for warnRe, start, end in self.ranged:
+            if not (warnRe is None or warnRe.search(text)):
+                continue
+            if lineNo is not None and start <= lineNo and end >= lineNo:
+                return True
+        return False
+
+
+class WarningSuppressions(object):
+
+    """
+    An index of warning suppressions, each a 4-tuple (FILE-RE, WARN-RE,
+    START, END) of compiled regular expressions and line numbers, as
+    described for L{WarningCountingShellCommand.addSuppression}.
+
+    Suppressions whose FILE-RE matches a literal path are indexed by that
+    path, so a warning is only checked against the suppressions for its
+    file, those for any file, and those with other FILE-REs.
+    """
+
+    def __init__(self):
+        self.count = 0
+        # all suppressions, which apply to warnings without a file name
+        self.anyWarning = _SuppressionGroup()
+        self.anyFile = _SuppressionGroup()
+        # FILE-RE.match is a prefix match, so literal paths are looked up by
+        # each of their lengths
+        self.byLiteral = {}
+        self.literalLengths = []
+        self.byFileRe = []
+        self._fileReGroups = {}
+
+    def __len__(self):
+        return self.count
+
+    def add(self, fileRe, warnRe, start, end):
+        self.count += 1
+        self.anyWarning.add(warnRe, start, end)
+        if fileRe is None:
+            group = self.anyFile
+        else:
+            literal = _literalPattern(fileRe)
+            if literal is not None:
+                group = self.byLiteral.get(literal)
+                if group is None:
+                    group = self.byLiteral[literal] = _SuppressionGroup()
+                    if len(literal) not in self.literalLengths:
+                        self.literalLengths.append(len(literal))
+            else:
+                key = (fileRe.pattern, fileRe.flags)
+                group = self._fileReGroups.get(key)
+                if group is None:
+                    group = self._fileReGroups[key] = _SuppressionGroup()
+                    self.byFileRe.append((fileRe, group))
+        group.add(warnRe, start, end)
+
+    def append(self, suppression):
+        # for subclasses which added to the list that suppressions once were
+        self.add(*suppression)
+
+    def matches(self, file, lineNo, text):
+        """Return true if the warning is suppressed."""
+        if file is None:
+            return self.anyWarning.matches(text, lineNo)
+        if self.anyFile.matches(text, lineNo):
+            return True
+        for length in self.literalLengths:
+            group = self.byLiteral.get(file[:length])
+            if group is not None and group.matches(text, lineNo):
+                return True
+        for fileRe, group in self.byFileRe:
+            if fileRe.match(file) and group.matches(text, lineNo):
+                return True
+        return False
+
+
 class WarningCountingShellCommand(ShellCommand):
     renderables = ['suppressionFile']
 
@@ -408,6 +564,10 @@ class WarningCountingShellCommand(ShellCommand):
     directoryLeavePattern = "make.*: Leaving directory"
     suppressionFile = None
 
+    # warnings are added to the 'warnings' log as they are found, this many
+    # lines at a time, rather than all being kept until the step finishes
+    warningLogBatchSize = 1000
+
     commentEmptyLineRe = re.compile(r"^\s*(\#.*)?$")
     suppressionLineRe = re.compile(r"^\s*(.+?)\s*:\s*(.+?)\s*(?:[:]\s*([0-9]+)(?:-([0-9]+))?\s*)?$")
 
@@ -435,11 +595,14 @@ class WarningCountingShellCommand(ShellCommand):
         # And upcall to let the base class do its work
         ShellCommand.__init__(self, **kwargs)
 
-        self.suppressions = []
+        self.suppressions = WarningSuppressions()
         self.directoryStack = []
 
         self.warnCount = 0
+        # only the warnings not yet added to the 'warnings' log; see
+        # addWarningsToLog
         self.loggedWarnings = []
+        self.warningLog = None
 
         self.addLogObserver(
             'stdio',
@@ -471,7 +634,7 @@ class WarningCountingShellCommand(ShellCommand):
                 fileRe = re.compile(fileRe)
             if warnRe is not None and isinstance(warnRe, basestring):
                 warnRe = re.compile(warnRe)
-            self.suppressions.append((fileRe, warnRe, start, end))
+            self.suppressions.add(fileRe, warnRe, start, end)
 
     def warnExtractWholeLine(self, line, match):
         """
@@ -527,6 +690,8 @@ class WarningCountingShellCommand(ShellCommand):
             match = wre.match(line)
             if match:
                 self.maybeAddWarning(self.loggedWarnings, line, match)
+                if len(self.loggedWarnings) >= self.warningLogBatchSize:
+                    self.addWarningsToLog()
 
     def maybeAddWarning(self, warnings, line, match):
         if self.suppressions:
@@ -539,14 +704,7 @@ class WarningCountingShellCommand(ShellCommand):
                     file = "%s/%s" % (currentDirectory, file)
 
             # Skip adding the warning if any suppression matches.
-            for fileRe, warnRe, start, end in self.suppressions:
-                if not (file is None or fileRe is None or fileRe.match(file)):
-                    continue
-                if not (warnRe is None or warnRe.search(text)):
-                    continue
-                if not ((start is None and end is None) or
-                        (lineNo is not None and start <= lineNo and end >= lineNo)):
-                    continue
+            if self.suppressions.matches(file, lineNo, text):
                 return
 
         warnings.append(line)
@@ -592,6 +750,33 @@ class WarningCountingShellCommand(ShellCommand):
         self.addSuppression(list)
         return ShellCommand.start(self)
 
+    def addWarningsToLog(self):
+        """
+        Add the warnings found so far to the 'warnings' log, creating it if
+        necessary.  Returns a Deferred that fires with the log when they have
+        been added."""
+        lines, self.loggedWarnings = self.loggedWarnings, []
+        if self.warningLog is None:
+            self.warningLog = self.addLog_newStyle('warnings')
+        if lines:
+            text = "\n".join(lines) + "\n"
+
+            @self.warningLog.addCallback
+            def addContent(log):
+                d = log.addStdout(text)
+                d.addCallback(lambda _: log)
+                return d
+        # the caller gets a Deferred of its own, so that it can wait for
+        # these lines without getting in the way of the next ones
+        d = defer.Deferred()
+
+        @self.warningLog.addBoth
+        def chain(res):
+            d.callback(res)
+            return res
+        return d
+
+    @defer.inlineCallbacks
     def createSummary(self, log):
         """
         Match log lines against warningPattern.
@@ -599,11 +784,10 @@ class WarningCountingShellCommand(ShellCommand):
         Warnings are collected into another log for this step, and the
         build-wide 'warnings-count' is updated."""
 
-        # If there were any warnings, make the log if lines with warnings
-        # available
+        # If there were any warnings, finish the log of lines with warnings
         if self.warnCount:
-            self.addCompleteLog("warnings (%d)" % self.warnCount,
-                                "\n".join(self.loggedWarnings) + "\n")
+            warningLog = yield self.addWarningsToLog()
+            yield warningLog.finish()
 
         warnings_stat = self.getStatistic('warnings', 0)
         self.setStatistic('warnings', warnings_stat + self.warnCount)
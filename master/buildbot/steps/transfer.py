@@ -16,10 +16,13 @@
 from __future__ import with_statement
 
 
+import bz2
 import os.path
+import shutil
 import stat
 import tarfile
 import tempfile
+import zlib
 try:
     from cStringIO import StringIO
     assert StringIO
@@ -38,6 +41,16 @@ from twisted.internet import defer
 from twisted.python import log
 from twisted.spread import pb
 
+# slaves with at least this version of the transfer commands accept a
+# 'window' argument, and keep that many blocks in flight rather than waiting
+# for each block to be acknowledged before sending the next
+WINDOWED_TRANSFER_VERSION = "2.18"
+
+# blocksize used when the step doesn't give one; slaves that can keep several
+# blocks in flight are sent larger blocks
+DEFAULT_BLOCKSIZE = 16 * 1024
+DEFAULT_WINDOWED_BLOCKSIZE = 64 * 1024
+
 
 class _FileWriter(pb.Referenceable):
 
@@ -103,82 +116,314 @@ class _FileWriter(pb.Referenceable):
                 os.unlink(self.tmpname)
 
 
-def _extractall(self, path=".", members=None):
-    """Fallback extractall method for TarFile, in case it doesn't have its own."""
+class _TarExtractor(object):
 
-    import copy
+    """
+    Extracts a tar archive into a directory as the archive's data arrives,
+    rather than waiting for all of it.  Pass each piece of the (uncompressed)
+    archive to L{feed}, then call L{close}.
+    """
 
-    directories = []
+    # member types whose data describes the next member rather than a file
+    EXTENSION_TYPES = (tarfile.GNUTYPE_LONGNAME, tarfile.GNUTYPE_LONGLINK,
+                       tarfile.XHDTYPE, tarfile.XGLTYPE,
+                       tarfile.SOLARIS_XHDTYPE)
+
+    # extended headers are kept in memory, so refuse any larger than this
+    MAX_EXTENDED_SIZE = 1024 * 1024
+
+    def __init__(self, destroot):
+        self.destroot = os.path.abspath(destroot)
+        self.realroot = os.path.realpath(self.destroot)
+        self.data = ''
+        # the number of zero blocks seen; two of them end the archive
+        self.zeroBlocks = 0
+        self.finished = False
+
+        # the member whose data is arriving, how much of it is still to
+        # come, and where it's going
+        self.tarinfo = None
+        self.remaining = 0
+        self.padding = 0
+        self.fp = None
+        self.path = None
 
-    if members is None:
-        members = self
+        # extended headers that apply to the next member, or to all of them
+        self.extended = {}
+        self.global_extended = {}
 
-    for tarinfo in members:
-        if tarinfo.isdir():
-            # Extract directories with a safe mode.
-            directories.append(tarinfo)
-            tarinfo = copy.copy(tarinfo)
-            tarinfo.mode = 0700
-        self.extract(tarinfo, path)
-
-    # Reverse sort directories.
-    directories.sort(lambda a, b: cmp(a.name, b.name))
-    directories.reverse()
-
-    # Set correct owner, mtime and filemode on directories.
-    for tarinfo in directories:
-        dirpath = os.path.join(path, tarinfo.name)
-        try:
-            self.chown(tarinfo, dirpath)
-            self.utime(tarinfo, dirpath)
-            self.chmod(tarinfo, dirpath)
-        except tarfile.ExtractError, e:
-            if self.errorlevel > 1:
-                raise
+        self.directories = []
+
+        # the files, links and topmost directories created so far, so that
+        # cancel can remove them
+        self.created = []
+
+    def feed(self, data):
+        if self.finished:
+            return
+        data = self.data + data
+        pos = 0
+        while not self.finished:
+            if self.remaining:
+                chunk = data[pos:pos + self.remaining]
+                if not chunk:
+                    break
+                pos += len(chunk)
+                self.remaining -= len(chunk)
+                if self.fp is not None:
+                    self.fp.write(chunk)
+                if not self.remaining:
+                    self._finishMember()
+            elif self.padding:
+                skip = min(self.padding, len(data) - pos)
+                if not skip:
+                    break
+                pos += skip
+                self.padding -= skip
+            elif len(data) - pos >= tarfile.BLOCKSIZE:
+                self._startMember(data[pos:pos + tarfile.BLOCKSIZE])
+                pos += tarfile.BLOCKSIZE
             else:
-                self._dbg(1, "tarfile: %s" % e)
+                break
+        self.data = data[pos:]
+
+    def close(self):
+        """
+        Finish the extraction, raising C{tarfile.ReadError} if the archive
+        ended before its end-of-archive marker (for example, because it was
+        truncated at maxsize), even if it ended between members.
+        """
+        if self.fp is not None:
+            # remove the partly-written member
+            self.fp.close()
+            self.fp = None
+            if self.tarinfo.type not in self.EXTENSION_TYPES:
+                os.unlink(self.path)
+        if not self.finished:
+            raise tarfile.ReadError("unexpected end of data")
+
+        # set directory times and modes last, as extractall does
+        for path, tarinfo in sorted(self.directories, reverse=True):
+            os.utime(path, (tarinfo.mtime, tarinfo.mtime))
+            os.chmod(path, tarinfo.mode)
+
+    def cancel(self):
+        """
+        Abandon the extraction, removing the files, links and directories
+        it created.  Files that it overwrote are removed too, rather than
+        restored.
+        """
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+        for path in reversed(self.created):
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.lexists(path):
+                os.unlink(path)
+        self.created = []
+
+    def _startMember(self, header):
+        if header == tarfile.NUL * tarfile.BLOCKSIZE:
+            # the end-of-archive marker is two zero blocks
+            self.zeroBlocks += 1
+            if self.zeroBlocks == 2:
+                self.finished = True
+            return
+        if self.zeroBlocks:
+            raise tarfile.ReadError("unexpected zero block")
+        try:
+            tarinfo = tarfile.TarInfo.frombuf(header)
+        except tarfile.HeaderError, e:
+            raise tarfile.ReadError(str(e))
+        if tarinfo.size < 0:
+            raise tarfile.ReadError("invalid member size")
+        if (tarinfo.type in self.EXTENSION_TYPES
+                and tarinfo.size > self.MAX_EXTENDED_SIZE):
+            raise tarfile.ReadError("extended header too large")
+        self.remaining = tarinfo.size
+        self.padding = -tarinfo.size % tarfile.BLOCKSIZE
+
+        if tarinfo.type in self.EXTENSION_TYPES:
+            self.tarinfo = tarinfo
+            self.fp = StringIO()
+            self.path = None
+        else:
+            self._applyExtended(tarinfo)
+            self.tarinfo = tarinfo
+            self._createMember(tarinfo)
+        if not self.remaining:
+            self._finishMember()
+
+    def _applyExtended(self, tarinfo):
+        extended = self.global_extended.copy()
+        extended.update(self.extended)
+        self.extended = {}
+        if 'path' in extended:
+            tarinfo.name = extended['path']
+        if 'linkpath' in extended:
+            tarinfo.linkname = extended['linkpath']
+        try:
+            if 'size' in extended:
+                tarinfo.size = int(extended['size'])
+            if 'mtime' in extended:
+                tarinfo.mtime = float(extended['mtime'])
+        except ValueError:
+            raise tarfile.ReadError("invalid pax header")
+        if tarinfo.size < 0:
+            raise tarfile.ReadError("invalid member size")
+        self.remaining = tarinfo.size
+        self.padding = -tarinfo.size % tarfile.BLOCKSIZE
+
+    def _checkInside(self, path, root, name):
+        if path != root and not path.startswith(os.path.join(root, '')):
+            raise tarfile.ExtractError("%r is outside the destination "
+                                       "directory" % (name,))
+
+    def _makedirs(self, path, mode=0777):
+        top = path
+        while not os.path.lexists(os.path.dirname(top)):
+            top = os.path.dirname(top)
+        os.makedirs(path, mode)
+        self.created.append(top)
+
+    def _createMember(self, tarinfo):
+        path = os.path.normpath(os.path.join(self.destroot, tarinfo.name))
+        self._checkInside(path, self.destroot, tarinfo.name)
+        self.path = path
+
+        # earlier members may have left symlinks along the way, so follow
+        # them before creating anything, as open and makedirs would
+        dirname = os.path.dirname(path)
+        if tarinfo.isdir():
+            self._checkInside(os.path.realpath(path), self.realroot,
+                              tarinfo.name)
+            if not os.path.isdir(path):
+                self._makedirs(path, 0700)
+            self.directories.append((path, tarinfo))
+            return
+        self._checkInside(os.path.realpath(dirname), self.realroot,
+                          tarinfo.name)
+        if tarinfo.issym():
+            # a symlink's target is relative to the symlink's directory
+            self._checkInside(
+                os.path.realpath(os.path.join(os.path.realpath(dirname),
+                                              tarinfo.linkname)),
+                self.realroot, tarinfo.linkname)
+        elif tarinfo.islnk():
+            # but a hard link's is relative to the top of the archive
+            source = os.path.normpath(os.path.join(self.destroot,
+                                                   tarinfo.linkname))
+            self._checkInside(source, self.destroot, tarinfo.linkname)
+            self._checkInside(os.path.realpath(source), self.realroot,
+                              tarinfo.linkname)
+        if not os.path.exists(dirname):
+            self._makedirs(dirname)
+        # never write through a link left by an earlier member
+        if os.path.islink(path) or (os.path.lexists(path)
+                                    and (tarinfo.issym() or tarinfo.islnk())):
+            os.unlink(path)
+        if tarinfo.isreg():
+            self.fp = open(path, 'wb')
+        elif tarinfo.issym():
+            os.symlink(tarinfo.linkname, path)
+        elif tarinfo.islnk():
+            os.link(source, path)
+        else:
+            # other types (devices, fifos) are skipped, as are their contents
+            return
+        self.created.append(path)
 
+    def _finishMember(self):
+        tarinfo = self.tarinfo
+        if tarinfo.type in self.EXTENSION_TYPES:
+            data = self.fp.getvalue()
+            self.fp = None
+            if tarinfo.type == tarfile.GNUTYPE_LONGNAME:
+                self.extended['path'] = data.split(tarfile.NUL, 1)[0]
+            elif tarinfo.type == tarfile.GNUTYPE_LONGLINK:
+                self.extended['linkpath'] = data.split(tarfile.NUL, 1)[0]
+            elif tarinfo.type == tarfile.XGLTYPE:
+                self.global_extended.update(self._parsePax(data))
+            else:
+                self.extended.update(self._parsePax(data))
+            return
 
-class _DirectoryWriter(_FileWriter):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+            os.utime(self.path, (tarinfo.mtime, tarinfo.mtime))
+            os.chmod(self.path, tarinfo.mode)
+
+    def _parsePax(self, data):
+        # records look like "%d %s=%s\n" % (length, keyword, value)
+        headers = {}
+        pos = 0
+        while pos < len(data) and data[pos] != tarfile.NUL:
+            try:
+                space = data.index(' ', pos)
+                length = int(data[pos:space])
+                if length <= space - pos or pos + length > len(data):
+                    raise ValueError
+                keyword, value = data[space + 1:pos + length - 1].split('=', 1)
+            except ValueError:
+                raise tarfile.ReadError("invalid pax header")
+            headers[keyword] = value
+            pos += length
+        return headers
+
+
+class _DirectoryWriter(pb.Referenceable):
 
     """
-    A DirectoryWriter is implemented as a FileWriter, with an added post-processing
-    step to unpack the archive, once the transfer has completed.
+    A DirectoryWriter receives a tar archive of a directory from the slave,
+    and unpacks it into L{destroot} as it arrives.
     """
 
-    def __init__(self, destroot, maxsize, compress, mode):
+    def __init__(self, destroot, maxsize, compress):
         self.destroot = destroot
+        self.remaining = maxsize
         self.compress = compress
+        if compress == 'bz2':
+            self.decompressor = bz2.BZ2Decompressor()
+        elif compress == 'gz':
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.decompressor = None
+        self.extractor = _TarExtractor(destroot)
 
-        self.fd, self.tarname = tempfile.mkstemp()
-        os.close(self.fd)
+    def remote_write(self, data):
+        """
+        Called from remote slave to write the next part of the archive,
+        within the boundaries of L{maxsize}
 
-        _FileWriter.__init__(self, self.tarname, maxsize, mode)
+        @type  data: C{string}
+        @param data: String of data to write
+        """
+        if self.remaining is not None:
+            data = data[:self.remaining]
+            self.remaining -= len(data)
+        if self.compress == 'gz':
+            # limit how much of a highly-compressed block is in memory
+            while data:
+                self.extractor.feed(
+                    self.decompressor.decompress(data, 1024 * 1024))
+                data = self.decompressor.unconsumed_tail
+        elif self.compress == 'bz2':
+            self.extractor.feed(self.decompressor.decompress(data))
+        else:
+            self.extractor.feed(data)
 
     def remote_unpack(self):
         """
         Called by remote slave to state that no more data will be transfered
         """
-        # Make sure remote_close is called, otherwise atomic rename wont happen
-        self.remote_close()
-
-        # Map configured compression to a TarFile setting
-        if self.compress == 'bz2':
-            mode = 'r|bz2'
-        elif self.compress == 'gz':
-            mode = 'r|gz'
-        else:
-            mode = 'r'
+        if self.compress == 'gz':
+            self.extractor.feed(self.decompressor.flush())
+        self.extractor.close()
 
-        # Support old python
-        if not hasattr(tarfile.TarFile, 'extractall'):
-            tarfile.TarFile.extractall = _extractall
-
-        # Unpack archive and clean up after self
-        archive = tarfile.open(name=self.tarname, mode=mode)
-        archive.extractall(path=self.destroot)
-        archive.close()
-        os.remove(self.tarname)
+    def cancel(self):
+        self.extractor.cancel()
 
 
 def makeStatusRemoteCommand(step, remote_command, args):
@@ -212,6 +457,15 @@ class _TransferBuildStep(BuildStep):
             message = "slave is too old, does not know about %s" % command
             raise BuildSlaveTooOldError(message)
 
+    def getTransferArgs(self, command):
+        # Return the 'blocksize' and 'window' arguments for a transfer
+        # command.  Slaves too old to keep several blocks in flight get the
+        # old default blocksize, and move one block per round trip.
+        if self.slaveVersionIsOlderThan(command, WINDOWED_TRANSFER_VERSION):
+            return {'blocksize': self.blocksize or DEFAULT_BLOCKSIZE}
+        return {'blocksize': self.blocksize or DEFAULT_WINDOWED_BLOCKSIZE,
+                'window': self.window}
+
     def setDefaultWorkdir(self, workdir):
         if self.workdir is None:
             self.workdir = workdir
@@ -257,7 +511,7 @@ class FileUpload(_TransferBuildStep):
     renderables = ['slavesrc', 'masterdest', 'url']
 
     def __init__(self, slavesrc, masterdest,
-                 workdir=None, maxsize=None, blocksize=16 * 1024, mode=None,
+                 workdir=None, maxsize=None, blocksize=None, window=16, mode=None,
                  keepstamp=False, url=None,
                  **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
@@ -266,6 +520,7 @@ class FileUpload(_TransferBuildStep):
         self.masterdest = masterdest
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
         if not isinstance(mode, (int, type(None))):
             config.error(
                 'mode must be an integer or None')
@@ -304,9 +559,9 @@ class FileUpload(_TransferBuildStep):
             'workdir': self._getWorkdir(),
             'writer': fileWriter,
             'maxsize': self.maxsize,
-            'blocksize': self.blocksize,
             'keepstamp': self.keepstamp,
         }
+        args.update(self.getTransferArgs('uploadFile'))
 
         cmd = makeStatusRemoteCommand(self, 'uploadFile', args)
         d = self.runTransferCommand(cmd, fileWriter)
@@ -320,7 +575,7 @@ class DirectoryUpload(_TransferBuildStep):
     renderables = ['slavesrc', 'masterdest', 'url']
 
     def __init__(self, slavesrc, masterdest,
-                 workdir=None, maxsize=None, blocksize=16 * 1024,
+                 workdir=None, maxsize=None, blocksize=None, window=16,
                  compress=None, url=None, **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
@@ -328,6 +583,7 @@ class DirectoryUpload(_TransferBuildStep):
         self.masterdest = masterdest
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
         if compress not in (None, 'gz', 'bz2'):
             config.error(
                 "'compress' must be one of None, 'gz', or 'bz2'")
@@ -352,7 +608,7 @@ class DirectoryUpload(_TransferBuildStep):
             self.addURL(os.path.basename(masterdest), self.url)
 
         # we use maxsize to limit the amount of data on both sides
-        dirWriter = _DirectoryWriter(masterdest, self.maxsize, self.compress, 0600)
+        dirWriter = _DirectoryWriter(masterdest, self.maxsize, self.compress)
 
         # default arguments
         args = {
@@ -360,9 +616,9 @@ class DirectoryUpload(_TransferBuildStep):
             'workdir': self._getWorkdir(),
             'writer': dirWriter,
             'maxsize': self.maxsize,
-            'blocksize': self.blocksize,
             'compress': self.compress
         }
+        args.update(self.getTransferArgs('uploadDirectory'))
 
         cmd = makeStatusRemoteCommand(self, 'uploadDirectory', args)
         d = self.runTransferCommand(cmd, dirWriter)
@@ -376,7 +632,7 @@ class MultipleFileUpload(_TransferBuildStep):
     renderables = ['slavesrcs', 'masterdest', 'url']
 
     def __init__(self, slavesrcs, masterdest,
-                 workdir=None, maxsize=None, blocksize=16 * 1024,
+                 workdir=None, maxsize=None, blocksize=None, window=16,
                  mode=None, compress=None, keepstamp=False, url=None, **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
@@ -384,6 +640,7 @@ class MultipleFileUpload(_TransferBuildStep):
         self.masterdest = masterdest
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
         if not isinstance(mode, (int, type(None))):
             config.error(
                 'mode must be an integer or None')
@@ -403,24 +660,24 @@ class MultipleFileUpload(_TransferBuildStep):
             'workdir': self._getWorkdir(),
             'writer': fileWriter,
             'maxsize': self.maxsize,
-            'blocksize': self.blocksize,
             'keepstamp': self.keepstamp,
         }
+        args.update(self.getTransferArgs('uploadFile'))
 
         cmd = makeStatusRemoteCommand(self, 'uploadFile', args)
         return self.runTransferCommand(cmd, fileWriter)
 
     def uploadDirectory(self, source, masterdest):
-        dirWriter = _DirectoryWriter(masterdest, self.maxsize, self.compress, 0600)
+        dirWriter = _DirectoryWriter(masterdest, self.maxsize, self.compress)
 
         args = {
             'slavesrc': source,
             'workdir': self._getWorkdir(),
             'writer': dirWriter,
             'maxsize': self.maxsize,
-            'blocksize': self.blocksize,
             'compress': self.compress
         }
+        args.update(self.getTransferArgs('uploadDirectory'))
 
         cmd = makeStatusRemoteCommand(self, 'uploadDirectory', args)
         return self.runTransferCommand(cmd, dirWriter)
@@ -546,7 +803,7 @@ class FileDownload(_TransferBuildStep):
     renderables = ['mastersrc', 'slavedest']
 
     def __init__(self, mastersrc, slavedest,
-                 workdir=None, maxsize=None, blocksize=16 * 1024, mode=None,
+                 workdir=None, maxsize=None, blocksize=None, window=16, mode=None,
                  **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
@@ -554,6 +811,7 @@ class FileDownload(_TransferBuildStep):
         self.slavedest = slavedest
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
         if not isinstance(mode, (int, type(None))):
             config.error(
                 'mode must be an integer or None')
@@ -590,10 +848,10 @@ class FileDownload(_TransferBuildStep):
             'slavedest': slavedest,
             'maxsize': self.maxsize,
             'reader': fileReader,
-            'blocksize': self.blocksize,
             'workdir': self._getWorkdir(),
             'mode': self.mode,
         }
+        args.update(self.getTransferArgs('downloadFile'))
 
         cmd = makeStatusRemoteCommand(self, 'downloadFile', args)
         d = self.runTransferCommand(cmd)
@@ -607,7 +865,7 @@ class StringDownload(_TransferBuildStep):
     renderables = ['slavedest', 's']
 
     def __init__(self, s, slavedest,
-                 workdir=None, maxsize=None, blocksize=16 * 1024, mode=None,
+                 workdir=None, maxsize=None, blocksize=None, window=16, mode=None,
                  **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
@@ -615,6 +873,7 @@ class StringDownload(_TransferBuildStep):
         self.slavedest = slavedest
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
         if not isinstance(mode, (int, type(None))):
             config.error(
                 "StringDownload step's mode must be an integer or None,"
@@ -642,10 +901,10 @@ class StringDownload(_TransferBuildStep):
             'slavedest': slavedest,
             'maxsize': self.maxsize,
             'reader': fileReader,
-            'blocksize': self.blocksize,
             'workdir': self._getWorkdir(),
             'mode': self.mode,
         }
+        args.update(self.getTransferArgs('downloadFile'))
 
         cmd = makeStatusRemoteCommand(self, 'downloadFile', args)
         d = self.runTransferCommand(cmd)
@@ -25,6 +25,7 @@ import hashlib
 
 from buildbot.db import buildrequests
 from buildbot.db import changesources
+from buildbot.db import logs
 from buildbot.db import schedulers
 from buildbot.test.util import validation
 from buildbot.util import datetime2epoch
@@ -54,6 +55,9 @@ class Row(object):
     @cvar required_columns: a tuple of columns that must be given in the
     constructor
 
+    @cvar binary_columns: a tuple of columns whose string values should not
+    be cast to unicode
+
     @cvar hashedColumns: a tuple of hash column and source columns designating
     a hash to work around MySQL's inability to do indexing.
 
@@ -62,6 +66,7 @@ class Row(object):
 
     id_column = ()
     required_columns = ()
+    binary_columns = ()
     lists = ()
     dicts = ()
     hashedColumns = []
@@ -85,7 +90,7 @@ class Row(object):
             assert col in self.defaults, "%s is not a valid column" % col
         # cast to unicode
         for k, v in self.values.iteritems():
-            if isinstance(v, str):
+            if isinstance(v, str) and k not in self.binary_columns:
                 self.values[k] = unicode(v)
         # calculate any necessary hashes
         for hash_col, src_cols in self.hashedColumns:
@@ -507,6 +512,7 @@ class LogChunk(Row):
         compressed=0)
 
     required_columns = ('logid', )
+    binary_columns = ('content', )
 
 
 class Master(Row):
@@ -752,6 +758,11 @@ class FakeChangesComponent(FakeDBComponent):
 
         return defer.succeed(self._chdict(row))
 
+    def getChangesByIds(self, changeids):
+        return defer.succeed([self._chdict(self.changes[changeid])
+                              if changeid in self.changes else None
+                              for changeid in changeids])
+
     def getChangeUids(self, changeid):
         try:
             ch_uids = self.changes[changeid]['uids']
@@ -764,7 +775,7 @@ class FakeChangesComponent(FakeDBComponent):
         chdicts = [self._chdict(self.changes[id]) for id in ids[-count:]]
         return defer.succeed(chdicts)
 
-    def getChanges(self):
+    def getChanges(self, resultSpec=None):
         chdicts = [self._chdict(v) for v in self.changes.values()]
         return defer.succeed(chdicts)
 
@@ -1499,11 +1510,13 @@ class FakeBuildRequestsComponent(FakeDBComponent):
 
     @defer.inlineCallbacks
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-                         bsid=None, branch=None, repository=None):
+                         bsid=None, branch=None, repository=None, brids=None):
         rv = []
         for br in self.reqs.itervalues():
             if buildername and br.buildername != buildername:
                 continue
+            if brids is not None and br.id not in brids:
+                continue
             if complete is not None:
                 if complete and not br.complete:
                     continue
@@ -1547,6 +1560,18 @@ class FakeBuildRequestsComponent(FakeDBComponent):
             rv.append(self._brdictFromRow(br))
         defer.returnValue(rv)
 
+    def getOldestRequestTimes(self, buildernames=None):
+        rv = {}
+        for br in self.reqs.itervalues():
+            if buildernames is not None and br.buildername not in buildernames:
+                continue
+            if br.complete or br.id in self.claims:
+                continue
+            submitted_at = _mkdt(br.submitted_at)
+            if br.buildername not in rv or submitted_at < rv[br.buildername]:
+                rv[br.buildername] = submitted_at
+        return defer.succeed(rv)
+
     def claimBuildRequests(self, brids, claimed_at=None, _reactor=reactor):
         for brid in brids:
             if brid not in self.reqs or brid in self.claims:
@@ -1673,7 +1698,7 @@ class FakeBuildsComponent(FakeDBComponent):
                 return defer.succeed(self._row2dict(row))
         return defer.succeed(None)
 
-    def getBuilds(self, builderid=None, buildrequestid=None):
+    def getBuilds(self, builderid=None, buildrequestid=None, resultSpec=None):
         ret = []
         for (id, row) in self.builds.items():
             if builderid and row['builderid'] != builderid:
@@ -1870,7 +1895,10 @@ class FakeLogsComponent(FakeDBComponent):
                 # make sure there are enough slots in the list
                 if len(lines) < row.last_line + 1:
                     lines.append([None] * (row.last_line + 1 - len(lines)))
-                lines[row.first_line:row.last_line + 1] = row.content.split('\n')
+                content = row.content
+                if row.compressed:
+                    content = logs.COMPRESSION_BYID[row.compressed]['read'](content)
+                lines[row.first_line:row.last_line + 1] = content.split('\n')
 
     # component methods
 
@@ -1932,19 +1960,21 @@ class FakeLogsComponent(FakeDBComponent):
         validation.verifyType(self.t, 'content', content,
                               validation.StringValidator())
         self.t.assertEqual(content[-1], u'\n')
+        stored = content
         content = content[:-1].split('\n')
         lines = self.log_lines[logid]
         lines.extend(content)
         num_lines = self.logs[logid]['num_lines'] = len(lines)
-        return defer.succeed((num_lines - len(content), num_lines - 1))
+        return defer.succeed((num_lines - len(content), num_lines - 1,
+                              stored))
 
     def finishLog(self, logid):
-        if id in self.logs:
-            self.logs['id'].complete = 1
+        if logid in self.logs:
+            self.logs[logid]['complete'] = 1
         return defer.succeed(None)
 
     def compressLog(self, logid):
-        return defer.succeed(None)
+        return defer.succeed(0)
 
 
 class FakeUsersComponent(FakeDBComponent):
@@ -2204,6 +2234,7 @@ class FakeDBConnector(object):
         self.master = master
         self.t = testcase
         self.checkForeignKeys = False
+        self.generation = 0
         self._components = []
         self.changes = comp = FakeChangesComponent(self, testcase)
         self._components.append(comp)
@@ -2238,9 +2269,14 @@ class FakeDBConnector(object):
         self.is_setup = True
         return defer.succeed(None)
 
+    def getGeneration(self):
+        # only insertTestData counts as a write
+        return self.generation
+
     def insertTestData(self, rows):
         """Insert a list of Row instances into the database; this method can be
         called synchronously or asynchronously (it completes immediately) """
+        self.generation += 1
         for row in rows:
             if self.checkForeignKeys:
                 row.checkForeignKeys(self, self.t)
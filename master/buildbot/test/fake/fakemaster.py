@@ -49,6 +49,9 @@ class FakeCache(object):
         d.addCallback(mkref)
         return d
 
+    def __contains__(self, key):
+        return False
+
     def put(self, key, val):
         pass
 
@@ -58,6 +61,9 @@ class FakeCaches(object):
     def get_cache(self, name, miss_fn):
         return FakeCache(name, miss_fn)
 
+    def get_metrics(self):
+        return {}
+
 
 class FakeStatus(object):
 
@@ -112,9 +112,6 @@ class FakeBuilder(builder.Builder):
     def detached(self, slave):
         pass
 
-    def getOldestRequestTime(self):
-        return 0
-
     def maybeStartBuild(self):
         return defer.succeed(None)
 
@@ -14,10 +14,13 @@
 # Copyright Buildbot Team Members
 
 import mock
+import random
 
 from buildbot.changes import base
+from buildbot.process import metrics
 from buildbot.test.util import changesource
 from buildbot.test.util import compat
+from buildbot.util import processpool
 from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.internet import task
@@ -180,3 +183,84 @@ class TestPollingChangeSource(changesource.ChangeSourceMixin, unittest.TestCase)
         d.addCallback(check)
         reactor.callWhenRunning(d.callback, None)
         return d
+
+    def test_loop_jitter(self):
+        self.patch(random, 'random', lambda: 0.4)
+        loops = []
+        self.changesource.poll = \
+            lambda: loops.append(self.clock.seconds())
+
+        self.changesource.parent = mock.Mock(pollJitter=0.5)
+        self.changesource.pollInterval = 5
+        self.startChangeSource()
+
+        d = defer.Deferred()
+        d.addCallback(self.runClockFor, 12)
+
+        def check(_):
+            # the polls are offset by 0.4 * 0.5 of the interval
+            self.assertEqual(loops, [6.0, 11.0])
+        d.addCallback(check)
+        reactor.callWhenRunning(d.callback, None)
+        return d
+
+    def test_poll_time_metric(self):
+        events = []
+        self.patch(metrics.MetricHistogramEvent, 'log',
+                   staticmethod(lambda *args: events.append(args)))
+
+        def poll():
+            d = defer.Deferred()
+            reactor.callLater(2, d.callback, None)
+            return d
+        self.changesource.poll = poll
+        self.changesource.pollInterval = 5
+        self.startChangeSource()
+
+        d = defer.Deferred()
+        d.addCallback(self.runClockFor, 8)
+
+        def check(_):
+            self.assertEqual(events, [
+                ('PollingChangeSource.poll-time.DummyCS', 2.0)])
+        d.addCallback(check)
+        reactor.callWhenRunning(d.callback, None)
+        return d
+
+    def test_runProcess_no_pool(self):
+        d = self.changesource.runProcess(lambda a, b: defer.succeed(a + b),
+                                         1, b=2)
+        d.addCallback(self.assertEqual, 3)
+        return d
+
+    def test_runProcess_pool(self):
+        events = []
+        self.patch(metrics.MetricHistogramEvent, 'log',
+                   staticmethod(lambda *args: events.append(args)))
+        pool = processpool.ProcessPool(maxProcesses=1)
+        self.changesource.parent = mock.Mock(processPool=pool)
+        self.changesource.getProcessHost = lambda: 'example.com'
+
+        processes = [defer.Deferred(), defer.Deferred()]
+        started = []
+
+        def process(i):
+            started.append(i)
+            return processes[i]
+        d1 = self.changesource.runProcess(process, 0)
+        d2 = self.changesource.runProcess(process, 1)
+        self.assertEqual(started, [0])
+        self.assertEqual(pool.runningByHost, {'example.com': 1})
+
+        self.clock.advance(3)
+        processes[0].callback('first')
+        self.assertEqual(started, [0, 1])
+        processes[1].callback('second')
+        self.assertEqual(pool.running, 0)
+        self.assertEqual(events, [
+            ('PollingChangeSource.queue-wait.DummyCS', 0.0),
+            ('PollingChangeSource.queue-wait.DummyCS', 3.0),
+        ])
+        d = defer.gatherResults([d1, d2])
+        d.addCallback(self.assertEqual, ['first', 'second'])
+        return d
@@ -22,132 +22,80 @@ from buildbot.changes import gitpoller
 from buildbot.test.util import changesource
 from buildbot.test.util import config
 from buildbot.test.util import gpo
-from twisted.internet import defer
 from twisted.trial import unittest
 
 # Test that environment variables get propagated to subprocesses (See #2116)
 os.environ['TEST_THAT_ENVIRONMENT_GETS_PASSED_TO_SUBPROCESSES'] = 'TRUE'
 
 
-class GitOutputParsing(gpo.GetProcessOutputMixin, unittest.TestCase):
-
-    """Test GitPoller methods for parsing git output"""
-
-    def setUp(self):
-        self.poller = gitpoller.GitPoller('git@example.com:foo/baz.git')
-        self.setUpGetProcessOutput()
-
-    dummyRevStr = '12345abcde'
-
-    def _perform_git_output_test(self, methodToTest, args,
-                                 desiredGoodOutput, desiredGoodResult,
-                                 emptyRaisesException=True):
-
-        # make this call to self.patch here so that we raise a SkipTest if it
-        # is not supported
-        self.expectCommands(
-            gpo.Expect('git', *args)
-            .path('gitpoller-work'),
-        )
-
-        d = defer.succeed(None)
-
-        def call_empty(_):
-            # we should get an Exception with empty output from git
-            return methodToTest(self.dummyRevStr)
-        d.addCallback(call_empty)
-
-        def cb_empty(_):
-            if emptyRaisesException:
-                self.fail("getProcessOutput should have failed on empty output")
-
-        def eb_empty(f):
-            if not emptyRaisesException:
-                self.fail("getProcessOutput should NOT have failed on empty output")
-        d.addCallbacks(cb_empty, eb_empty)
-        d.addCallback(lambda _: self.assertAllCommandsRan())
-
-        # and the method shouldn't supress any exceptions
-        self.expectCommands(
-            gpo.Expect('git', *args)
-            .path('gitpoller-work')
-            .exit(1),
-        )
-
-        def call_exception(_):
-            return methodToTest(self.dummyRevStr)
-        d.addCallback(call_exception)
-
-        def cb_exception(_):
-            self.fail("getProcessOutput should have failed on stderr output")
-
-        def eb_exception(f):
-            pass
-        d.addCallbacks(cb_exception, eb_exception)
-        d.addCallback(lambda _: self.assertAllCommandsRan())
-
-        # finally we should get what's expected from good output
-        self.expectCommands(
-            gpo.Expect('git', *args)
-            .path('gitpoller-work')
-            .stdout(desiredGoodOutput)
-        )
-
-        def call_desired(_):
-            return methodToTest(self.dummyRevStr)
-        d.addCallback(call_desired)
-
-        def cb_desired(r):
-            self.assertEquals(r, desiredGoodResult)
-            # check types
-            if isinstance(r, basestring):
-                self.assertIsInstance(r, unicode)
-            elif isinstance(r, list):
-                [self.assertIsInstance(e, unicode) for e in r]
-        d.addCallback(cb_desired)
-        d.addCallback(lambda _: self.assertAllCommandsRan())
-        return d
-
-    def test_get_commit_author(self):
-        authorStr = u'Sammy Jankis <email@example.com>'
-        return self._perform_git_output_test(self.poller._get_commit_author,
-                                             ['log', '--no-walk', '--format=%aN <%aE>', self.dummyRevStr, '--'],
-                                             authorStr, authorStr)
-
-    def _test_get_commit_comments(self, commentStr):
-        return self._perform_git_output_test(self.poller._get_commit_comments,
-                                             ['log', '--no-walk', '--format=%s%n%b', self.dummyRevStr, '--'],
-                                             commentStr, commentStr, emptyRaisesException=False)
-
-    def test_get_commit_comments(self):
-        comments = [u'this is a commit message\n\nthat is multiline',
-                    u'single line message', u'']
-        return defer.DeferredList([self._test_get_commit_comments(commentStr) for commentStr in comments])
-
-    def test_get_commit_files(self):
-        filesStr = '\n\nfile1\nfile2\n"\146ile_octal"\nfile space'
-        filesRes = ['file1', 'file2', 'file_octal', 'file space']
-        return self._perform_git_output_test(self.poller._get_commit_files,
-                                             ['log', '--name-only', '--no-walk', '--format=%n', self.dummyRevStr, '--'],
-                                             filesStr, filesRes, emptyRaisesException=False)
-
-    def test_get_commit_files_with_space_in_changed_files(self):
-        filesStr = 'normal_directory/file1\ndirectory with space/file2'
-        return self._perform_git_output_test(
-            self.poller._get_commit_files,
-            ['log', '--name-only', '--no-walk', '--format=%n', self.dummyRevStr, '--'],
-            filesStr,
-            filter(lambda x: x.strip(), filesStr.splitlines(), ),
-            emptyRaisesException=False,
-        )
-
-    def test_get_commit_timestamp(self):
-        stampStr = '1273258009'
-        return self._perform_git_output_test(self.poller._get_commit_timestamp,
-                                             ['log', '--no-walk', '--format=%ct', self.dummyRevStr, '--'],
-                                             stampStr, float(stampStr))
-
-    # _get_changes is tested in TestGitPoller, below
+def gitLog(*commits):
+    """Return the output of C{git log -z --name-only} with the poller's
+    format for C{commits}, given as (revision, timestamp, author, comments,
+    files) tuples."""
+    output = []
+    for rev, timestamp, author, comments, files in commits:
+        output.append('\0%s\0%s\0%s\0%s\n\0'
+                      % (rev, timestamp, author, comments))
+        if files:
+            output.append('\n' + ''.join(f + '\0' for f in files))
+    return ''.join(output)
+
+
+def fakeCommit(rev):
+    return (rev, '1273258009', 'by:' + rev[:8], 'hello!', ['/etc/' + rev[:3]])
+
+
+class GitLogParser(unittest.TestCase):
+
+    commits = [
+        ('4423cdbcbb89c14e50dd5f4152415afd686c5241', '1273258009',
+         'Sammy Jankis <email@example.com>',
+         'this is a commit message\n\nthat is multiline',
+         ['file1', 'directory with space/file2', 'f\xc3\xa9']),
+        ('64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a', '1273258010',
+         'Sammy Jankis <email@example.com>', '', []),
+        ('9118f4ab71963d23d02d4bdc54876ac8bf05acf2', '1273258011',
+         'Sammy Jankis <email@example.com>', 'single line message',
+         ['\nfile with newline']),
+    ]
+
+    def expected(self, commits):
+        return [(rev, timestamp, author, comments + '\n', files)
+                for rev, timestamp, author, comments, files in commits]
+
+    def test_parse(self):
+        parser = gitpoller._GitLogParser()
+        commits = parser.feed(gitLog(*self.commits))
+        commits.extend(parser.finish())
+        self.assertEqual(commits, self.expected(self.commits))
+
+    def test_parse_incremental(self):
+        output = gitLog(*self.commits)
+        parser = gitpoller._GitLogParser()
+        commits = []
+        # each commit is complete only once the next one has started
+        second = output.index('\0' + self.commits[1][0])
+        for i in range(second + 1):
+            commits.extend(parser.feed(output[i]))
+        self.assertEqual(commits, self.expected(self.commits[:1]))
+        for i in range(second + 1, len(output)):
+            commits.extend(parser.feed(output[i]))
+        commits.extend(parser.finish())
+        self.assertEqual(commits, self.expected(self.commits))
+
+    def test_parse_empty(self):
+        parser = gitpoller._GitLogParser()
+        self.assertEqual(parser.feed(''), [])
+        self.assertEqual(parser.finish(), [])
+
+    def test_parse_garbage(self):
+        parser = gitpoller._GitLogParser()
+        self.assertRaises(ValueError, lambda: parser.feed('fatal\0'))
+
+    def test_parse_truncated(self):
+        parser = gitpoller._GitLogParser()
+        self.assertEqual(parser.feed('\0abcdef\0123'), [])
+        self.assertRaises(ValueError, parser.finish)
 
 
 class TestGitPoller(gpo.GetProcessOutputMixin,
@@ -170,9 +118,34 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
     def tearDown(self):
         return self.tearDownChangeSource()
 
+    def expectLog(self, revRange, *revs):
+        return gpo.Expect('git', 'log', '--reverse', '-z', '--name-only',
+                          gitpoller._GitLogParser.LOG_FORMAT, revRange, '--') \
+            .path('gitpoller-work') \
+            .stdout(gitLog(*[fakeCommit(rev) if isinstance(rev, str) else rev
+                             for rev in revs]))
+
+    def expectPollCommands(self, *logExpectations):
+        self.expectCommands(
+            gpo.Expect('git', 'init', '--bare', 'gitpoller-work'),
+            gpo.Expect('git', 'fetch', self.REPOURL,
+                       '+master:refs/buildbot/%s/master' % self.REPOURL_QUOTED)
+            .path('gitpoller-work'),
+            gpo.Expect('git', 'rev-parse',
+                       'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
+            .path('gitpoller-work')
+            .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
+            *logExpectations)
+        self.poller.lastRev = {
+            'master': 'fa3ae8ed68e664d4db24798611b352e3c6509930'
+        }
+
     def test_describe(self):
         self.assertSubstring("GitPoller", self.poller.describe())
 
+    def test_getProcessHost(self):
+        self.assertEqual(self.poller.getProcessHost(), 'example.com')
+
     def test_name(self):
         self.assertEqual(self.REPOURL, self.poller.name)
 
@@ -261,11 +234,7 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                        'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
-            gpo.Expect('git', 'log',
-                       '--format=%H',
-                       'fa3ae8ed68e664d4db24798611b352e3c6509930..4423cdbcbb89c14e50dd5f4152415afd686c5241',
-                       '--')
-            .path('gitpoller-work')
+            self.expectLog('fa3ae8ed68e664d4db24798611b352e3c6509930..4423cdbcbb89c14e50dd5f4152415afd686c5241')
             .exit(1),
         )
 
@@ -299,12 +268,7 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                        'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
-            gpo.Expect('git', 'log',
-                       '--format=%H',
-                       '4423cdbcbb89c14e50dd5f4152415afd686c5241..4423cdbcbb89c14e50dd5f4152415afd686c5241',
-                       '--')
-            .path('gitpoller-work')
-            .stdout(''),
+            self.expectLog('4423cdbcbb89c14e50dd5f4152415afd686c5241..4423cdbcbb89c14e50dd5f4152415afd686c5241'),
         )
 
         self.poller.lastRev = {
@@ -364,46 +328,19 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                        'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
-            gpo.Expect('git', 'log',
-                       '--format=%H',
-                       'fa3ae8ed68e664d4db24798611b352e3c6509930..4423cdbcbb89c14e50dd5f4152415afd686c5241',
-                       '--')
-            .path('gitpoller-work')
-            .stdout('\n'.join([
-                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a',
-                '4423cdbcbb89c14e50dd5f4152415afd686c5241'])),
+            self.expectLog(
+                'fa3ae8ed68e664d4db24798611b352e3c6509930..4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a'),
             gpo.Expect('git', 'rev-parse',
                        'refs/buildbot/%s/release' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('9118f4ab71963d23d02d4bdc54876ac8bf05acf2'),
-            gpo.Expect('git', 'log',
-                       '--format=%H',
-                       'bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5..9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
-                       '--')
-            .path('gitpoller-work')
-            .stdout('\n'.join([
-                '9118f4ab71963d23d02d4bdc54876ac8bf05acf2'
-            ])),
+            self.expectLog(
+                'bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5..9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
+                '9118f4ab71963d23d02d4bdc54876ac8bf05acf2'),
         )
 
-        # and patch out the _get_commit_foo methods which were already tested
-        # above
-        def timestamp(rev):
-            return defer.succeed(1273258009)
-        self.patch(self.poller, '_get_commit_timestamp', timestamp)
-
-        def author(rev):
-            return defer.succeed(u'by:' + rev[:8])
-        self.patch(self.poller, '_get_commit_author', author)
-
-        def files(rev):
-            return defer.succeed([u'/etc/' + rev[:3]])
-        self.patch(self.poller, '_get_commit_files', files)
-
-        def comments(rev):
-            return defer.succeed(u'hello!')
-        self.patch(self.poller, '_get_commit_comments', comments)
-
         # do the poll
         self.poller.branches = ['master', 'release']
         self.poller.lastRev = {
@@ -483,35 +420,13 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                        'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
-            gpo.Expect(
-                'git', 'log', '--format=%H',
+            self.expectLog(
                 'fa3ae8ed68e664d4db24798611b352e3c6509930..'
                 '4423cdbcbb89c14e50dd5f4152415afd686c5241',
-                '--')
-            .path('gitpoller-work')
-            .stdout('\n'.join([
-                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a',
-                '4423cdbcbb89c14e50dd5f4152415afd686c5241'])),
+                '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a'),
         )
 
-        # and patch out the _get_commit_foo methods which were already tested
-        # above
-        def timestamp(rev):
-            return defer.succeed(1273258009)
-        self.patch(self.poller, '_get_commit_timestamp', timestamp)
-
-        def author(rev):
-            return defer.succeed(u'by:' + rev[:8])
-        self.patch(self.poller, '_get_commit_author', author)
-
-        def files(rev):
-            return defer.succeed([u'/etc/' + rev[:3]])
-        self.patch(self.poller, '_get_commit_files', files)
-
-        def comments(rev):
-            return defer.succeed(u'hello!')
-        self.patch(self.poller, '_get_commit_comments', comments)
-
         # do the poll
         self.poller.branches = True
         self.poller.lastRev = {
@@ -561,12 +476,7 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                        'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
-            gpo.Expect('git', 'log',
-                       '--format=%H',
-                       '4423cdbcbb89c14e50dd5f4152415afd686c5241..4423cdbcbb89c14e50dd5f4152415afd686c5241',
-                       '--')
-            .path('gitpoller-work')
-            .stdout(''),
+            self.expectLog('4423cdbcbb89c14e50dd5f4152415afd686c5241..4423cdbcbb89c14e50dd5f4152415afd686c5241'),
         )
 
         self.poller.lastRev = {
@@ -599,47 +509,22 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                        'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
-            gpo.Expect(
-                'git', 'log', '--format=%H',
+            self.expectLog(
                 'fa3ae8ed68e664d4db24798611b352e3c6509930..'
                 '4423cdbcbb89c14e50dd5f4152415afd686c5241',
-                '--')
-            .path('gitpoller-work')
-            .stdout('\n'.join([
-                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a',
-                '4423cdbcbb89c14e50dd5f4152415afd686c5241'])),
+                '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a'),
             gpo.Expect(
                 'git', 'rev-parse', 'refs/buildbot/%s/release' %
                 self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('9118f4ab71963d23d02d4bdc54876ac8bf05acf2'),
-            gpo.Expect(
-                'git', 'log', '--format=%H',
+            self.expectLog(
                 'bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5..'
                 '9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
-                '--')
-            .path('gitpoller-work')
-            .stdout('\n'.join(['9118f4ab71963d23d02d4bdc54876ac8bf05acf2'])),
+                '9118f4ab71963d23d02d4bdc54876ac8bf05acf2'),
         )
 
-        # and patch out the _get_commit_foo methods which were already tested
-        # above
-        def timestamp(rev):
-            return defer.succeed(1273258009)
-        self.patch(self.poller, '_get_commit_timestamp', timestamp)
-
-        def author(rev):
-            return defer.succeed(u'by:' + rev[:8])
-        self.patch(self.poller, '_get_commit_author', author)
-
-        def files(rev):
-            return defer.succeed([u'/etc/' + rev[:3]])
-        self.patch(self.poller, '_get_commit_files', files)
-
-        def comments(rev):
-            return defer.succeed(u'hello!')
-        self.patch(self.poller, '_get_commit_comments', comments)
-
         # do the poll
         self.poller.branches = True
         self.poller.lastRev = {
@@ -698,35 +583,13 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                        'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
-            gpo.Expect(
-                'git', 'log', '--format=%H',
+            self.expectLog(
                 'fa3ae8ed68e664d4db24798611b352e3c6509930..'
                 '4423cdbcbb89c14e50dd5f4152415afd686c5241',
-                '--')
-            .path('gitpoller-work')
-            .stdout('\n'.join([
-                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a',
-                '4423cdbcbb89c14e50dd5f4152415afd686c5241']))
+                '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a')
         )
 
-        # and patch out the _get_commit_foo methods which were already tested
-        # above
-        def timestamp(rev):
-            return defer.succeed(1273258009)
-        self.patch(self.poller, '_get_commit_timestamp', timestamp)
-
-        def author(rev):
-            return defer.succeed(u'by:' + rev[:8])
-        self.patch(self.poller, '_get_commit_author', author)
-
-        def files(rev):
-            return defer.succeed([u'/etc/' + rev[:3]])
-        self.patch(self.poller, '_get_commit_files', files)
-
-        def comments(rev):
-            return defer.succeed(u'hello!')
-        self.patch(self.poller, '_get_commit_comments', comments)
-
         # do the poll
         class TestCallable:
 
@@ -791,33 +654,12 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                 'refs/buildbot/%s/refs/pull/410/head' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('9118f4ab71963d23d02d4bdc54876ac8bf05acf2'),
-            gpo.Expect(
-                'git', 'log', '--format=%H',
+            self.expectLog(
                 'bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5..'
                 '9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
-                '--')
-            .path('gitpoller-work')
-            .stdout('\n'.join(['9118f4ab71963d23d02d4bdc54876ac8bf05acf2'])),
+                '9118f4ab71963d23d02d4bdc54876ac8bf05acf2'),
         )
 
-        # and patch out the _get_commit_foo methods which were already tested
-        # above
-        def timestamp(rev):
-            return defer.succeed(1273258009)
-        self.patch(self.poller, '_get_commit_timestamp', timestamp)
-
-        def author(rev):
-            return defer.succeed(u'by:' + rev[:8])
-        self.patch(self.poller, '_get_commit_author', author)
-
-        def files(rev):
-            return defer.succeed([u'/etc/' + rev[:3]])
-        self.patch(self.poller, '_get_commit_files', files)
-
-        def comments(rev):
-            return defer.succeed(u'hello!')
-        self.patch(self.poller, '_get_commit_comments', comments)
-
         def pullFilter(branch):
             """
             Note that this isn't useful in practice, because it will only
@@ -870,35 +712,12 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                        'refs/buildbot/%s/master' % self.REPOURL_QUOTED)
             .path('gitpoller-work')
             .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
-            gpo.Expect('git', 'log',
-                       '--format=%H',
-                       'fa3ae8ed68e664d4db24798611b352e3c6509930..4423cdbcbb89c14e50dd5f4152415afd686c5241',
-                       '--')
-            .path('gitpoller-work')
-            .stdout('\n'.join([
-                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a',
-                '4423cdbcbb89c14e50dd5f4152415afd686c5241'
-            ])),
+            self.expectLog(
+                'fa3ae8ed68e664d4db24798611b352e3c6509930..4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a'),
         )
 
-        # and patch out the _get_commit_foo methods which were already tested
-        # above
-        def timestamp(rev):
-            return defer.succeed(1273258009)
-        self.patch(self.poller, '_get_commit_timestamp', timestamp)
-
-        def author(rev):
-            return defer.succeed(u'by:' + rev[:8])
-        self.patch(self.poller, '_get_commit_author', author)
-
-        def files(rev):
-            return defer.succeed([u'/etc/' + rev[:3]])
-        self.patch(self.poller, '_get_commit_files', files)
-
-        def comments(rev):
-            return defer.succeed(u'hello!')
-        self.patch(self.poller, '_get_commit_comments', comments)
-
         # do the poll
         self.poller.lastRev = {
             'master': 'fa3ae8ed68e664d4db24798611b352e3c6509930'
@@ -952,6 +771,119 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
 
         return d
 
+    def test_poll_batches(self):
+        revs = ['%040x' % i for i in range(1, 8)]
+        self.expectPollCommands(
+            self.expectLog('fa3ae8ed68e664d4db24798611b352e3c6509930..'
+                           '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                           *revs))
+        self.poller.changeBatchSize = 3
+
+        # count the batches taken from git
+        batches = []
+        nextBatch = gitpoller._GitLogProtocol.nextBatch
+
+        def patchedNextBatch(proto):
+            d = nextBatch(proto)
+            d.addCallback(lambda batch: batches.append(len(batch)) or batch)
+            return d
+        self.patch(gitpoller._GitLogProtocol, 'nextBatch', patchedNextBatch)
+
+        d = self.poller.poll()
+
+        @d.addCallback
+        def check(_):
+            self.assertAllCommandsRan()
+            self.assertEqual(batches, [3, 3, 1, 0])
+            self.assertEqual(
+                [c['revision'] for c in self.master.data.updates.changesAdded],
+                revs)
+            self.assertEqual(self.poller.changeCount, 7)
+        return d
+
+    def test_poll_decoding(self):
+        self.expectPollCommands(
+            self.expectLog('fa3ae8ed68e664d4db24798611b352e3c6509930..'
+                           '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                           ('4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                            '1273258009', 'J\xc3\xa9r\xc3\xb4me <j@example.com>',
+                            'this is a commit message\n\nthat is multiline',
+                            ['file space', 'f\xc3\xa9', '"quoted"'])))
+        self.poller.usetimestamps = False
+
+        d = self.poller.poll()
+
+        @d.addCallback
+        def check(_):
+            self.assertAllCommandsRan()
+            added = self.master.data.updates.changesAdded
+            self.assertEqual(len(added), 1)
+            self.assertEqual(added[0]['author'], u'J\xe9r\xf4me <j@example.com>')
+            self.assertEqual(added[0]['comments'],
+                             u'this is a commit message\n\nthat is multiline')
+            self.assertEqual(added[0]['files'],
+                             [u'file space', u'f\xe9', u'"quoted"'])
+            self.assertEqual(added[0]['when_timestamp'], None)
+        return d
+
+    def test_poll_badTimestamp(self):
+        self.expectPollCommands(
+            self.expectLog('fa3ae8ed68e664d4db24798611b352e3c6509930..'
+                           '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                           ('4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                            'soon', 'by:4423cdbc', 'hello!', [])))
+
+        d = self.poller.poll()
+
+        @d.addCallback
+        def check(_):
+            self.assertAllCommandsRan()
+            self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+            self.assertEqual(self.master.data.updates.changesAdded, [])
+        return d
+
+    def test_poll_badOutput(self):
+        self.expectPollCommands(
+            gpo.Expect('git', 'log', '--reverse', '-z', '--name-only',
+                       gitpoller._GitLogParser.LOG_FORMAT,
+                       'fa3ae8ed68e664d4db24798611b352e3c6509930..'
+                       '4423cdbcbb89c14e50dd5f4152415afd686c5241', '--')
+            .path('gitpoller-work')
+            .stdout('warning: something\0' + gitLog(fakeCommit('1' * 40))))
+
+        d = self.poller.poll()
+
+        @d.addCallback
+        def check(_):
+            self.assertAllCommandsRan()
+            self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+            self.assertEqual(self.master.data.updates.changesAdded, [])
+        return d
+
+    def test_poll_failLog_midway(self):
+        revs = ['%040x' % i for i in range(1, 4)]
+        self.expectPollCommands(
+            self.expectLog('fa3ae8ed68e664d4db24798611b352e3c6509930..'
+                           '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                           *revs)
+            .stderr('fatal: out of memory')
+            .exit(128))
+        self.poller.changeBatchSize = 2
+
+        d = self.poller.poll()
+
+        @d.addCallback
+        def check(_):
+            self.assertAllCommandsRan()
+            errors = self.flushLoggedErrors(EnvironmentError)
+            self.assertEqual(len(errors), 1)
+            self.assertIn('fatal: out of memory', str(errors[0].value))
+            # the first batch was complete before git failed
+            self.assertEqual(
+                [c['revision'] for c in self.master.data.updates.changesAdded],
+                revs[:2])
+        return d
+
     # We mock out base.PollingChangeSource.startService, since it calls
     # reactor.callWhenRunning, which leaves a dirty reactor if a synchronous
     # deferred is returned from a test method.
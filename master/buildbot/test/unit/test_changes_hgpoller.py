@@ -70,6 +70,9 @@ class TestHgPoller(gpo.GetProcessOutputMixin,
     def test_describe(self):
         self.assertSubstring("HgPoller", self.poller.describe())
 
+    def test_getProcessHost(self):
+        self.assertEqual(self.poller.getProcessHost(), 'example.com')
+
     def test_name(self):
         self.assertEqual(self.remote_repo, self.poller.name)
 
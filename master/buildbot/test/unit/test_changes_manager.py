@@ -30,6 +30,8 @@ class TestChangeManager(unittest.TestCase):
         self.master = mock.Mock()
         self.cm = manager.ChangeManager(self.master)
         self.new_config = mock.Mock()
+        self.new_config.changeSourcePolling = dict(
+            max_processes=None, max_processes_per_host=None, jitter=0)
 
     def make_sources(self, n):
         for i in range(n):
@@ -62,3 +64,17 @@ class TestChangeManager(unittest.TestCase):
             self.assertIdentical(src1.parent, None)
             self.assertIdentical(src1.master, None)
         return d
+
+    def test_reconfigService_processPool(self):
+        self.new_config.change_sources = []
+        self.new_config.changeSourcePolling = dict(
+            max_processes=8, max_processes_per_host=2, jitter=0.5)
+
+        d = self.cm.reconfigService(self.new_config)
+
+        @d.addCallback
+        def check(_):
+            self.assertEqual(self.cm.processPool.maxProcesses, 8)
+            self.assertEqual(self.cm.processPool.maxPerHost, 2)
+            self.assertEqual(self.cm.pollJitter, 0.5)
+        return d
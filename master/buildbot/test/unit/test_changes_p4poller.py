@@ -111,6 +111,16 @@ class TestP4Poller(changesource.ChangeSourceMixin,
                      split_file=lambda x: x.split('/', 1)))
         self.assertSubstring("p4source", self.changesource.describe())
 
+    def test_getProcessHost(self):
+        for p4port, host in [(None, None),
+                             ('perforce:1666', 'perforce'),
+                             ('ssl:Perforce.example.com:1666',
+                              'perforce.example.com')]:
+            cs = P4Source(p4port=p4port, p4user=None,
+                          p4base='//depot/myproject/',
+                          split_file=lambda x: x.split('/', 1))
+            self.assertEqual(cs.getProcessHost(), host)
+
     def test_name(self):
         # no name:
         cs1 = P4Source(p4port=None, p4user=None,
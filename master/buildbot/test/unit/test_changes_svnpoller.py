@@ -278,6 +278,12 @@ class TestSVNPoller(gpo.GetProcessOutputMixin,
         s = self.attachSVNPoller('file://')
         self.assertSubstring("SVNPoller", s.describe())
 
+    def test_getProcessHost(self):
+        s = self.attachSVNPoller('svn+ssh://svn.example.com/repo/trunk')
+        self.assertEqual(s.getProcessHost(), 'svn.example.com')
+        s = self.attachSVNPoller('file:///var/svn/repo')
+        self.assertEqual(s.getProcessHost(), None)
+
     def test_name(self):
         s = self.attachSVNPoller('file://')
         self.assertEqual("file://", s.name)
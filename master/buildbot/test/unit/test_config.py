@@ -55,6 +55,10 @@ global_defaults = dict(
     properties=properties.Properties(),
     mergeRequests=None,
     prioritizeBuilders=None,
+    builderDistributionConcurrency=1,
+    changeSourcePolling=dict(max_processes=None, max_processes_per_host=None,
+                             jitter=0),
+    retention=dict(enabled=False, batch_size=100, dry_run=False),
     protocols={},
     multiMaster=False,
     manhole=None,
@@ -178,7 +182,8 @@ class MasterConfig(ConfigErrorsMixin, dirs.DirsMixin, unittest.TestCase):
                 db_url='sqlite:///state.sqlite'),
             mq=dict(type='simple'),
             metrics=None,
-            caches=dict(Changes=10, Builds=15),
+            caches=dict(Changes=10, Builds=15, logchunks=10),
+            cacheAutoTune=None,
             schedulers={},
             builders=[],
             slaves=[],
@@ -496,6 +501,82 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
                              dict(prioritizeBuilders='yes'))
         self.assertConfigError(self.errors, "must be a callable")
 
+    def test_load_global_builderDistributionConcurrency(self):
+        self.do_test_load_global(dict(builderDistributionConcurrency=4),
+                                 builderDistributionConcurrency=4)
+
+    def test_load_global_builderDistributionConcurrency_invalid(self):
+        self.cfg.load_global(self.filename,
+                             dict(builderDistributionConcurrency=0))
+        self.assertConfigError(self.errors, "must be a positive integer")
+
+    def test_load_global_changeSourcePolling(self):
+        self.do_test_load_global(
+            dict(changeSourcePolling=dict(max_processes=8,
+                                          max_processes_per_host=2)),
+            changeSourcePolling=dict(max_processes=8,
+                                     max_processes_per_host=2, jitter=0))
+
+    def test_load_global_changeSourcePolling_jitter(self):
+        self.do_test_load_global(
+            dict(changeSourcePolling=dict(jitter=0.5)),
+            changeSourcePolling=dict(max_processes=None,
+                                     max_processes_per_host=None, jitter=0.5))
+
+    def test_load_global_changeSourcePolling_not_dict(self):
+        self.cfg.load_global(self.filename,
+                             dict(changeSourcePolling=8))
+        self.assertConfigError(self.errors, "must be a dictionary")
+
+    def test_load_global_changeSourcePolling_unknown_key(self):
+        self.cfg.load_global(self.filename,
+                             dict(changeSourcePolling=dict(processes=8)))
+        self.assertConfigError(self.errors,
+                               "unknown c['changeSourcePolling'] keys processes")
+
+    def test_load_global_changeSourcePolling_invalid_limit(self):
+        self.cfg.load_global(self.filename,
+                             dict(changeSourcePolling=dict(
+                                 max_processes_per_host=0)))
+        self.assertConfigError(self.errors, "must be a positive integer")
+
+    def test_load_global_changeSourcePolling_invalid_jitter(self):
+        self.cfg.load_global(self.filename,
+                             dict(changeSourcePolling=dict(jitter=2)))
+        self.assertConfigError(self.errors, "between 0 and 1")
+
+    def test_load_global_retention(self):
+        self.do_test_load_global(
+            dict(retention=dict(enabled=True, dry_run=True)),
+            retention=dict(enabled=True, batch_size=100, dry_run=True))
+
+    def test_load_global_retention_not_dict(self):
+        self.cfg.load_global(self.filename, dict(retention=True))
+        self.assertConfigError(self.errors, "must be a dictionary")
+
+    def test_load_global_retention_unknown_key(self):
+        self.cfg.load_global(self.filename,
+                             dict(retention=dict(horizon=10)))
+        self.assertConfigError(self.errors,
+                               "unknown c['retention'] keys horizon")
+
+    def test_load_global_retention_invalid_batch_size(self):
+        self.cfg.load_global(self.filename,
+                             dict(retention=dict(batch_size=0)))
+        self.assertConfigError(self.errors, "must be a positive integer")
+
+    def test_load_global_retention_invalid_dry_run(self):
+        self.cfg.load_global(self.filename,
+                             dict(retention=dict(dry_run='yes')))
+        self.assertConfigError(self.errors, "must be True or False")
+
+    def test_load_global_retention_invalid_enabled(self):
+        self.cfg.load_global(self.filename,
+                             dict(retention=dict(enabled=1)))
+        self.assertConfigError(self.errors,
+                               "c['retention']['enabled'] must be True or "
+                               "False")
+
     def test_load_global_slavePortnum_int(self):
         self.do_test_load_global(dict(slavePortnum=123),
                                  protocols={'pb': {'port': 'tcp:123'}})
@@ -570,6 +651,34 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
                          dict(db=dict(db_url='abcd', db_poll_interval=10)))
         self.assertResults(db=dict(db_url='abcd'))
 
+    def test_load_db_log_compression(self):
+        self.cfg.load_db(self.filename,
+                         dict(db=dict(db_url='abcd', log_compression='bz2')))
+        self.assertResults(db=dict(db_url='abcd', log_compression='bz2'))
+
+    def test_load_db_log_compression_invalid(self):
+        self.cfg.load_db(self.filename,
+                         dict(db=dict(log_compression='zip')))
+        self.assertConfigError(self.errors, "must be one of")
+
+    def test_load_db_pool_size(self):
+        self.cfg.load_db(self.filename,
+                         dict(db=dict(db_url='abcd', pool_size=5,
+                                      pool_max_size=20)))
+        self.assertResults(db=dict(db_url='abcd', pool_size=5,
+                                   pool_max_size=20))
+
+    def test_load_db_pool_size_invalid(self):
+        self.cfg.load_db(self.filename,
+                         dict(db=dict(db_url='abcd', pool_size=0)))
+        self.assertConfigError(self.errors, "must be a positive integer")
+
+    def test_load_db_pool_max_size_too_small(self):
+        self.cfg.load_db(self.filename,
+                         dict(db=dict(db_url='abcd', pool_size=10,
+                                      pool_max_size=5)))
+        self.assertConfigError(self.errors, "must not be less than")
+
     def test_load_db_unk_keys(self):
         self.cfg.load_db(self.filename,
                          dict(db=dict(db_url='abcd', db_poll_interval=10, bar='bar')))
@@ -593,6 +702,26 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
                          dict(mq=dict(bar='bar')))
         self.assertConfigError(self.errors, "unrecognized keys in")
 
+    def test_load_mq_persistent_queue(self):
+        self.cfg.load_mq(self.filename,
+                         dict(mq=dict(persistent_queue_size=0,
+                                      persistent_queue_dir='/var/tmp')))
+        self.assertResults(mq=dict(type='simple', persistent_queue_size=0,
+                                   persistent_queue_dir='/var/tmp'))
+
+    def test_load_mq_persistent_queue_size_invalid(self):
+        for size in (-1, '100', True):
+            self.errors.errors[:] = []
+            self.cfg.load_mq(self.filename,
+                             dict(mq=dict(persistent_queue_size=size)))
+            self.assertConfigError(self.errors,
+                                   "must be a non-negative integer")
+
+    def test_load_mq_persistent_queue_dir_invalid(self):
+        self.cfg.load_mq(self.filename,
+                         dict(mq=dict(persistent_queue_dir=['/tmp'])))
+        self.assertConfigError(self.errors, "must be a directory name")
+
     def test_load_metrics_defaults(self):
         self.cfg.load_metrics(self.filename, {})
         self.assertResults(metrics=None)
@@ -608,7 +737,8 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
 
     def test_load_caches_defaults(self):
         self.cfg.load_caches(self.filename, {})
-        self.assertResults(caches=dict(Changes=10, Builds=15))
+        self.assertResults(caches=dict(Changes=10, Builds=15,
+                                       logchunks=10))
 
     def test_load_caches_invalid(self):
         self.cfg.load_caches(self.filename, dict(caches=13))
@@ -617,7 +747,8 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_caches_buildCacheSize(self):
         self.cfg.load_caches(self.filename,
                              dict(buildCacheSize=13))
-        self.assertResults(caches=dict(Builds=13, Changes=10))
+        self.assertResults(caches=dict(Builds=13, Changes=10,
+                                       logchunks=10))
 
     def test_load_caches_buildCacheSize_and_caches(self):
         self.cfg.load_caches(self.filename,
@@ -627,7 +758,8 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_caches_changeCacheSize(self):
         self.cfg.load_caches(self.filename,
                              dict(changeCacheSize=13))
-        self.assertResults(caches=dict(Changes=13, Builds=15))
+        self.assertResults(caches=dict(Changes=13, Builds=15,
+                                       logchunks=10))
 
     def test_load_caches_changeCacheSize_and_caches(self):
         self.cfg.load_caches(self.filename,
@@ -637,7 +769,8 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_caches(self):
         self.cfg.load_caches(self.filename,
                              dict(caches=dict(foo=1)))
-        self.assertResults(caches=dict(Changes=10, Builds=15, foo=1))
+        self.assertResults(caches=dict(Changes=10, Builds=15,
+                                       logchunks=10, foo=1))
 
     def test_load_caches_not_int_err(self):
         """
@@ -656,6 +789,43 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
         self.assertConfigError(self.errors,
                                "'Changes' cache size must be at least 1, got '-12'")
 
+    def test_load_caches_cacheAutoTune(self):
+        self.cfg.load_caches(self.filename,
+                             dict(cacheAutoTune=dict(memory_budget=2 ** 20)))
+        self.assertResults(cacheAutoTune=dict(memory_budget=2 ** 20,
+                                              interval=300))
+
+    def test_load_caches_cacheAutoTune_interval(self):
+        self.cfg.load_caches(self.filename,
+                             dict(cacheAutoTune=dict(memory_budget=2 ** 20,
+                                                     interval=60)))
+        self.assertResults(cacheAutoTune=dict(memory_budget=2 ** 20,
+                                              interval=60))
+
+    def test_load_caches_cacheAutoTune_invalid(self):
+        self.cfg.load_caches(self.filename, dict(cacheAutoTune=13))
+        self.assertConfigError(self.errors, "must be a dictionary")
+
+    def test_load_caches_cacheAutoTune_no_budget(self):
+        self.cfg.load_caches(self.filename,
+                             dict(cacheAutoTune=dict(interval=60)))
+        self.assertConfigError(self.errors,
+                               "'memory_budget'] must be a positive integer")
+
+    def test_load_caches_cacheAutoTune_bad_interval(self):
+        self.cfg.load_caches(self.filename,
+                             dict(cacheAutoTune=dict(memory_budget=100,
+                                                     interval=0)))
+        self.assertConfigError(self.errors,
+                               "'interval'] must be a positive number")
+
+    def test_load_caches_cacheAutoTune_unknown_key(self):
+        self.cfg.load_caches(self.filename,
+                             dict(cacheAutoTune=dict(memory_budget=100,
+                                                     budget=10)))
+        self.assertConfigError(self.errors,
+                               "unknown c['cacheAutoTune'] keys budget")
+
     def test_load_schedulers_defaults(self):
         self.cfg.load_schedulers(self.filename, {})
         self.assertResults(schedulers={})
@@ -1044,6 +1214,20 @@ class MasterConfig_checkers(ConfigErrorsMixin, unittest.TestCase):
 
         self.assertConfigError(self.errors, "logHorizon must be less")
 
+    def test_check_horizons_builder(self):
+        self.cfg.buildHorizon = 50
+        self.cfg.builders = [
+            FakeBuilder(name='b1', logHorizon=None, buildHorizon=None),
+            FakeBuilder(name='b2', logHorizon=20, buildHorizon=None),
+            FakeBuilder(name='b3', logHorizon=60, buildHorizon=None),
+            FakeBuilder(name='b4', logHorizon=60, buildHorizon=100),
+        ]
+        self.cfg.check_horizons()
+
+        self.assertConfigError(self.errors, "builder 'b3': logHorizon must "
+                               "be less than or equal to buildHorizon")
+        self.assertEqual(len(self.errors.errors), 1)
+
     def test_check_ports_protocols_set(self):
         self.cfg.protocols = {"pb": {"port": 10}}
         self.cfg.check_ports()
@@ -1188,6 +1372,8 @@ class BuilderConfig(ConfigErrorsMixin, unittest.TestCase):
                               env={},
                               properties={},
                               mergeRequests=None,
+                              buildHorizon=None,
+                              logHorizon=None,
                               description=None)
 
     def test_unicode_name(self):
@@ -1241,6 +1427,21 @@ class BuilderConfig(ConfigErrorsMixin, unittest.TestCase):
                                                'slavenames': ['s2', 's1'],
                                                })
 
+    def test_horizons(self):
+        cfg = config.BuilderConfig(name='b', slavename='s1',
+                                   factory=self.factory, buildHorizon=100,
+                                   logHorizon=10)
+        self.assertAttributes(cfg, buildHorizon=100, logHorizon=10)
+        self.assertEqual(cfg.getConfigDict()['buildHorizon'], 100)
+        self.assertEqual(cfg.getConfigDict()['logHorizon'], 10)
+
+    def test_horizons_invalid(self):
+        self.assertRaisesConfigError(
+            "builder 'b': logHorizon must be a non-negative integer",
+            lambda: config.BuilderConfig(name='b', slavename='s1',
+                                         factory=self.factory,
+                                         logHorizon=-1))
+
     def test_getConfigDict_mergeRequests(self):
         for mr in (False, lambda a, b, c: False):
             cfg = config.BuilderConfig(name='b', mergeRequests=mr,
@@ -152,7 +152,8 @@ class TestBuildRequestsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
             buildername=None,
             bsid=None,
             complete=None,
-            claimed=None)
+            claimed=None,
+            brids=None)
 
     @defer.inlineCallbacks
     def testGetFilters(self):
@@ -170,7 +171,8 @@ class TestBuildRequestsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
             buildername=None,
             bsid=55,
             complete=False,
-            claimed=True)
+            claimed=True,
+            brids=None)
 
     @defer.inlineCallbacks
     def testGetClaimedByMasterIdFilters(self):
@@ -186,7 +188,17 @@ class TestBuildRequestsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
             buildername=None,
             bsid=None,
             complete=None,
-            claimed=fakedb.FakeBuildRequestsComponent.MASTER_ID)
+            claimed=fakedb.FakeBuildRequestsComponent.MASTER_ID,
+            brids=None)
+
+    @defer.inlineCallbacks
+    def testGetBuildrequestidFilter(self):
+        f1 = resultspec.Filter('buildrequestid', 'eq', [44, 45])
+        buildrequests = yield self.callGet(
+            ('buildrequests',),
+            resultSpec=resultspec.ResultSpec(filters=[f1]))
+        self.assertEqual(sorted(br['buildrequestid'] for br in buildrequests),
+                         [44, 45])
 
 
 class TestBuildRequest(interfaces.InterfaceTests, unittest.TestCase):
@@ -258,6 +270,25 @@ class TestBuildRequest(interfaces.InterfaceTests, unittest.TestCase):
                                      expectedRes=True,
                                      expectedException=None)
 
+    @defer.inlineCallbacks
+    def testClaimBuildRequestsEvents(self):
+        self.master.db.insertTestData([
+            fakedb.Builder(id=77, name='bbb'),
+            fakedb.BuildRequest(id=44, buildsetid=8822, buildername='bbb'),
+            fakedb.BuildRequest(id=55, buildsetid=8822, buildername='bbb'),
+        ])
+        # the updated requests are fetched together, not one at a time
+        self.patch(self.master.db.buildrequests, 'getBuildRequest',
+                   mock.Mock(side_effect=AssertionError("called")))
+        res = yield self.rtype.claimBuildRequests([44, 55],
+                                                  claimed_at=self.CLAIMED_AT)
+        self.assertTrue(res)
+        self.assertEqual(
+            sorted((k, msg['claimed'])
+                   for k, msg in self.master.mq.productions),
+            [(('buildrequests', '44', 'update'), True),
+             (('buildrequests', '55', 'update'), True)])
+
     @defer.inlineCallbacks
     def testClaimBuildRequestsNoBrids(self):
         claimBuildRequestsMock = mock.Mock(return_value=defer.succeed(None))
@@ -0,0 +1,72 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from buildbot.data import caches
+from buildbot.test.util import endpoint
+from twisted.internet import defer
+from twisted.trial import unittest
+
+chdicts = dict(hits=10, refhits=2, misses=3, max_size=5, size=5,
+               evictions=1, miss_latency=0.25, memory=5000)
+ssdicts = dict(hits=0, refhits=0, misses=0, max_size=1, size=0,
+               evictions=0, miss_latency=None, memory=0)
+
+
+class CacheEndpoint(endpoint.EndpointMixin, unittest.TestCase):
+
+    endpointClass = caches.CacheEndpoint
+    resourceTypeClass = caches.Cache
+
+    def setUp(self):
+        self.setUpEndpoint()
+        self.master.caches.get_metrics = lambda: dict(chdicts=chdicts,
+                                                      ssdicts=ssdicts)
+
+    def tearDown(self):
+        self.tearDownEndpoint()
+
+    @defer.inlineCallbacks
+    def test_get_existing(self):
+        cache = yield self.callGet(('caches', 'chdicts'))
+        self.validateData(cache)
+        expected = dict(chdicts, name=u'chdicts')
+        self.assertEqual(cache, expected)
+
+    @defer.inlineCallbacks
+    def test_get_missing(self):
+        cache = yield self.callGet(('caches', 'bdicts'))
+        self.assertEqual(cache, None)
+
+
+class CachesEndpoint(endpoint.EndpointMixin, unittest.TestCase):
+
+    endpointClass = caches.CachesEndpoint
+    resourceTypeClass = caches.Cache
+
+    def setUp(self):
+        self.setUpEndpoint()
+        self.master.caches.get_metrics = lambda: dict(chdicts=chdicts,
+                                                      ssdicts=ssdicts)
+
+    def tearDown(self):
+        self.tearDownEndpoint()
+
+    @defer.inlineCallbacks
+    def test_get(self):
+        cachelist = yield self.callGet(('caches',))
+        [self.validateData(c) for c in cachelist]
+        self.assertEqual([c['name'] for c in cachelist],
+                         [u'chdicts', u'ssdicts'])
+        self.assertEqual(cachelist[1]['miss_latency'], None)
@@ -220,6 +220,50 @@ class Log(interfaces.InterfaceTests, unittest.TestCase):
             (13, u'foo', u'foo_3', 's'),
         ])
 
+    @defer.inlineCallbacks
+    def test_followLog(self):
+        self.patch(self.master.db.logs, 'appendLog',
+                   mock.Mock(side_effect=lambda **kw: defer.succeed(
+                       (10, 11, kw['content']))))
+        calls = []
+        sub = self.rtype.followLog(10, lambda *args: calls.append(args))
+        self.rtype.followLog(11, lambda *args: calls.append(('other',)))
+        yield self.rtype.appendLog(logid=10, content=u'foo\nbar\n')
+        self.assertEqual(calls, [(10, u'foo\nbar\n')])
+
+        sub.unsubscribe()
+        self.assertNotIn(10, self.rtype._followers)
+        yield self.rtype.appendLog(logid=10, content=u'baz\n')
+        self.assertEqual(len(calls), 1)
+
+    @defer.inlineCallbacks
+    def test_followLog_truncated(self):
+        # followers get the lines as they were stored, not as given
+        self.patch(self.master.db.logs, 'appendLog',
+                   mock.Mock(return_value=defer.succeed(
+                       (10, 10, u'x' * 10 + u'\n'))))
+        calls = []
+        self.rtype.followLog(10, lambda *args: calls.append(args))
+        yield self.rtype.appendLog(logid=10, content=u'x' * 20 + u'\n')
+        self.assertEqual(calls, [(10, u'x' * 10 + u'\n')])
+
+    def test_followLog_unsubscribe_last(self):
+        sub1 = self.rtype.followLog(10, lambda *args: None)
+        sub2 = self.rtype.followLog(10, lambda *args: None)
+        sub1.unsubscribe()
+        self.assertIn(10, self.rtype._followers)
+        sub2.unsubscribe()
+        self.assertNotIn(10, self.rtype._followers)
+
+    @defer.inlineCallbacks
+    def test_followLog_missing_log(self):
+        self.patch(self.master.db.logs, 'appendLog',
+                   mock.Mock(return_value=defer.succeed(None)))
+        calls = []
+        self.rtype.followLog(10, lambda *args: calls.append(args))
+        yield self.rtype.appendLog(logid=10, content=u'foo\n')
+        self.assertEqual(calls, [])
+
     def test_signature_finishLog(self):
         @self.assertArgSpecMatches(
             self.master.data.updates.finishLog,  # fake
@@ -197,6 +197,17 @@ class ResultSpec(unittest.TestCase):
             base.ListResult(mklist('x', *range(10, 20)),
                             offset=10, total=30, limit=10))
 
+    def test_pagination_prepaginated_fields(self):
+        data = base.ListResult(mklist(('x', 'y'), *zip(range(10, 20),
+                                                       range(20, 30))))
+        data.offset = 10
+        data.total = 30
+        data.limit = 10
+        self.assertListResultEqual(
+            resultspec.ResultSpec(fields=['x']).apply(data),
+            base.ListResult(mklist('x', *range(10, 20)),
+                            offset=10, total=30, limit=10))
+
     def test_pagination_prepaginated_without_clearing_resultspec(self):
         data = base.ListResult(mklist('x', *range(10, 20)))
         data.offset = 10
@@ -76,6 +76,16 @@ class Integer(TypeMixin, unittest.TestCase):
     cmpResults = [(10, '9', 1), (-2, '-1', -1)]
 
 
+class Float(TypeMixin, unittest.TestCase):
+
+    klass = types.Float
+    good = [0.0, -1.5, 1e100]
+    bad = [None, '', '0', 1]
+    stringValues = [('0', 0.0), ('-1.5', -1.5), ('1e3', 1000.0)]
+    badStringValues = ['one', '']
+    cmpResults = [(10.0, '9.5', 1), (-2.0, '-1', -1)]
+
+
 class String(TypeMixin, unittest.TestCase):
 
     klass = types.String
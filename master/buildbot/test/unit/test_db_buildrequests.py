@@ -122,6 +122,25 @@ class Tests(interfaces.InterfaceTests):
         return self.do_test_getBuildRequests_claim_args(
             expected=[50, 51, 52, 53])
 
+    def test_getBuildRequests_brids(self):
+        return self.do_test_getBuildRequests_claim_args(
+            brids=[50, 52, 54],
+            expected=[50, 52])
+
+    def test_getBuildRequests_brids_batched(self):
+        d = self.insertTestData([
+            fakedb.BuildRequest(id=id, buildsetid=self.BSID)
+            for id in range(1, 251)])
+        d.addCallback(lambda _:
+                      self.db.buildrequests.getBuildRequests(
+                          brids=range(2, 251, 2)))
+
+        def check(brlist):
+            self.assertEqual(sorted([br['buildrequestid'] for br in brlist]),
+                             range(2, 251, 2))
+        d.addCallback(check)
+        return d
+
     def test_getBuildRequests_claimed_mine(self):
         return self.do_test_getBuildRequests_claim_args(
             claimed=self.MASTER_ID,
@@ -342,6 +361,69 @@ class Tests(interfaces.InterfaceTests):
     def test_getBuildRequests_no_repository_nor_branch(self):
         return self.do_test_getBuildRequests_branch_arg(expected=[70, 80, 90])
 
+    def test_signature_getOldestRequestTimes(self):
+        @self.assertArgSpecMatches(self.db.buildrequests.getOldestRequestTimes)
+        def getOldestRequestTimes(self, buildernames=None):
+            pass
+
+    def do_test_getOldestRequestTimes(self, buildernames, expected):
+        d = self.insertTestData([
+            fakedb.BuildRequest(id=50, buildsetid=self.BSID, buildername="a",
+                                submitted_at=self.SUBMITTED_AT_EPOCH + 10),
+            fakedb.BuildRequest(id=51, buildsetid=self.BSID, buildername="a",
+                                submitted_at=self.SUBMITTED_AT_EPOCH),
+            # claimed and complete requests are not pending
+            fakedb.BuildRequest(id=52, buildsetid=self.BSID, buildername="a",
+                                submitted_at=self.SUBMITTED_AT_EPOCH - 10),
+            fakedb.BuildRequestClaim(brid=52, masterid=self.MASTER_ID,
+                                     claimed_at=self.CLAIMED_AT_EPOCH),
+            fakedb.BuildRequest(id=53, buildsetid=self.BSID, buildername="b",
+                                submitted_at=self.SUBMITTED_AT_EPOCH - 20,
+                                complete=1),
+            fakedb.BuildRequest(id=54, buildsetid=self.BSID, buildername="b",
+                                submitted_at=self.SUBMITTED_AT_EPOCH + 20),
+            # every request for "c" is claimed
+            fakedb.BuildRequest(id=55, buildsetid=self.BSID, buildername="c",
+                                submitted_at=self.SUBMITTED_AT_EPOCH),
+            fakedb.BuildRequestClaim(brid=55, masterid=self.OTHER_MASTER_ID,
+                                     claimed_at=self.CLAIMED_AT_EPOCH),
+        ])
+        d.addCallback(lambda _:
+                      self.db.buildrequests.getOldestRequestTimes(
+                          buildernames=buildernames))
+
+        def check(times):
+            self.assertEqual(times, expected)
+        d.addCallback(check)
+        return d
+
+    def test_getOldestRequestTimes(self):
+        return self.do_test_getOldestRequestTimes(None, {
+            u"a": self.SUBMITTED_AT,
+            u"b": epoch2datetime(self.SUBMITTED_AT_EPOCH + 20),
+        })
+
+    def test_getOldestRequestTimes_buildernames(self):
+        return self.do_test_getOldestRequestTimes(["b", "c", "d"], {
+            u"b": epoch2datetime(self.SUBMITTED_AT_EPOCH + 20),
+        })
+
+    def test_getOldestRequestTimes_buildernames_batched(self):
+        d = self.insertTestData([
+            fakedb.BuildRequest(id=id, buildsetid=self.BSID,
+                                buildername="b%d" % id, submitted_at=id)
+            for id in range(1, 251)])
+        d.addCallback(lambda _:
+                      self.db.buildrequests.getOldestRequestTimes(
+                          buildernames=["b%d" % id
+                                        for id in range(2, 251, 2)]))
+
+        def check(times):
+            self.assertEqual(times, dict(("b%d" % id, epoch2datetime(id))
+                                         for id in range(2, 251, 2)))
+        d.addCallback(check)
+        return d
+
     def do_test_claimBuildRequests(self, rows, now, brids, expected=None,
                                    expfailure=None, claimed_at=None):
         clock = task.Clock()
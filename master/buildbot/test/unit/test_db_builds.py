@@ -13,6 +13,8 @@
 #
 # Copyright Buildbot Team Members
 
+from buildbot.data import base
+from buildbot.data import resultspec
 from buildbot.db import builds
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
@@ -90,7 +92,8 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getBuilds(self):
         @self.assertArgSpecMatches(self.db.builds.getBuilds)
-        def getBuilds(self, builderid=None, buildrequestid=None):
+        def getBuilds(self, builderid=None, buildrequestid=None,
+                      resultSpec=None):
             pass
 
     def test_signature_addBuild(self):
@@ -257,6 +260,62 @@ class Tests(interfaces.InterfaceTests):
 
 class RealTests(Tests):
 
+    def makeResultSpec(self, **kwargs):
+        rs = resultspec.ResultSpec(**kwargs)
+        rs.fieldMapping = {'buildid': 'id', 'builderid': 'builderid',
+                           'results': 'results'}
+        return rs
+
+    @defer.inlineCallbacks
+    def test_getBuilds_resultSpec_pushdown(self):
+        yield self.insertTestData(self.backgroundData + self.threeBuilds)
+        rs = self.makeResultSpec(
+            filters=[resultspec.Filter('builderid', 'eq', [77])],
+            order=['-buildid'], limit=1)
+        d = self.db.builds.getBuilds(resultSpec=rs)
+        # everything is applied in SQL, and the spec is updated before the
+        # query is handed to the database thread
+        self.assertEqual((rs.filters, rs.order, rs.limit, rs.offset),
+                         ([], None, None, None))
+        bdicts = yield d
+        self.assertEqual(bdicts, base.ListResult([self.threeBdicts[52]],
+                                                 offset=None, total=2,
+                                                 limit=1))
+
+    @defer.inlineCallbacks
+    def test_getBuilds_resultSpec_offset(self):
+        yield self.insertTestData(self.backgroundData + self.threeBuilds)
+        rs = self.makeResultSpec(order=['buildid'], offset=1)
+        bdicts = yield self.db.builds.getBuilds(resultSpec=rs)
+        self.assertEqual(bdicts, base.ListResult(
+            [self.threeBdicts[51], self.threeBdicts[52]],
+            offset=1, total=3, limit=None))
+
+    @defer.inlineCallbacks
+    def test_getBuilds_resultSpec_nullable(self):
+        yield self.insertTestData(self.backgroundData + self.threeBuilds)
+        # NULL results compare as in Python, and ordering on a nullable
+        # column is left to ResultSpec.apply, along with the pagination
+        rs = self.makeResultSpec(
+            filters=[resultspec.Filter('results', 'ne', [5])],
+            order=['results'], limit=1)
+        bdicts = yield self.db.builds.getBuilds(resultSpec=rs)
+        self.assertEqual(sorted(bdicts, key=lambda bd: bd['id']),
+                         [self.threeBdicts[50], self.threeBdicts[51]])
+        self.assertEqual((rs.filters, rs.order, rs.limit),
+                         ([], ['results'], 1))
+
+    @defer.inlineCallbacks
+    def test_getBuilds_resultSpec_unmapped(self):
+        yield self.insertTestData(self.backgroundData + self.threeBuilds)
+        f = resultspec.Filter('complete', 'eq', [True])
+        rs = self.makeResultSpec(filters=[f], order=['-buildid'], limit=1)
+        bdicts = yield self.db.builds.getBuilds(resultSpec=rs)
+        # the order is applied, but not the limit
+        self.assertEqual([bd['id'] for bd in bdicts], [52, 51, 50])
+        self.assertEqual((rs.filters, rs.order, rs.limit),
+                         ([f], None, 1))
+
     @defer.inlineCallbacks
     def test_addBuild_existing_race(self):
         clock = task.Clock()
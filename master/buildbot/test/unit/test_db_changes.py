@@ -15,8 +15,11 @@
 
 import sqlalchemy as sa
 
+from buildbot.data import base
+from buildbot.data import resultspec
 from buildbot.db import changes
 from buildbot.db import sourcestamps
+from buildbot.process import cache
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
 from buildbot.test.util import connector_component
@@ -171,6 +174,23 @@ class Tests(interfaces.InterfaceTests):
         d.addCallback(check14)
         return d
 
+    def test_signature_getChangesByIds(self):
+        @self.assertArgSpecMatches(self.db.changes.getChangesByIds)
+        def getChangesByIds(self, changeids):
+            pass
+
+    @defer.inlineCallbacks
+    def test_getChangesByIds(self):
+        yield self.insertTestData(self.change13_rows + self.change14_rows)
+        chdicts = yield self.db.changes.getChangesByIds([14, 99, 13, 14])
+        self.assertEqual([ch and ch['changeid'] for ch in chdicts],
+                         [14, None, 13, 14])
+        self.assertEqual(chdicts[0], self.change14_dict)
+        self.assertEqual(sorted(chdicts[2]['files']),
+                         ['master/README.txt', 'slave/README.txt'])
+        self.assertEqual(chdicts[2]['properties'],
+                         {'notest': ('no', 'Change')})
+
     def test_signature_getChangeUids(self):
         @self.assertArgSpecMatches(self.db.changes.getChangeUids)
         def getChangeUids(self, changeid):
@@ -220,7 +240,7 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getChanges(self):
         @self.assertArgSpecMatches(self.db.changes.getChanges)
-        def getChanges(self):
+        def getChanges(self, resultSpec=None):
             pass
 
     def insert7Changes(self):
@@ -337,6 +357,56 @@ class RealTests(Tests):
 
     # tests that only "real" implementations will pass
 
+    @defer.inlineCallbacks
+    def test_getChanges_resultSpec(self):
+        yield self.insert7Changes()
+        rs = resultspec.ResultSpec(
+            filters=[resultspec.Filter('changeid', 'gt', [9])],
+            order=['-changeid'], offset=1, limit=2)
+        rs.fieldMapping = {'changeid': 'changeid'}
+        chdicts = yield self.db.changes.getChanges(resultSpec=rs)
+        self.assertIsInstance(chdicts, base.ListResult)
+        self.assertEqual([ch['changeid'] for ch in chdicts], [13, 12])
+        self.assertEqual((chdicts.offset, chdicts.total, chdicts.limit),
+                         (1, 5, 2))
+        for chdict in chdicts:
+            validation.verifyDbDict(self, 'chdict', chdict)
+
+    @defer.inlineCallbacks
+    def test_getChangesByIds_batches(self):
+        self.db.changes.BULK_LOAD_BATCH_SIZE = 2
+        yield self.insert7Changes()
+        chdicts = yield self.db.changes.getChangesByIds(range(8, 16))
+        self.assertEqual([ch and ch['changeid'] for ch in chdicts],
+                         [8, 9, 10, 11, 12, 13, 14, None])
+        self.assertEqual(chdicts[6], self.change14_dict)
+
+    @defer.inlineCallbacks
+    def test_getChangesByIds_cache(self):
+        self.db.master.caches = cache.CacheManager()
+        self.db.changes = changes.ChangesConnectorComponent(self.db)
+        yield self.insert7Changes()
+        ch13 = yield self.db.changes.getChange(13)
+        chdicts = yield self.db.changes.getChangesByIds([12, 13])
+        # the cached chdict is returned, and the other is now cached
+        self.assertIdentical(chdicts[1], ch13)
+        self.assertIdentical((yield self.db.changes.getChange(12)),
+                             chdicts[0])
+
+    @defer.inlineCallbacks
+    def test_getRecentChanges_queries(self):
+        yield self.insert7Changes()
+        queries = []
+
+        def execute(conn, clauseelement, *multiparams, **params):
+            queries.append(clauseelement)
+        sa.event.listen(self.db.pool.engine, 'before_execute', execute)
+        changes = yield self.db.changes.getRecentChanges(7)
+        self.assertEqual(len(changes), 7)
+        # one for the changeids, then one each for changes, files, and
+        # properties
+        self.assertEqual(len(queries), 4)
+
     def test_addChange(self):
         clock = task.Clock()
         clock.advance(SOMETIME)
@@ -82,6 +82,56 @@ class DBConnector(db.RealDatabaseMixin, unittest.TestCase):
             self.assertTrue(self.db.changes.pruneChanges.called)
         return d
 
+    @defer.inlineCallbacks
+    def test_pruneBuilds(self):
+        self.master.config.buildHorizon = 100
+        self.master.config.logHorizon = 10
+        self.master.config.retention['enabled'] = True
+        self.master.config.retention['dry_run'] = True
+        self.master.config.builders = [
+            mock.Mock(buildHorizon=None, logHorizon=None),
+            mock.Mock(buildHorizon=20, logHorizon=None),
+            mock.Mock(buildHorizon=None, logHorizon=None),
+        ]
+        for name, builder_config in zip(['b1', 'b2', 'unknown'],
+                                        self.master.config.builders):
+            builder_config.name = name
+        self.db.builders.getBuilders = lambda: defer.succeed([
+            dict(id=1, name='b1'), dict(id=2, name='b2')])
+        self.db.retention.pruneBuilder = mock.Mock(
+            side_effect=lambda *args, **kwargs: defer.succeed(dict(
+                builds=3, steps=0, logs=0, logchunks=0, buildrequests=0,
+                buildsets=0)))
+
+        yield self.db._pruneBuilds()
+        self.assertEqual(self.db.retention.pruneBuilder.call_args_list, [
+            mock.call(1, 'b1', buildHorizon=100, logHorizon=10,
+                      batchSize=100, dryRun=True),
+            mock.call(2, 'b2', buildHorizon=20, logHorizon=10,
+                      batchSize=100, dryRun=True),
+        ])
+
+    @defer.inlineCallbacks
+    def test_pruneBuilds_not_enabled(self):
+        # the horizons alone do not prune the database
+        self.master.config.buildHorizon = 100
+        self.master.config.builders = [
+            mock.Mock(buildHorizon=None, logHorizon=None)]
+        self.db.builders.getBuilders = mock.Mock()
+        self.db.retention.pruneBuilder = mock.Mock()
+        yield self.db._pruneBuilds()
+        self.assertFalse(self.db.builders.getBuilders.called)
+        self.assertFalse(self.db.retention.pruneBuilder.called)
+
+    @defer.inlineCallbacks
+    def test_pruneBuilds_no_horizons(self):
+        self.master.config.retention['enabled'] = True
+        self.master.config.builders = [
+            mock.Mock(buildHorizon=None, logHorizon=None)]
+        self.db.builders.getBuilders = mock.Mock()
+        yield self.db._pruneBuilds()
+        self.assertFalse(self.db.builders.getBuilders.called)
+
     def test_setup_check_version_bad(self):
         d = self.startService(check_version=True)
         return self.assertFailure(d, exceptions.DatabaseNotReadyError)
@@ -13,15 +13,21 @@
 #
 # Copyright Buildbot Team Members
 
+import bz2
+import re
+import sqlalchemy as sa
 import textwrap
+import zlib
 
 from buildbot.db import logs
+from buildbot.process import cache
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
 from buildbot.test.util import connector_component
 from buildbot.test.util import interfaces
 from buildbot.test.util import validation
 from twisted.internet import defer
+from twisted.internet import task
 from twisted.trial import unittest
 
 
@@ -57,6 +63,7 @@ class Tests(interfaces.InterfaceTests):
                         content="yet another line"),
     ]
 
+    @defer.inlineCallbacks
     def checkTestLogLines(self):
         expLines = ['line zero', 'line 1', 'line TWO', 'line 3', 'line 2**2',
                     'another line', 'yet another line']
@@ -65,10 +72,10 @@ class Tests(interfaces.InterfaceTests):
                 got_lines = yield self.db.logs.getLogLines(201,
                                                            first_line, last_line)
                 self.assertEqual(got_lines,
-                                 "\n".join(expLines[first_line:last_line + 1] + "\n"))
+                                 "\n".join(expLines[first_line:last_line + 1]) + "\n")
         # check overflow
         self.assertEqual((yield self.db.logs.getLogLines(201, 5, 20)),
-                         "\n".join(expLines[5:7] + "\n"))
+                         "\n".join(expLines[5:7]) + "\n")
 
     # signature tests
 
@@ -176,11 +183,29 @@ class Tests(interfaces.InterfaceTests):
     @defer.inlineCallbacks
     def test_getLogLines(self):
         yield self.insertTestData(self.backgroundData + self.testLogLines)
-        self.checkTestLogLines()
+        yield self.checkTestLogLines()
 
         # check line number reversal
         self.assertEqual((yield self.db.logs.getLogLines(201, 6, 3)), '')
 
+    @defer.inlineCallbacks
+    def test_getLogLines_compressed(self):
+        yield self.insertTestData(self.backgroundData + [
+            fakedb.Log(id=201, stepid=101, name=u'stdio', slug=u'stdio',
+                       complete=1, num_lines=7, type=u's'),
+            fakedb.LogChunk(logid=201, first_line=0, last_line=4, compressed=1,
+                            content=zlib.compress(textwrap.dedent("""\
+                        line zero
+                        line 1
+                        line TWO
+                        line 3
+                        line 2**2"""))),
+            fakedb.LogChunk(logid=201, first_line=5, last_line=6, compressed=2,
+                            content=bz2.compress("another line\n"
+                                                 "yet another line")),
+        ])
+        yield self.checkTestLogLines()
+
     @defer.inlineCallbacks
     def test_getLogLines_empty(self):
         yield self.insertTestData(self.backgroundData + [
@@ -213,11 +238,11 @@ class Tests(interfaces.InterfaceTests):
         logid = yield self.db.logs.addLog(
             stepid=102, name=u'another', slug=u'another', type=u's')
         self.assertEqual((yield self.db.logs.appendLog(logid, u'xyz\n')),
-                         (0, 0))
+                         (0, 0, u'xyz\n'))
         self.assertEqual((yield self.db.logs.appendLog(201, u'abc\ndef\n')),
-                         (7, 8))
+                         (7, 8, u'abc\ndef\n'))
         self.assertEqual((yield self.db.logs.appendLog(logid, u'XYZ\n')),
-                         (1, 1))
+                         (1, 1, u'XYZ\n'))
         self.assertEqual((yield self.db.logs.getLogLines(201, 6, 7)),
                          u"yet another line\nabc\n")
         self.assertEqual((yield self.db.logs.getLogLines(201, 7, 8)),
@@ -241,14 +266,14 @@ class Tests(interfaces.InterfaceTests):
         yield self.insertTestData(self.backgroundData + self.testLogLines)
         yield self.db.logs.compressLog(201)
         # test log lines should still be readable just the same
-        self.checkTestLogLines()
+        yield self.checkTestLogLines()
 
     @defer.inlineCallbacks
     def test_addLogLines_big_chunk(self):
         yield self.insertTestData(self.backgroundData + self.testLogLines)
         self.assertEqual(
             (yield self.db.logs.appendLog(201, u'abc\n' * 20000)),  # 80k
-            (7, 20006))
+            (7, 20006, u'abc\n' * 20000))
         lines = yield self.db.logs.getLogLines(201, 7, 50000)
         self.assertEqual(len(lines), 80000)
         self.assertEqual(lines, (u'abc\n' * 20000))
@@ -258,7 +283,7 @@ class Tests(interfaces.InterfaceTests):
         yield self.insertTestData(self.backgroundData + self.testLogLines)
         line = u'x' * 33000 + '\n'
         self.assertEqual((yield self.db.logs.appendLog(201, line * 3)),
-                         (7, 9))  # three long lines, all truncated
+                         (7, 9, line * 3))
         lines = yield self.db.logs.getLogLines(201, 7, 100)
         self.assertEqual(len(lines), 99003)
         self.assertEqual(lines, (line * 3))
@@ -271,7 +296,8 @@ class RealTests(Tests):
         yield self.insertTestData(self.backgroundData + self.testLogLines)
         self.assertEqual(
             (yield self.db.logs.appendLog(201, u'abc\ndef\nghi\njkl\n')),
-            (7, 10))
+            (7, 10, u'abc\ndef\nghi\njkl\n'))
+        self.clock.advance(self.db.logs.APPEND_FLUSH_DELAY)
 
         def thd(conn):
             res = conn.execute(self.db.model.logchunks.select(
@@ -291,7 +317,12 @@ class RealTests(Tests):
     def test_addLogLines_huge_lines(self):
         yield self.insertTestData(self.backgroundData + self.testLogLines)
         line = u'xy' * 70000 + '\n'
-        yield self.db.logs.appendLog(201, line * 3)
+        first_line, last_line, stored = yield self.db.logs.appendLog(
+            201, line * 3)
+        self.assertEqual((first_line, last_line), (7, 9))
+        # the lines are truncated, and the caller is told so
+        self.assertEqual(stored, (u'xy' * 32768 + '\n') * 3)
+        self.assertEqual((yield self.db.logs.getLogLines(201, 7, 9)), stored)
         for lineno in 7, 8, 9:
             line = yield self.db.logs.getLogLines(201, lineno, lineno)
             self.assertEqual(len(line), 65537)
@@ -306,8 +337,274 @@ class RealTests(Tests):
         self.assertEqual(len(chunk), 65534)
         chunk.decode('utf-8')
 
-    # TODO: test compressing with >64k
-    # TODO: test compressing compressed size >64k
+    @defer.inlineCallbacks
+    def test_appendLog_buffered(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        self.assertEqual((yield self.db.logs.appendLog(201, u'abc\n')),
+                         (7, 7, u'abc\n'))
+        self.assertEqual((yield self.db.logs.appendLog(201, u'def\nghi\n')),
+                         (8, 9, u'def\nghi\n'))
+
+        # nothing has been written yet, but readers see the new lines
+        self.assertEqual(len((yield self.getLogChunkRows(201))), 4)
+        self.assertEqual((yield self.db.logs.getLog(201))['num_lines'], 10)
+        self.assertEqual([l['num_lines'] for l in
+                          (yield self.db.logs.getLogs(101))], [10])
+        self.assertEqual((yield self.db.logs.getLogLines(201, 5, 8)),
+                         u'another line\nyet another line\nabc\ndef\n')
+        self.assertEqual((yield self.db.logs.getLogLines(201, 9, 20)),
+                         u'ghi\n')
+
+        # after the delay, the appends are written as a single chunk
+        self.clock.advance(self.db.logs.APPEND_FLUSH_DELAY)
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([(r['first_line'], r['last_line'], r['content'])
+                          for r in rows[4:]], [(7, 9, 'abc\ndef\nghi')])
+        self.assertEqual((yield self.db.logs.getLog(201))['num_lines'], 10)
+        self.assertEqual((yield self.db.logs.getLogLines(201, 5, 8)),
+                         u'another line\nyet another line\nabc\ndef\n')
+
+    @defer.inlineCallbacks
+    def test_appendLog_buffered_several_logs(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        logid = yield self.db.logs.addLog(
+            stepid=102, name=u'another', slug=u'another', type=u's')
+        yield self.db.logs.appendLog(logid, u'xyz\n')
+        yield self.db.logs.appendLog(201, u'abc\n')
+        yield self.db.logs.appendLog(logid, u'\n')
+        yield self.db.logs.appendLog(logid, u'XYZ\n')
+
+        self.clock.advance(self.db.logs.APPEND_FLUSH_DELAY)
+        rows = yield self.getLogChunkRows(logid)
+        self.assertEqual([(r['first_line'], r['last_line'], r['content'])
+                          for r in rows], [(0, 2, 'xyz\n\nXYZ')])
+        self.assertEqual((yield self.db.logs.getLogLines(logid, 0, 2)),
+                         u'xyz\n\nXYZ\n')
+        self.assertEqual((yield self.db.logs.getLogLines(201, 7, 7)),
+                         u'abc\n')
+
+        # the lines are still counted once they are written
+        def thd(conn):
+            tbl = self.db.model.logs
+            q = sa.select([tbl.c.id, tbl.c.num_lines])
+            return sorted(map(tuple, conn.execute(q).fetchall()))
+        self.assertEqual((yield self.db.pool.do(thd)),
+                         [(201, 8), (logid, 3)])
+
+    @defer.inlineCallbacks
+    def test_appendLog_buffer_full(self):
+        self.patch(self.db.logs, 'APPEND_FLUSH_SIZE', 10)
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n')
+        self.assertEqual(len((yield self.getLogChunkRows(201))), 4)
+        yield self.db.logs.appendLog(201, u'defghijk\n')
+        # this append went over the limit, so both were written at once
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([(r['first_line'], r['last_line'], r['content'])
+                          for r in rows[4:]], [(7, 8, 'abc\ndefghijk')])
+        # and the timer is no longer needed
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    @defer.inlineCallbacks
+    def test_finishLog_flushes(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n')
+        yield self.db.logs.finishLog(201)
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual(rows[-1]['content'], 'abc')
+        logdict = yield self.db.logs.getLog(201)
+        self.assertEqual((logdict['num_lines'], logdict['complete']),
+                         (8, True))
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    @defer.inlineCallbacks
+    def test_appendLog_buffer_dropped_once_written(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n')
+        self.clock.advance(self.db.logs.APPEND_FLUSH_DELAY)
+        yield self.db.logs._flushLock.run(lambda: None)
+        self.assertEqual(self.db.logs._appendBuffers, {})
+        # the next append continues from the lines that were written
+        self.assertEqual((yield self.db.logs.appendLog(201, u'def\n')),
+                         (8, 8, u'def\n'))
+        self.assertEqual((yield self.db.logs.getLogLines(201, 6, 8)),
+                         u'yet another line\nabc\ndef\n')
+
+    @defer.inlineCallbacks
+    def test_finishLog_append_during_flush(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n')
+        do = self.db.pool.do
+        appended = []
+
+        def appendDuringWrite(callable, *args, **kwargs):
+            if callable == self.db.logs._thdWriteSegments and not appended:
+                appended.append(self.db.logs.appendLog(201, u'def\n'))
+            return do(callable, *args, **kwargs)
+        self.patch(self.db.pool, 'do', appendDuringWrite)
+        yield self.db.logs.finishLog(201)
+        self.assertEqual((yield appended[0]), (8, 8, u'def\n'))
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([r['content'] for r in rows[4:]], ['abc', 'def'])
+        self.assertEqual((yield self.db.logs.getLog(201))['num_lines'], 9)
+        self.assertEqual(self.db.logs._appendBuffers, {})
+
+    def getLogChunkRows(self, logid):
+        def thd(conn):
+            tbl = self.db.model.logchunks
+            q = tbl.select(whereclause=(tbl.c.logid == logid))
+            q = q.order_by(tbl.c.first_line)
+            return [dict(row) for row in conn.execute(q).fetchall()]
+        return self.db.pool.do(thd)
+
+    @defer.inlineCallbacks
+    def do_test_compressLog(self, mode, compressed):
+        self.db.master.config.db['log_compression'] = mode
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        content = u''.join(u'line %d of compile output\n' % i
+                           for i in xrange(7, 10007))
+        yield self.db.logs.appendLog(201, content)
+        yield self.db.logs.finishLog(201)
+        self.assertTrue(len((yield self.getLogChunkRows(201))) > 4)
+
+        saved = yield self.db.logs.compressLog(201)
+        self.assertTrue(saved > 0)
+
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([(r['first_line'], r['last_line'], r['compressed'])
+                          for r in rows], [(0, 10006, compressed)])
+        self.assertEqual((yield self.db.logs.getLogLines(201, 5, 7)),
+                         u'another line\nyet another line\n'
+                         u'line 7 of compile output\n')
+        self.assertEqual((yield self.db.logs.getLogLines(201, 7, 10006)),
+                         content)
+
+        # compressing again is a no-op
+        self.assertEqual((yield self.db.logs.compressLog(201)), 0)
+
+    def test_compressLog_gz(self):
+        return self.do_test_compressLog('gz', 1)
+
+    def test_compressLog_bz2(self):
+        return self.do_test_compressLog('bz2', 2)
+
+    @defer.inlineCallbacks
+    def test_compressLog_raw(self):
+        self.db.master.config.db['log_compression'] = 'raw'
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        self.assertEqual((yield self.db.logs.compressLog(201)), 0)
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([r['compressed'] for r in rows], [0, 0, 0, 0])
+
+    @defer.inlineCallbacks
+    def test_compressLog_default_gz(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'the same line\n' * 1000)
+        yield self.db.logs.finishLog(201)
+        yield self.db.logs.compressLog(201)
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([r['compressed'] for r in rows], [1])
+
+    @defer.inlineCallbacks
+    def test_compressLog_too_big_for_one_chunk(self):
+        self.patch(logs.LogsConnectorComponent, 'MAX_CHUNK_SIZE', 1024)
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        content = u''.join(u'%08x %s\n' % (i, u'y' * (i % 37))
+                           for i in xrange(7, 5007))
+        yield self.db.logs.appendLog(201, content)
+        yield self.db.logs.finishLog(201)
+        yield self.db.logs.compressLog(201)
+
+        rows = yield self.getLogChunkRows(201)
+        self.assertTrue(len(rows) > 1)
+        for row in rows:
+            self.assertTrue(len(row['content']) <= 1024)
+        self.assertEqual((yield self.db.logs.getLogLines(201, 7, 5006)),
+                         content)
+
+    def countQueries(self):
+        queries = []
+        do = self.db.pool.do
+
+        def countingDo(callable, *args, **kwargs):
+            queries.append(callable)
+            return do(callable, *args, **kwargs)
+        self.patch(self.db.pool, 'do', countingDo)
+        return queries
+
+    @defer.inlineCallbacks
+    def test_getLogLines_single_query(self):
+        self.db.master.caches = cache.CacheManager()
+        self.db.master.caches.config = dict(logchunks=10)
+        self.db.logs = logs.LogsConnectorComponent(self.db)
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        queries = self.countQueries()
+        lines = yield self.db.logs.getLogLines(201, 0, 6)
+        # a single query reads the four chunks
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            self.db.master.caches.get_metrics()['logchunks']['misses'], 4)
+
+        # once cached, the chunks are not indexed again
+        self.assertEqual((yield self.db.logs.getLogLines(201, 0, 6)), lines)
+        self.assertEqual(len(queries), 2)
+        metrics = self.db.master.caches.get_metrics()['logchunks']
+        self.assertEqual((metrics['hits'], metrics['misses']), (4, 4))
+
+    @defer.inlineCallbacks
+    def test_getLogLines_chunks_replaced(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        queries = self.countQueries()
+        do = self.db.pool.do
+
+        def compressAfterFirst(callable, *args, **kwargs):
+            d = do(callable, *args, **kwargs)
+            if len(queries) == 1:
+                # compress the log between reading its chunks' rows and their
+                # content, so that the chunks are gone when they are read
+                @d.addCallback
+                def compress(rows):
+                    d = self.db.logs.compressLog(201)
+                    d.addCallback(lambda _: rows)
+                    return d
+            return d
+        self.patch(self.db.pool, 'do', compressAfterFirst)
+        self.assertEqual((yield self.db.logs.getLogLines(201, 0, 6)),
+                         u'line zero\nline 1\nline TWO\nline 3\nline 2**2\n'
+                         u'another line\nyet another line\n')
+
+
+class TestLogChunkIndex(unittest.TestCase):
+
+    def test_getLines(self):
+        index = logs.LogChunkIndex('zero\none\n\nthree\xe2\x98\x83\nfour')
+        self.assertEqual(index.getLines(0, 0), u'zero')
+        self.assertEqual(index.getLines(0, 4),
+                         u'zero\none\n\nthree\N{SNOWMAN}\nfour')
+        self.assertEqual(index.getLines(2, 2), u'')
+        self.assertEqual(index.getLines(1, 3), u'one\n\nthree\N{SNOWMAN}')
+        self.assertEqual(index.getLines(4, 4), u'four')
+
+    def test_getLines_one_line(self):
+        index = logs.LogChunkIndex('only')
+        self.assertEqual(index.getLines(0, 0), u'only')
+
+    def test_getLines_strides(self):
+        self.patch(logs.LogChunkIndex, 'STRIDE', 4)
+        self.patch(logs.LogChunkIndex, '_stride',
+                   re.compile('(?:[^\n]*\n){4}'))
+        lines = ['line %d' % i for i in range(18)]
+        index = logs.LogChunkIndex('\n'.join(lines))
+        self.assertEqual(index.getLines(5, 6), u'line 5\nline 6')
+        # only the lines that were needed have been scanned
+        self.assertEqual(list(index.offsets), [0, 28])
+        self.assertFalse(index.scanned)
+        self.assertEqual(index.getLines(14, 17), u'\n'.join(lines[14:18]))
+        self.assertEqual(len(index.offsets), 5)
+        for first in range(18):
+            for last in range(first, 18):
+                self.assertEqual(index.getLines(first, last),
+                                 u'\n'.join(lines[first:last + 1]))
 
 
 class TestFakeDB(unittest.TestCase, Tests):
@@ -332,6 +629,7 @@ class TestRealDB(unittest.TestCase,
         @d.addCallback
         def finish_setup(_):
             self.db.logs = logs.LogsConnectorComponent(self.db)
+            self.db.logs._reactor = self.clock = task.Clock()
         return d
 
     def tearDown(self):
@@ -18,6 +18,7 @@ import sqlalchemy as sa
 import time
 
 from buildbot.db import pool
+from buildbot.process import metrics
 from buildbot.test.util import db
 from twisted.internet import defer
 from twisted.internet import reactor
@@ -78,6 +79,27 @@ class Basic(unittest.TestCase):
         d = self.pool.do_with_engine(fail)
         return self.assertFailure(d, sa.exc.OperationalError)
 
+    @defer.inlineCallbacks
+    def test_generation(self):
+        def read(conn):
+            conn.execute("SELECT 1")
+            conn.execute(sa.select([sa.literal(1)]))
+
+        def write(engine):
+            engine.execute("CREATE TABLE gen ( a integer )")
+
+        def fail(conn):
+            conn.execute("INSERT INTO gen values ( 1 )")
+            raise RuntimeError("oh noes")
+        yield self.pool.do(read)
+        self.assertEqual(self.pool.generation, 0)
+        yield self.pool.do_with_engine(write)
+        self.assertEqual(self.pool.generation, 1)
+        yield self.pool.do(read)
+        self.assertEqual(self.pool.generation, 1)
+        yield self.assertFailure(self.pool.do(fail), RuntimeError)
+        self.assertEqual(self.pool.generation, 2)
+
     def test_persistence_across_invocations(self):
         # NOTE: this assumes that both methods are called with the same
         # connection; if they run in parallel threads then it is not valid to
@@ -97,6 +119,121 @@ class Basic(unittest.TestCase):
         return d
 
 
+class Sizing(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        self.pools = []
+        # start pools immediately, so that shutdown can stop them
+        self.patch(reactor, 'callWhenRunning', lambda fn: fn())
+
+    def tearDown(self):
+        for p in self.pools:
+            p.shutdown()
+
+    def makePool(self, **kwargs):
+        p = pool.DBThreadPool(self.engine, **kwargs)
+        self.pools.append(p)
+        return p
+
+    def test_default_size(self):
+        p = self.makePool()
+        self.assertEqual((p.size, p.max_size, p.max), (5, 5, 5))
+
+    def test_default_size_from_engine(self):
+        self.engine.optimal_thread_pool_size = 15
+        p = self.makePool()
+        self.assertEqual((p.size, p.max_size, p.max), (15, 15, 15))
+
+    def test_configured_size(self):
+        self.engine.optimal_thread_pool_size = 15
+        p = self.makePool(size=3, max_size=10)
+        self.assertEqual((p.size, p.max_size, p.max), (3, 10, 3))
+        self.assertNotEqual(p._adapt_task, None)
+
+    def test_configured_size_limited_by_engine(self):
+        self.engine.optimal_thread_pool_size = 1
+        p = self.makePool(size=3, max_size=10)
+        self.assertEqual((p.size, p.max_size, p.max), (1, 1, 1))
+        self.assertEqual(p._adapt_task, None)
+
+    def test_setSize(self):
+        p = self.makePool(size=3, max_size=10)
+        p.setSize(8)
+        self.assertEqual((p.size, p.max_size, p.max), (8, 8, 8))
+        self.assertEqual(p._adapt_task, None)
+
+    def test_setSize_keeps_adapted_size(self):
+        p = self.makePool(size=3, max_size=10)
+        p.adjustPoolsize(maxthreads=6)
+        p.setSize(4, 12)
+        self.assertEqual(p.max, 6)
+
+    def addQueries(self, p, count, wait, elapsed):
+        p._adapt_count += count
+        p._adapt_wait_total += count * wait
+        p._adapt_exec_total += count * elapsed
+
+    def test_adapt_grow(self):
+        p = self.makePool(size=4, max_size=10)
+        self.addQueries(p, 10, 0.5, 0.1)
+        p._adapt()
+        self.assertEqual(p.max, 6)
+        self.addQueries(p, 10, 0.5, 0.1)
+        p._adapt()
+        self.assertEqual(p.max, 9)
+        self.addQueries(p, 10, 0.5, 0.1)
+        p._adapt()
+        self.assertEqual(p.max, 10)
+
+    def test_adapt_database_saturated(self):
+        p = self.makePool(size=4, max_size=10)
+        self.addQueries(p, 10, 0.5, 0.1)
+        p._adapt()
+        self.assertEqual(p.max, 6)
+        # more threads only made each query slower, so back off
+        self.addQueries(p, 10, 0.5, 0.3)
+        p._adapt()
+        self.assertEqual(p.max, 5)
+
+    def test_adapt_shrink(self):
+        p = self.makePool(size=4, max_size=10)
+        p.adjustPoolsize(maxthreads=6)
+        p.waiters.append(object())  # an idle thread
+        p._adapt()
+        self.assertEqual(p.max, 5)
+        p._adapt()
+        p._adapt()
+        self.assertEqual(p.max, 4)
+
+    def test_adapt_steady(self):
+        p = self.makePool(size=4, max_size=10)
+        self.addQueries(p, 10, 0.001, 0.1)
+        p._adapt()
+        self.assertEqual(p.max, 4)
+
+    @defer.inlineCallbacks
+    def test_histograms(self):
+        events = []
+        self.patch(metrics.MetricHistogramEvent, 'log',
+                   classmethod(lambda cls, name, value:
+                               events.append((name, value))))
+        p = self.makePool()
+
+        def thd(conn):
+            time.sleep(0.01)
+        yield p.do(thd)
+        yield p.do_with_engine(thd)
+
+        names = [name for name, value in events]
+        self.assertEqual(names, [
+            'DBThreadPool.queue-wait.test_db_pool.thd',
+            'DBThreadPool.exec-time.test_db_pool.thd',
+        ] * 2)
+        self.assertTrue(events[1][1] >= 0.01)
+        self.assertEqual(p._adapt_count, 2)
+
+
 class Stress(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,246 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import sqlalchemy as sa
+
+from buildbot.db import retention
+from buildbot.process import metrics
+from buildbot.test.fake import fakedb
+from buildbot.test.util import connector_component
+from twisted.internet import defer
+from twisted.trial import unittest
+
+TIME1 = 1304262222
+
+
+class TestRetentionConnectorComponent(
+        connector_component.ConnectorComponentMixin,
+        unittest.TestCase):
+
+    def setUp(self):
+        d = self.setUpConnectorComponent(
+            table_names=['builders', 'masters', 'sourcestamps', 'buildsets',
+                         'buildset_properties', 'buildset_sourcestamps',
+                         'buildrequests', 'buildrequest_claims', 'builds',
+                         'steps', 'logs', 'logchunks'])
+
+        @d.addCallback
+        def finish_setup(_):
+            self.db.retention = \
+                retention.RetentionConnectorComponent(self.db)
+        return d
+
+    def tearDown(self):
+        return self.tearDownConnectorComponent()
+
+    # builder b1 has six completed builds, numbered 1 to 6, each of a
+    # request in a buildset of its own except for the first, whose buildset
+    # also has a pending request for b2, and a running build, numbered 7;
+    # each completed build has a step with a log of two chunks.  Request 39
+    # was completed without a build, and buildset 30 was triggered by build
+    # 50.
+    def insertHistory(self):
+        rows = [
+            fakedb.Master(id=88),
+            fakedb.Builder(id=77, name='b1'),
+            fakedb.Builder(id=78, name='b2'),
+            fakedb.SourceStamp(id=234),
+            fakedb.Buildset(id=19, complete=1),
+            fakedb.BuildsetSourceStamp(buildsetid=19, sourcestampid=234),
+            fakedb.BuildRequest(id=39, buildsetid=19, buildername='b1',
+                                complete=1),
+            fakedb.Buildset(id=20, complete=0),
+            fakedb.BuildsetProperty(buildsetid=20),
+            fakedb.BuildRequest(id=47, buildsetid=20, buildername='b2'),
+            fakedb.Buildset(id=30, complete=0, parent_buildid=50),
+            fakedb.BuildRequest(id=48, buildsetid=30, buildername='b2'),
+            fakedb.BuildRequestClaim(brid=40, masterid=88, claimed_at=TIME1),
+        ]
+        for i in range(6):
+            rows.extend([
+                fakedb.BuildRequest(id=40 + i, buildsetid=20 + i,
+                                    buildername='b1', complete=1),
+                fakedb.Build(id=50 + i, number=1 + i, buildrequestid=40 + i,
+                             builderid=77, masterid=88, buildslaveid=13,
+                             complete_at=TIME1 + i),
+                fakedb.Step(id=60 + i, buildid=50 + i),
+                fakedb.Log(id=70 + i, stepid=60 + i),
+                fakedb.LogChunk(logid=70 + i, first_line=0, last_line=0),
+                fakedb.LogChunk(logid=70 + i, first_line=1, last_line=1),
+            ])
+            if i:
+                rows.extend([
+                    fakedb.Buildset(id=20 + i, complete=1),
+                    fakedb.BuildsetSourceStamp(buildsetid=20 + i,
+                                               sourcestampid=234),
+                ])
+        rows.extend([
+            fakedb.Buildset(id=26, complete=0),
+            fakedb.BuildRequest(id=46, buildsetid=26, buildername='b1'),
+            fakedb.Build(id=56, number=7, buildrequestid=46, builderid=77,
+                         masterid=88, buildslaveid=13),
+        ])
+        return self.insertTestData(rows)
+
+    def getIds(self):
+        def thd(conn):
+            model = self.db.model
+            ids = {}
+            for table, column in [
+                    ('builds', model.builds.c.id),
+                    ('steps', model.steps.c.id),
+                    ('logs', model.logs.c.id),
+                    ('logchunks', model.logchunks.c.logid),
+                    ('buildrequests', model.buildrequests.c.id),
+                    ('buildrequest_claims',
+                     model.buildrequest_claims.c.brid),
+                    ('buildsets', model.buildsets.c.id),
+                    ('buildset_properties',
+                     model.buildset_properties.c.buildsetid),
+                    ('buildset_sourcestamps',
+                     model.buildset_sourcestamps.c.buildsetid)]:
+                ids[table] = sorted(row[0] for row in
+                                    conn.execute(sa.select([column])))
+            return ids
+        return self.db.pool.do(thd)
+
+    @defer.inlineCallbacks
+    def test_pruneBuilder_no_horizons(self):
+        yield self.insertHistory()
+        before = yield self.getIds()
+        counts = yield self.db.retention.pruneBuilder(77, 'b1')
+        self.assertEqual(counts, dict.fromkeys(retention.PRUNED_TABLES, 0))
+        self.assertEqual((yield self.getIds()), before)
+
+    @defer.inlineCallbacks
+    def do_test_buildHorizon(self, batchSize):
+        yield self.insertHistory()
+        counts = yield self.db.retention.pruneBuilder(
+            77, 'b1', buildHorizon=3, batchSize=batchSize)
+        self.assertEqual(counts, dict(builds=4, steps=4, logs=4, logchunks=8,
+                                      buildrequests=5, buildsets=4))
+        ids = yield self.getIds()
+        self.assertEqual(ids, {
+            # the three newest builds are kept, including the running one
+            'builds': [54, 55, 56],
+            'steps': [64, 65],
+            'logs': [74, 75],
+            'logchunks': [74, 74, 75, 75],
+            # the requests older than build 54's are deleted, but not b2's
+            'buildrequests': [44, 45, 46, 47, 48],
+            'buildrequest_claims': [],
+            # buildset 20 still has a request for b2
+            'buildsets': [20, 24, 25, 26, 30],
+            'buildset_properties': [20],
+            'buildset_sourcestamps': [24, 25],
+        })
+
+        def thd(conn):
+            tbl = self.db.model.buildsets
+            q = sa.select([tbl.c.parent_buildid], tbl.c.id == 30)
+            return conn.execute(q).scalar()
+        self.assertEqual((yield self.db.pool.do(thd)), None)
+
+    def test_pruneBuilder_buildHorizon(self):
+        return self.do_test_buildHorizon(batchSize=100)
+
+    def test_pruneBuilder_buildHorizon_batches(self):
+        return self.do_test_buildHorizon(batchSize=1)
+
+    @defer.inlineCallbacks
+    def test_pruneBuilder_buildHorizon_metrics(self):
+        events = []
+        self.patch(metrics.MetricCountEvent, 'log',
+                   staticmethod(lambda *args: events.append(args)))
+        yield self.insertHistory()
+        yield self.db.retention.pruneBuilder(77, 'b1', buildHorizon=3,
+                                             batchSize=2)
+        self.assertEqual(sorted(events), sorted([
+            ('RetentionConnectorComponent.deleted.builds', 2),
+            ('RetentionConnectorComponent.deleted.steps', 2),
+            ('RetentionConnectorComponent.deleted.logs', 2),
+            ('RetentionConnectorComponent.deleted.logchunks', 4),
+        ] * 2 + [
+            ('RetentionConnectorComponent.deleted.buildrequests', 2),
+            ('RetentionConnectorComponent.deleted.buildsets', 2),
+            ('RetentionConnectorComponent.deleted.buildrequests', 2),
+            ('RetentionConnectorComponent.deleted.buildsets', 1),
+            ('RetentionConnectorComponent.deleted.buildrequests', 1),
+            ('RetentionConnectorComponent.deleted.buildsets', 1),
+        ]))
+
+    @defer.inlineCallbacks
+    def test_pruneBuilder_buildHorizon_beyond_history(self):
+        yield self.insertHistory()
+        counts = yield self.db.retention.pruneBuilder(77, 'b1',
+                                                      buildHorizon=10)
+        # only the request completed without a build, before any build, goes
+        self.assertEqual(counts, dict(builds=0, steps=0, logs=0, logchunks=0,
+                                      buildrequests=1, buildsets=1))
+        ids = yield self.getIds()
+        self.assertEqual(ids['builds'], [50, 51, 52, 53, 54, 55, 56])
+        self.assertNotIn(39, ids['buildrequests'])
+
+    @defer.inlineCallbacks
+    def test_pruneBuilder_logHorizon(self):
+        yield self.insertHistory()
+        counts = yield self.db.retention.pruneBuilder(77, 'b1', logHorizon=2)
+        self.assertEqual(counts, dict(builds=0, steps=0, logs=5, logchunks=10,
+                                      buildrequests=0, buildsets=0))
+        ids = yield self.getIds()
+        self.assertEqual(ids['builds'], [50, 51, 52, 53, 54, 55, 56])
+        self.assertEqual(ids['steps'], [60, 61, 62, 63, 64, 65])
+        self.assertEqual(ids['logs'], [75])
+        self.assertEqual(self.db.retention._logsPrunedThrough, {77: 5})
+
+        # the next pass starts after the builds already pruned
+        yield self.insertTestData([
+            fakedb.Buildset(id=27, complete=1),
+            fakedb.BuildRequest(id=49, buildsetid=27, buildername='b1',
+                                complete=1),
+            fakedb.Build(id=57, number=8, buildrequestid=49, builderid=77,
+                         masterid=88, buildslaveid=13, complete_at=TIME1),
+        ])
+        counts = yield self.db.retention.pruneBuilder(77, 'b1', logHorizon=2)
+        self.assertEqual(counts['logs'], 1)
+        self.assertEqual((yield self.getIds())['logs'], [])
+        self.assertEqual(self.db.retention._logsPrunedThrough, {77: 6})
+
+    @defer.inlineCallbacks
+    def test_pruneBuilder_both_horizons(self):
+        yield self.insertHistory()
+        counts = yield self.db.retention.pruneBuilder(
+            77, 'b1', buildHorizon=3, logHorizon=2)
+        self.assertEqual(counts, dict(builds=4, steps=4, logs=5, logchunks=10,
+                                      buildrequests=5, buildsets=4))
+        ids = yield self.getIds()
+        self.assertEqual(ids['builds'], [54, 55, 56])
+        self.assertEqual(ids['steps'], [64, 65])
+        self.assertEqual(ids['logs'], [75])
+
+    @defer.inlineCallbacks
+    def test_pruneBuilder_dryRun(self):
+        events = []
+        self.patch(metrics.MetricCountEvent, 'log',
+                   staticmethod(lambda *args: events.append(args)))
+        yield self.insertHistory()
+        before = yield self.getIds()
+        counts = yield self.db.retention.pruneBuilder(
+            77, 'b1', buildHorizon=3, logHorizon=2, batchSize=2, dryRun=True)
+        self.assertEqual(counts, dict(builds=4, steps=4, logs=5, logchunks=10,
+                                      buildrequests=5, buildsets=4))
+        self.assertEqual((yield self.getIds()), before)
+        self.assertEqual(events, [])
+        self.assertEqual(self.db.retention._logsPrunedThrough, {})
@@ -13,9 +13,13 @@
 #
 # Copyright Buildbot Team Members
 
+import datetime
 import mock
+import os
 
 from buildbot.mq import simple
+from buildbot.process import metrics
+from twisted.internet import defer
 from twisted.trial import unittest
 
 
@@ -27,3 +31,101 @@ class SimpleMQ(unittest.TestCase):
 
     # this class *only* implements the interface, so there's little left to
     # test
+
+
+class PersistentQueueRef(unittest.TestCase):
+
+    def setUp(self):
+        self.master = mock.Mock(name='master')
+        self.master.basedir = os.path.abspath(self.mktemp())
+        os.makedirs(self.master.basedir)
+        self.mq = simple.SimpleMQ(self.master)
+        cfg = mock.Mock()
+        cfg.mq = dict(persistent_queue_size=3)
+        self.mq.reconfigService(cfg)
+        self.metrics = []
+        self.patch(metrics.MetricCountEvent, 'log',
+                   staticmethod(lambda *args, **kw: self.metrics.append(args)))
+
+    def test_queue_dir_defaults_to_basedir(self):
+        self.assertEqual(self.mq.persistent_queue_dir, self.master.basedir)
+        cfg = mock.Mock()
+        cfg.mq = dict(persistent_queue_dir=None)
+        self.mq.reconfigService(cfg)
+        self.assertEqual(self.mq.persistent_queue_dir, self.master.basedir)
+
+    @defer.inlineCallbacks
+    def stoppedQueue(self):
+        qref = yield self.mq.startConsuming(mock.Mock(), ('abc', None),
+                                            persistent_name='ABC')
+        qref.stopConsuming()
+        defer.returnValue(qref)
+
+    def produce(self, count):
+        for i in range(count):
+            self.mq.produce(('abc', str(i)), dict(i=i, when=datetime.datetime(
+                2014, 1, 1, 12, i)))
+
+    def expected(self, count):
+        return [mock.call(('abc', str(i)), dict(i=i, when=datetime.datetime(
+                          2014, 1, 1, 12, i)))
+                for i in range(count)]
+
+    @defer.inlineCallbacks
+    def test_queue_in_memory(self):
+        qref = yield self.stoppedQueue()
+        self.produce(3)
+        self.assertEqual((len(qref.queue), qref.spool), (3, None))
+
+        cb = mock.Mock()
+        yield self.mq.startConsuming(cb, ('abc', None), persistent_name='ABC')
+        self.assertEqual(cb.call_args_list, self.expected(3))
+
+    @defer.inlineCallbacks
+    def test_spill_to_file(self):
+        qref = yield self.stoppedQueue()
+        self.produce(10)
+        self.assertEqual((len(qref.queue), qref.spooled), (3, 7))
+        self.assertEqual(os.listdir(self.master.basedir), [])
+
+        cb = mock.Mock()
+        yield self.mq.startConsuming(cb, ('abc', None), persistent_name='ABC')
+        self.assertEqual(cb.call_args_list, self.expected(10))
+        self.assertEqual((qref.queue, qref.spool, qref.spooled),
+                         ([], None, 0))
+
+        # and new messages are delivered directly
+        cb.reset_mock()
+        self.produce(1)
+        self.assertEqual(cb.call_args_list, self.expected(1))
+
+    @defer.inlineCallbacks
+    def test_messages_produced_while_replaying(self):
+        yield self.stoppedQueue()
+        self.produce(5)
+        calls = []
+
+        def cb(routingKey, data):
+            calls.append(routingKey)
+            if routingKey == ('abc', '0'):
+                self.mq.produce(('abc', 'new'), {})
+        yield self.mq.startConsuming(cb, ('abc', None), persistent_name='ABC')
+        self.assertEqual(calls, [('abc', str(i)) for i in range(5)] +
+                         [('abc', 'new')])
+
+    @defer.inlineCallbacks
+    def test_metrics(self):
+        yield self.stoppedQueue()
+        self.produce(4)
+        queued = [m for m in self.metrics if m[0] == 'SimpleMQ.ABC.queued']
+        spilled = [m for m in self.metrics
+                   if m[0] == 'SimpleMQ.ABC.spilled_bytes']
+        self.assertEqual(queued, [('SimpleMQ.ABC.queued', 1)] * 4)
+        self.assertEqual(len(spilled), 1)
+        self.assertTrue(spilled[0][1] > 0)
+
+        del self.metrics[:]
+        yield self.mq.startConsuming(mock.Mock(), ('abc', None),
+                                     persistent_name='ABC')
+        self.assertEqual(self.metrics, [('SimpleMQ.ABC.queued', 0),
+                                        ('SimpleMQ.ABC.spilled_bytes', 0)])
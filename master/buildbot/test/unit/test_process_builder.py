@@ -21,7 +21,6 @@ from buildbot.process import builder
 from buildbot.process import factory
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
-from buildbot.util import epoch2datetime
 from twisted.internet import defer
 from twisted.trial import unittest
 
@@ -339,50 +338,6 @@ class TestGetBuilderId(BuilderMixin, unittest.TestCase):
         self.assertIsInstance(arg, unicode)
 
 
-class TestGetOldestRequestTime(BuilderMixin, unittest.TestCase):
-
-    def setUp(self):
-        # a collection of rows that would otherwise clutter up every test
-        master_id = fakedb.FakeBuildRequestsComponent.MASTER_ID
-        self.base_rows = [
-            fakedb.SourceStamp(id=21),
-            fakedb.Buildset(id=11, reason='because'),
-            fakedb.BuildsetSourceStamp(buildsetid=11, sourcestampid=21),
-            fakedb.BuildRequest(id=111, submitted_at=1000,
-                                buildername='bldr1', buildsetid=11),
-            fakedb.BuildRequest(id=222, submitted_at=2000,
-                                buildername='bldr1', buildsetid=11),
-            fakedb.BuildRequestClaim(brid=222, masterid=master_id,
-                                     claimed_at=2001),
-            fakedb.BuildRequest(id=333, submitted_at=3000,
-                                buildername='bldr1', buildsetid=11),
-            fakedb.BuildRequest(id=444, submitted_at=2500,
-                                buildername='bldr2', buildsetid=11),
-            fakedb.BuildRequestClaim(brid=444, masterid=master_id,
-                                     claimed_at=2501),
-        ]
-
-    def test_gort_unclaimed(self):
-        d = self.makeBuilder(name='bldr1')
-        d.addCallback(lambda _: self.db.insertTestData(self.base_rows))
-        d.addCallback(lambda _: self.bldr.getOldestRequestTime())
-
-        def check(rqtime):
-            self.assertEqual(rqtime, epoch2datetime(1000))
-        d.addCallback(check)
-        return d
-
-    def test_gort_all_claimed(self):
-        d = self.makeBuilder(name='bldr2')
-        d.addCallback(lambda _: self.db.insertTestData(self.base_rows))
-        d.addCallback(lambda _: self.bldr.getOldestRequestTime())
-
-        def check(rqtime):
-            self.assertEqual(rqtime, None)
-        d.addCallback(check)
-        return d
-
-
 class TestReconfig(BuilderMixin, unittest.TestCase):
 
     """Tests that a reconfig properly updates all attributes"""
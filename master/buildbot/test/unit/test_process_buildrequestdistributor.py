@@ -264,47 +264,68 @@ class Test(TestBRDBase):
         self.quiet_deferred.addCallback(check)
         return self.quiet_deferred
 
+    @defer.inlineCallbacks
     def do_test_sortBuilders(self, prioritizeBuilders, oldestRequestTimes,
-                             expected, returnDeferred=False):
+                             expected, rows=[]):
         self.useMock_maybeStartBuildsOnBuilder()
         self.addBuilders(oldestRequestTimes.keys())
         self.master.config.prioritizeBuilders = prioritizeBuilders
 
-        def mklambda(t):  # work around variable-binding issues
-            if returnDeferred:
-                return lambda: defer.succeed(t)
-            else:
-                return lambda: t
-
-        for n, t in oldestRequestTimes.iteritems():
+        rows = self.base_rows + rows
+        for i, (n, t) in enumerate(sorted(oldestRequestTimes.iteritems())):
             if t is not None:
-                t = epoch2datetime(t)
-            self.builders[n].getOldestRequestTime = mklambda(t)
-
-        d = self.brd._sortBuilders(oldestRequestTimes.keys())
+                rows.append(fakedb.BuildRequest(id=100 + i, buildsetid=11,
+                                                buildername=n,
+                                                submitted_at=t))
+        yield self.master.db.insertTestData(rows)
 
-        def check(result):
-            self.assertEqual(result, expected)
-            self.checkAllCleanedUp()
-        d.addCallback(check)
-        return d
+        result = yield self.brd._sortBuilders(oldestRequestTimes.keys())
+        self.assertEqual(result, expected)
+        self.checkAllCleanedUp()
 
-    def test_sortBuilders_default_sync(self):
+    def test_sortBuilders_default(self):
         return self.do_test_sortBuilders(None,  # use the default sort
                                          dict(bldr1=777, bldr2=999, bldr3=888),
                                          ['bldr1', 'bldr3', 'bldr2'])
 
-    def test_sortBuilders_default_asyn(self):
-        return self.do_test_sortBuilders(None,  # use the default sort
-                                         dict(bldr1=777, bldr2=999, bldr3=888),
-                                         ['bldr1', 'bldr3', 'bldr2'],
-                                         returnDeferred=True)
-
     def test_sortBuilders_default_None(self):
         return self.do_test_sortBuilders(None,  # use the default sort
                                          dict(bldr1=777, bldr2=None, bldr3=888),
                                          ['bldr1', 'bldr3', 'bldr2'])
 
+    def test_sortBuilders_default_ignores_claimed_and_complete(self):
+        master_id = fakedb.FakeBuildRequestsComponent.MASTER_ID
+        rows = [
+            # older requests for bldr2 and bldr3 that are no longer pending
+            fakedb.BuildRequest(id=10, buildsetid=11, buildername='bldr2',
+                                submitted_at=111),
+            fakedb.BuildRequestClaim(brid=10, masterid=master_id,
+                                     claimed_at=112),
+            fakedb.BuildRequest(id=11, buildsetid=11, buildername='bldr3',
+                                submitted_at=222, complete=1),
+        ]
+        return self.do_test_sortBuilders(None,  # use the default sort
+                                         dict(bldr1=777, bldr2=999, bldr3=888),
+                                         ['bldr1', 'bldr3', 'bldr2'],
+                                         rows=rows)
+
+    def test_sortBuilders_default_single_query(self):
+        getOldestRequestTimes = mock.Mock(
+            return_value=defer.succeed({u'bldr1': epoch2datetime(20),
+                                        u'bldr2': epoch2datetime(10)}))
+        self.patch(self.master.db.buildrequests, 'getOldestRequestTimes',
+                   getOldestRequestTimes)
+        d = self.do_test_sortBuilders(None,  # use the default sort
+                                      dict(bldr1=None, bldr2=None, bldr3=None),
+                                      ['bldr2', 'bldr1', 'bldr3'])
+
+        @d.addCallback
+        def check(_):
+            getOldestRequestTimes.assert_called_once_with(mock.ANY)
+            self.assertEqual(sorted(getOldestRequestTimes.call_args[0][0]),
+                             ['bldr1', 'bldr2', 'bldr3'])
+        return d
+
     def test_sortBuilders_custom(self):
         def prioritizeBuilders(master, builders):
             self.assertIdentical(master, self.master)
@@ -344,6 +365,85 @@ class Test(TestBRDBase):
         d.addCallback(check)
         return d
 
+    def useControlled_maybeStartBuildsOnBuilder(self, slavenames):
+        # sets up a mock "maybeStartBuildsOnBuilder" that does not finish
+        # until the test fires the Deferred in self.running_builders
+        self.maybeStartBuildsOnBuilder_calls = []
+        self.running_builders = {}
+
+        def maybeStartBuildsOnBuilder(bldr):
+            self.maybeStartBuildsOnBuilder_calls.append(bldr.name)
+            d = self.running_builders[bldr.name] = defer.Deferred()
+            return d
+        self.brd._maybeStartBuildsOnBuilder = maybeStartBuildsOnBuilder
+
+        self.addBuilders(sorted(slavenames))
+        for name, slaves in slavenames.iteritems():
+            self.builders[name].config.slavenames = slaves
+
+    def finishBuilder(self, name):
+        self.running_builders.pop(name).callback(None)
+
+    def test_concurrency_independent_builders(self):
+        self.master.config.builderDistributionConcurrency = 2
+        self.useControlled_maybeStartBuildsOnBuilder(
+            dict(A=['s1'], B=['s2'], C=['s3']))
+        self.brd.maybeStartBuildsOn(['A', 'B', 'C'])
+
+        # A and B run at once; C waits for one of them to finish
+        self.assertEqual(self.maybeStartBuildsOnBuilder_calls, ['A', 'B'])
+        self.finishBuilder('B')
+        self.assertEqual(self.maybeStartBuildsOnBuilder_calls,
+                         ['A', 'B', 'C'])
+        self.finishBuilder('A')
+        self.finishBuilder('C')
+        self.checkAllCleanedUp()
+
+    def test_concurrency_shared_slaves(self):
+        self.master.config.builderDistributionConcurrency = 4
+        self.useControlled_maybeStartBuildsOnBuilder(
+            dict(A=['s1', 's2'], B=['s2', 's3'], C=['s3'], D=['s4']))
+        self.brd.maybeStartBuildsOn(['A', 'B', 'C', 'D'])
+
+        # B shares a slave with A, and C must not take B's slaves before it
+        self.assertEqual(self.maybeStartBuildsOnBuilder_calls, ['A', 'D'])
+        self.finishBuilder('A')
+        self.assertEqual(self.maybeStartBuildsOnBuilder_calls,
+                         ['A', 'D', 'B'])
+        self.finishBuilder('B')
+        self.assertEqual(self.maybeStartBuildsOnBuilder_calls,
+                         ['A', 'D', 'B', 'C'])
+        self.finishBuilder('C')
+        self.finishBuilder('D')
+        self.checkAllCleanedUp()
+
+    def test_concurrency_new_builders_while_waiting(self):
+        self.master.config.builderDistributionConcurrency = 2
+        self.useControlled_maybeStartBuildsOnBuilder(
+            dict(A=['s1'], B=['s2']))
+        self.brd.maybeStartBuildsOn(['A'])
+        self.assertEqual(self.maybeStartBuildsOnBuilder_calls, ['A'])
+
+        # B starts without waiting for A to finish
+        self.brd.maybeStartBuildsOn(['B'])
+        self.assertEqual(self.maybeStartBuildsOnBuilder_calls, ['A', 'B'])
+        self.finishBuilder('A')
+        self.finishBuilder('B')
+        self.checkAllCleanedUp()
+
+    def test_concurrency_same_builder_again(self):
+        self.master.config.builderDistributionConcurrency = 2
+        self.useControlled_maybeStartBuildsOnBuilder(dict(A=['s1']))
+        self.brd.maybeStartBuildsOn(['A'])
+
+        # A is pending again, but must wait for the running pass to finish
+        self.brd.maybeStartBuildsOn(['A'])
+        self.assertEqual(self.maybeStartBuildsOnBuilder_calls, ['A'])
+        self.finishBuilder('A')
+        self.assertEqual(self.maybeStartBuildsOnBuilder_calls, ['A', 'A'])
+        self.finishBuilder('A')
+        self.checkAllCleanedUp()
+
     def test_stopService(self):
         # check that stopService waits for a builder run to complete, but does not
         # allow a subsequent run to start
@@ -429,6 +529,26 @@ class TestMaybeStartBuilds(TestBRDBase):
         yield self.do_test_maybeStartBuildsOnBuilder(rows=rows,
                                                      exp_claims=[10], exp_builds=[('test-slave1', [10])])
 
+    @defer.inlineCallbacks
+    def test_claimed_messages(self):
+        self.master.config.mergeRequests = False
+        self.addSlaves({'test-slave1': 1})
+        rows = self.base_rows + [
+            fakedb.BuildRequest(id=10, buildsetid=11, buildername="A",
+                                submitted_at=130000),
+        ]
+        # the messages are built from the chosen requests, without
+        # re-fetching each one
+        self.master.db.buildrequests.getBuildRequest = mock.Mock(
+            side_effect=AssertionError("should not be called"))
+        yield self.do_test_maybeStartBuildsOnBuilder(rows=rows,
+                                                     exp_claims=[10], exp_builds=[('test-slave1', [10])])
+        self.master.mq.assertProductions([
+            (('buildsets', '11', 'builders', '-1', 'buildrequests', '10',
+              'claimed'),
+             dict(bsid=11, brid=10, buildername=u'A', builderid=-1)),
+        ])
+
     @defer.inlineCallbacks
     def test_sorted_by_submit_time(self):
         self.master.config.mergeRequests = False
@@ -14,21 +14,57 @@
 # Copyright Buildbot Team Members
 
 import mock
+import random
 
 from buildbot.process import cache
+from buildbot.util import lru
+from twisted.internet import defer
+from twisted.internet import task
 from twisted.trial import unittest
 
 
+class Entry(object):
+
+    def __init__(self, key):
+        self.key = key
+        self.data = 'x' * 1000
+
+
+def miss_fn(key):
+    return defer.succeed(Entry(key))
+
+
 class CacheManager(unittest.TestCase):
 
     def setUp(self):
+        self.clock = task.Clock()
         self.caches = cache.CacheManager()
+        self.caches._reactor = self.clock
+        self.patch(lru.AsyncLRUCache, '_reactor', self.clock)
+        self.caches.startService()
+
+    def tearDown(self):
+        return self.caches.stopService()
 
-    def make_config(self, **kwargs):
+    def make_config(self, cacheAutoTune=None, **kwargs):
         cfg = mock.Mock()
         cfg.caches = kwargs
+        cfg.cacheAutoTune = cacheAutoTune
         return cfg
 
+    def autotune_config(self, memory_budget=10 ** 6, **kwargs):
+        return self.make_config(
+            cacheAutoTune=dict(memory_budget=memory_budget, interval=60),
+            **kwargs)
+
+    def lookup(self, c, keys):
+        for key in keys:
+            c.get(key)
+
+    def random_keys(self, n=30, lookups=300):
+        rnd = random.Random(0)
+        return [rnd.randrange(n) for _ in xrange(lookups)]
+
     def test_get_cache_idempotency(self):
         foo_cache = self.caches.get_cache("foo", None)
         bar_cache = self.caches.get_cache("bar", None)
@@ -54,3 +90,101 @@ class CacheManager(unittest.TestCase):
         metric = self.caches.get_metrics()['foo']
         for k in 'hits', 'refhits', 'misses', 'max_size':
             self.assertIn(k, metric)
+
+    @defer.inlineCallbacks
+    def test_get_metrics_values(self):
+        self.caches.reconfigService(self.make_config(foo=2))
+        c = self.caches.get_cache("foo", miss_fn)
+        for key in 'aab':
+            yield c.get(key)
+        c.set_max_size(1)
+        metric = self.caches.get_metrics()['foo']
+        self.assertEqual(metric['size'], 1)
+        self.assertEqual(metric['evictions'], 1)
+        self.assertEqual(metric['miss_latency'], 0)
+        self.assertTrue(1000 < metric['memory'] < 2000, metric['memory'])
+
+    def test_get_metrics_no_fetches(self):
+        self.caches.get_cache("foo", miss_fn)
+        metric = self.caches.get_metrics()['foo']
+        self.assertEqual((metric['miss_latency'], metric['memory']),
+                         (None, 0))
+
+    def test_estimate_memory_samples(self):
+        c = self.caches.get_cache("foo", miss_fn)
+        c.set_max_size(100)
+        self.lookup(c, range(100))
+        estimate = self.caches.estimate_memory(c)
+        self.assertTrue(100 * 1000 < estimate < 200 * 1000, estimate)
+
+    def test_autotune_task(self):
+        self.caches.autotune = mock.Mock()
+        self.caches.reconfigService(self.autotune_config())
+        autotune_task = self.caches.autotune_task
+        self.assertFalse(self.caches.autotune.called)
+        self.clock.advance(60)
+        self.assertTrue(self.caches.autotune.called)
+
+        self.caches.reconfigService(self.make_config())
+        self.assertEqual(self.caches.autotune_task, None)
+        self.assertFalse(autotune_task.running)
+
+    def test_autotune_grows_while_hit_rate_improves(self):
+        self.caches.reconfigService(self.autotune_config(foo=10))
+        c = self.caches.get_cache("foo", miss_fn)
+        keys = self.random_keys()
+        self.lookup(c, keys)
+        self.caches.autotune()
+        self.assertEqual(c.max_size, 20)
+        self.lookup(c, keys)
+        self.caches.autotune()
+        self.assertEqual(c.max_size, 40)
+        # now that all 30 keys fit, the cache is no longer full
+        self.lookup(c, keys)
+        self.caches.autotune()
+        self.assertEqual(c.max_size, 40)
+
+    def test_autotune_reverts_useless_growth(self):
+        self.caches.reconfigService(self.autotune_config(foo=10))
+        c = self.caches.get_cache("foo", miss_fn)
+        # every lookup misses, whatever the size
+        self.lookup(c, range(200))
+        self.caches.autotune()
+        self.assertEqual(c.max_size, 20)
+        self.lookup(c, range(200, 400))
+        self.caches.autotune()
+        self.assertEqual(c.max_size, 10)
+
+    def test_autotune_within_budget(self):
+        self.caches.reconfigService(
+            self.autotune_config(memory_budget=25000, foo=10))
+        c = self.caches.get_cache("foo", miss_fn)
+        keys = self.random_keys()
+        self.lookup(c, keys)
+        # doubling to 20 entries of over 1000 bytes would exceed the budget
+        self.caches.autotune()
+        self.assertEqual(c.max_size, 10)
+
+    def test_autotune_shrinks_over_budget(self):
+        self.caches.reconfigService(self.autotune_config(foo=10))
+        c = self.caches.get_cache("foo", miss_fn)
+        keys = self.random_keys()
+        self.lookup(c, keys)
+        self.caches.autotune()
+        self.assertEqual(c.max_size, 20)
+        self.lookup(c, keys)
+        self.caches.reconfigService(
+            self.autotune_config(memory_budget=15000, foo=10))
+        # the tuned size survives the reconfig
+        self.assertEqual(c.max_size, 20)
+        self.caches.autotune()
+        self.assertEqual(c.max_size, 10)
+
+    def test_reconfig_without_autotune_resets_sizes(self):
+        self.caches.reconfigService(self.autotune_config(foo=10))
+        c = self.caches.get_cache("foo", miss_fn)
+        self.lookup(c, self.random_keys())
+        self.caches.autotune()
+        self.assertEqual(c.max_size, 20)
+        self.caches.reconfigService(self.make_config(foo=10))
+        self.assertEqual(c.max_size, 10)
@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 import gc
+import mock
 import sys
 
 from buildbot.process import metrics
@@ -163,6 +164,27 @@ class TestPeriodicChecks(TestMetricBase):
         self.assertEquals(report['counters']['gc.garbage'], 2)
         self.assertEquals(report['alarms']['gc.garbage'][0], 'WARN')
 
+    def testCacheCheck(self):
+        caches = mock.Mock()
+        caches.get_metrics.return_value = dict(
+            chdicts=dict(hits=10, max_size=5, miss_latency=None))
+        metrics.cacheCheck(caches)
+
+        counters = self.observer.asDict()['counters']
+        self.assertEqual(counters['caches.chdicts.hits'], 10)
+        self.assertEqual(counters['caches.chdicts.max_size'], 5)
+        self.assertNotIn('caches.chdicts.miss_latency', counters)
+
+    def testObserverPeriodicCheck(self):
+        self.patch(gc, 'garbage', [])
+        self.master.caches.get_metrics = lambda: dict(
+            chdicts=dict(evictions=3))
+        self.observer.periodicCheck()
+
+        counters = self.observer.asDict()['counters']
+        self.assertEqual(counters['gc.garbage'], 0)
+        self.assertEqual(counters['caches.chdicts.evictions'], 3)
+
     def testGetRSS(self):
         self.assert_(metrics._get_rss() > 0)
     if sys.platform != 'linux2':
@@ -241,6 +263,21 @@ class TestReports(unittest.TestCase):
         self.assertEquals("Timer time_foo: 1", handler.report())
         self.assertEquals({"timers": {"time_foo": 1}}, handler.asDict())
 
+    def testMetricHistogramReport(self):
+        handler = metrics.MetricHistogramHandler(None)
+        for value in (0.0005, 0.003, 0.003, 0.04):
+            handler.handle({}, metrics.MetricHistogramEvent('hist_foo', value))
+
+        self.assertEquals("Histogram hist_foo: count 4, mean 0.0116, "
+                          "p50 0.005, p90 0.04, p99 0.04, max 0.04",
+                          handler.report())
+        report = handler.asDict()['histograms']['hist_foo']
+        self.assertEquals(report['count'], 4)
+        self.assertEquals(report['p50'], 0.005)
+        self.assertEquals(report['buckets'][:6],
+                          [(0.001, 1), (0.002, 0), (0.005, 2), (0.01, 0),
+                           (0.02, 0), (0.05, 1)])
+
     def testMetricAlarmReport(self):
         handler = metrics.MetricAlarmHandler(None)
         handler.handle({}, metrics.MetricAlarmEvent('alarm_foo', msg='Uh oh', level=metrics.ALARM_WARN))
@@ -13,6 +13,10 @@
 #
 # Copyright Buildbot Team Members
 
+import mock
+import zlib
+
+from buildbot.process import metrics
 from buildbot.process import remotecommand
 from buildbot.status.results import SUCCESS
 from buildbot.test.fake import logfile
@@ -150,6 +154,85 @@ class TestRunCommand(unittest.TestCase, Tests):
         self.failUnlessEqual(log.header, 'some header')
 
 
+class TestUpdateCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+
+        def log(counter, count=1, absolute=False):
+            if counter.startswith('RemoteCommand.update-bytes.'):
+                self.events.append((counter, count))
+        self.patch(metrics.MetricCountEvent, 'log', staticmethod(log))
+        self.cmd = remotecommand.RemoteCommand('shell', {'arg': 'val'})
+        self.cmd.buildslave = mock.Mock()
+        self.log = logfile.FakeLogFile('stdio', 'dummy')
+        self.cmd.useLog(self.log)
+        self.other = logfile.FakeLogFile('other', 'dummy')
+        self.cmd.useLog(self.other)
+        self.conn = mock.Mock(name='conn')
+        self.step = mock.Mock(name='step')
+        self.step.slaveVersionIsOlderThan.return_value = True
+
+    def start(self):
+        self.cmd.run(self.step, self.conn, 'bldr')
+        return self.conn.remoteStartCommand.call_args[0][4]
+
+    def test_old_slave(self):
+        args = self.start()
+        self.assertEqual(args, {'arg': 'val'})
+        self.step.slaveVersionIsOlderThan.assert_called_with('shell', '2.19')
+
+    def test_new_slave(self):
+        self.step.slaveVersionIsOlderThan.return_value = False
+        args = self.start()
+        self.assertEqual(args, {'arg': 'val', 'update_compression': 'zlib'})
+        # the command's own args are unchanged
+        self.assertEqual(self.cmd.args, {'arg': 'val'})
+
+    def test_new_slave_disabled(self):
+        self.step.slaveVersionIsOlderThan.return_value = False
+        self.cmd.updateCompression = None
+        args = self.start()
+        self.assertEqual(args, {'arg': 'val'})
+
+    def test_remote_update(self):
+        self.step.slaveVersionIsOlderThan.return_value = False
+        self.start()
+        compressor = zlib.compressobj()
+
+        def compress(data):
+            return compressor.compress(data) + \
+                compressor.flush(zlib.Z_SYNC_FLUSH)
+        out1 = compress('hello ' * 100)
+        err = compress('err')
+        hdr = compress('header')
+        out2 = compress('hello ' * 100)
+        other = compress('other')
+        self.cmd.remote_update([
+            [{'stdout': out1, 'stderr': err, 'header': hdr,
+              'compressed': ['stdout', 'stderr', 'header']}, 0],
+            [{'stdout': out2, 'compressed': ['stdout']}, 0],
+            [{'header': u'plain', 'log': ('other', other),
+              'compressed': ['log']}, 0],
+        ])
+        self.assertEqual(self.log.stdout, 'hello ' * 200)
+        self.assertEqual(self.log.stderr, 'err')
+        self.assertEqual(self.log.header, 'headerplain')
+        self.assertEqual(self.other.stdout, 'other')
+        self.assertEqual(self.cmd.updates, {'log': [('other', 'other')]})
+        compressed = sum(len(s) for s in (out1, err, hdr, out2, other))
+        self.assertEqual(self.events, [
+            ('RemoteCommand.update-bytes.compressed', compressed),
+            ('RemoteCommand.update-bytes.uncompressed', 1214),
+        ])
+
+    def test_remote_update_uncompressed(self):
+        self.start()
+        self.cmd.remote_update([[{'stdout': 'hello'}, 0]])
+        self.assertEqual(self.log.stdout, 'hello')
+        self.assertEqual(self.events, [])
+
+
 class TestFakeRunCommand(unittest.TestCase, Tests):
 
     remoteCommandClass = fakeremotecommand.FakeRemoteCommand
@@ -708,7 +708,7 @@ class WarningCountingShellCommand(steps.BuildStepMixin, unittest.TestCase):
         )
         self.expectOutcome(result=WARNINGS, status_text=["'make'", "warnings"])
         self.expectProperty("warnings-count", 1)
-        self.expectLogfile("warnings (1)", "warning: blarg!\n")
+        self.expectLogfile("warnings", "warning: blarg!\n")
         return self.runStep()
 
     def test_custom_pattern(self):
@@ -723,7 +723,7 @@ class WarningCountingShellCommand(steps.BuildStepMixin, unittest.TestCase):
         )
         self.expectOutcome(result=WARNINGS, status_text=["'make'", "warnings"])
         self.expectProperty("warnings-count", 2)
-        self.expectLogfile("warnings (2)", "scary: foo\nscary: bar\n")
+        self.expectLogfile("warnings", "scary: foo\nscary: bar\n")
         return self.runStep()
 
     def test_maxWarnCount(self):
@@ -749,7 +749,7 @@ class WarningCountingShellCommand(steps.BuildStepMixin, unittest.TestCase):
         )
         self.expectOutcome(result=FAILURE, status_text=["'make'", "failed"])
         self.expectProperty("warnings-count", 1)
-        self.expectLogfile("warnings (1)", "warning: I might fail\n")
+        self.expectLogfile("warnings", "warning: I might fail\n")
         return self.runStep()
 
     def do_test_suppressions(self, step, supps_file='', stdout='',
@@ -785,8 +785,7 @@ class WarningCountingShellCommand(steps.BuildStepMixin, unittest.TestCase):
             if exp_warning_count != 0:
                 self.expectOutcome(result=WARNINGS,
                                    status_text=["'make'", "warnings"])
-                self.expectLogfile("warnings (%d)" % exp_warning_count,
-                                   exp_warning_log)
+                self.expectLogfile("warnings", exp_warning_log)
             else:
                 self.expectOutcome(result=SUCCESS,
                                    status_text=["'make'"])
@@ -930,6 +929,41 @@ class WarningCountingShellCommand(steps.BuildStepMixin, unittest.TestCase):
         return self.do_test_suppressions(step, '', stdout, 2,
                                          exp_warning_log)
 
+    def test_warning_log_batches(self):
+        step = shell.WarningCountingShellCommand(command=['make'])
+        self.setupStep(step)
+        # setupStep makes a new step, so set this on that one
+        self.step.warningLogBatchSize = 2
+        # loggedWarnings only holds the warnings not yet in the log
+        batches = []
+        addWarningsToLog = self.step.addWarningsToLog
+
+        def recordBatch():
+            batches.append(self.step.loggedWarnings)
+            return addWarningsToLog()
+        self.step.addWarningsToLog = recordBatch
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command=["make"])
+            + ExpectShell.log('stdio',
+                              stdout=''.join('warning: %d\nok\n' % i
+                                             for i in range(5)))
+            + 0
+        )
+        self.expectOutcome(result=WARNINGS, status_text=["'make'", "warnings"])
+        self.expectProperty("warnings-count", 5)
+        self.expectLogfile("warnings", ''.join('warning: %d\n' % i
+                                               for i in range(5)))
+        d = self.runStep()
+
+        @d.addCallback
+        def check(_):
+            self.assertEqual(batches, [['warning: 0', 'warning: 1'],
+                                       ['warning: 2', 'warning: 3'],
+                                       ['warning: 4']])
+            self.assertEqual(self.step.loggedWarnings, [])
+        return d
+
     def test_warnExtractFromRegexpGroups(self):
         step = shell.WarningCountingShellCommand(command=['make'])
         we = shell.WarningCountingShellCommand.warnExtractFromRegexpGroups
@@ -939,6 +973,75 @@ class WarningCountingShellCommand(steps.BuildStepMixin, unittest.TestCase):
                          (exp_file, exp_lineNo, exp_text))
 
 
+class WarningSuppressions(unittest.TestCase):
+
+    def setUp(self):
+        self.supps = shell.WarningSuppressions()
+
+    def add(self, fileRe, warnRe, start=None, end=None):
+        self.supps.add(fileRe and re.compile(fileRe),
+                       warnRe and re.compile(warnRe), start, end)
+
+    def test_empty(self):
+        self.assertEqual(len(self.supps), 0)
+        self.assertFalse(self.supps.matches('a.c', 1, 'unused'))
+        self.assertFalse(self.supps.matches(None, None, 'unused'))
+
+    def test_literal_file(self):
+        self.add(r'src/a\.c', 'unused')
+        self.add('src/b.c', None)
+        self.assertEqual(self.supps.byLiteral.keys(), ['src/a.c'])
+        self.assertTrue(self.supps.matches('src/a.c', 1, 'x unused y'))
+        # FILE-RE is matched at the beginning of the file name only
+        self.assertTrue(self.supps.matches('src/a.cpp', 1, 'unused'))
+        self.assertFalse(self.supps.matches('other/src/a.c', 1, 'unused'))
+        self.assertFalse(self.supps.matches('src/a.c', 1, 'shadowed'))
+        self.assertTrue(self.supps.matches('src/b.c', 1, 'shadowed'))
+        self.assertTrue(self.supps.matches('src/bxc', 1, 'shadowed'))
+
+    def test_file_regexp(self):
+        self.add('.*/gen/.*', 'deprecated')
+        self.add('(?i)SRC/', 'unused')
+        self.assertTrue(self.supps.matches('a/gen/b.c', 1, 'deprecated'))
+        self.assertFalse(self.supps.matches('a/b.c', 1, 'deprecated'))
+        self.assertTrue(self.supps.matches('src/a.c', 1, 'unused'))
+
+    def test_any_file(self):
+        self.add(None, 'deprecated')
+        self.assertTrue(self.supps.matches('a.c', 1, 'is deprecated'))
+        self.assertTrue(self.supps.matches(None, None, 'is deprecated'))
+
+    def test_no_file(self):
+        # a warning without a file name is matched against all suppressions
+        self.add('a.c', 'unused')
+        self.add('.*b', 'shadowed', 10, 20)
+        self.assertTrue(self.supps.matches(None, None, 'unused'))
+        self.assertFalse(self.supps.matches(None, None, 'shadowed'))
+        self.assertTrue(self.supps.matches(None, 15, 'shadowed'))
+
+    def test_line_ranges(self):
+        self.add('a.c', 'unused', 100, 199)
+        self.add('a.c', None, 5, 5)
+        self.assertFalse(self.supps.matches('a.c', 99, 'unused'))
+        self.assertTrue(self.supps.matches('a.c', 150, 'unused'))
+        self.assertFalse(self.supps.matches('a.c', 150, 'shadowed'))
+        self.assertTrue(self.supps.matches('a.c', 5, 'shadowed'))
+        self.assertFalse(self.supps.matches('a.c', None, 'unused'))
+
+    def test_many_patterns(self):
+        for i in range(200):
+            self.add(r'a\.c', 'warning %d$' % i)
+        self.add(r'a\.c', r'(\w+) is \1')
+        self.assertEqual(len(self.supps), 201)
+        self.assertTrue(self.supps.matches('a.c', 1, 'warning 0'))
+        self.assertTrue(self.supps.matches('a.c', 1, 'warning 199'))
+        self.assertFalse(self.supps.matches('a.c', 1, 'warning 200'))
+        self.assertTrue(self.supps.matches('a.c', 1, 'x is x'))
+        self.assertFalse(self.supps.matches('a.c', 1, 'x is y'))
+        # 200 patterns combined 50 at a time, and one with a group
+        self.assertEqual(len(self.supps.byLiteral['a.c'].regexps), 5)
+
+
 class Compile(steps.BuildStepMixin, unittest.TestCase):
 
     def setUp(self):
@@ -59,6 +59,7 @@ def uploadTarFile(filename, **members):
         archive = tarfile.TarFile(fileobj=f, name=filename, mode='w')
         for name, content in members.iteritems():
             archive.addfile(tarfile.TarInfo(name), StringIO(content))
+        archive.close()
         writer = command.args['writer']
         writer.remote_write(f.getvalue())
         writer.remote_unpack()
@@ -119,6 +120,263 @@ class TestFileWriter(unittest.TestCase):
         mockedMkstemp.assert_called_once_with(dir=absdir)
         mockedFdopen.assert_called_once_with(7, 'wb')
 
+
+class TestDirectoryWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.srcdir = os.path.abspath('srcdir')
+        self.destdir = os.path.abspath('destdir')
+        for d in self.srcdir, self.destdir:
+            if os.path.exists(d):
+                shutil.rmtree(d)
+        longdir = os.path.join(self.srcdir, 'sub', 'd' * 120)
+        os.makedirs(longdir)
+        with open(os.path.join(self.srcdir, 'top'), 'wb') as f:
+            f.write('top\n' * 1000)
+        with open(os.path.join(longdir, 'f' * 120), 'wb') as f:
+            f.write('long\n')
+        os.chmod(os.path.join(self.srcdir, 'top'), 0751)
+        os.utime(os.path.join(self.srcdir, 'top'), (1234567890, 1234567890))
+        if hasattr(os, 'symlink'):
+            os.symlink('top', os.path.join(self.srcdir, 'link'))
+
+    def tearDown(self):
+        for d in self.srcdir, self.destdir:
+            if os.path.exists(d):
+                shutil.rmtree(d)
+
+    def makeArchive(self, compress=None, format=tarfile.DEFAULT_FORMAT):
+        f = StringIO()
+        archive = tarfile.open(fileobj=f, mode='w|' + (compress or ''),
+                               format=format)
+        archive.add(self.srcdir, '')
+        archive.close()
+        return f.getvalue()
+
+    def writeArchive(self, data, compress=None, maxsize=None, piece=100):
+        writer = transfer._DirectoryWriter(self.destdir, maxsize, compress)
+        for i in xrange(0, len(data), piece):
+            writer.remote_write(data[i:i + piece])
+        writer.remote_unpack()
+
+    def assertUnpacked(self):
+        top = os.path.join(self.destdir, 'top')
+        self.assertEqual(open(top).read(), 'top\n' * 1000)
+        self.assertEqual(stat.S_IMODE(os.stat(top).st_mode), 0751)
+        self.assertEqual(os.stat(top).st_mtime, 1234567890)
+        longfile = os.path.join(self.destdir, 'sub', 'd' * 120, 'f' * 120)
+        self.assertEqual(open(longfile).read(), 'long\n')
+        if hasattr(os, 'symlink'):
+            self.assertEqual(os.readlink(os.path.join(self.destdir, 'link')),
+                             'top')
+
+    def test_unpack(self):
+        self.writeArchive(self.makeArchive())
+        self.assertUnpacked()
+
+    def test_unpack_gz(self):
+        self.writeArchive(self.makeArchive('gz'), 'gz')
+        self.assertUnpacked()
+
+    def test_unpack_bz2(self):
+        self.writeArchive(self.makeArchive('bz2'), 'bz2')
+        self.assertUnpacked()
+
+    def test_unpack_pax(self):
+        self.writeArchive(self.makeArchive(format=tarfile.PAX_FORMAT))
+        self.assertUnpacked()
+
+    def test_unpack_whole(self):
+        self.writeArchive(self.makeArchive(), piece=1 << 20)
+        self.assertUnpacked()
+
+    def test_unpacks_as_data_arrives(self):
+        data = self.makeArchive()
+        writer = transfer._DirectoryWriter(self.destdir, None, None)
+        writer.remote_write(data[:4096])
+        self.assertTrue(os.path.exists(os.path.join(self.destdir, 'top')))
+        writer.remote_write(data[4096:])
+        writer.remote_unpack()
+        self.assertUnpacked()
+
+    def test_maxsize(self):
+        self.assertRaises(tarfile.ReadError, self.writeArchive,
+                          self.makeArchive(), maxsize=2000)
+        # the partly-written file is removed
+        self.assertFalse(os.path.exists(os.path.join(self.destdir, 'top')))
+
+    def test_maxsize_at_member_boundary(self):
+        # the archive ends between members, but without its end-of-archive
+        # marker, so it is still incomplete
+        data = self.makeMembers(('a', tarfile.REGTYPE, '', 'a' * 512))
+        self.assertRaises(tarfile.ReadError, self.writeArchive, data,
+                          maxsize=1024)
+        self.assertRaises(tarfile.ReadError, self.writeArchive, data,
+                          maxsize=1536)
+        self.writeArchive(data, maxsize=2048)
+
+    def test_outside_destination(self):
+        f = StringIO()
+        archive = tarfile.open(fileobj=f, mode='w')
+        archive.addfile(tarfile.TarInfo('../escaped'), StringIO(''))
+        archive.close()
+        self.assertRaises(tarfile.ExtractError, self.writeArchive,
+                          f.getvalue())
+        self.assertFalse(os.path.exists(os.path.abspath('escaped')))
+
+    def makeMembers(self, *members):
+        f = StringIO()
+        archive = tarfile.open(fileobj=f, mode='w')
+        for name, type, linkname, data in members:
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.type = type
+            tarinfo.linkname = linkname
+            tarinfo.size = len(data)
+            archive.addfile(tarinfo, StringIO(data))
+        archive.close()
+        return f.getvalue()
+
+    def assertRefused(self, *members):
+        self.assertRaises(tarfile.ExtractError, self.writeArchive,
+                          self.makeMembers(*members))
+
+    def makeHeader(self, name, type=tarfile.REGTYPE, size=0, sizeField=None):
+        header = tarfile.TarInfo(name)
+        header.type = type
+        header.size = size
+        header = header.tobuf(format=tarfile.GNU_FORMAT)
+        if sizeField is not None:
+            header = header[:124] + sizeField + header[136:]
+        # recompute the checksum
+        header = header[:148] + ' ' * 8 + header[156:]
+        chksum = tarfile.calc_chksums(header)[0]
+        return header[:148] + '%06o\0 ' % chksum + header[156:]
+
+    def test_bad_checksum(self):
+        header = self.makeHeader('a')
+        header = header[:148] + '0000000\0' + header[156:]
+        self.assertRaises(tarfile.ReadError, self.writeArchive,
+                          header + tarfile.NUL * 1024)
+
+    def test_negative_size(self):
+        self.assertRaises(tarfile.ReadError, self.writeArchive,
+                          self.makeHeader('a', sizeField='-0000000001\0')
+                          + 'data'.ljust(tarfile.BLOCKSIZE, tarfile.NUL)
+                          + tarfile.NUL * 1024)
+
+    def test_huge_size(self):
+        # a base-256 size larger than the data that follows
+        huge = '\x80' + '\0' * 3 + '\x10' + '\0' * 7
+        self.assertRaises(tarfile.ReadError, self.writeArchive,
+                          self.makeHeader('a', sizeField=huge)
+                          + tarfile.NUL * 2048)
+        self.assertFalse(os.path.exists(os.path.join(self.destdir, 'a')))
+
+    def test_huge_extended_header(self):
+        writer = transfer._DirectoryWriter(self.destdir, None, None)
+        self.assertRaises(tarfile.ReadError, writer.remote_write,
+                          self.makeHeader('././@PaxHeader', tarfile.XHDTYPE,
+                                          size=1 << 30))
+
+    def paxRecord(self, keyword, value):
+        # the length includes its own digits
+        record = ' %s=%s\n' % (keyword, value)
+        length = len(record)
+        while len(str(length)) + len(record) != length:
+            length += 1
+        return '%d%s' % (length, record)
+
+    def makePaxMember(self, records, name='a'):
+        pax = self.makeHeader('././@PaxHeader', tarfile.XHDTYPE,
+                              size=len(records))
+        return (pax + records.ljust(-len(records) % tarfile.BLOCKSIZE
+                                    + len(records), tarfile.NUL)
+                + self.makeHeader(name) + tarfile.NUL * 1024)
+
+    def test_pax_path(self):
+        self.writeArchive(self.makePaxMember(self.paxRecord('path', 'b/cd')))
+        self.assertTrue(os.path.exists(os.path.join(self.destdir, 'b', 'cd')))
+        self.assertFalse(os.path.exists(os.path.join(self.destdir, 'a')))
+
+    def test_pax_path_outside_destination(self):
+        for path in ('../escaped', 'b/../../escaped'):
+            self.assertRaises(tarfile.ExtractError, self.writeArchive,
+                              self.makePaxMember(self.paxRecord('path', path)))
+        self.assertFalse(os.path.exists(os.path.abspath('escaped')))
+
+    def test_pax_malformed(self):
+        for records in ('garbage\n', '99 path=a\n', '0 path=a\n',
+                        '10 pathab\n', self.paxRecord('size', '-1234'),
+                        self.paxRecord('size', 'x'),
+                        self.paxRecord('mtime', 'x')):
+            self.assertRaises(tarfile.ReadError, self.writeArchive,
+                              self.makePaxMember(records))
+
+    def test_symlink_outside_destination(self):
+        outside = os.path.abspath('outside')
+        self.addCleanup(shutil.rmtree, outside, True)
+        os.makedirs(outside)
+        self.assertRefused(('a', tarfile.SYMTYPE, outside, ''),
+                           ('a/passwd', tarfile.REGTYPE, '', 'pwned'))
+        self.assertRefused(('a', tarfile.SYMTYPE, '../outside', ''))
+        self.assertRefused(('sub/a', tarfile.SYMTYPE, '../../outside', ''))
+        self.assertEqual(os.listdir(outside), [])
+
+    def test_symlink_inside_destination(self):
+        self.writeArchive(self.makeMembers(
+            ('sub', tarfile.DIRTYPE, '', ''),
+            ('sub/a', tarfile.SYMTYPE, '..', ''),
+            ('sub/a/f', tarfile.REGTYPE, '', 'data')))
+        self.assertEqual(open(os.path.join(self.destdir, 'f')).read(), 'data')
+
+    def test_hardlink_outside_destination(self):
+        outside = os.path.abspath('outside')
+        self.addCleanup(os.unlink, outside)
+        open(outside, 'w').write('secret')
+        self.assertRefused(('a', tarfile.LNKTYPE, '../outside', ''))
+        self.assertRefused(('a', tarfile.LNKTYPE, outside, ''))
+        self.assertFalse(os.path.exists(os.path.join(self.destdir, 'a')))
+
+    def test_hardlink_through_symlink(self):
+        outside = os.path.abspath('outside')
+        self.addCleanup(os.unlink, outside)
+        open(outside, 'w').write('secret')
+        os.makedirs(self.destdir)
+        os.symlink(outside, os.path.join(self.destdir, 'ln'))
+        self.assertRefused(('a', tarfile.LNKTYPE, 'ln', ''))
+
+    def test_parent_symlink_outside_destination(self):
+        outside = os.path.abspath('outside')
+        self.addCleanup(shutil.rmtree, outside, True)
+        os.makedirs(outside)
+        os.makedirs(self.destdir)
+        os.symlink(outside, os.path.join(self.destdir, 'a'))
+        self.assertRefused(('a/passwd', tarfile.REGTYPE, '', 'pwned'))
+        self.assertRefused(('a/sub/passwd', tarfile.REGTYPE, '', 'pwned'))
+        self.assertRefused(('a', tarfile.DIRTYPE, '', ''))
+        self.assertEqual(os.listdir(outside), [])
+
+    def test_file_replaces_symlink(self):
+        outside = os.path.abspath('outside')
+        self.addCleanup(os.unlink, outside)
+        open(outside, 'w').write('secret')
+        self.writeArchive(self.makeMembers(
+            ('a', tarfile.SYMTYPE, 'b', ''),
+            ('b', tarfile.REGTYPE, '', 'b'),
+            ('a', tarfile.REGTYPE, '', 'a')))
+        self.assertFalse(os.path.islink(os.path.join(self.destdir, 'a')))
+        self.assertEqual(open(os.path.join(self.destdir, 'a')).read(), 'a')
+        self.assertEqual(open(os.path.join(self.destdir, 'b')).read(), 'b')
+
+    def test_cancel_removes_unpacked(self):
+        os.makedirs(os.path.join(self.destdir, 'old'))
+        data = self.makeArchive()
+        writer = transfer._DirectoryWriter(self.destdir, None, None)
+        writer.remote_write(data[:len(data) // 2])
+        self.assertTrue(os.path.exists(os.path.join(self.destdir, 'top')))
+        writer.cancel()
+        self.assertEqual(os.listdir(self.destdir), ['old'])
+
 # Test buildbot.steps.transfer._TransferBuildStep class.
 
 
@@ -174,6 +432,24 @@ class TestFileUpload(steps.BuildStepMixin, unittest.TestCase):
         self.setupStep(
             transfer.FileUpload(slavesrc='srcfile', masterdest=self.destfile))
 
+        self.expectCommands(
+            Expect('uploadFile', dict(
+                slavesrc="srcfile", workdir='wkdir',
+                blocksize=65536, window=16, maxsize=None, keepstamp=False,
+                writer=ExpectRemoteRef(transfer._FileWriter)))
+            + Expect.behavior(uploadString("Hello world!"))
+            + 0)
+
+        self.expectOutcome(
+            result=SUCCESS, status_text=["uploading", "srcfile"])
+        d = self.runStep()
+        return d
+
+    def testOldSlave(self):
+        self.setupStep(
+            transfer.FileUpload(slavesrc='srcfile', masterdest=self.destfile),
+            slave_version={'*': "2.16"})
+
         self.expectCommands(
             Expect('uploadFile', dict(
                 slavesrc="srcfile", workdir='wkdir',
@@ -187,6 +463,24 @@ class TestFileUpload(steps.BuildStepMixin, unittest.TestCase):
         d = self.runStep()
         return d
 
+    def testBlocksizeAndWindow(self):
+        self.setupStep(
+            transfer.FileUpload(slavesrc='srcfile', masterdest=self.destfile,
+                                blocksize=1024, window=4))
+
+        self.expectCommands(
+            Expect('uploadFile', dict(
+                slavesrc="srcfile", workdir='wkdir',
+                blocksize=1024, window=4, maxsize=None, keepstamp=False,
+                writer=ExpectRemoteRef(transfer._FileWriter)))
+            + Expect.behavior(uploadString("Hello world!"))
+            + 0)
+
+        self.expectOutcome(
+            result=SUCCESS, status_text=["uploading", "srcfile"])
+        d = self.runStep()
+        return d
+
     def testTimestamp(self):
         self.setupStep(
             transfer.FileUpload(slavesrc=__file__, masterdest=self.destfile, keepstamp=True))
@@ -197,7 +491,7 @@ class TestFileUpload(steps.BuildStepMixin, unittest.TestCase):
         self.expectCommands(
             Expect('uploadFile', dict(
                 slavesrc=__file__, workdir='wkdir',
-                blocksize=16384, maxsize=None, keepstamp=True,
+                blocksize=65536, window=16, maxsize=None, keepstamp=True,
                 writer=ExpectRemoteRef(transfer._FileWriter)))
             + Expect.behavior(uploadString('test', timestamp=timestamp))
             + 0)
@@ -228,7 +522,7 @@ class TestFileUpload(steps.BuildStepMixin, unittest.TestCase):
         self.expectCommands(
             Expect('uploadFile', dict(
                 slavesrc=__file__, workdir='wkdir',
-                blocksize=16384, maxsize=None, keepstamp=False,
+                blocksize=65536, window=16, maxsize=None, keepstamp=False,
                 writer=ExpectRemoteRef(transfer._FileWriter)))
             + Expect.behavior(uploadString("Hello world!"))
             + 0)
@@ -251,7 +545,7 @@ class TestFileUpload(steps.BuildStepMixin, unittest.TestCase):
         self.expectCommands(
             Expect('uploadFile', dict(
                 slavesrc="srcfile", workdir='wkdir',
-                blocksize=16384, maxsize=None, keepstamp=False,
+                blocksize=65536, window=16, maxsize=None, keepstamp=False,
                 writer=ExpectRemoteRef(transfer._FileWriter)))
             + 1)
 
@@ -270,7 +564,7 @@ class TestFileUpload(steps.BuildStepMixin, unittest.TestCase):
         self.expectCommands(
             Expect('uploadFile', dict(
                 slavesrc="srcfile", workdir='wkdir',
-                blocksize=16384, maxsize=None, keepstamp=False,
+                blocksize=65536, window=16, maxsize=None, keepstamp=False,
                 writer=ExpectRemoteRef(transfer._FileWriter)))
             + Expect.behavior(behavior))
 
@@ -309,7 +603,7 @@ class TestDirectoryUpload(steps.BuildStepMixin, unittest.TestCase):
         self.expectCommands(
             Expect('uploadDirectory', dict(
                 slavesrc="srcdir", workdir='wkdir',
-                blocksize=16384, compress=None, maxsize=None,
+                blocksize=65536, window=16, compress=None, maxsize=None,
                 writer=ExpectRemoteRef(transfer._DirectoryWriter)))
             + Expect.behavior(uploadTarFile('fake.tar', test="Hello world!"))
             + 0)
@@ -325,7 +619,7 @@ class TestDirectoryUpload(steps.BuildStepMixin, unittest.TestCase):
         self.expectCommands(
             Expect('uploadDirectory', dict(
                 slavesrc="srcdir", workdir='wkdir',
-                blocksize=16384, compress=None, maxsize=None,
+                blocksize=65536, window=16, compress=None, maxsize=None,
                 writer=ExpectRemoteRef(transfer._DirectoryWriter)))
             + 1)
 
@@ -343,7 +637,7 @@ class TestDirectoryUpload(steps.BuildStepMixin, unittest.TestCase):
         self.expectCommands(
             Expect('uploadDirectory', dict(
                 slavesrc="srcdir", workdir='wkdir',
-                blocksize=16384, compress=None, maxsize=None,
+                blocksize=65536, window=16, compress=None, maxsize=None,
                 writer=ExpectRemoteRef(transfer._DirectoryWriter)))
             + Expect.behavior(behavior))
 
@@ -396,7 +690,7 @@ class TestMultipleFileUpload(steps.BuildStepMixin, unittest.TestCase):
             + 0,
             Expect('uploadFile', dict(
                 slavesrc="srcfile", workdir='wkdir',
-                blocksize=16384, maxsize=None, keepstamp=False,
+                blocksize=65536, window=16, maxsize=None, keepstamp=False,
                 writer=ExpectRemoteRef(transfer._FileWriter)))
             + Expect.behavior(uploadString("Hello world!"))
             + 0)
@@ -416,7 +710,7 @@ class TestMultipleFileUpload(steps.BuildStepMixin, unittest.TestCase):
             + 0,
             Expect('uploadDirectory', dict(
                 slavesrc="srcdir", workdir='wkdir',
-                blocksize=16384, compress=None, maxsize=None,
+                blocksize=65536, window=16, compress=None, maxsize=None,
                 writer=ExpectRemoteRef(transfer._DirectoryWriter)))
             + Expect.behavior(uploadTarFile('fake.tar', test="Hello world!"))
             + 0)
@@ -436,7 +730,7 @@ class TestMultipleFileUpload(steps.BuildStepMixin, unittest.TestCase):
             + 0,
             Expect('uploadFile', dict(
                 slavesrc="srcfile", workdir='wkdir',
-                blocksize=16384, maxsize=None, keepstamp=False,
+                blocksize=65536, window=16, maxsize=None, keepstamp=False,
                 writer=ExpectRemoteRef(transfer._FileWriter)))
             + Expect.behavior(uploadString("Hello world!"))
             + 0,
@@ -446,7 +740,7 @@ class TestMultipleFileUpload(steps.BuildStepMixin, unittest.TestCase):
             + 0,
             Expect('uploadDirectory', dict(
                 slavesrc="srcdir", workdir='wkdir',
-                blocksize=16384, compress=None, maxsize=None,
+                blocksize=65536, window=16, compress=None, maxsize=None,
                 writer=ExpectRemoteRef(transfer._DirectoryWriter)))
             + Expect.behavior(uploadTarFile('fake.tar', test="Hello world!"))
             + 0)
@@ -467,7 +761,7 @@ class TestMultipleFileUpload(steps.BuildStepMixin, unittest.TestCase):
             + 0,
             Expect('uploadFile', dict(
                 slavesrc="srcfile", workdir='wkdir',
-                blocksize=16384, maxsize=None, keepstamp=False,
+                blocksize=65536, window=16, maxsize=None, keepstamp=False,
                 writer=ExpectRemoteRef(transfer._FileWriter)))
             + 1)
 
@@ -490,7 +784,7 @@ class TestMultipleFileUpload(steps.BuildStepMixin, unittest.TestCase):
             + 0,
             Expect('uploadFile', dict(
                 slavesrc="srcfile", workdir='wkdir',
-                blocksize=16384, maxsize=None, keepstamp=False,
+                blocksize=65536, window=16, maxsize=None, keepstamp=False,
                 writer=ExpectRemoteRef(transfer._FileWriter)))
             + Expect.behavior(behavior))
 
@@ -522,7 +816,7 @@ class TestMultipleFileUpload(steps.BuildStepMixin, unittest.TestCase):
             + 0,
             Expect('uploadFile', dict(
                 slavesrc="srcfile", workdir='wkdir',
-                blocksize=16384, maxsize=None, keepstamp=False,
+                blocksize=65536, window=16, maxsize=None, keepstamp=False,
                 writer=ExpectRemoteRef(transfer._FileWriter)))
             + Expect.behavior(uploadString("Hello world!"))
             + 0,
@@ -532,7 +826,7 @@ class TestMultipleFileUpload(steps.BuildStepMixin, unittest.TestCase):
             + 0,
             Expect('uploadDirectory', dict(
                 slavesrc="srcdir", workdir='wkdir',
-                blocksize=16384, compress=None, maxsize=None,
+                blocksize=65536, window=16, compress=None, maxsize=None,
                 writer=ExpectRemoteRef(transfer._DirectoryWriter)))
             + Expect.behavior(uploadTarFile('fake.tar', test="Hello world!"))
             + 0)
@@ -573,7 +867,7 @@ class TestStringDownload(unittest.TestCase):
         s = transfer.StringDownload("Hello World", "hello.txt")
         s.build = Mock()
         s.build.getProperties.return_value = Properties()
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = "2.18"
 
         s.step_status = Mock()
         s.buildslave = Mock()
@@ -602,7 +896,7 @@ class TestJSONStringDownload(unittest.TestCase):
         s = transfer.JSONStringDownload(msg, "hello.json")
         s.build = Mock()
         s.build.getProperties.return_value = Properties()
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = "2.18"
 
         s.step_status = Mock()
         s.buildslave = Mock()
@@ -632,7 +926,7 @@ class TestJSONPropertiesDownload(unittest.TestCase):
         props = Properties()
         props.setProperty('key1', 'value1', 'test')
         s.build.getProperties.return_value = props
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = "2.18"
         ss = Mock()
         ss.asDict.return_value = dict(revision="12345")
         s.build.getSourceStamp.return_value = ss
@@ -20,6 +20,7 @@ import string
 from buildbot.util import lru
 from twisted.internet import defer
 from twisted.internet import reactor
+from twisted.internet import task
 from twisted.python import failure
 from twisted.trial import unittest
 
@@ -221,6 +222,13 @@ class LRUCacheTest(unittest.TestCase):
         res = self.lru.get('b')
         self.check_result(res, long('b'))
 
+    def test_evictions(self):
+        for c in 'abcd':
+            self.lru.get(c)
+        self.assertEqual(self.lru.evictions, 1)
+        self.lru.set_max_size(1)
+        self.assertEqual(self.lru.evictions, 3)
+
     def test_miss_fn_kwargs(self):
         def keep_kwargs_miss_fn(k, **kwargs):
             return set(kwargs.keys())
@@ -254,6 +262,12 @@ class LRUCacheTest(unittest.TestCase):
         self.assertEqual(self.lru.get('p'), set(['PPP']))
         self.assertEqual(self.lru.get('q'), set(['new-q']))  # updated
 
+    def test_contains(self):
+        self.assertFalse('p' in self.lru)
+        self.lru.put('p', set(['PPP']))
+        self.assertTrue('p' in self.lru)
+        self.assertEqual((self.lru.hits, self.lru.misses), (0, 0))
+
 
 class AsyncLRUCacheTest(unittest.TestCase):
 
@@ -557,6 +571,32 @@ class AsyncLRUCacheTest(unittest.TestCase):
         res = yield self.lru.get('b')
         self.check_result(res, long('b'))
 
+    @defer.inlineCallbacks
+    def test_evictions(self):
+        for c in 'abcd':
+            yield self.lru.get(c)
+        self.assertEqual(self.lru.evictions, 1)
+
+    def test_fetch_time(self):
+        clock = task.Clock()
+        self.patch(lru.AsyncLRUCache, '_reactor', clock)
+        fetches = {}
+
+        def slow_miss_fn(k):
+            d = fetches[k] = defer.Deferred()
+            return d
+        self.lru.miss_fn = slow_miss_fn
+
+        self.lru.get('a')
+        self.lru.get('a')
+        self.lru.get('b').addErrback(lambda f: f.trap(RuntimeError))
+        clock.advance(2)
+        fetches['a'].callback(short('a'))
+        clock.advance(3)
+        fetches['b'].errback(RuntimeError("oh noes"))
+        # one fetch per key, whether or not it failed
+        self.assertEqual((self.lru.fetches, self.lru.fetch_time), (2, 7.0))
+
     def test_miss_fn_kwargs(self):
         def keep_kwargs_miss_fn(k, **kwargs):
             return defer.succeed(set(kwargs.keys()))
@@ -586,3 +626,13 @@ class AsyncLRUCacheTest(unittest.TestCase):
         self.assertEqual((yield self.lru.get('p')), short('p'))
         self.lru.put('p', set(['P2P2']))
         self.assertEqual((yield self.lru.get('p')), set(['P2P2']))
+
+    def test_contains(self):
+        d = defer.Deferred()
+        self.lru.miss_fn = lambda key: d
+        self.assertFalse('p' in self.lru)
+        self.lru.get('p')
+        # being fetched
+        self.assertTrue('p' in self.lru)
+        d.callback(short('p'))
+        self.assertTrue('p' in self.lru)
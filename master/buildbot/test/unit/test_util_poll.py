@@ -13,6 +13,8 @@
 #
 # Copyright Buildbot Team Members
 
+import random
+
 from buildbot.util.poll import method as poll_method
 from twisted.internet import defer
 from twisted.internet import task
@@ -104,6 +106,47 @@ class TestPollerSync(unittest.TestCase):
         self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 2)
         return self.poll.stop()
 
+    def test_jitter(self):
+        """With jitter, the polls are offset by a random fraction of the
+        interval"""
+        self.patch(random, 'random', lambda: 0.5)
+        self.poll.start(interval=10, now=False, jitter=0.4)
+        self.clock.pump([2, 9.9])
+        self.assertEqual(self.calls, 0)
+        self.clock.advance(0.1)
+        self.assertEqual(self.calls, 1)
+        self.clock.advance(10)
+        self.assertEqual(self.calls, 2)
+        return self.poll.stop()
+
+    def test_jitter_run_now(self):
+        """Jitter does not delay a poll that runs immediately"""
+        self.poll.start(interval=10, now=True, jitter=0.4)
+        self.assertEqual(self.calls, 1)
+        return self.poll.stop()
+
+    def test_jitter_call_before_loop(self):
+        """Calling the poll method while waiting to start the loop starts it
+        immediately"""
+        self.patch(random, 'random', lambda: 0.5)
+        self.poll.start(interval=10, now=False, jitter=0.4)
+        self.poll()
+        self.assertEqual(self.calls, 1)
+        self.clock.advance(10)
+        self.assertEqual(self.calls, 2)
+        return self.poll.stop()
+
+    def test_jitter_stop_before_loop(self):
+        """Stopping the poller while waiting to start the loop cancels it"""
+        self.poll.start(interval=10, now=False, jitter=0.4)
+        d = self.poll.stop()
+        self.assertTrue(d.called)
+        self.clock.advance(20)
+        self.assertEqual(self.calls, 0)
+        self.poll.start(interval=10, now=True)
+        self.assertEqual(self.calls, 1)
+        return self.poll.stop()
+
 
 class TestPollerAsync(unittest.TestCase):
 
@@ -0,0 +1,127 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from buildbot.util import processpool
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class HostFromUrl(unittest.TestCase):
+
+    def test_url(self):
+        self.assertEqual(
+            processpool.hostFromUrl('https://Git.Example.com:8443/repo.git'),
+            'git.example.com')
+
+    def test_url_with_user(self):
+        self.assertEqual(
+            processpool.hostFromUrl('ssh://git@example.com/repo.git'),
+            'example.com')
+
+    def test_file_url(self):
+        self.assertEqual(processpool.hostFromUrl('file:///var/repo'), None)
+
+    def test_scp_style(self):
+        self.assertEqual(
+            processpool.hostFromUrl('git@Example.com:project/repo.git'),
+            'example.com')
+
+    def test_host_port(self):
+        self.assertEqual(processpool.hostFromUrl('perforce:1666'),
+                         'perforce')
+
+    def test_local_path(self):
+        self.assertEqual(processpool.hostFromUrl('/var/repos/project'), None)
+
+    def test_empty(self):
+        self.assertEqual(processpool.hostFromUrl(None), None)
+        self.assertEqual(processpool.hostFromUrl(''), None)
+
+
+class ProcessPool(unittest.TestCase):
+
+    def setUp(self):
+        self.started = []
+
+    def acquire(self, pool, host, name):
+        d = pool.acquire(host)
+        d.addCallback(lambda _: self.started.append(name))
+
+    def test_no_limits(self):
+        pool = processpool.ProcessPool()
+        for i in range(10):
+            self.acquire(pool, 'example.com', i)
+        self.assertEqual(self.started, range(10))
+        self.assertEqual(pool.running, 10)
+        self.assertEqual(pool.runningByHost, {'example.com': 10})
+
+    def test_global_limit_fifo(self):
+        pool = processpool.ProcessPool(maxProcesses=2)
+        for name in 'abcd':
+            self.acquire(pool, None, name)
+        self.assertEqual(self.started, ['a', 'b'])
+        pool.release(None)
+        self.assertEqual(self.started, ['a', 'b', 'c'])
+        pool.release(None)
+        pool.release(None)
+        self.assertEqual(self.started, ['a', 'b', 'c', 'd'])
+        pool.release(None)
+        self.assertEqual(pool.running, 0)
+
+    def test_per_host_limit_skips(self):
+        pool = processpool.ProcessPool(maxProcesses=3, maxPerHost=1)
+        self.acquire(pool, 'one', 'a')
+        self.acquire(pool, 'one', 'b')
+        self.acquire(pool, 'two', 'c')
+        self.acquire(pool, None, 'd')
+        # 'b' waits for host 'one', but does not hold up the others
+        self.assertEqual(self.started, ['a', 'c', 'd'])
+        pool.release('one')
+        self.assertEqual(self.started, ['a', 'c', 'd', 'b'])
+        self.assertEqual(pool.runningByHost, {'one': 1, 'two': 1})
+
+    def test_setLimits_starts_waiting(self):
+        pool = processpool.ProcessPool(maxProcesses=1)
+        for name in 'abc':
+            self.acquire(pool, None, name)
+        self.assertEqual(self.started, ['a'])
+        pool.setLimits(None, None)
+        self.assertEqual(self.started, ['a', 'b', 'c'])
+
+    def test_run(self):
+        pool = processpool.ProcessPool(maxProcesses=1)
+        processes = [defer.Deferred(), defer.Deferred()]
+        d1 = pool.run('example.com', lambda i: processes[i], 0)
+        d2 = pool.run('example.com', lambda i: processes[i], i=1)
+        self.assertEqual(pool.running, 1)
+        processes[0].callback('first')
+        processes[1].callback('second')
+        self.assertEqual(pool.running, 0)
+        self.assertEqual(pool.runningByHost, {})
+        d = defer.gatherResults([d1, d2])
+        d.addCallback(self.assertEqual, ['first', 'second'])
+        return d
+
+    def test_run_failure_releases(self):
+        pool = processpool.ProcessPool(maxProcesses=1)
+
+        def fail():
+            raise RuntimeError('oh noes')
+        d1 = pool.run('example.com', fail)
+        d2 = pool.run('example.com', lambda: 'ok')
+        self.assertEqual(pool.running, 0)
+        d1 = self.assertFailure(d1, RuntimeError)
+        d2.addCallback(self.assertEqual, 'ok')
+        return defer.gatherResults([d1, d2])
@@ -28,3 +28,71 @@ class MatchTuple(tuplematching.TupleMatchingMixin, unittest.TestCase):
                          % (routingKey,
                             'should match' if shouldMatch else "shouldn't match",
                             filter))
+
+
+class FilterIndexMatching(tuplematching.TupleMatchingMixin, unittest.TestCase):
+
+    def do_test_match(self, routingKey, shouldMatch, filter):
+        index = tuplematch.FilterIndex()
+        index.add(filter, 'v')
+        result = index.match(routingKey)
+        self.assertEqual(result, ['v'] if shouldMatch else [],
+                         '%r %s %r'
+                         % (routingKey,
+                            'should match' if shouldMatch else "shouldn't match",
+                            filter))
+
+
+class FilterIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = tuplematch.FilterIndex()
+
+    def test_match_order(self):
+        self.index.add(('a', None, 'c'), 1)
+        self.index.add(('a', 'b', 'c'), 2)
+        self.index.add((None, None, None), 3)
+        self.index.add(('a', 'b', None), 4)
+        self.index.add(('a', 'b', 'c'), 5)
+        self.index.add(('x', 'b', 'c'), 6)
+        self.index.add(('a', 'b'), 7)
+        self.assertEqual(self.index.match(('a', 'b', 'c')), [1, 2, 3, 4, 5])
+        self.assertEqual(self.index.match(('a', 'x', 'c')), [1, 3])
+        self.assertEqual(self.index.match(('a', 'b')), [7])
+        self.assertEqual(self.index.match(('a',)), [])
+
+    def test_match_None_in_key(self):
+        self.index.add(('a', None), 1)
+        self.index.add(('a', 'b'), 2)
+        self.assertEqual(self.index.match(('a', None)), [1])
+
+    def test_remove(self):
+        self.index.add(('a', None, 'c'), 1)
+        self.index.add(('a', 'b', 'c'), 2)
+        self.index.add(('a', 'b', 'c'), 3)
+        self.index.remove(('a', 'b', 'c'), 2)
+        self.assertEqual(self.index.match(('a', 'b', 'c')), [1, 3])
+        self.assertEqual(len(self.index), 2)
+
+    def test_remove_prunes(self):
+        self.index.add(('a', 'b', 'c'), 1)
+        self.index.add(('a', 'x', 'c'), 2)
+        self.index.remove(('a', 'b', 'c'), 1)
+        self.assertEqual(self.index._roots[3][0]['a'][0].keys(), ['x'])
+        self.index.remove(('a', 'x', 'c'), 2)
+        self.assertEqual(self.index._roots, {})
+        self.assertEqual(len(self.index), 0)
+
+    def test_remove_missing(self):
+        self.index.add(('a', 'b'), 1)
+        self.index.remove(('a', 'b'), 2)
+        self.index.remove(('a', 'c'), 1)
+        self.index.remove(('a', 'b', 'c'), 1)
+        self.assertEqual(self.index.match(('a', 'b')), [1])
+
+    def test_readd_moves_to_end(self):
+        self.index.add(('a',), 1)
+        self.index.add(('a',), 2)
+        self.index.remove(('a',), 1)
+        self.index.add(('a',), 1)
+        self.assertEqual(self.index.match(('a',)), [2, 1])
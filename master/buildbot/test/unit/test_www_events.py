@@ -0,0 +1,112 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+
+from buildbot.util import epoch2datetime
+from buildbot.util import json
+from buildbot.www import events
+from twisted.trial import unittest
+
+
+class EventEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = events.EventEncoder()
+
+    def test_encode(self):
+        encoded = self.encoder.encode(
+            ('builds', '1', 'new'),
+            dict(buildid=1, started_at=epoch2datetime(1300000000)))
+        self.assertEqual(json.loads(encoded),
+                         dict(key=['builds', '1', 'new'],
+                              message=dict(buildid=1, started_at=1300000000)))
+
+    def test_encode_once(self):
+        key, message = ('builds', '1', 'new'), dict(buildid=1)
+        encoded = self.encoder.encode(key, message)
+        self.patch(json, 'dumps', mock.Mock(side_effect=RuntimeError))
+        self.assertIdentical(self.encoder.encode(key, message), encoded)
+
+    def test_encode_equal_message(self):
+        # only the identical message object is known to be unchanged
+        key, message = ('builds', '1', 'new'), dict(buildid=1)
+        self.encoder.encode(key, message)
+        message = dict(buildid=2)
+        self.assertEqual(json.loads(self.encoder.encode(key, message)),
+                         dict(key=list(key), message=message))
+
+
+class EventWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.consumer = mock.Mock(name='consumer')
+        self.written = []
+        self.drop = mock.Mock(name='drop')
+        self.writer = events.EventWriter(self.consumer, self.written.append,
+                                         self.drop)
+        self.writer.highWaterMark = 10
+
+    def test_registers(self):
+        self.consumer.registerProducer.assert_called_with(self.writer, True)
+
+    def test_write(self):
+        self.writer.write('abc')
+        self.writer.write('def')
+        self.assertEqual(self.written, ['abc', 'def'])
+
+    def test_paused(self):
+        self.writer.pauseProducing()
+        self.writer.write('abc')
+        self.writer.write('def')
+        self.assertEqual(self.written, [])
+        self.writer.resumeProducing()
+        self.assertEqual(self.written, ['abc', 'def'])
+        self.assertEqual(self.writer.queued, 0)
+
+    def test_paused_while_resuming(self):
+        self.writer.pauseProducing()
+        for data in 'abc':
+            self.writer.write(data)
+
+        def write(data):
+            self.written.append(data)
+            self.writer.pauseProducing()
+        self.writer._write = write
+        self.writer.resumeProducing()
+        self.assertEqual(self.written, ['a'])
+        self.writer.resumeProducing()
+        self.assertEqual(self.written, ['a', 'b'])
+
+    def test_high_water_mark(self):
+        self.writer.pauseProducing()
+        self.writer.write('abcdef')
+        self.writer.write('ghij')
+        self.assertFalse(self.drop.called)
+        self.writer.write('k')
+        self.drop.assert_called_with()
+        self.consumer.unregisterProducer.assert_called_with()
+        # nothing more is written, even when resumed
+        self.writer.resumeProducing()
+        self.writer.write('l')
+        self.assertEqual(self.written, [])
+
+    def test_stopProducing(self):
+        self.writer.pauseProducing()
+        self.writer.write('abc')
+        self.writer.stopProducing()
+        self.writer.resumeProducing()
+        self.assertEqual(self.written, [])
+        self.assertFalse(self.drop.called)
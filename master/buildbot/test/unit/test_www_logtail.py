@@ -0,0 +1,186 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from buildbot.test.fake import fakedb
+from buildbot.test.util import www
+from buildbot.util import json
+from buildbot.www import logtail
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class LogTailResource(www.WwwTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.master = self.make_master(url='h:/a/b/')
+        # there is no validator for log messages
+        self.master.mq.verifyMessages = False
+        self.master.db.insertTestData([
+            fakedb.Log(id=60, stepid=50, name=u'stdio', slug=u'stdio',
+                       num_lines=3, type=u's'),
+            fakedb.LogChunk(logid=60, first_line=0, last_line=2,
+                            content='ofoo\nobar\nobaz'),
+        ])
+        self.rsrc = logtail.LogTailResource(self.master)
+
+    def readEvents(self, request):
+        events = []
+        for block in request.written.split('\n\n')[:-1]:
+            fields = dict(line.split(': ', 1) for line in block.split('\n'))
+            events.append((fields['event'], fields.get('id'),
+                           json.loads(fields['data'])))
+        request.written = ''
+        return events
+
+    def logMessage(self, num_lines, complete=False):
+        return dict(logid=60, name=u'stdio', slug=u'stdio', stepid=50,
+                    complete=complete, num_lines=num_lines, type=u's')
+
+    def test_backfill(self):
+        self.render_resource(self.rsrc, '/60')
+        self.assertEqual(self.request.headers['content-type'],
+                         ['text/event-stream'])
+        self.assertEqual(self.readEvents(self.request), [
+            ('logchunk', '3', dict(logid=60, firstline=0,
+                                   content=u'ofoo\nobar\nobaz\n')),
+        ])
+        self.assertFalse(self.request.finished)
+
+    def test_backfill_in_batches(self):
+        self.patch(logtail.LogTail, 'readLines', 2)
+        self.render_resource(self.rsrc, '/60')
+        self.assertEqual(self.readEvents(self.request), [
+            ('logchunk', '2', dict(logid=60, firstline=0,
+                                   content=u'ofoo\nobar\n')),
+            ('logchunk', '3', dict(logid=60, firstline=2,
+                                   content=u'obaz\n')),
+        ])
+
+    def test_resume_from_line(self):
+        self.render_resource(self.rsrc, '/60?line=2')
+        self.assertEqual(self.readEvents(self.request), [
+            ('logchunk', '3', dict(logid=60, firstline=2, content=u'obaz\n')),
+        ])
+
+    def test_resume_from_last_event_id(self):
+        self.render_resource(self.rsrc, '/60?line=0',
+                             extraHeaders={'last-event-id': '1'})
+        self.assertEqual(self.readEvents(self.request), [
+            ('logchunk', '3', dict(logid=60, firstline=1,
+                                   content=u'obar\nobaz\n')),
+        ])
+
+    def test_live_lines(self):
+        self.render_resource(self.rsrc, '/60')
+        self.readEvents(self.request)
+        self.master.data.rtypes.log.appendLog(60, u'oqux\noquux\n')
+        self.assertEqual(self.readEvents(self.request), [
+            ('logchunk', '5', dict(logid=60, firstline=3,
+                                   content=u'oqux\noquux\n')),
+        ])
+
+    def test_overlapping_lines(self):
+        self.render_resource(self.rsrc, '/60')
+        self.readEvents(self.request)
+        self.request.producer.linesAppended(1, u'obar\nobaz\noqux\n')
+        self.assertEqual(self.readEvents(self.request), [
+            ('logchunk', '4', dict(logid=60, firstline=3, content=u'oqux\n')),
+        ])
+
+    def test_lines_from_another_master(self):
+        self.render_resource(self.rsrc, '/60')
+        self.readEvents(self.request)
+        # appended without being delivered here
+        self.master.db.logs.appendLog(60, u'oqux\n')
+        self.master.mq.callConsumer(('logs', '60', 'append'),
+                                    self.logMessage(4))
+        self.assertEqual(self.readEvents(self.request), [
+            ('logchunk', '4', dict(logid=60, firstline=3, content=u'oqux\n')),
+        ])
+
+    def test_paused(self):
+        self.render_resource(self.rsrc, '/60')
+        self.readEvents(self.request)
+        tail = self.request.producer
+        tail.pauseProducing()
+        self.master.data.rtypes.log.appendLog(60, u'oqux\n')
+        self.master.data.rtypes.log.appendLog(60, u'oquux\n')
+        self.assertEqual(self.request.written, '')
+        # the lines are read from the database on resuming
+        tail.resumeProducing()
+        self.assertEqual(self.readEvents(self.request), [
+            ('logchunk', '5', dict(logid=60, firstline=3,
+                                   content=u'oqux\noquux\n')),
+        ])
+
+    def test_finished(self):
+        self.render_resource(self.rsrc, '/60')
+        self.readEvents(self.request)
+        self.master.mq.callConsumer(('logs', '60', 'finished'),
+                                    self.logMessage(3, complete=True))
+        self.assertEqual(self.readEvents(self.request), [
+            ('finished', None, dict(logid=60, num_lines=3)),
+        ])
+        self.assertTrue(self.request.finished)
+        self.assertEqual(self.master.mq.qrefs, [])
+        self.assertEqual(self.request.producer, None)
+
+    def test_complete_log(self):
+        self.master.db.logs.finishLog(60)
+        self.render_resource(self.rsrc, '/60?line=3')
+        self.assertEqual(self.readEvents(self.request), [
+            ('finished', None, dict(logid=60, num_lines=3)),
+        ])
+        self.assertTrue(self.request.finished)
+        self.assertEqual(self.master.data.rtypes.log._followers, {})
+
+    def test_complete_log_not_followed(self):
+        self.master.db.logs.finishLog(60)
+        self.patch(self.master.data.rtypes.log, 'followLog',
+                   lambda *args: self.fail("complete log followed"))
+        self.render_resource(self.rsrc, '/60')
+        self.assertTrue(self.request.finished)
+
+    def test_client_disconnects(self):
+        self.render_resource(self.rsrc, '/60')
+        self.request.finish()
+        self.assertEqual(self.master.mq.qrefs, [])
+        self.assertEqual(self.master.data.rtypes.log._followers, {})
+
+    def test_read_fails_after_client_disconnects(self):
+        read = defer.Deferred()
+        get = self.master.data.get
+
+        def getContents(path, **kwargs):
+            if path[-1] == 'contents':
+                return read
+            return get(path, **kwargs)
+        self.patch(self.master.data, 'get', getContents)
+        self.render_resource(self.rsrc, '/60')
+        self.request.finish()
+        read.errback(RuntimeError("oh noes"))
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        self.assertTrue(self.request.finished)
+
+    def test_missing_log(self):
+        self.render_resource(self.rsrc, '/61')
+        self.assertEqual(self.request.responseCode, 404)
+        self.assertTrue(self.request.finished)
+        self.assertEqual(self.master.mq.qrefs, [])
+
+    def test_bad_line(self):
+        self.render_resource(self.rsrc, '/60?line=x')
+        self.assertEqual(self.request.responseCode, 400)
+        self.assertTrue(self.request.finished)
@@ -15,7 +15,9 @@
 
 import mock
 import re
+import zlib
 
+from buildbot.process import cache
 from buildbot.test.fake import endpoint
 from buildbot.test.util import compat
 from buildbot.test.util import www
@@ -463,6 +465,160 @@ class V2RootResource_REST(www.WwwTestMixin, unittest.TestCase):
                              responseCode=500)
         self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
 
+    def patchTestsGet(self):
+        # count the calls to the /test endpoint
+        calls = []
+        get = endpoint.TestsEndpoint.get
+
+        def countingGet(ep, resultSpec, kwargs):
+            calls.append(None)
+            return get(ep, resultSpec, kwargs)
+        self.patch(endpoint.TestsEndpoint, 'get', countingGet)
+        return calls
+
+    @defer.inlineCallbacks
+    def test_api_etag(self):
+        calls = self.patchTestsGet()
+        yield self.render_resource(self.rsrc, '/test')
+        etag = self.request.headers['etag'][0]
+        yield self.render_resource(self.rsrc, '/test',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertEqual(self.request.responseCode, 304)
+        self.assertEqual(self.request.written, '')
+        self.assertEqual(self.request.headers['etag'], [etag])
+        # the data was not read again
+        self.assertEqual(len(calls), 1)
+
+    @defer.inlineCallbacks
+    def test_api_etag_depends_on_request(self):
+        yield self.render_resource(self.rsrc, '/test')
+        etag = self.request.headers['etag'][0]
+        yield self.render_resource(self.rsrc, '/test?limit=1',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertEqual(self.request.responseCode, 200)
+        yield self.render_resource(self.rsrc, '/test',
+                                   accept='application/json',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertEqual(self.request.responseCode, 200)
+
+    @defer.inlineCallbacks
+    def test_api_etag_after_write(self):
+        yield self.render_resource(self.rsrc, '/test')
+        etag = self.request.headers['etag'][0]
+        self.master.db.generation += 1
+        yield self.render_resource(self.rsrc, '/test',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertEqual(self.request.responseCode, 200)
+        self.assertNotEqual(self.request.headers['etag'], [etag])
+
+    @defer.inlineCallbacks
+    def test_api_etag_multiMaster(self):
+        # the generation is not used, as it does not count other masters'
+        # writes, so the ETag is derived from the content
+        self.master.config.multiMaster = True
+        calls = self.patchTestsGet()
+        yield self.render_resource(self.rsrc, '/test')
+        etag = self.request.headers['etag'][0]
+        self.master.db.generation += 1
+        yield self.render_resource(self.rsrc, '/test',
+                                   extraHeaders={'if-none-match':
+                                                 '"xyz", W/' + etag})
+        self.assertEqual(self.request.responseCode, 304)
+        self.assertEqual(len(calls), 2)
+
+    @defer.inlineCallbacks
+    def test_api_etag_not_from_generation(self):
+        # an endpoint whose data is not in the database is read every time,
+        # and its ETag is derived from the content
+        self.patch(endpoint.TestsEndpoint, 'etagFromGeneration', False)
+        calls = self.patchTestsGet()
+        yield self.render_resource(self.rsrc, '/test')
+        etag = self.request.headers['etag'][0]
+        yield self.render_resource(self.rsrc, '/test',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertEqual(self.request.responseCode, 304)
+        self.assertEqual(len(calls), 2)
+
+        self.patch(endpoint, 'testData',
+                   {13: {'id': 13, 'info': 'changed', 'success': True}})
+        yield self.render_resource(self.rsrc, '/test',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertEqual(self.request.responseCode, 200)
+        self.assertNotEqual(self.request.headers['etag'], [etag])
+
+    @defer.inlineCallbacks
+    def test_api_etag_caches(self):
+        # the cache metrics change without any database write
+        self.master.caches = cache.CacheManager()
+        c = self.master.caches.get_cache('chdicts',
+                                         lambda key: defer.succeed(set([key])))
+        yield self.render_resource(self.rsrc, '/caches')
+        etag = self.request.headers['etag'][0]
+        self.assertEqual(
+            json.loads(self.request.written)['caches'][0]['misses'], 0)
+        yield c.get(1)
+        yield self.render_resource(self.rsrc, '/caches',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertEqual(self.request.responseCode, 200)
+        self.assertEqual(
+            json.loads(self.request.written)['caches'][0]['misses'], 1)
+
+    @defer.inlineCallbacks
+    def test_api_etag_log_append(self):
+        # appended lines may be held in the append buffer, without any
+        # database write, and must still change the ETag
+        logid = yield self.master.db.logs.addLog(
+            stepid=50, name=u'stdio', slug=u'stdio', type=u's')
+        yield self.master.db.logs.appendLog(logid, u'line 0\n')
+        for path in ('/logs/%d' % logid, '/logs/%d/contents' % logid):
+            yield self.render_resource(self.rsrc, path)
+            etag = self.request.headers['etag'][0]
+            yield self.master.db.logs.appendLog(logid, u'more\n')
+            yield self.render_resource(self.rsrc, path,
+                                       extraHeaders={'if-none-match': etag})
+            self.assertEqual(self.request.responseCode, 200)
+            self.assertNotEqual(self.request.headers['etag'], [etag])
+
+    @defer.inlineCallbacks
+    def test_api_head_cached_length(self):
+        get = yield self.render_resource(self.rsrc, '/test')
+        calls = self.patchTestsGet()
+        yield self.render_resource(self.rsrc, '/test', method='HEAD')
+        self.assertEqual(int(self.request.headers['content-length'][0]),
+                         len(get))
+        self.assertEqual(len(calls), 0)
+
+    @defer.inlineCallbacks
+    def test_api_gzip(self):
+        self.rsrc.GZIP_MIN_SIZE = 0
+        get = yield self.render_resource(self.rsrc, '/test')
+        yield self.render_resource(
+            self.rsrc, '/test', extraHeaders={'accept-encoding': 'gzip'})
+        self.assertEqual(self.request.headers['content-encoding'], ['gzip'])
+        self.assertEqual(zlib.decompress(self.request.written,
+                                         16 + zlib.MAX_WBITS), get)
+        etag = self.request.headers['etag'][0]
+        self.assertTrue(etag.endswith('-gzip"'))
+        yield self.render_resource(
+            self.rsrc, '/test', extraHeaders={'accept-encoding': 'gzip',
+                                              'if-none-match': etag})
+        self.assertEqual(self.request.responseCode, 304)
+
+    @defer.inlineCallbacks
+    def test_api_gzip_not_accepted(self):
+        self.rsrc.GZIP_MIN_SIZE = 0
+        yield self.render_resource(
+            self.rsrc, '/test',
+            extraHeaders={'accept-encoding': 'deflate, gzip;q=0'})
+        self.assertNotIn('content-encoding', self.request.headers)
+        json.loads(self.request.written)
+
+    @defer.inlineCallbacks
+    def test_api_gzip_small(self):
+        yield self.render_resource(
+            self.rsrc, '/test/13', extraHeaders={'accept-encoding': 'gzip'})
+        self.assertNotIn('content-encoding', self.request.headers)
+
 
 class V2RootResource_JSONRPC2(www.WwwTestMixin, unittest.TestCase):
 
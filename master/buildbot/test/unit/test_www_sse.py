@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 import datetime
+import mock
 
 from buildbot.test.unit import test_data_changes
 from buildbot.test.util import www
@@ -81,6 +82,32 @@ class EventResource(www.WwwTestMixin, unittest.TestCase):
         self.assertEqual(self.request.responseCode, 400)
         self.assertIn("unknown uuid", self.request.written)
 
+    def test_listen_registers_producer(self):
+        self.render_resource(self.sse, '/listen/changes/*/*')
+        request = self.request
+        self.readUUID(request)
+        self.assertNotEqual(request.producer, None)
+        request.finish()
+        self.assertEqual(request.producer, None)
+
+    def test_listen_slow_client(self):
+        self.render_resource(self.sse, '/listen/changes/*/*')
+        request = self.request
+        request.transport = mock.Mock()
+        self.readUUID(request)
+        writer = request.producer
+        writer.highWaterMark = 1000
+        writer.pauseProducing()
+        self.master.mq.callConsumer(("changes", "500", "new"),
+                                    test_data_changes.Change.changeEvent)
+        self.assertEqual(request.written, "")
+        self.assertFalse(request.transport.loseConnection.called)
+        # the client falls too far behind, and is disconnected
+        for i in range(3):
+            self.master.mq.callConsumer(("changes", "500", "new"),
+                                        test_data_changes.Change.changeEvent)
+        request.transport.loseConnection.assert_called_with()
+
     def readEvent(self, request):
         kw = {}
         hasEmptyLine = False
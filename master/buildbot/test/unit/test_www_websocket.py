@@ -0,0 +1,177 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import random
+
+from buildbot.www import websocket
+from struct import pack
+from twisted.internet import protocol
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+
+KEY = "\x01\x80\x7f\xff"
+
+
+def slowMask(buf, key):
+    return "".join(chr(ord(c) ^ ord(key[i % 4])) for i, c in enumerate(buf))
+
+
+def maskedFrame(buf, opcode=websocket.NORMAL, key=KEY):
+    # as sent by a browser: the payload is masked
+    frame = websocket.make_hybi07_frame(buf, opcode)
+    header_length = len(frame) - len(buf)
+    return (frame[0] + chr(ord(frame[1]) | 0x80) + frame[2:header_length]
+            + key + websocket.mask(buf, key))
+
+
+class Mask(unittest.TestCase):
+
+    def test_lengths(self):
+        rnd = random.Random(0)
+        for length in range(10) + [1023, 1024, 65537]:
+            buf = "".join(chr(rnd.randrange(256)) for _ in xrange(length))
+            self.assertEqual(websocket.mask(buf, KEY), slowMask(buf, KEY))
+
+    def test_unmask(self):
+        buf = "Hello, world"
+        self.assertEqual(websocket.mask(websocket.mask(buf, KEY), KEY), buf)
+
+
+class ParseFrames(unittest.TestCase):
+
+    def test_unmasked(self):
+        buf = websocket.make_hybi07_frame("hello")
+        self.assertEqual(websocket.parse_hybi07_frames(buf),
+                         ([(websocket.NORMAL, "hello")], ""))
+
+    def test_masked(self):
+        self.assertEqual(websocket.parse_hybi07_frames(maskedFrame("hello")),
+                         ([(websocket.NORMAL, "hello")], ""))
+
+    def test_lengths(self):
+        for length in (0, 0x7d, 0x7e, 0xffff, 0x10000):
+            data = "x" * length
+            self.assertEqual(
+                websocket.parse_hybi07_frames(maskedFrame(data)),
+                ([(websocket.NORMAL, data)], ""))
+
+    def test_several_and_partial(self):
+        buf = (maskedFrame("one") + maskedFrame("two")
+               + maskedFrame("three")[:-2])
+        self.assertEqual(
+            websocket.parse_hybi07_frames(buf),
+            ([(websocket.NORMAL, "one"), (websocket.NORMAL, "two")],
+             maskedFrame("three")[:-2]))
+
+    def test_partial_header(self):
+        buf = maskedFrame("x" * 0x10000)[:5]
+        self.assertEqual(websocket.parse_hybi07_frames(buf), ([], buf))
+
+    def test_close(self):
+        buf = maskedFrame(pack(">H", 1001) + "going away", websocket.CLOSE)
+        self.assertEqual(websocket.parse_hybi07_frames(buf),
+                         ([(websocket.CLOSE, (1001, "going away"))], ""))
+
+    def test_close_no_reason(self):
+        buf = maskedFrame("", websocket.CLOSE)
+        self.assertEqual(websocket.parse_hybi07_frames(buf),
+                         ([(websocket.CLOSE, (1000, "No reason given"))], ""))
+
+    def test_reserved_flag(self):
+        self.assertRaises(websocket.WSException,
+                          websocket.parse_hybi07_frames, "\xc1\x00")
+
+    def test_unknown_opcode(self):
+        self.assertRaises(websocket.WSException,
+                          websocket.parse_hybi07_frames, "\x83\x00")
+
+
+class HyBi07FrameParser(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = websocket.HyBi07FrameParser()
+
+    def feedInPieces(self, buf, size):
+        frames = []
+        for i in xrange(0, len(buf), size):
+            frames.extend(self.parser.feed(buf[i:i + size]))
+        return frames
+
+    def test_byte_at_a_time(self):
+        buf = maskedFrame("a" * 300) + maskedFrame("") + maskedFrame("b")
+        self.assertEqual(self.feedInPieces(buf, 1),
+                         [(websocket.NORMAL, "a" * 300),
+                          (websocket.NORMAL, ""),
+                          (websocket.NORMAL, "b")])
+        self.assertEqual(self.parser.buffered, 0)
+        self.assertEqual(self.parser.chunks, [])
+
+    def test_large_frame_in_chunks(self):
+        data = "".join(chr(i % 251) for i in xrange(1 << 20))
+        buf = maskedFrame(data) + maskedFrame("next")
+        self.assertEqual(self.feedInPieces(buf, 65536 + 3),
+                         [(websocket.NORMAL, data),
+                          (websocket.NORMAL, "next")])
+
+    def test_header_parsed_once(self):
+        buf = maskedFrame("x" * 1000)
+        calls = []
+        parseHeader = self.parser.parseHeader
+
+        def wrap():
+            header = parseHeader()
+            calls.append(header)
+            return header
+        self.parser.parseHeader = wrap
+        self.assertEqual(self.feedInPieces(buf, 100),
+                         [(websocket.NORMAL, "x" * 1000)])
+        self.assertEqual(len([c for c in calls if c is not None]), 1)
+
+    def test_unparsed(self):
+        buf = maskedFrame("hello")
+        self.assertEqual(self.parser.feed(buf + buf[:3]),
+                         [(websocket.NORMAL, "hello")])
+        self.assertEqual(self.feedInPieces(buf[3:-1], 1), [])
+        self.assertEqual(self.parser.unparsed(), buf[:-1])
+
+
+class WebSocketsProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+        wrapped = protocol.Protocol()
+        wrapped.dataReceived = self.received.append
+        factory = websocket.WebSocketsFactory(protocol.Factory())
+        self.proto = websocket.WebSocketsProtocol(factory, wrapped)
+        self.transport = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.transport)
+
+    def test_dataReceived(self):
+        buf = maskedFrame("one") + maskedFrame("two")
+        self.proto.dataReceived(buf[:7])
+        self.assertEqual(self.received, [])
+        self.proto.dataReceived(buf[7:])
+        self.assertEqual(self.received, ["one", "two"])
+
+    def test_close(self):
+        self.proto.dataReceived(maskedFrame("", websocket.CLOSE))
+        self.assertTrue(self.transport.disconnecting)
+        self.assertEqual(self.transport.value(),
+                         websocket.make_hybi07_frame("", websocket.CLOSE))
+
+    def test_write(self):
+        self.proto.write("hello")
+        self.assertEqual(self.transport.value(),
+                         websocket.make_hybi07_frame("hello"))
@@ -14,7 +14,10 @@
 # Copyright Buildbot Team Members
 
 from twisted.internet import defer
+from twisted.internet import error
+from twisted.internet import reactor
 from twisted.internet import utils
+from twisted.python import failure
 
 
 class Expect(object):
@@ -54,6 +57,53 @@ class Expect(object):
         return "<gpo.Expect(bin=%s, args=%s)>" % (self._bin, self._args)
 
 
+class FakeProcessTransport(object):
+
+    """A transport for a process protocol started with the patched
+    C{reactor.spawnProcess}, which delivers the expected stdout in chunks of
+    C{chunkSize} bytes, honoring C{pauseProducing}."""
+
+    chunkSize = 7
+
+    def __init__(self, proto, stdout, stderr, exit):
+        self.proto = proto
+        self.stdout = stdout
+        self.stderr = stderr
+        self.exit = exit
+        self.paused = False
+        self.lost = False
+        self.ended = False
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.deliver()
+
+    def loseConnection(self):
+        self.lost = True
+        self.deliver()
+
+    def deliver(self):
+        while self.stdout and not self.paused and not self.lost:
+            chunk = self.stdout[:self.chunkSize]
+            self.stdout = self.stdout[self.chunkSize:]
+            self.proto.childDataReceived(1, chunk)
+        if self.ended or (self.stdout and not self.lost) or self.paused:
+            return
+        self.ended = True
+        if self.stderr:
+            self.proto.childDataReceived(2, self.stderr)
+        if self.lost:
+            reason = error.ProcessTerminated(signal=13)
+        elif self.exit:
+            reason = error.ProcessTerminated(exitCode=self.exit)
+        else:
+            reason = error.ProcessDone(0)
+        self.proto.processEnded(failure.Failure(reason))
+
+
 class GetProcessOutputMixin:
 
     def setUpGetProcessOutput(self):
@@ -99,12 +149,28 @@ class GetProcessOutputMixin:
         expect = self._expected_commands.pop(0)
         return defer.succeed(expect.check(self, bin, path, args))
 
+    def patched_spawnProcess(self, proto, bin, args=(), env=None,
+                             path=None, **kwargs):
+        self._check_env(env)
+
+        if not self._expected_commands:
+            self.fail("got command %s %s when no further commands were expected"
+                      % (bin, args))
+
+        expect = self._expected_commands.pop(0)
+        stdout, stderr, exit = expect.check(self, bin, path, args[1:])
+        transport = FakeProcessTransport(proto, stdout, stderr, exit)
+        proto.makeConnection(transport)
+        transport.deliver()
+        return transport
+
     def _patch_gpo(self):
         if not self._gpo_patched:
             self.patch(utils, "getProcessOutput",
                        self.patched_getProcessOutput)
             self.patch(utils, "getProcessOutputAndValue",
                        self.patched_getProcessOutputAndValue)
+            self.patch(reactor, "spawnProcess", self.patched_spawnProcess)
             self._gpo_patched = True
 
     def addGetProcessOutputExpectEnv(self, d):
@@ -41,6 +41,8 @@ class FakeRequest(object):
     method = 'GET'
     path = '/req.path'
     responseCode = 200
+    transport = None
+    producer = None
 
     def __init__(self, path=None):
         self.headers = {}
@@ -84,6 +86,12 @@ class FakeRequest(object):
     def getHeader(self, key):
         return self.input_headers.get(key)
 
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def unregisterProducer(self):
+        self.producer = None
+
     def processingFailed(self, f):
         self.deferred.errback(f)
 
@@ -17,6 +17,7 @@ from collections import defaultdict
 from collections import deque
 from itertools import ifilterfalse
 from twisted.internet import defer
+from twisted.internet import reactor
 from twisted.python import log
 from weakref import WeakValueDictionary
 
@@ -30,7 +31,7 @@ class LRUCache(object):
     """
 
     __slots__ = ('max_size max_queue miss_fn queue cache weakrefs '
-                 'refcount hits refhits misses'.split())
+                 'refcount hits refhits misses evictions'.split())
     sentinel = object()
     QUEUE_SIZE_FACTOR = 10
 
@@ -40,7 +41,7 @@ class LRUCache(object):
         self.queue = deque()
         self.cache = {}
         self.weakrefs = WeakValueDictionary()
-        self.hits = self.misses = self.refhits = 0
+        self.hits = self.misses = self.refhits = self.evictions = 0
         self.refcount = defaultdict(lambda: 0)
         self.miss_fn = miss_fn
 
@@ -69,6 +70,9 @@ class LRUCache(object):
 
         return result
 
+    def __contains__(self, key):
+        return key in self.cache or key in self.weakrefs
+
     def keys(self):
         return self.cache.keys()
 
@@ -163,6 +167,7 @@ class LRUCache(object):
                 refc = refcount[k] = refcount[k] - 1
             del cache[k]
             del refcount[k]
+            self.evictions += 1
 
 
 class AsyncLRUCache(LRUCache):
@@ -170,13 +175,25 @@ class AsyncLRUCache(LRUCache):
     """
     An LRU cache with asynchronous locking to ensure that in the common case of
     multiple concurrent requests for the same key, only one fetch is performed.
+
+    The number of completed fetches, and the total time they took, are kept
+    in C{fetches} and C{fetch_time}.
     """
 
-    __slots__ = ['concurrent']
+    __slots__ = ['concurrent', 'fetches', 'fetch_time']
+
+    # for tests
+    _reactor = reactor
 
     def __init__(self, miss_fn, max_size=50):
         LRUCache.__init__(self, miss_fn, max_size=max_size)
         self.concurrent = {}
+        self.fetches = 0
+        self.fetch_time = 0.0
+
+    def __contains__(self, key):
+        # a key that is being fetched will be available without another fetch
+        return LRUCache.__contains__(self, key) or key in self.concurrent
 
     def get(self, key, **miss_fn_kwargs):
         try:
@@ -201,9 +218,15 @@ class AsyncLRUCache(LRUCache):
         assert key not in concurrent
         concurrent[key] = [d]
 
+        started = self._reactor.seconds()
         miss_d = self.miss_fn(key, **miss_fn_kwargs)
 
+        def fetched():
+            self.fetches += 1
+            self.fetch_time += self._reactor.seconds() - started
+
         def handle_result(result):
+            fetched()
             if result is not None:
                 self.cache[key] = result
                 self.weakrefs[key] = result
@@ -220,6 +243,7 @@ class AsyncLRUCache(LRUCache):
                 d.callback(result)
 
         def handle_failure(f):
+            fetched()
             # errback all of the waiting Deferreds
             dlist = concurrent.pop(key)
             for d in dlist:
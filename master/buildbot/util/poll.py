@@ -13,6 +13,8 @@
 #
 # Copyright Buildbot Team Members
 
+import random
+
 from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.internet import task
@@ -22,7 +24,7 @@ from twisted.python import log
 class Poller(object):
 
     __slots__ = ['fn', 'instance', 'loop', 'started', 'running',
-                 'pending', 'stopDeferreds', '_reactor']
+                 'pending', 'stopDeferreds', 'startCall', '_reactor']
 
     def __init__(self, fn, instance):
         self.fn = fn
@@ -32,6 +34,7 @@ class Poller(object):
         self.running = False
         self.pending = False
         self.stopDeferreds = []
+        self.startCall = None
         self._reactor = reactor
 
     def _run(self):
@@ -50,7 +53,12 @@ class Poller(object):
         return d
 
     def __call__(self):
-        if self.started:
+        if self.startCall:
+            # the loop has not started yet, so start it now
+            self.startCall.cancel()
+            self.startCall = None
+            self._startLoop(self.loop.interval, True)
+        elif self.started:
             if self.running:
                 self.pending = True
             else:
@@ -60,11 +68,28 @@ class Poller(object):
                 self.loop.reset()
                 self.loop.interval = old_interval
 
-    def start(self, interval, now=False):
+    def start(self, interval, now=False, jitter=0):
+        """Call the function every C{interval} seconds, starting now if
+        C{now} is true.  Otherwise, if C{jitter} is given, the calls are
+        offset by a random delay of up to that fraction of the interval, so
+        that pollers started together do not all run at the same moments."""
         assert not self.started
         if not self.loop:
             self.loop = task.LoopingCall(self._run)
             self.loop.clock = self._reactor
+        self.started = True
+        if jitter and not now:
+            # remember the interval, in case we are called before the loop
+            # starts
+            self.loop.interval = interval
+            self.startCall = self._reactor.callLater(
+                random.random() * jitter * interval,
+                self._startLoop, interval, False)
+        else:
+            self._startLoop(interval, now)
+
+    def _startLoop(self, interval, now):
+        self.startCall = None
         stopDeferred = self.loop.start(interval, now=now)
 
         @stopDeferred.addCallback
@@ -72,9 +97,12 @@ class Poller(object):
             self.started = False
             while self.stopDeferreds:
                 self.stopDeferreds.pop().callback(None)
-        self.started = True
 
     def stop(self):
+        if self.startCall:
+            self.startCall.cancel()
+            self.startCall = None
+            self.started = False
         if self.loop and self.loop.running:
             self.loop.stop()
         if self.started:
@@ -0,0 +1,110 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import re
+import urlparse
+
+from collections import deque
+from twisted.internet import defer
+
+
+def hostFromUrl(url):
+    """
+    Return the host named by a repository URL, which may be a URL proper
+    (C{https://host/path}), an scp-style location (C{user@host:path}) or a
+    C{host:port} pair, or None if it names no host, as for a local path.
+    """
+    if not url:
+        return None
+    if '://' in url:
+        return urlparse.urlsplit(url).hostname or None
+    mo = re.match(r'^(?:[^@/]+@)?([^:/]+):', url)
+    if mo:
+        return mo.group(1).lower()
+    return None
+
+
+class ProcessPool(object):
+
+    """
+    Limits the number of processes that are run at once, in total and for
+    each host that the processes talk to.  Callers wait for a slot with
+    L{acquire}, run their process, and then give the slot back with
+    L{release}.  Waiters are started in the order they arrived, except that a
+    waiter for a host that is at its limit does not hold up waiters for other
+    hosts.  A limit of None means no limit.
+    """
+
+    def __init__(self, maxProcesses=None, maxPerHost=None):
+        self.maxProcesses = maxProcesses
+        self.maxPerHost = maxPerHost
+        self.running = 0
+        self.runningByHost = {}
+        self.waiting = deque()
+
+    def setLimits(self, maxProcesses, maxPerHost):
+        self.maxProcesses = maxProcesses
+        self.maxPerHost = maxPerHost
+        self._startWaiting()
+
+    def acquire(self, host=None):
+        """Return a Deferred that fires when a process for C{host} may
+        start."""
+        d = defer.Deferred()
+        self.waiting.append((host, d))
+        self._startWaiting()
+        return d
+
+    def release(self, host=None):
+        """Note that a process for C{host} has finished."""
+        self.running -= 1
+        if host is not None:
+            self.runningByHost[host] -= 1
+            if not self.runningByHost[host]:
+                del self.runningByHost[host]
+        self._startWaiting()
+
+    def run(self, host, fn, *args, **kwargs):
+        """Call C{fn}, which starts a process and returns a Deferred that
+        fires when it is finished, once a process for C{host} may start."""
+        d = self.acquire(host)
+        d.addCallback(lambda _: defer.maybeDeferred(fn, *args, **kwargs))
+
+        @d.addBoth
+        def release(res):
+            self.release(host)
+            return res
+        return d
+
+    def _startWaiting(self):
+        started = []
+        for entry in self.waiting:
+            if self.maxProcesses is not None \
+                    and self.running >= self.maxProcesses:
+                break
+            host = entry[0]
+            if host is not None and self.maxPerHost is not None \
+                    and self.runningByHost.get(host, 0) >= self.maxPerHost:
+                continue
+            self.running += 1
+            if host is not None:
+                self.runningByHost[host] = self.runningByHost.get(host, 0) + 1
+            started.append(entry)
+        for entry in started:
+            self.waiting.remove(entry)
+        # fire the Deferreds only once the pool is consistent, as their
+        # callbacks may start or finish other processes
+        for host, d in started:
+            d.callback(None)
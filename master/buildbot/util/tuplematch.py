@@ -23,3 +23,102 @@ def matchTuple(routingKey, filter):
         if f is not None and f != k:
             return False
     return True
+
+
+class FilterIndex(object):
+
+    """
+    A collection of (filter, value) pairs, indexed so that the values whose
+    filters match a routing key (as defined by L{matchTuple}) can be found
+    without trying every filter.  The cost of L{match} grows with the number
+    of matching filters, not with the number of filters in the index.
+
+    Filters are stored in a trie, with one level per tuple element; C{None}
+    elements are stored under the C{None} key, and followed for any routing
+    key element.
+    """
+
+    def __init__(self):
+        # filter length -> node, where a node is a tuple (children, values),
+        # children maps a filter element to a node one level deeper, and
+        # values maps each value added with that exact filter to its sequence
+        # number
+        self._roots = {}
+        self._seq = itertools.count()
+
+    def add(self, filter, value):
+        node = self._roots.get(len(filter))
+        if node is None:
+            node = self._roots[len(filter)] = ({}, {})
+        for f in filter:
+            children = node[0]
+            child = children.get(f)
+            if child is None:
+                child = children[f] = ({}, {})
+            node = child
+        node[1][value] = self._seq.next()
+
+    def remove(self, filter, value):
+        node = self._roots.get(len(filter))
+        path = []
+        for f in filter:
+            if node is None:
+                return
+            path.append((node, f))
+            node = node[0].get(f)
+        if node is None or value not in node[1]:
+            return
+        del node[1][value]
+
+        # prune any nodes left empty
+        if not node[1] and not node[0]:
+            for parent, f in reversed(path):
+                del parent[0][f]
+                if parent[0] or parent[1]:
+                    break
+            else:
+                del self._roots[len(filter)]
+
+    def match(self, routingKey):
+        """
+        Return the values whose filters match the routing key, in the order
+        in which they were added.
+        """
+        node = self._roots.get(len(routingKey))
+        if node is None:
+            return []
+        nodes = [node]
+        for k in routingKey:
+            next_nodes = []
+            for node in nodes:
+                children = node[0]
+                if k is not None:
+                    child = children.get(k)
+                    if child is not None:
+                        next_nodes.append(child)
+                child = children.get(None)
+                if child is not None:
+                    next_nodes.append(child)
+            if not next_nodes:
+                return []
+            nodes = next_nodes
+
+        if len(nodes) == 1:
+            values = nodes[0][1]
+            if len(values) < 2:
+                return values.keys()
+            return sorted(values, key=values.get)
+        matches = []
+        for node in nodes:
+            matches.extend((seq, value) for value, seq in node[1].iteritems())
+        matches.sort()
+        return [value for seq, value in matches]
+
+    def __len__(self):
+        count = 0
+        nodes = self._roots.values()
+        while nodes:
+            node = nodes.pop()
+            count += len(node[1])
+            nodes.extend(node[0].itervalues())
+        return count
@@ -0,0 +1,126 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Delivery of MQ messages to web clients, shared by the websocket and
+server-sent events resources.
+"""
+
+import datetime
+
+from buildbot.util import datetime2epoch
+from buildbot.util import json
+from collections import deque
+from twisted.internet.interfaces import IPushProducer
+from twisted.python import log
+from zope.interface import implements
+
+
+def _toJson(obj):
+    if isinstance(obj, datetime.datetime):
+        return datetime2epoch(obj)
+
+
+class EventEncoder(object):
+
+    """
+    Encodes MQ messages as JSON.  The MQ hands the same routing key and
+    message objects to every matching consumer, one consumer after another,
+    so remembering the most recent encoding means that each message is
+    encoded once, no matter how many clients it is delivered to.
+    """
+
+    def __init__(self):
+        # (routingKey, message, encoded) for the last message encoded; the
+        # references keep the ids of the key and message from being reused
+        self._last = None
+
+    def encode(self, routingKey, message):
+        """Return the JSON encoding of C{{"key": routingKey, "message":
+        message}}."""
+        last = self._last
+        if last and last[0] is routingKey and last[1] is message:
+            return last[2]
+        encoded = json.dumps(dict(key=routingKey, message=message),
+                             default=_toJson, separators=(',', ':'))
+        self._last = (routingKey, message, encoded)
+        return encoded
+
+encoder = EventEncoder()
+
+
+class EventWriter(object):
+
+    """
+    Writes encoded events to a client connection, registered as a streaming
+    producer with the connection's transport.  When the transport pauses the
+    writer because its buffer is full, events are queued until it is resumed.
+    If the queue grows beyond C{highWaterMark} bytes, the client is not
+    keeping up: the queue is discarded and C{drop} is called to disconnect
+    it, so that a slow client cannot make the master's memory grow without
+    bound.
+    """
+
+    implements(IPushProducer)
+
+    highWaterMark = 1024 * 1024
+
+    def __init__(self, consumer, write, drop):
+        self.consumer = consumer
+        self._write = write
+        self._drop = drop
+        self.paused = False
+        self.dropped = False
+        self.queue = deque()
+        self.queued = 0
+        consumer.registerProducer(self, True)
+
+    def write(self, data):
+        if self.dropped:
+            return
+        if not self.paused:
+            self._write(data)
+            return
+        self.queue.append(data)
+        self.queued += len(data)
+        if self.queued > self.highWaterMark:
+            log.msg("dropping web client that is %d bytes behind"
+                    % (self.queued,))
+            self.stop()
+            self._drop()
+
+    def stop(self):
+        """Stop writing, and discard any queued events."""
+        if not self.dropped:
+            self.dropped = True
+            self.queue.clear()
+            self.queued = 0
+            self.consumer.unregisterProducer()
+
+    # IPushProducer
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        # writing may pause the writer again
+        while self.queue and not self.paused and not self.dropped:
+            data = self.queue.popleft()
+            self.queued -= len(data)
+            self._write(data)
+
+    def stopProducing(self):
+        self.stop()
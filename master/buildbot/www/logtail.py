@@ -0,0 +1,268 @@
+# This file is part of .  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright  Team Members
+
+"""
+Streaming of the lines of a log as they are appended, as server-sent events.
+"""
+
+from buildbot.util import json
+from collections import deque
+from twisted.internet import defer
+from twisted.internet.interfaces import IPushProducer
+from twisted.python import log
+from twisted.web import resource
+from twisted.web import server
+from zope.interface import implements
+
+
+class LogTail(object):
+
+    """
+    Send the lines of a log to a client, starting at line C{next_line}, and
+    then each line as it is appended, until the log is finished.
+
+    Lines appended by this master are sent as they are appended, without
+    reading them back from the database.  Lines that are not available that
+    way -- those before the tail was started, those appended by another
+    master, and those appended while the client's connection was paused --
+    are read from the database instead.  As a result, a client that cannot
+    keep up costs database reads, not memory.
+    """
+
+    implements(IPushProducer)
+
+    # maximum number of lines read from the database at once
+    readLines = 1000
+
+    def __init__(self, master, logid, next_line, request):
+        self.master = master
+        self.logid = logid
+        self.request = request
+        # the next line to send, and the number of lines in the log, as far
+        # as we know
+        self.next_line = next_line
+        self.known_lines = 0
+        self.complete = False
+        # (first_line, content) for lines appended here but not yet sent
+        self.pending = deque()
+        self.paused = False
+        self.running = False
+        self.stopped = False
+        self.subscription = None
+        self.qref = None
+
+    @defer.inlineCallbacks
+    def start(self):
+        """
+        Start following the log.  The returned Deferred fires with False if
+        the log does not exist, and with True once the lines in the database
+        are being sent.
+        """
+        # consume the log's events before looking at the log, so that any
+        # lines appended meanwhile are known, and read from the database
+        self.qref = yield self.master.mq.startConsuming(
+            self.logEvent, ('logs', str(self.logid), None))
+        logdict = yield self.master.data.get(('logs', str(self.logid)))
+        if not logdict or self.stopped:
+            self.stop()
+            defer.returnValue(False)
+        self.known_lines = max(self.known_lines, logdict['num_lines'])
+        self.complete = self.complete or logdict['complete']
+        if not self.complete:
+            self.subscription = self.master.data.rtypes.log.followLog(
+                self.logid, self.linesAppended)
+
+        self.request.setHeader('content-type', 'text/event-stream')
+        self.request.setHeader('cache-control', 'no-cache')
+        self.request.registerProducer(self, True)
+        self._run()
+        defer.returnValue(True)
+
+    def stop(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        self.pending.clear()
+        if self.subscription:
+            self.subscription.unsubscribe()
+            self.subscription = None
+        if self.qref:
+            self.qref.stopConsuming()
+            self.qref = None
+        if self.request.producer is self:
+            self.request.unregisterProducer()
+
+    def linesAppended(self, first_line, content):
+        if self.stopped:
+            return
+        if self.paused:
+            # the client is not keeping up; read these lines later
+            self.known_lines = max(self.known_lines,
+                                   first_line + content.count('\n'))
+            return
+        self.pending.append((first_line, content))
+        self._run()
+
+    def logEvent(self, key, msg):
+        self.known_lines = max(self.known_lines, msg['num_lines'])
+        self.complete = self.complete or msg['complete']
+        self._run()
+
+    @defer.inlineCallbacks
+    def _run(self):
+        # a single loop sends lines, so that they are sent in order
+        if self.running:
+            return
+        self.running = True
+        try:
+            while not self.stopped and not self.paused:
+                self._sendPending()
+                if self.next_line < self.known_lines:
+                    limit = min(self.known_lines - self.next_line,
+                                self.readLines)
+                    chunk = yield self.master.data.get(
+                        ('logs', str(self.logid), 'contents'),
+                        offset=self.next_line, limit=limit)
+                    if not chunk or not chunk['content']:
+                        # not written yet; try again on the next event
+                        break
+                    if not self.stopped:
+                        self._send(chunk['firstline'], chunk['content'])
+                    continue
+                if self.complete:
+                    self._finish()
+                break
+        except Exception:
+            log.err(None, "while following log %d" % (self.logid,))
+            self.stop()
+            if not self.request.finished:
+                self.request.finish()
+        finally:
+            self.running = False
+
+    def _sendPending(self):
+        pending = self.pending
+        while pending:
+            first_line, content = pending[0]
+            if first_line > self.next_line:
+                # read the missing lines from the database first
+                self.known_lines = max(self.known_lines, first_line)
+                return
+            pending.popleft()
+            self._send(first_line, content)
+            if self.paused:
+                return
+
+    def _send(self, first_line, content):
+        num_lines = content.count('\n')
+        if first_line + num_lines <= self.next_line:
+            return
+        # skip any lines that have already been sent
+        i = 0
+        while first_line < self.next_line:
+            i = content.index('\n', i) + 1
+            first_line += 1
+            num_lines -= 1
+        if i:
+            content = content[i:]
+        self.next_line = first_line + num_lines
+        self.known_lines = max(self.known_lines, self.next_line)
+        data = json.dumps(dict(logid=self.logid, firstline=first_line,
+                               content=content))
+        # the event id is the line to resume from
+        self.request.write("id: %d\nevent: logchunk\ndata: %s\n\n"
+                           % (self.next_line, data))
+
+    def _finish(self):
+        data = json.dumps(dict(logid=self.logid, num_lines=self.next_line))
+        self.request.write("event: finished\ndata: %s\n\n" % (data,))
+        self.stop()
+        self.request.finish()
+
+    # IPushProducer
+
+    def pauseProducing(self):
+        self.paused = True
+        # forget lines that have not been sent; they will be read later
+        self.pending.clear()
+
+    def resumeProducing(self):
+        self.paused = False
+        self._run()
+
+    def stopProducing(self):
+        self.stop()
+
+
+class LogTailResource(resource.Resource):
+
+    """
+    Serves C{/logtail/<logid>}: the lines of the log as server-sent events.
+    Each C{logchunk} event carries a JSON object in the form of a logchunk,
+    with the log's C{logid}, the C{firstline} of the chunk, and its
+    C{content}; its id is the number of the line that follows the chunk.
+    Once the log is finished, a C{finished} event is sent and the response
+    ends.
+
+    Lines are sent from line 0, or from the line given by the C{line} query
+    argument, or from the C{Last-Event-ID} header, which browsers send when
+    they reconnect.
+    """
+
+    isLeaf = True
+
+    def __init__(self, master):
+        resource.Resource.__init__(self)
+        self.master = master
+
+    def finish(self, request, code, msg):
+        request.setResponseCode(code)
+        request.setHeader('content-type', 'text/plain; charset=utf-8')
+        request.write(msg)
+        request.finish()
+
+    def render_GET(self, request):
+        path = request.postpath
+        if path and path[-1] == '':
+            path = path[:-1]
+        try:
+            logid, = path
+            logid = int(logid)
+            line = request.getHeader('last-event-id')
+            if line is None:
+                line = request.args.get('line', ['0'])[0]
+            line = int(line)
+            if line < 0:
+                raise ValueError
+        except ValueError:
+            self.finish(request, 400, "invalid log id or line number")
+            return server.NOT_DONE_YET
+
+        tail = LogTail(self.master, logid, line, request)
+        request.notifyFinish().addBoth(lambda _: tail.stop())
+
+        d = tail.start()
+
+        @d.addCallback
+        def started(found):
+            if not found:
+                self.finish(request, 404, "no such log")
+
+        @d.addErrback
+        def failed(f):
+            log.err(f, "while starting to follow log %d" % (logid,))
+            tail.stop()
+            self.finish(request, 500, "internal error")
+        return server.NOT_DONE_YET
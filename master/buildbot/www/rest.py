@@ -17,8 +17,11 @@ from __future__ import with_statement
 
 import datetime
 import fnmatch
+import hashlib
+import os
 import re
 import types
+import zlib
 
 from buildbot.data import exceptions
 from buildbot.data import resultspec
@@ -101,6 +104,24 @@ class V2RootResource(resource.Resource):
     # enable reconfigResource calls
     needsReconfig = True
 
+    # responses at least this large are gzip-encoded for clients that accept
+    # it
+    GZIP_MIN_SIZE = 1024
+    GZIP_LEVEL = 6
+
+    # the most content lengths to remember for HEAD requests
+    MAX_CACHED_LENGTHS = 1000
+
+    def __init__(self, master):
+        resource.Resource.__init__(self, master)
+        # distinguishes ETags from those given out before a restart, as the
+        # database generation starts over
+        self.etagSalt = os.urandom(8).encode('hex')
+        # content length of each representation, by ETag, for the current
+        # database generation
+        self.cachedLengths = {}
+        self.cachedLengthsGeneration = None
+
     def getEndpoint(self, request):
         # note that trailing slashes are not allowed
         return self.master.data.getEndpoint(tuple(request.postpath))
@@ -284,6 +305,62 @@ class V2RootResource(resource.Resource):
 
         return rspec
 
+    def getGenerationEtag(self, request, compact):
+        # Return an ETag for the response to this request, based on the
+        # database generation, or None if the generation cannot tell whether
+        # the data has changed.  This must be called before the data is read.
+        if self.master.config.multiMaster:
+            # other masters' writes do not change the generation
+            return None
+        generation = self.master.db.getGeneration()
+        if generation is None:
+            return None
+        if generation != self.cachedLengthsGeneration:
+            self.cachedLengths = {}
+            self.cachedLengthsGeneration = generation
+        key = repr((self.etagSalt, generation, request.postpath,
+                    sorted(request.args.items()), compact))
+        return '"%s"' % (hashlib.sha1(key).hexdigest(),)
+
+    def etagMatches(self, request, etag):
+        ifNoneMatch = request.getHeader('if-none-match')
+        if not ifNoneMatch:
+            return False
+        for candidate in ifNoneMatch.split(','):
+            candidate = candidate.strip()
+            if candidate.startswith('W/'):
+                candidate = candidate[2:]
+            if candidate.endswith('-gzip"'):
+                candidate = candidate[:-6] + '"'
+            if candidate in ('*', etag):
+                return True
+        return False
+
+    def acceptsGzip(self, request):
+        for coding in (request.getHeader('accept-encoding') or '').split(','):
+            params = coding.split(';')
+            if params[0].strip().lower() not in ('gzip', 'x-gzip'):
+                continue
+            for param in params[1:]:
+                name, _, value = param.partition('=')
+                if name.strip() == 'q':
+                    try:
+                        return float(value) > 0
+                    except ValueError:
+                        return False
+            return True
+        return False
+
+    def writeNotModified(self, request, etag):
+        request.setResponseCode(304)
+        request.setHeader('etag', etag)
+
+    def gzip(self, data):
+        # wbits of 16 + MAX_WBITS produces a gzip header and trailer
+        compressor = zlib.compressobj(self.GZIP_LEVEL, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
     @defer.inlineCallbacks
     def renderRest(self, request):
         def writeError(msg, errcode=404, jsonrpccode=None):
@@ -297,6 +374,29 @@ class V2RootResource(resource.Resource):
             ep, kwargs = self.getEndpoint(request)
 
             rspec = self.decodeResultSpec(request, ep)
+
+            # the representation depends on these request headers
+            request.setHeader("vary", "Accept, Accept-Encoding")
+            compact = 'application/json' in (request.getHeader('accept') or '')
+
+            # if the database has not changed since the client got its copy,
+            # there is no need to read it again; likewise, a HEAD request for
+            # a representation that was recently rendered needs only its
+            # length
+            etag = None
+            if ep.etagFromGeneration:
+                etag = self.getGenerationEtag(request, compact)
+            if etag is not None:
+                if self.etagMatches(request, etag):
+                    self.writeNotModified(request, etag)
+                    return
+                if request.method == "HEAD" and etag in self.cachedLengths:
+                    self.setContentHeaders(request, compact)
+                    request.setHeader("etag", etag)
+                    request.setHeader("content-length",
+                                      self.cachedLengths[etag])
+                    return
+
             data = yield ep.get(rspec, kwargs)
             if data is None:
                 writeError("not found", errcode=404)
@@ -326,27 +426,6 @@ class V2RootResource(resource.Resource):
                 'meta': meta
             }
 
-            # set up the content type and formatting options; if the request
-            # accepts text/html or text/plain, the JSON will be rendered in a
-            # readable, multiline format.
-
-            if 'application/json' in (request.getHeader('accept') or ''):
-                compact = True
-                request.setHeader("content-type",
-                                  'application/json; charset=utf-8')
-            else:
-                compact = False
-                request.setHeader("content-type",
-                                  'text/plain; charset=utf-8')
-
-            # set up caching
-            if self.cache_seconds:
-                now = datetime.datetime.utcnow()
-                expires = now + datetime.timedelta(seconds=self.cache_seconds)
-                request.setHeader("Expires",
-                                  expires.strftime("%a, %d %b %Y %H:%M:%S GMT"))
-                request.setHeader("Pragma", "no-cache")
-
             # filter out blanks if necessary and render the data
             if compact:
                 data = json.dumps(data, default=self._toJson,
@@ -355,11 +434,52 @@ class V2RootResource(resource.Resource):
                 data = json.dumps(data, default=self._toJson,
                                   sort_keys=True, indent=2)
 
+            # without a database generation, or for data that is not in the
+            # database, the ETag can only be derived from the content itself;
+            # this saves bandwidth, but not work
+            if etag is None:
+                etag = '"%s"' % (hashlib.sha1(data).hexdigest(),)
+                if self.etagMatches(request, etag):
+                    self.writeNotModified(request, etag)
+                    return
+            elif len(self.cachedLengths) < self.MAX_CACHED_LENGTHS:
+                self.cachedLengths[etag] = len(data)
+
+            self.setContentHeaders(request, compact)
+
+            # HEAD responses describe the uncompressed representation, so that
+            # they need not compress it
+            if (request.method != "HEAD" and len(data) >= self.GZIP_MIN_SIZE
+                    and self.acceptsGzip(request)):
+                data = self.gzip(data)
+                etag = etag[:-1] + '-gzip"'
+                request.setHeader("content-encoding", "gzip")
+            request.setHeader("etag", etag)
+
             if request.method == "HEAD":
                 request.setHeader("content-length", len(data))
             else:
                 request.write(data)
 
+    def setContentHeaders(self, request, compact):
+        # set up the content type and formatting options; if the request
+        # accepts text/html or text/plain, the JSON will be rendered in a
+        # readable, multiline format.
+        if compact:
+            request.setHeader("content-type",
+                              'application/json; charset=utf-8')
+        else:
+            request.setHeader("content-type",
+                              'text/plain; charset=utf-8')
+
+        # set up caching
+        if self.cache_seconds:
+            now = datetime.datetime.utcnow()
+            expires = now + datetime.timedelta(seconds=self.cache_seconds)
+            request.setHeader("Expires",
+                              expires.strftime("%a, %d %b %Y %H:%M:%S GMT"))
+            request.setHeader("Pragma", "no-cache")
+
     def reconfigResource(self, new_config):
         # pre-translate the origin entries in the config
         self.origins = [re.compile(fnmatch.translate(o.lower()))
@@ -20,6 +20,7 @@ from buildbot.util import service
 from buildbot.www import auth
 from buildbot.www import avatar
 from buildbot.www import config as wwwconfig
+from buildbot.www import logtail
 from buildbot.www import rest
 from buildbot.www import sse
 from buildbot.www import ws
@@ -155,6 +156,9 @@ class WWWService(config.ReconfigurableServiceMixin, service.AsyncMultiService):
         # /sse
         root.putChild('sse', sse.EventResource(self.master))
 
+        # /logtail
+        root.putChild('logtail', logtail.LogTailResource(self.master))
+
         self.root = root
         self.site = server.Site(root)
 
@@ -13,12 +13,10 @@
 #
 # Copyright  Team Members
 
-import datetime
 import uuid
 
 from buildbot.data.exceptions import InvalidPathError
-from buildbot.util import datetime2epoch
-from buildbot.util import json
+from buildbot.www import events
 from twisted.python import log
 from twisted.web import resource
 from twisted.web import server
@@ -29,25 +27,32 @@ class Consumer(object):
     def __init__(self, request):
         self.request = request
         self.qrefs = {}
+        self.writer = None
 
-    def _toJson(self, obj):
-        if isinstance(obj, datetime.datetime):
-            return datetime2epoch(obj)
+    def startWriting(self):
+        # events are written through an EventWriter, which stops a slow client
+        # from queueing events without bound
+        self.writer = events.EventWriter(self.request, self.request.write,
+                                         self.dropClient)
+
+    def dropClient(self):
+        request = self.request
+        if request.transport:
+            request.transport.loseConnection()
 
     def stopConsuming(self, key=None):
         if key is not None:
             self.qrefs[key].stopConsuming()
         else:
+            if self.writer:
+                self.writer.stop()
             for qref in self.qrefs.values():
                 qref.stopConsuming()
             self.qrefs = {}
 
     def onMessage(self, event, data):
-        request = self.request
-        msg = dict(key=event, message=data)
-        request.write("event: " + "event" + "\n")
-        request.write("data: " + json.dumps(msg, default=self._toJson) + "\n")
-        request.write("\n")
+        self.writer.write("event: event\ndata: %s\n\n"
+                          % (events.encoder.encode(event, data),))
 
     def registerQref(self, path, qref):
         self.qrefs[path] = qref
@@ -126,6 +131,7 @@ class EventResource(resource.Resource):
 
         if command == "listen":
             self.consumers[cid] = consumer
+            consumer.startWriting()
             request.setHeader("content-type", "text/event-stream")
             request.write("")
             request.write("event: handshake\n")
@@ -114,6 +114,21 @@ def make_accept(key):
 # Frames are bonghits in newer WS versions, so helpers are appreciated.
 
 
+_xor_tables = {}
+
+
+def _xor_table(byte):
+    """
+    Return a translation table which XORs every byte with C{byte}.
+    """
+
+    try:
+        return _xor_tables[byte]
+    except KeyError:
+        table = _xor_tables[byte] = "".join(chr(i ^ byte) for i in range(256))
+        return table
+
+
 def mask(buf, key):
     """
     Mask or unmask a buffer of bytes with a masking key.
@@ -121,12 +136,13 @@ def mask(buf, key):
     The key must be exactly four bytes long.
     """
 
-    # This is super-secure, I promise~
-    key = [ord(i) for i in key]
-    buf = list(buf)
-    for i, char in enumerate(buf):
-        buf[i] = chr(ord(char) ^ key[i % 4])
-    return "".join(buf)
+    # Every fourth byte is XORed with the same key byte, so each of the four
+    # strided slices can be masked with a single str.translate, rather than
+    # one byte at a time.
+    masked = bytearray(buf)
+    for i in range(4):
+        masked[i::4] = buf[i::4].translate(_xor_table(ord(key[i])))
+    return str(masked)
 
 
 def make_hybi07_frame(buf, opcode=NORMAL):
@@ -153,24 +169,155 @@ def make_hybi07_frame(buf, opcode=NORMAL):
 def parse_hybi07_frames(buf):
     """
     Parse HyBi-07 frames in a highly compliant manner.
+
+    Returns the complete frames in C{buf}, and the data left over.
+    """
+
+    parser = HyBi07FrameParser()
+    frames = parser.feed(buf)
+    return frames, parser.unparsed()
+
+
+class HyBi07FrameParser(object):
+
     """
+    Incremental parser for HyBi-07 frames.
+
+    Data is fed to the parser as it arrives.  The header of a frame is parsed
+    once, and the payload is then only collected until the frame is
+    complete, so a large frame arriving in many pieces is neither re-parsed
+    nor copied for each piece.
+    """
+
+    # The longest header: two bytes, an eight byte length, and a mask.
+    max_header_length = 14
+
+    def __init__(self):
+        # Data not yet parsed is the chunks, less the first `offset` bytes of
+        # the first chunk.
+        self.chunks = []
+        self.offset = 0
+        self.buffered = 0
+        # (opcode, key, header length, payload length) of the frame whose
+        # header has been parsed.
+        self.header = None
+
+    def feed(self, data):
+        """
+        Add data received from the peer, and return a list of the frames it
+        completed, each a tuple of (opcode, data).
+        """
+
+        if data:
+            self.chunks.append(data)
+            self.buffered += len(data)
+
+        frames = []
+        while True:
+            if self.header is None:
+                self.header = self.parseHeader()
+                if self.header is None:
+                    break
+
+            opcode, key, offset, length = self.header
+            if self.buffered < offset + length:
+                break
+            self.header = None
+
+            self.take(offset)
+            data = self.take(length)
+            if key is not None:
+                data = mask(data, key)
+
+            if opcode == CLOSE:
+                if len(data) >= 2:
+                    # Gotta unpack the opcode and return usable data here.
+                    data = unpack(">H", data[:2])[0], data[2:]
+                else:
+                    # No reason given; use generic data.
+                    data = 1000, "No reason given"
 
-    start = 0
-    frames = []
+            frames.append((opcode, data))
+
+        return frames
+
+    def unparsed(self):
+        """
+        Return the data which has not been parsed into frames.
+        """
+
+        return self.peek(self.buffered)
+
+    def peek(self, length):
+        """
+        Return up to C{length} bytes of unparsed data, without consuming it.
+        """
+
+        chunk = self.chunks[0] if self.chunks else ""
+        if len(chunk) - self.offset < length and len(self.chunks) > 1:
+            # Only happens for the few bytes of a header split across
+            # chunks, or for unparsed(); merge the chunks involved.
+            needed = length + self.offset
+            merged = []
+            while self.chunks and needed > 0:
+                chunk = self.chunks.pop(0)
+                merged.append(chunk)
+                needed -= len(chunk)
+            chunk = "".join(merged)
+            self.chunks.insert(0, chunk)
+        return chunk[self.offset:self.offset + length]
+
+    def take(self, length):
+        """
+        Consume and return C{length} bytes of data, which must be buffered.
+        """
+
+        if not length:
+            return ""
+        self.buffered -= length
+        chunk = self.chunks[0]
+        end = self.offset + length
+        if end <= len(chunk):
+            # The common case: the data is all in one chunk.
+            data = chunk[self.offset:end]
+            self.offset = end
+        else:
+            # Collect the data from as many chunks as it spans, joining them
+            # only once.
+            pieces = [chunk[self.offset:]]
+            needed = length - len(pieces[0])
+            del self.chunks[0]
+            while needed > len(self.chunks[0]):
+                chunk = self.chunks.pop(0)
+                pieces.append(chunk)
+                needed -= len(chunk)
+            pieces.append(self.chunks[0][:needed])
+            self.offset = needed
+            data = "".join(pieces)
+        if self.offset == len(self.chunks[0]):
+            del self.chunks[0]
+            self.offset = 0
+        return data
+
+    def parseHeader(self):
+        """
+        Parse the header of the next frame, returning a tuple (opcode, key,
+        header length, payload length), or None if the header is not complete
+        yet.  The header is consumed along with the payload.
+        """
 
-    while True:
         # If there's not at least two bytes in the buffer, bail.
-        if len(buf) - start < 2:
-            break
+        if self.buffered < 2:
+            return None
+
+        buf = self.peek(self.max_header_length)
 
         # Grab the header. This single byte holds some flags nobody cares
         # about, and an opcode which nobody cares about.
-        header = ord(buf[start])
+        header = ord(buf[0])
         if header & 0x70:
             # At least one of the reserved flags is set. Pork chop sandwiches!
             raise WSException("Reserved flag in HyBi-07 frame (%d)" % header)
-            frames.append(("", CLOSE))
-            return frames, buf
 
         # Get the opcode, and translate it to a local enum which we actually
         # care about.
@@ -182,7 +329,7 @@ def parse_hybi07_frames(buf):
 
         # Get the payload length and determine whether we need to look for an
         # extra length.
-        length = ord(buf[start + 1])
+        length = ord(buf[1])
         masked = length & 0x80
         length &= 0x7f
 
@@ -193,52 +340,32 @@ def parse_hybi07_frames(buf):
 
         # Extra length fields.
         if length == 0x7e:
-            if len(buf) - start < 4:
-                break
+            if len(buf) < 4:
+                return None
 
-            length = buf[start + 2:start + 4]
-            length = unpack(">H", length)[0]
+            length = unpack(">H", buf[2:4])[0]
             offset += 2
         elif length == 0x7f:
-            if len(buf) - start < 10:
-                break
+            if len(buf) < 10:
+                return None
 
             # Protocol bug: The top bit of this long long *must* be cleared;
             # that is, it is expected to be interpreted as signed. That's
             # fucking stupid, if you don't mind me saying so, and so we're
             # interpreting it as unsigned anyway. If you wanna send exabytes
             # of data down the wire, then go ahead!
-            length = buf[start + 2:start + 10]
-            length = unpack(">Q", length)[0]
+            length = unpack(">Q", buf[2:10])[0]
             offset += 8
 
+        key = None
         if masked:
-            if len(buf) - (start + offset) < 4:
-                break
+            if len(buf) < offset + 4:
+                return None
 
-            key = buf[start + offset:start + offset + 4]
+            key = buf[offset:offset + 4]
             offset += 4
 
-        if len(buf) - (start + offset) < length:
-            break
-
-        data = buf[start + offset:start + offset + length]
-
-        if masked:
-            data = mask(data, key)
-
-        if opcode == CLOSE:
-            if len(data) >= 2:
-                # Gotta unpack the opcode and return usable data here.
-                data = unpack(">H", data[:2])[0], data[2:]
-            else:
-                # No reason given; use generic data.
-                data = 1000, "No reason given"
-
-        frames.append((opcode, data))
-        start += offset + length
-
-    return frames, buf[start:]
+        return opcode, key, offset, length
 
 
 class WebSocketsProtocol(ProtocolWrapper):
@@ -248,24 +375,24 @@ class WebSocketsProtocol(ProtocolWrapper):
     layer.
     """
 
-    buf = ""
     codec = None
 
     def __init__(self, *args, **kwargs):
         ProtocolWrapper.__init__(self, *args, **kwargs)
         self.pending_frames = []
+        self.parser = HyBi07FrameParser()
 
     def connectionMade(self):
         ProtocolWrapper.connectionMade(self)
         log.msg("Opening connection with %s" % self.transport.getPeer())
 
-    def parseFrames(self):
+    def parseFrames(self, data):
         """
         Find frames in incoming data and pass them to the underlying protocol.
         """
 
         try:
-            frames, self.buf = parse_hybi07_frames(self.buf)
+            frames = self.parser.feed(data)
         except WSException:
             # Couldn't parse all the frames, something went wrong, let's bail.
             log.err()
@@ -309,9 +436,7 @@ class WebSocketsProtocol(ProtocolWrapper):
         self.pending_frames = []
 
     def dataReceived(self, data):
-        self.buf += data
-
-        self.parseFrames()
+        self.parseFrames(data)
 
         # Kick any pending frames. This is needed because frames might have
         # started piling up early; we can get write()s from our protocol above
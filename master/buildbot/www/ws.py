@@ -14,6 +14,7 @@
 # Copyright  Team Members
 
 from buildbot.util import json
+from buildbot.www import events
 from buildbot.www import websocket
 from twisted.internet import protocol
 from twisted.python import log
@@ -25,6 +26,10 @@ class WsProtocol(protocol.Protocol):
         self.master = master
         self.qrefs = {}
 
+    def connectionMade(self):
+        self.writer = events.EventWriter(self.transport, self.transport.write,
+                                         self.transport.loseConnection)
+
     def dataReceived(self, frame):
         log.msg("FRAME %s" % frame)
         # parse the incoming request
@@ -39,9 +44,13 @@ class WsProtocol(protocol.Protocol):
             if path in self.qrefs:
                 return
 
+            # each message is encoded once for all connections, and the path
+            # spliced into the JSON object for this one
+            prefix = '{"path":%s,' % (json.dumps(path),)
+
             def callback(key, message):
-                content = json.dumps(dict(path=path, key=key, message=message))
-                self.transport.write(content)
+                encoded = events.encoder.encode(key, message)
+                self.writer.write(prefix + encoded[1:])
             d = self.master.data.startConsuming(callback, options, path)
 
             @d.addCallback
@@ -53,6 +62,7 @@ class WsProtocol(protocol.Protocol):
 
     def connectionLost(self, reason):
         log.msg("connection lost", system=self)
+        self.writer.stop()
         for qref in self.qrefs.values():
             qref.stopConsuming()
         self.qrefs = None  # to be sure we don't add any more
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+#
+# usage: python build_distribution.py [options]
+#
+# Measures how long BuildRequestDistributor takes to start builds when many
+# requests arrive at once for many builders, as after a commit that triggers
+# every builder.  The requests live in an in-memory SQLite database, and each
+# builder's maybeStartBuild takes --start-latency seconds, standing in for the
+# round trips to the slave.  Each builder has --slaves-per-builder slaves,
+# picked at random from a pool of --slaves, so some builders share slaves.
+# Run with different values of --concurrency to compare.  With
+# --per-builder-sort, builders are prioritized by querying each builder's
+# oldest request in turn, as the default sorter did before it used a single
+# aggregated query, for comparison.
+
+import optparse
+import random
+import sys
+import tempfile
+import time
+
+from buildbot import config
+from buildbot.data import connector as dataconnector
+from buildbot.data import resultspec
+from buildbot.db import connector as dbconnector
+from buildbot.db import model
+from buildbot.mq import simple
+from buildbot.process import buildrequestdistributor
+from buildbot.process import cache
+from buildbot.util import ascii2unicode
+from twisted.internet import defer
+from twisted.internet import reactor
+
+SUBMITTED_AT = 1300000000
+
+
+class FakeMaster(object):
+
+    masterid = 1
+
+    def __init__(self, options, basedir):
+        self.config = config.MasterConfig()
+        self.config.db['db_url'] = 'sqlite://'
+        self.config.builderDistributionConcurrency = options.concurrency
+        self.caches = cache.CacheManager()
+        self.mq = simple.SimpleMQ(self)
+        self.db = dbconnector.DBConnector(self, basedir)
+        self.data = dataconnector.DataConnector(self)
+
+
+class FakeBuilderConfig(object):
+    nextSlave = None
+    nextBuild = None
+
+    def __init__(self, slavenames):
+        self.slavenames = slavenames
+
+
+class FakeSlave(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.busy = False
+
+
+class FakeBuilder(object):
+
+    def __init__(self, name, slaves, master, options, starts):
+        self.name = name
+        self.slaves = slaves
+        self.config = FakeBuilderConfig([s.name for s in slaves])
+        self.master = master
+        self.options = options
+        self.starts = starts
+
+    def getAvailableSlaves(self):
+        return [s for s in self.slaves if not s.busy]
+
+    def canStartWithSlavebuilder(self, slave):
+        return not slave.busy
+
+    def canStartBuild(self, slave, breq):
+        return not slave.busy
+
+    def getMergeRequestsFn(self):
+        return False
+
+    @defer.inlineCallbacks
+    def getOldestRequestTime(self):
+        # as Builder.getOldestRequestTime did
+        unclaimed = yield self.master.data.get(
+            ('builders', ascii2unicode(self.name), 'buildrequests'),
+            [resultspec.Filter('claimed', 'eq', [False])])
+        if unclaimed:
+            defer.returnValue(min(brd['submitted_at'] for brd in unclaimed))
+
+    def maybeStartBuild(self, slave, breqs):
+        slave.busy = True
+        d = defer.Deferred()
+        reactor.callLater(self.options.start_latency, d.callback, True)
+        d.addCallback(lambda res: self.starts.append(time.time()) or res)
+        return d
+
+
+class FakeBotMaster(object):
+
+    def __init__(self, master):
+        self.master = master
+        self.builders = {}
+
+    def maybeStartBuildsForBuilder(self, buildername):
+        pass
+
+
+@defer.inlineCallbacks
+def setUp(master, options, rnd):
+    yield master.db.setup(check_version=False)
+
+    def thd(conn):
+        m = master.db.model
+        model.Model.metadata.create_all(bind=conn)
+        conn.execute(m.masters.insert(),
+                     dict(id=1, name=u'master', name_hash=u'master',
+                          active=1, last_active=SUBMITTED_AT))
+        conn.execute(m.sourcestamps.insert(),
+                     dict(id=1, ss_hash=u'ss', branch=u'master',
+                          revision=u'abcdef', patchid=None, repository=u'repo',
+                          codebase=u'', project=u'proj',
+                          created_at=SUBMITTED_AT))
+        buildsets, bsss, buildrequests = [], [], []
+        for i in xrange(options.builders):
+            conn.execute(m.builders.insert(),
+                         dict(id=i + 1, name=u'builder%03d' % i,
+                              name_hash=u'builder%03d' % i))
+            for j in xrange(options.requests):
+                bsid = i * options.requests + j + 1
+                buildsets.append(dict(id=bsid, reason=u'benchmark',
+                                      submitted_at=SUBMITTED_AT, complete=0,
+                                      results=-1))
+                bsss.append(dict(buildsetid=bsid, sourcestampid=1))
+                buildrequests.append(dict(id=bsid, buildsetid=bsid,
+                                          buildername=u'builder%03d' % i,
+                                          priority=0, complete=0, results=-1,
+                                          submitted_at=SUBMITTED_AT + j))
+        conn.execute(m.buildsets.insert(), buildsets)
+        conn.execute(m.buildset_sourcestamps.insert(), bsss)
+        conn.execute(m.buildrequests.insert(), buildrequests)
+    yield master.db.pool.do(thd)
+
+    slaves = [FakeSlave('slave%03d' % i) for i in xrange(options.slaves)]
+    botmaster = FakeBotMaster(master)
+    starts = []
+    for i in xrange(options.builders):
+        name = 'builder%03d' % i
+        botmaster.builders[name] = FakeBuilder(
+            name, rnd.sample(slaves, options.slaves_per_builder),
+            master, options, starts)
+    defer.returnValue((botmaster, starts))
+
+
+def perBuilderSort(master, builders):
+    d = defer.gatherResults([bldr.getOldestRequestTime()
+                             for bldr in builders])
+
+    @d.addCallback
+    def sort(times):
+        xformed = sorted((t is None, t, bldr.name, bldr)
+                         for t, bldr in zip(times, builders))
+        return [xf[-1] for xf in xformed]
+    return d
+
+
+@defer.inlineCallbacks
+def main(options):
+    rnd = random.Random(options.seed)
+    master = FakeMaster(options, tempfile.gettempdir())
+    try:
+        botmaster, starts = yield setUp(master, options, rnd)
+
+        if options.per_builder_sort:
+            master.config.prioritizeBuilders = perBuilderSort
+        brd = buildrequestdistributor.BuildRequestDistributor(botmaster)
+
+        # time spent prioritizing builders
+        sorting = [0.0]
+        sortBuilders = brd._sortBuilders
+
+        @defer.inlineCallbacks
+        def timedSortBuilders(buildernames):
+            sortStart = time.time()
+            rv = yield sortBuilders(buildernames)
+            sorting[0] += time.time() - sortStart
+            defer.returnValue(rv)
+        brd._sortBuilders = timedSortBuilders
+        quiet = defer.Deferred()
+        brd._quiet = lambda: quiet.callback(None)
+        brd.startService()
+
+        start = time.time()
+        brd.maybeStartBuildsOn(sorted(botmaster.builders))
+        yield quiet
+        elapsed = time.time() - start
+
+        latencies = sorted(t - start for t in starts)
+        print "concurrency %d: started %d builds on %d builders in %.2fs" % (
+            options.concurrency, len(starts), options.builders, elapsed)
+        print "prioritizing builders took %.2fs" % (sorting[0],)
+        if latencies:
+            print "start latency: median %.2fs, 90%% %.2fs, max %.2fs" % (
+                latencies[len(latencies) // 2],
+                latencies[len(latencies) * 9 // 10], latencies[-1])
+        yield brd.stopService()
+    finally:
+        if master.db.pool:
+            master.db.pool.shutdown()
+
+
+def run():
+    parser = optparse.OptionParser()
+    parser.add_option('--builders', type='int', default=300)
+    parser.add_option('--slaves', type='int', default=200)
+    parser.add_option('--slaves-per-builder', type='int', default=2)
+    parser.add_option('--requests', type='int', default=3,
+                      help="pending build requests per builder")
+    parser.add_option('--start-latency', type='float', default=0.05,
+                      help="seconds taken by each builder's maybeStartBuild")
+    parser.add_option('--concurrency', type='int', default=1,
+                      help="value for c['builderDistributionConcurrency']")
+    parser.add_option('--per-builder-sort', action='store_true',
+                      default=False)
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args()
+
+    result = []
+    d = main(options)
+    d.addErrback(result.append)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+    if result:
+        result[0].printTraceback()
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run()
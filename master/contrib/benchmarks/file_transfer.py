@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+# usage: python file_transfer.py [options]
+#
+# Measures FileUpload and FileDownload throughput over a link with latency.
+# The master's _FileWriter or _FileReader is served over PB on loopback, and
+# the slave's transfer command reaches it through a proxy that delays the
+# data in each direction by half of --rtt milliseconds.  The buildslave
+# package must be importable, e.g. with PYTHONPATH=../slave.  Compare
+# --window 1 (one block per round trip, as with older slaves) against larger
+# windows.
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from collections import deque
+
+from buildbot.steps import transfer
+from buildslave.commands import transfer as slavetransfer
+from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.spread import pb
+
+
+class DelayedForwarder(protocol.Protocol):
+
+    """Forward data to C{peer}, each chunk C{delay} seconds after it arrived,
+    preserving order."""
+
+    peer = None
+
+    def connectionMade(self):
+        self.queue = deque()
+
+    def dataReceived(self, data):
+        self.queue.append(data)
+        reactor.callLater(self.factory.delay, self.forward)
+
+    def forward(self):
+        data = self.queue.popleft()
+        if self.peer is not None:
+            self.peer.transport.write(data)
+
+    def connectionLost(self, reason):
+        if self.peer is not None and self.peer.transport:
+            reactor.callLater(self.factory.delay,
+                              self.peer.transport.loseConnection)
+
+
+class DelayingProxyFactory(protocol.ServerFactory):
+
+    def __init__(self, port, delay):
+        self.port = port
+        self.delay = delay
+
+    def buildProtocol(self, addr):
+        server = DelayedForwarder()
+        server.factory = self
+        client_factory = protocol.ClientFactory()
+
+        def buildClient(addr):
+            client = DelayedForwarder()
+            client.factory = self
+            client.peer = server
+            server.peer = client
+            return client
+        client_factory.buildProtocol = buildClient
+        reactor.connectTCP('127.0.0.1', self.port, client_factory)
+        return server
+
+
+class Root(pb.Root):
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+    def remote_getWriter(self):
+        return transfer._FileWriter(os.path.join(self.basedir, 'uploaded'),
+                                    None, None)
+
+    def remote_getReader(self):
+        return transfer._FileReader(
+            open(os.path.join(self.basedir, 'source'), 'rb'))
+
+
+class SlaveBuilder(object):
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+    def sendUpdate(self, data):
+        pass
+
+
+@defer.inlineCallbacks
+def runTransfer(remote, basedir, options):
+    builder = SlaveBuilder(basedir)
+    args = dict(workdir='.', maxsize=None, blocksize=options.blocksize,
+                window=options.window)
+    if options.download:
+        args.update(slavedest='downloaded', mode=None,
+                    reader=(yield remote.callRemote('getReader')))
+        cmd = slavetransfer.SlaveFileDownloadCommand(builder, 'bench', args)
+    else:
+        args.update(slavesrc='source', keepstamp=False,
+                    writer=(yield remote.callRemote('getWriter')))
+        cmd = slavetransfer.SlaveFileUploadCommand(builder, 'bench', args)
+    yield cmd.doStart()
+
+
+@defer.inlineCallbacks
+def main(options):
+    basedir = tempfile.mkdtemp()
+    with open(os.path.join(basedir, 'source'), 'wb') as f:
+        for _ in xrange(options.size):
+            f.write(os.urandom(1024 * 1024))
+
+    server = reactor.listenTCP(0, pb.PBServerFactory(Root(basedir)),
+                               interface='127.0.0.1')
+    proxy = reactor.listenTCP(
+        0, DelayingProxyFactory(server.getHost().port, options.rtt / 2000.0),
+        interface='127.0.0.1')
+    factory = pb.PBClientFactory()
+    reactor.connectTCP('127.0.0.1', proxy.getHost().port, factory)
+    try:
+        remote = yield factory.getRootObject()
+        start = time.time()
+        yield runTransfer(remote, basedir, options)
+        elapsed = time.time() - start
+
+        dest = 'downloaded' if options.download else 'uploaded'
+        with open(os.path.join(basedir, 'source'), 'rb') as f:
+            expected = f.read()
+        with open(os.path.join(basedir, dest), 'rb') as f:
+            assert f.read() == expected, "transferred file differs"
+
+        print "%s %dMB, rtt %dms, blocksize %d, window %d: " \
+            "%.2fs (%.2fMB/s)" % (
+                dest, options.size, options.rtt, options.blocksize,
+                options.window, elapsed, options.size / elapsed)
+    finally:
+        factory.disconnect()
+        yield proxy.stopListening()
+        yield server.stopListening()
+        shutil.rmtree(basedir)
+
+
+def run():
+    parser = optparse.OptionParser()
+    parser.add_option('--size', type='int', default=16,
+                      help="size of the file to transfer, in MB")
+    parser.add_option('--rtt', type='int', default=50,
+                      help="round-trip time to simulate, in milliseconds")
+    parser.add_option('--blocksize', type='int',
+                      default=transfer.DEFAULT_WINDOWED_BLOCKSIZE)
+    parser.add_option('--window', type='int', default=16)
+    parser.add_option('--download', action='store_true', default=False,
+                      help="transfer from master to slave (default: upload)")
+    options, args = parser.parse_args()
+
+    result = []
+    d = main(options)
+    d.addErrback(result.append)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+    if result:
+        result[0].printTraceback()
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run()
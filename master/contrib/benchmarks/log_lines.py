@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# usage: python log_lines.py [options]
+#
+# Measures how quickly LogsConnectorComponent.getLogLines can read random
+# windows of lines from a large log, as the web UI's log viewer does when
+# paging through /logs/n:logid/contents.  The log is written to a temporary
+# SQLite database first; use --db-url to run against another database.
+
+import optparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from buildbot import config
+from buildbot.db import enginestrategy
+from buildbot.db import logs
+from buildbot.db import model
+from buildbot.db import pool
+from buildbot.process import cache
+from twisted.internet import defer
+from twisted.internet import reactor
+
+
+class FakeMaster(object):
+
+    def __init__(self, options):
+        self.config = config.MasterConfig()
+        self.config.db['log_compression'] = options.compression
+        if options.cache_size is not None:
+            self.config.caches['logchunks'] = options.cache_size
+        self.caches = cache.CacheManager()
+        self.caches.config = self.config.caches
+
+
+class Connector(object):
+
+    def __init__(self, options, basedir):
+        self.master = FakeMaster(options)
+        engine = enginestrategy.create_engine(options.db_url, basedir=basedir)
+        self.pool = pool.DBThreadPool(engine)
+        self.model = model.Model(self)
+        self.logs = logs.LogsConnectorComponent(self)
+
+
+@defer.inlineCallbacks
+def setUp(db, options):
+    def thd(conn):
+        model.Model.metadata.drop_all(bind=conn)
+        model.Model.metadata.create_all(bind=conn)
+        conn.execute(db.model.logs.insert(),
+                     dict(id=1, name=u'stdio', slug=u'stdio', stepid=None,
+                          complete=0, num_lines=0, type=u's'))
+    yield db.pool.do(thd)
+
+    start = time.time()
+    batch = 10000
+    for first in xrange(0, options.lines, batch):
+        content = u''.join(
+            u'o[%7d] compiling src/module%d/file%d.c -O2 -Wall\n'
+            % (i, i % 97, i % 13)
+            for i in xrange(first, min(first + batch, options.lines)))
+        yield db.logs.appendLog(1, content)
+    yield db.logs.finishLog(1)
+    print "wrote %d lines in %.2fs" % (options.lines, time.time() - start)
+
+    if options.compression != 'raw':
+        start = time.time()
+        saved = yield db.logs.compressLog(1)
+        print "compressed with %s in %.2fs, saving %d bytes" % (
+            options.compression, time.time() - start, saved)
+
+
+@defer.inlineCallbacks
+def readWindows(db, options):
+    rnd = random.Random(options.seed)
+    start = time.time()
+    for _ in xrange(options.reads):
+        first = rnd.randrange(0, options.lines - options.window)
+        lines = yield db.logs.getLogLines(1, first, first + options.window - 1)
+        assert lines.count(u'\n') == options.window
+    elapsed = time.time() - start
+    print "read %d windows of %d lines in %.2fs (%.2fms per read)" % (
+        options.reads, options.window, elapsed,
+        elapsed * 1000 / options.reads)
+
+
+@defer.inlineCallbacks
+def main(options):
+    basedir = tempfile.mkdtemp()
+    db = Connector(options, basedir)
+    try:
+        yield setUp(db, options)
+        yield readWindows(db, options)
+    finally:
+        db.pool.shutdown()
+        shutil.rmtree(basedir)
+
+
+def run():
+    parser = optparse.OptionParser()
+    parser.add_option('--db-url', default='sqlite:///%(basedir)s/state.sqlite')
+    parser.add_option('--lines', type='int', default=1000000)
+    parser.add_option('--reads', type='int', default=1000)
+    parser.add_option('--window', type='int', default=100)
+    parser.add_option('--cache-size', type='int',
+                      help="size of the logchunks cache (default: as "
+                      "configured by default in a master)")
+    parser.add_option('--compression', default='raw',
+                      choices=sorted(logs.COMPRESSION_MODES))
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args()
+
+    result = []
+    d = main(options)
+    d.addErrback(result.append)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+    if result:
+        result[0].printTraceback()
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run()
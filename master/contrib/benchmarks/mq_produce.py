@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# usage: python mq_produce.py [options]
+#
+# Measures the cost of SimpleMQ.produce with many registered consumers, as on
+# a master with hundreds of websocket clients and schedulers.  Each consumer
+# watches a handful of specific builds, steps or logs, or a whole collection.
+# With --linear, the routing keys are matched against every filter in turn,
+# as SimpleMQ did before it used an index, for comparison.
+
+import optparse
+import random
+import time
+
+from buildbot.mq import simple
+from buildbot.util import tuplematch
+
+COLLECTIONS = [
+    ('builds', 'new'), ('builds', 'finished'),
+    ('steps', 'new'), ('steps', 'finished'),
+    ('logs', 'append'), ('logs', 'finished'),
+    ('buildrequests', 'new'), ('buildsets', 'complete'),
+]
+
+
+def makeFilter(rnd, options):
+    coll, event = rnd.choice(COLLECTIONS)
+    if rnd.random() < options.wildcard_fraction:
+        return (coll, None, event)
+    return (coll, str(rnd.randrange(options.ids)), event)
+
+
+def makeKey(rnd, options):
+    coll, event = rnd.choice(COLLECTIONS)
+    return (coll, str(rnd.randrange(options.ids)), event)
+
+
+def run():
+    parser = optparse.OptionParser()
+    parser.add_option('--subscriptions', type='int', default=10000)
+    parser.add_option('--messages', type='int', default=100000)
+    parser.add_option('--ids', type='int', default=5000,
+                      help="number of distinct object ids in routing keys")
+    parser.add_option('--wildcard-fraction', type='float', default=0.01,
+                      help="fraction of subscriptions to a whole collection")
+    parser.add_option('--linear', action='store_true', default=False)
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args()
+
+    rnd = random.Random(options.seed)
+    mq = simple.SimpleMQ(master=None)
+    delivered = [0]
+
+    def callback(routingKey, data):
+        delivered[0] += 1
+
+    filters = [makeFilter(rnd, options)
+               for _ in xrange(options.subscriptions)]
+    qrefs = [mq.startConsuming(callback, f).result for f in filters]
+    keys = [makeKey(rnd, options) for _ in xrange(options.messages)]
+
+    if options.linear:
+        def produce(routingKey, data):
+            for qref in qrefs:
+                if tuplematch.matchTuple(routingKey, qref.filter):
+                    qref.invoke(routingKey, data)
+    else:
+        produce = mq.produce
+
+    start = time.time()
+    for key in keys:
+        produce(key, None)
+    elapsed = time.time() - start
+    print "%d messages to %d subscriptions: %.2fs (%.1fus per message), " \
+        "%d deliveries" % (options.messages, options.subscriptions, elapsed,
+                           elapsed * 1e6 / options.messages, delivered[0])
+
+    start = time.time()
+    for qref in qrefs:
+        qref.stopConsuming()
+    print "stopped consuming in %.2fs" % (time.time() - start,)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+# usage: python update_compression.py [options] LOGFILE..
+#
+# Measures how much compressing command updates saves on the wire, and what
+# it costs, for real build output: give it the stdio of a few compile steps.
+# Each file is cut into updates of --chunk-size bytes, as RunProcess sends
+# them when a command writes output quickly (slow commands send smaller
+# updates), which go through a SlaveBuilder's compression and a
+# RemoteCommand's decompression, just as they would between a slave and the
+# master.  For comparison, the size of the updates when each is compressed
+# on its own, without the history of the stream, is shown too.  The
+# buildslave package must be importable, e.g. with PYTHONPATH=../slave.
+
+import optparse
+import time
+import zlib
+
+from buildbot.process import remotecommand
+from buildslave import bot
+from twisted.internet import defer
+
+
+class FakeStep(object):
+
+    def slaveVersionIsOlderThan(self, command, minversion):
+        return False
+
+
+class FakeConnection(object):
+
+    def remoteStartCommand(self, remoteCommand, builderName, commandId,
+                           commandName, args):
+        self.args = args
+        return defer.succeed(None)
+
+
+class FakeBuildSlave(object):
+
+    def messageReceivedFromSlave(self):
+        pass
+
+
+class FakeLog(object):
+
+    def __init__(self):
+        self.size = 0
+
+    def getName(self):
+        return 'stdio'
+
+    def addStdout(self, data):
+        self.size += len(data)
+
+
+class FakeRemoteStep(object):
+
+    """Deliver the slave's update batches to C{cmd}, timing how long the
+    master takes to handle them."""
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.wireSize = 0
+        self.elapsed = 0.0
+
+    def callRemote(self, method, updates):
+        for update, num in updates:
+            self.wireSize += len(update['stdout'])
+        start = time.time()
+        self.cmd.remote_update(updates)
+        self.elapsed += time.time() - start
+        return defer.succeed(0)
+
+
+def replay(data, options):
+    # the master asks the slave to compress, as it does for slaves that are
+    # recent enough
+    cmd = remotecommand.RemoteCommand('shell', {})
+    cmd.buildslave = FakeBuildSlave()
+    log = FakeLog()
+    cmd.useLog(log)
+    conn = FakeConnection()
+    cmd.run(FakeStep(), conn, 'builder')
+
+    sb = bot.SlaveBuilder('builder')
+    sb.startService()
+    # as SlaveBuilder.remote_startCommand does when asked to compress
+    if conn.args.get('update_compression') == 'zlib':
+        sb.updateCompressor = zlib.compressobj(options.level)
+    sb.remoteStep = FakeRemoteStep(cmd)
+
+    start = time.time()
+    for offset in xrange(0, len(data), options.chunk_size):
+        sb.sendUpdate({'stdout': data[offset:offset + options.chunk_size]})
+    total = time.time() - start
+    assert log.size == len(data)
+    return sb.remoteStep.wireSize, total - sb.remoteStep.elapsed, \
+        sb.remoteStep.elapsed
+
+
+def main(options, filenames):
+    totals = [0, 0, 0, 0.0, 0.0]
+    for filename in filenames:
+        data = open(filename, 'rb').read()
+        if not data:
+            continue
+        wire, slaveTime, masterTime = replay(data, options)
+        alone = sum(len(zlib.compress(data[offset:offset + options.chunk_size],
+                                      options.level))
+                    for offset in xrange(0, len(data), options.chunk_size))
+        for i, value in enumerate((len(data), wire, alone, slaveTime,
+                                   masterTime)):
+            totals[i] += value
+        print "%s: %d bytes, %d on the wire (%.1f%%), %d compressing " \
+            "updates alone (%.1f%%)" % (
+                filename, len(data), wire, 100.0 * wire / len(data), alone,
+                100.0 * alone / len(data))
+
+    raw, wire, alone, slaveTime, masterTime = totals
+    if not raw:
+        print "no output to compress"
+        return
+    print "total: %d bytes, %d on the wire, saving %d bytes (%.1f%%)" % (
+        raw, wire, raw - wire, 100.0 * (raw - wire) / raw)
+    print "updates compressed alone would save %d bytes (%.1f%%)" % (
+        raw - alone, 100.0 * (raw - alone) / raw)
+    mb = raw / 1048576.0
+    print "slave: %.2fs (%.1f MB/s); master: %.2fs (%.1f MB/s)" % (
+        slaveTime, mb / max(slaveTime, 1e-6), masterTime,
+        mb / max(masterTime, 1e-6))
+
+
+def run():
+    parser = optparse.OptionParser(usage="%prog [options] LOGFILE..")
+    parser.add_option('--chunk-size', type='int', default=64 * 1024,
+                      help="bytes of output in each update")
+    parser.add_option('--level', type='int', default=6,
+                      help="zlib compression level, as the slave's "
+                      "updateCompressionLevel")
+    options, args = parser.parse_args()
+    if not args:
+        parser.error("give one or more log files to compress")
+    main(options, args)
+
+if __name__ == '__main__':
+    run()
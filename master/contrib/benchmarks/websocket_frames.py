@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#
+# usage: python websocket_frames.py [options]
+#
+# Measures how fast the master unmasks and parses websocket frames sent by
+# browsers, for frames of 1KB, 64KB and 1MB arriving in --chunk byte reads.
+# With --old, frames are parsed as websocket.py did before it had an
+# incremental parser: the received data is appended to a buffer and the
+# whole buffer re-parsed after each read, and payloads are unmasked one byte
+# at a time.
+
+import optparse
+import os
+import time
+
+from buildbot.www import websocket
+
+SIZES = [1024, 64 * 1024, 1024 * 1024]
+
+
+def oldMask(buf, key):
+    key = [ord(i) for i in key]
+    buf = list(buf)
+    for i, char in enumerate(buf):
+        buf[i] = chr(ord(char) ^ key[i % 4])
+    return "".join(buf)
+
+
+class OldParser(object):
+
+    def __init__(self):
+        self.buf = ""
+
+    def feed(self, data):
+        self.buf += data
+        frames, self.buf = websocket.parse_hybi07_frames(self.buf)
+        return frames
+
+
+def maskedFrame(buf, key):
+    frame = websocket.make_hybi07_frame(buf)
+    header_length = len(frame) - len(buf)
+    return (frame[0] + chr(ord(frame[1]) | 0x80) + frame[2:header_length] +
+            key + websocket.mask(buf, key))
+
+
+def measure(size, options):
+    key = os.urandom(4)
+    payload = os.urandom(size)
+    frame = maskedFrame(payload, key)
+    count = max(1, options.bytes // size)
+    data = frame * count
+    reads = [data[i:i + options.chunk]
+             for i in xrange(0, len(data), options.chunk)]
+
+    parser = OldParser() if options.old else websocket.HyBi07FrameParser()
+    received = 0
+    start = time.time()
+    for read in reads:
+        for opcode, data in parser.feed(read):
+            received += 1
+    elapsed = time.time() - start
+    assert received == count, "parsed %d frames of %d" % (received, count)
+    print "%7d byte frames: parsed %d in %.3fs (%.1fMB/s)" % (
+        size, count, elapsed, count * size / elapsed / 1e6)
+
+
+def run():
+    parser = optparse.OptionParser()
+    parser.add_option('--bytes', type='int', default=16 * 1024 * 1024,
+                      help="total payload to parse for each frame size")
+    parser.add_option('--chunk', type='int', default=16 * 1024,
+                      help="size of each read from the connection")
+    parser.add_option('--old', action='store_true', default=False)
+    options, args = parser.parse_args()
+
+    if options.old:
+        websocket.mask = oldMask
+    for size in SIZES:
+        measure(size, options)
+
+if __name__ == '__main__':
+    run()
@@ -17,6 +17,7 @@ import os.path
 import signal
 import socket
 import sys
+import zlib
 
 from twisted.application import internet
 from twisted.application import service
@@ -62,9 +63,41 @@ class SlaveBuilder(pb.Referenceable, service.Service):
     # when the step is started
     remoteStep = None
 
+    # Status updates are sent to the master as soon as they are produced,
+    # unless earlier updates are still waiting to be acknowledged.  In that
+    # case, they are collected into a batch, which is sent when the master
+    # acknowledges an earlier batch, when it reaches updateBatchSize bytes,
+    # or after updateBatchDelay seconds.  At most maxUnackedBatches batches
+    # are sent without being acknowledged; when that many are outstanding,
+    # the producers of the updates (the running processes) are paused.
+    updateBatchSize = 64 * 1024
+    updateBatchDelay = 0.2
+    maxUnackedBatches = 8
+
+    # When the master asks for it, the strings in a command's updates are
+    # compressed with a zlib stream that lasts as long as the command.  Each
+    # string is flushed on its own, so that the master can decompress it as
+    # soon as it arrives, but it is compressed against all of the command's
+    # output before it, which is what makes compressing short chunks of
+    # repetitive build output worthwhile.  The strings are compressed in the
+    # order of compressedUpdateKeys, which the master decompresses them in.
+    updateCompressor = None
+    updateCompressionLevel = 6
+    compressedUpdateKeys = ('stdout', 'stderr', 'header', 'log')
+
+    # for scheduling future events
+    _reactor = reactor
+
     def __init__(self, name):
         # service.Service.__init__(self) # Service has no __init__ method
         self.setName(name)
+        self.pendingUpdates = []
+        self.pendingUpdatesSize = 0
+        self.unackedBatches = 0
+        self.updateBatchTimer = None
+        self.updatesFlushed = []
+        self.updateProducers = []
+        self.updateProducersPaused = False
 
     def __repr__(self):
         return "<SlaveBuilder '%s' at %d>" % (self.name, id(self))
@@ -88,6 +121,7 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         service.Service.stopService(self)
         if self.stopCommandOnShutdown:
             self.stopCommand()
+        self._discardUpdates()
 
     def activity(self):
         bot = self.parent
@@ -114,6 +148,7 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         self.remoteStep = None
         if self.stopCommandOnShutdown:
             self.stopCommand()
+        self._discardUpdates()
 
     # the following are Commands that can be invoked by the master-side
     # Builder
@@ -141,6 +176,12 @@ class SlaveBuilder(pb.Referenceable, service.Service):
             factory = registry.getFactory(command)
         except KeyError:
             raise UnknownCommand("unrecognized SlaveCommand '%s'" % command)
+        self.updateCompressor = None
+        if 'update_compression' in args:
+            args = args.copy()
+            if args.pop('update_compression') == 'zlib':
+                self.updateCompressor = zlib.compressobj(
+                    self.updateCompressionLevel)
         self.command = factory(self, stepId, args)
 
         log.msg(" startCommand:%s [id %s]" % (command, stepId))
@@ -190,11 +231,116 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         # master still expects to receive. Provide it to avoid significant
         # interoperability issues between new slaves and old masters.
         if self.remoteStep:
+            if self.updateCompressor:
+                data = self._compressUpdate(data)
             update = [data, 0]
-            updates = [update]
+            self.pendingUpdates.append(update)
+            self.pendingUpdatesSize += self._updateSize(data)
+            if (not self.unackedBatches
+                    or self.pendingUpdatesSize >= self.updateBatchSize):
+                self.sendUpdates()
+            elif not self.updateBatchTimer:
+                self.updateBatchTimer = self._reactor.callLater(
+                    self.updateBatchDelay, self.sendUpdates)
+
+    def _compressUpdate(self, data):
+        # unicode strings are left alone; the 'compressed' key lists the keys
+        # whose strings were compressed
+        compressed = []
+        data = data.copy()
+        for key in self.compressedUpdateKeys:
+            value = data.get(key)
+            if key == 'log' and value is not None:
+                name, value = value
+            if not isinstance(value, str):
+                continue
+            value = (self.updateCompressor.compress(value)
+                     + self.updateCompressor.flush(zlib.Z_SYNC_FLUSH))
+            if key == 'log':
+                value = (name, value)
+            data[key] = value
+            compressed.append(key)
+        if compressed:
+            data['compressed'] = compressed
+        return data
+
+    def _updateSize(self, data):
+        # an estimate of the size of an update, counting only its strings
+        size = 0
+        for value in data.itervalues():
+            if isinstance(value, (tuple, list)):
+                size += sum(len(v) for v in value if isinstance(v, str))
+            elif isinstance(value, str):
+                size += len(value)
+        return size
+
+    def sendUpdates(self):
+        """Send the pending status updates to the master as one batch, unless
+        too many batches are awaiting acknowledgement already."""
+        if self.updateBatchTimer:
+            if self.updateBatchTimer.active():
+                self.updateBatchTimer.cancel()
+            self.updateBatchTimer = None
+        if self.pendingUpdates and self.remoteStep \
+                and self.unackedBatches < self.maxUnackedBatches:
+            updates = self.pendingUpdates
+            self.pendingUpdates = []
+            self.pendingUpdatesSize = 0
+            self.unackedBatches += 1
             d = self.remoteStep.callRemote("update", updates)
             d.addCallback(self.ackUpdate)
             d.addErrback(self._ackFailed, "SlaveBuilder.sendUpdate")
+            d.addBoth(self._batchAcked)
+        self._checkUpdateProducers()
+        if not self.pendingUpdates:
+            waiters, self.updatesFlushed = self.updatesFlushed, []
+            for d in waiters:
+                d.callback(None)
+
+    def _batchAcked(self, _):
+        self.unackedBatches -= 1
+        self.sendUpdates()
+
+    def _checkUpdateProducers(self):
+        paused = self.unackedBatches >= self.maxUnackedBatches
+        if paused == self.updateProducersPaused:
+            return
+        self.updateProducersPaused = paused
+        if paused:
+            log.msg("%d update batches not yet acknowledged by the master; "
+                    "pausing" % (self.unackedBatches,))
+        for producer in self.updateProducers:
+            if paused:
+                producer.pauseProducing()
+            else:
+                producer.resumeProducing()
+
+    def _discardUpdates(self):
+        # the updates can no longer be delivered, so stop waiting for them;
+        # any batches in flight will fail when the connection is lost
+        self.pendingUpdates = []
+        self.pendingUpdatesSize = 0
+        self.sendUpdates()
+
+    def waitForUpdates(self):
+        """Return a Deferred that fires when all pending updates have been
+        sent to the master."""
+        if not self.pendingUpdates:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self.updatesFlushed.append(d)
+        return d
+
+    def registerUpdateProducer(self, producer):
+        """Register an L{IPushProducer} of status updates, which is paused
+        while the master is not keeping up with them."""
+        self.updateProducers.append(producer)
+        if self.updateProducersPaused:
+            producer.pauseProducing()
+
+    def unregisterUpdateProducer(self, producer):
+        if producer in self.updateProducers:
+            self.updateProducers.remove(producer)
 
     def ackUpdate(self, acknum):
         self.activity()  # update the "last activity" timer
@@ -222,6 +368,12 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         if not self.running:
             log.msg(" but we weren't running, quitting silently")
             return
+        if self.remoteStep:
+            # the master must see all of the updates before the completion
+            d = self.waitForUpdates()
+            d.addCallback(lambda _: self.sendComplete(failure))
+
+    def sendComplete(self, failure):
         if self.remoteStep:
             self.remoteStep.dontNotifyOnDisconnect(self.lostRemoteStep)
             d = self.remoteStep.callRemote("complete", failure)
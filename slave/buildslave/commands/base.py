@@ -37,7 +37,7 @@ from buildslave.interfaces import ISlaveCommand
 # this used to be a CVS $-style "Revision" auto-updated keyword, but since I
 # moved to Darcs as the primary repository, this is updated manually each
 # time this file is changed. The last cvs_ver that was here was 1.51 .
-command_version = "2.16"
+command_version = "2.19"
 
 # version history:
 #  >=1.17: commands are interruptable
@@ -71,6 +71,10 @@ command_version = "2.16"
 #  >= 2.15: 'interruptSignal' option is added to SlaveShellCommand
 #  >= 2.16: 'sigtermTime' option is added to SlaveShellCommand
 #  >= 2.17: listdir command added to read a directory
+#  >= 2.18: uploadFile, uploadDirectory and downloadFile accept 'window',
+#           the number of blocks to keep in flight
+#  >= 2.19: all commands accept 'update_compression', and compress the
+#           strings in their updates with it
 
 
 class Command:
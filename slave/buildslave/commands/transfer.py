@@ -15,9 +15,11 @@
 
 import os
 import tarfile
-import tempfile
+
+from collections import deque
 
 from twisted.internet import defer
+from twisted.python import failure
 from twisted.python import log
 
 from buildslave.commands.base import Command
@@ -60,6 +62,7 @@ class SlaveFileUploadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['keepstamp']: whether to preserve file modified and accessed times
+        - ['window']:    number of blocks to keep in flight (default 1)
     """
     debug = False
     requiredArgs = ['workdir', 'slavesrc', 'writer', 'blocksize']
@@ -71,6 +74,7 @@ class SlaveFileUploadCommand(TransferCommand):
         self.remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.keepstamp = args.get('keepstamp', False)
+        self.window = args.get('window', 1)
         self.stderr = None
         self.rc = 0
 
@@ -131,18 +135,56 @@ class SlaveFileUploadCommand(TransferCommand):
         return d
 
     def _loop(self, fire_when_done):
-        d = defer.maybeDeferred(self._writeBlock)
+        # keep up to self.window writes in flight.  PB delivers them to the
+        # writer in order, so only the last one needs to finish before the
+        # file is closed.
+        self._fire_when_done = fire_when_done
+        self._inflight = 0
+        self._eof = False
+        self._failure = None
+        self._filling = False
+        self._fillWindow()
+        return None
 
-        def _done(finished):
-            if finished:
-                fire_when_done.callback(None)
+    def _fillWindow(self):
+        if self._filling:
+            # a write finished synchronously; the loop below will carry on
+            return
+        self._filling = True
+        try:
+            while (self._inflight < self.window and not self._eof
+                   and self._failure is None):
+                try:
+                    d = self._writeBlock()
+                except Exception:
+                    self._failure = failure.Failure()
+                    break
+                if d is True:
+                    self._eof = True
+                    break
+                self._inflight += 1
+                d.addCallbacks(self._writeDone, self._writeFailed)
+        finally:
+            self._filling = False
+
+        if self._inflight == 0 and (self._eof or self._failure is not None):
+            fire_when_done, self._fire_when_done = self._fire_when_done, None
+            if fire_when_done is None:
+                return
+            if self._failure is not None:
+                fire_when_done.errback(self._failure)
             else:
-                self._loop(fire_when_done)
+                fire_when_done.callback(None)
 
-        def _err(why):
-            fire_when_done.errback(why)
-        d.addCallbacks(_done, _err)
-        return None
+    def _writeDone(self, res):
+        self._inflight -= 1
+        self._fillWindow()
+
+    def _writeFailed(self, why):
+        self._inflight -= 1
+        if self._failure is None:
+            self._failure = why
+        self._fillWindow()
 
     def _writeBlock(self):
         """Write a block of data to the remote writer"""
@@ -180,6 +222,94 @@ class SlaveFileUploadCommand(TransferCommand):
         return d
 
 
+class _TarStream(object):
+
+    """
+    A file-like object that reads as a tar archive of L{path}, compressed
+    with L{compress}.  The archive is produced as it is read, so it is never
+    written out in full.
+    """
+
+    chunksize = 64 * 1024
+
+    def __init__(self, path, compress):
+        if compress == 'bz2':
+            mode = 'w|bz2'
+        elif compress == 'gz':
+            mode = 'w|gz'
+        else:
+            mode = 'w|'
+        self.output = []
+        self.buffered = 0
+        self.archive = tarfile.open(mode=mode, fileobj=self)
+        # check the path now, so a missing directory fails the command
+        # before anything is sent
+        os.lstat(path)
+        self.members = self._generate(path)
+
+    def write(self, data):
+        # called by the tarfile
+        self.output.append(data)
+        self.buffered += len(data)
+
+    def read(self, length):
+        while self.buffered < length and self.members is not None:
+            try:
+                self.members.next()
+            except StopIteration:
+                self.members = None
+        data = ''.join(self.output)
+        self.output = [data[length:]]
+        self.buffered = len(self.output[0])
+        return data[:length]
+
+    def close(self):
+        if self.members is not None:
+            self.members.close()
+            self.members = None
+
+    def _generate(self, path):
+        archive = self.archive
+        for tarinfo, filename in self._walk(path, ''):
+            archive.addfile(tarinfo)
+            if tarinfo.isreg():
+                # add the contents a chunk at a time, yielding in between,
+                # as TarFile.addfile would in one go
+                fp = open(filename, 'rb')
+                try:
+                    remaining = tarinfo.size
+                    while remaining:
+                        data = fp.read(min(remaining, self.chunksize))
+                        if not data:
+                            raise IOError("end of file reached")
+                        archive.fileobj.write(data)
+                        remaining -= len(data)
+                        yield
+                finally:
+                    fp.close()
+                blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+                if remainder:
+                    archive.fileobj.write(
+                        tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+                    blocks += 1
+                archive.offset += blocks * tarfile.BLOCKSIZE
+            yield
+        archive.close()
+
+    def _walk(self, path, arcname):
+        # yield (tarinfo, filename) in the order TarFile.add would add them
+        tarinfo = self.archive.gettarinfo(path, arcname)
+        if tarinfo is None:
+            # sockets and the like can't be archived
+            return
+        yield tarinfo, path
+        if tarinfo.isdir():
+            for name in sorted(os.listdir(path)):
+                for member in self._walk(os.path.join(path, name),
+                                         os.path.join(arcname, name)):
+                    yield member
+
+
 class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
     debug = False
     requiredArgs = ['workdir', 'slavesrc', 'writer', 'blocksize']
@@ -191,6 +321,7 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         self.remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.compress = args['compress']
+        self.window = args.get('window', 1)
         self.stderr = None
         self.rc = 0
 
@@ -204,22 +335,8 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         if self.debug:
             log.msg("path: %r" % self.path)
 
-        # Create temporary archive
-        fd, self.tarname = tempfile.mkstemp()
-        fileobj = os.fdopen(fd, 'w')
-        if self.compress == 'bz2':
-            mode = 'w|bz2'
-        elif self.compress == 'gz':
-            mode = 'w|gz'
-        else:
-            mode = 'w'
-        archive = tarfile.open(name=self.tarname, mode=mode, fileobj=fileobj)
-        archive.add(self.path, '')
-        archive.close()
-        fileobj.close()
-
-        # Transfer it
-        self.fp = open(self.tarname, 'rb')
+        # Archive the directory as it is transferred
+        self.fp = _TarStream(self.path, self.compress)
 
         self.sendStatus({'header': "sending %s" % self.path})
 
@@ -241,7 +358,6 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
 
     def finished(self, res):
         self.fp.close()
-        os.remove(self.tarname)
         return TransferCommand.finished(self, res)
 
 
@@ -257,6 +373,7 @@ class SlaveFileDownloadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['mode']:      access mode for the new file
+        - ['window']:    number of blocks to keep in flight (default 1)
     """
     debug = False
     requiredArgs = ['workdir', 'slavedest', 'reader', 'blocksize']
@@ -268,6 +385,7 @@ class SlaveFileDownloadCommand(TransferCommand):
         self.bytes_remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.mode = args['mode']
+        self.window = args.get('window', 1)
         self.stderr = None
         self.rc = 0
 
@@ -319,18 +437,70 @@ class SlaveFileDownloadCommand(TransferCommand):
         return d
 
     def _loop(self, fire_when_done):
-        d = defer.maybeDeferred(self._readBlock)
+        # keep up to self.window reads in flight.  Each is a [length, data,
+        # done] list, kept in request order so that the data is written in
+        # order whatever order the replies arrive in.
+        self._fire_when_done = fire_when_done
+        self._pending = deque()
+        self._requested = 0
+        self._eof = False
+        self._failure = None
+        self._filling = False
+        self._fillWindow()
+        return None
 
-        def _done(finished):
-            if finished:
-                fire_when_done.callback(None)
+    def _fillWindow(self):
+        if self._filling:
+            # a read finished synchronously; the loop below will carry on
+            return
+        self._filling = True
+        try:
+            while (len(self._pending) < self.window and not self._eof
+                   and self._failure is None):
+                try:
+                    finished = self._readBlock()
+                except Exception:
+                    self._failure = failure.Failure()
+                    break
+                if finished is None:
+                    # maxsize is taken up by reads already in flight
+                    break
+                if finished:
+                    self._eof = True
+        finally:
+            self._filling = False
+
+        if not self._pending and (self._eof or self._failure is not None):
+            fire_when_done, self._fire_when_done = self._fire_when_done, None
+            if fire_when_done is None:
+                return
+            if self._failure is not None:
+                fire_when_done.errback(self._failure)
             else:
-                self._loop(fire_when_done)
+                fire_when_done.callback(None)
 
-        def _err(why):
-            fire_when_done.errback(why)
-        d.addCallbacks(_done, _err)
-        return None
+    def _readDone(self, data, read):
+        read[1:] = [data, True]
+        self._flushReads()
+
+    def _readFailed(self, why, read):
+        read[2] = True
+        if self._failure is None:
+            self._failure = why
+        self._flushReads()
+
+    def _flushReads(self):
+        while self._pending and self._pending[0][2]:
+            length, data, done = self._pending.popleft()
+            self._requested -= length
+            if self._eof or self._failure is not None or data is None:
+                continue
+            try:
+                if self._writeData(data):
+                    self._eof = True
+            except Exception:
+                self._failure = failure.Failure()
+        self._fillWindow()
 
     def _readBlock(self):
         """Read a block of data from the remote reader."""
@@ -341,19 +511,27 @@ class SlaveFileDownloadCommand(TransferCommand):
             return True
 
         length = self.blocksize
-        if self.bytes_remaining is not None and length > self.bytes_remaining:
-            length = self.bytes_remaining
+        if self.bytes_remaining is not None:
+            available = self.bytes_remaining - self._requested
+            if length > available:
+                length = available
 
         if length <= 0:
+            if self._pending:
+                return None
             if self.stderr is None:
                 self.stderr = "Maximum filesize reached, truncating file '%s'" \
                     % self.path
                 self.rc = 1
             return True
         else:
+            self._requested += length
+            read = [length, None, False]
+            self._pending.append(read)
             d = self.reader.callRemote('read', length)
-            d.addCallback(self._writeData)
-            return d
+            d.addCallbacks(self._readDone, self._readFailed,
+                           callbackArgs=(read,), errbackArgs=(read,))
+            return False
 
     def _writeData(self, data):
         if self.debug:
@@ -34,6 +34,7 @@ from twisted.internet import error
 from twisted.internet import protocol
 from twisted.internet import reactor
 from twisted.internet import task
+from twisted.python import filepath
 from twisted.python import log
 from twisted.python import runtime
 from twisted.python.win32 import quoteArguments
@@ -44,6 +45,13 @@ from buildslave.exceptions import AbandonChain
 if runtime.platformType == 'posix':
     from twisted.internet.process import Process
 
+# inotify needs Linux, ctypes and Twisted-10.0 or later; without it, logfiles
+# are polled
+try:
+    from twisted.internet import inotify
+except ImportError:
+    inotify = None
+
 
 def win32_batch_quote(cmd_list):
     # Quote cmd_list to a string that is suitable for inclusion in a
@@ -86,13 +94,107 @@ def shell_quote(cmd_list):
         return " ".join([quote(e) for e in cmd_list])
 
 
+class LogFileNotifier(object):
+
+    """
+    Tells L{LogFileWatcher}s when their logfiles may have changed, using a
+    single inotify instance, with one watch on each directory that holds a
+    watched logfile; directories are watched rather than the logfiles, as a
+    logfile may not exist yet, or may be deleted and created again.  The
+    notifier is created when the first logfile is watched, and closed when
+    the last one no longer is, so that nothing is left open between builds.
+    """
+
+    MASK = 0
+    if inotify is not None:
+        MASK = (inotify.IN_CREATE | inotify.IN_MODIFY | inotify.IN_CLOSE_WRITE
+                | inotify.IN_MOVED_TO | inotify.IN_DELETE)
+
+    def __init__(self, reactor=reactor):
+        self.inotify = inotify.INotify(reactor)
+        self.inotify.startReading()
+        # directory -> list of LogFileWatchers of logfiles in it
+        self.watchers = {}
+
+    def add(self, watcher):
+        """Start telling C{watcher} about changes to its logfile, and return
+        True, or return False if its directory cannot be watched."""
+        dirname = os.path.dirname(watcher.logfile)
+        if dirname not in self.watchers:
+            try:
+                self.inotify.watch(filepath.FilePath(dirname), self.MASK,
+                                   callbacks=[self._notify])
+            except inotify.INotifyError:
+                # the directory does not exist, or there are too many watches
+                if not self.watchers:
+                    self.close()
+                return False
+            self.watchers[dirname] = []
+        self.watchers[dirname].append(watcher)
+        return True
+
+    def remove(self, watcher):
+        dirname = os.path.dirname(watcher.logfile)
+        watchers = self.watchers.get(dirname, [])
+        if watcher in watchers:
+            watchers.remove(watcher)
+            if not watchers:
+                del self.watchers[dirname]
+                self.inotify.ignore(filepath.FilePath(dirname))
+        if not self.watchers:
+            self.close()
+
+    def close(self):
+        global _logFileNotifier
+        if _logFileNotifier is self:
+            _logFileNotifier = None
+        self.inotify.loseConnection()
+
+    def _notify(self, ignored, path, mask):
+        if mask & inotify.IN_DELETE_SELF:
+            # the directory itself is gone, and so is its watch
+            for watcher in self.watchers.pop(path.path, []):
+                watcher.notifierLost()
+            if not self.watchers:
+                self.close()
+            return
+        for watcher in self.watchers.get(path.dirname(), []):
+            if watcher.logfile == path.path:
+                watcher.changed()
+
+_logFileNotifier = None
+
+
+def getLogFileNotifier():
+    """Return the L{LogFileNotifier}, creating it if necessary, or None if
+    inotify is not available."""
+    global _logFileNotifier
+    if _logFileNotifier is None and inotify is not None:
+        try:
+            _logFileNotifier = LogFileNotifier()
+        except inotify.INotifyError:
+            log.msg("inotify is not available; polling logfiles")
+    return _logFileNotifier
+
+
 class LogFileWatcher:
+
+    """
+    Sends the contents of a logfile that a command writes to the master as
+    it grows.  Where inotify is available, the logfile is read when it
+    changes; otherwise, or until its directory exists, it is polled every
+    C{POLL_INTERVAL} seconds.  Reads start at C{MIN_READ_SIZE} bytes, and
+    double while the file has more to give, up to C{MAX_READ_SIZE}.
+    """
+
     POLL_INTERVAL = 2
+    MIN_READ_SIZE = 16 * 1024
+    MAX_READ_SIZE = 1024 * 1024
 
     def __init__(self, command, name, logfile, follow=False):
         self.command = command
         self.name = name
-        self.logfile = logfile
+        self.logfile = os.path.abspath(logfile)
 
         log.msg("LogFileWatcher created to watch %s" % logfile)
         # we are created before the ShellCommand starts. If the logfile we're
@@ -100,24 +202,75 @@ class LogFileWatcher:
         # ctime/mtime so we can tell when it starts to change.
         self.old_logfile_stats = self.statFile()
         self.started = False
+        self.readSize = self.MIN_READ_SIZE
 
         # follow the file, only sending back lines
         # added since we started watching
         self.follow = follow
 
-        # every 2 seconds we check on the file again
-        self.poller = task.LoopingCall(self.poll)
+        # the LogFileNotifier that tells us about changes, if any
+        self.notifier = None
+        self.pendingPoll = None
+        self._reactor = reactor
+
+        # otherwise, every 2 seconds we check on the file again
+        self.poller = task.LoopingCall(self._pollAndWatch)
 
     def start(self):
-        self.poller.start(self.POLL_INTERVAL).addErrback(self._cleanupPoll)
+        if self._watch():
+            # catch up with anything written before the watch was added
+            self.poll()
+        else:
+            self._startPolling()
+
+    def _startPolling(self):
+        d = self.poller.start(self.POLL_INTERVAL)
+        d.addErrback(self._cleanupPoll)
 
     def _cleanupPoll(self, err):
         log.err(err, msg="Polling error")
         self.poller = None
 
+    def _watch(self):
+        notifier = getLogFileNotifier()
+        if notifier is None or not notifier.add(self):
+            return False
+        self.notifier = notifier
+        return True
+
+    def _pollAndWatch(self):
+        # switch to notifications once the logfile's directory exists
+        if self._watch():
+            self.poller.stop()
+        self.poll()
+
+    def changed(self):
+        """Called by the notifier when the logfile may have changed; the
+        notifications of a burst of writes are handled with a single
+        poll."""
+        if not self.pendingPoll:
+            self.pendingPoll = self._reactor.callLater(0, self._changed)
+
+    def _changed(self):
+        self.pendingPoll = None
+        self.poll()
+
+    def notifierLost(self):
+        """Called by the notifier when the logfile's directory was deleted,
+        and it can no longer tell us about changes."""
+        self.notifier = None
+        self.poll()
+        self._startPolling()
+
     def stop(self):
         self.poll()
-        if self.poller is not None:
+        if self.notifier is not None:
+            self.notifier.remove(self)
+            self.notifier = None
+        if self.pendingPoll:
+            self.pendingPoll.cancel()
+            self.pendingPoll = None
+        if self.poller is not None and self.poller.running:
             self.poller.stop()
         if self.started:
             self.f.close()
@@ -148,10 +301,16 @@ class LogFileWatcher:
             self.started = True
         self.f.seek(self.f.tell(), 0)
         while True:
-            data = self.f.read(10000)
+            data = self.f.read(self.readSize)
             if not data:
                 return
             self.command.addLogfile(self.name, data)
+            # read more at once while the file keeps filling our reads, and
+            # less again once it is keeping up with the writer
+            if len(data) == self.readSize:
+                self.readSize = min(self.readSize * 2, self.MAX_READ_SIZE)
+            else:
+                self.readSize = max(self.readSize // 2, self.MIN_READ_SIZE)
 
 
 if runtime.platformType == 'posix':
@@ -359,6 +518,8 @@ class RunProcess:
         self.logEnviron = logEnviron
         self.timeout = timeout
         self.ioTimeoutTimer = None
+        self.ioTimeoutPaused = False
+        self.paused = False
         self.sigtermTime = sigtermTime
         self.maxTime = maxTime
         self.maxTimeoutTimer = None
@@ -560,6 +721,10 @@ class RunProcess:
         for w in self.logFileWatchers:
             w.start()
 
+        # stop reading the process's output while the master is not keeping
+        # up with the updates already sent
+        self.builder.registerUpdateProducer(self)
+
     def _spawnProcess(self, processProtocol, executable, args=(), env={},
                       path=None, uid=None, gid=None, usePTY=False, childFDs=None):
         """private implementation of reactor.spawnProcess, to allow use of
@@ -736,6 +901,7 @@ class RunProcess:
             self.ioTimeoutTimer.reset(self.timeout)
 
     def finished(self, sig, rc):
+        self._unregisterProducer()
         self.elapsedTime = util.now(self._reactor) - self.startTime
         log.msg("command finished with signal %s, exit code %s, elapsedTime: %0.6f" % (sig, rc, self.elapsedTime))
         for w in self.logFileWatchers:
@@ -759,6 +925,7 @@ class RunProcess:
             log.msg("Hey, command %s finished twice" % self)
 
     def failed(self, why):
+        self._unregisterProducer()
         self._sendBuffers()
         log.msg("RunProcess.failed: command failed: %s" % (why,))
         self._cancelTimers()
@@ -769,6 +936,37 @@ class RunProcess:
         else:
             log.msg("Hey, command %s finished twice" % self)
 
+    # IPushProducer, registered with the builder
+
+    def pauseProducing(self):
+        if self.paused:
+            return
+        self.paused = True
+        self.process.pauseProducing()
+        # time spent paused is not silence from the process
+        if self.ioTimeoutTimer:
+            self.ioTimeoutTimer.cancel()
+            self.ioTimeoutTimer = None
+            self.ioTimeoutPaused = True
+
+    def resumeProducing(self):
+        if not self.paused:
+            return
+        self.paused = False
+        self.process.resumeProducing()
+        if self.ioTimeoutPaused:
+            self.ioTimeoutPaused = False
+            self.ioTimeoutTimer = self._reactor.callLater(self.timeout,
+                                                          self.doTimeout)
+
+    def stopProducing(self):
+        pass
+
+    def _unregisterProducer(self):
+        self.builder.unregisterUpdateProducer(self)
+        self.resumeProducing()
+        self.ioTimeoutPaused = False
+
     def doTimeout(self):
         self.ioTimeoutTimer = None
         msg = "command timed out: %d seconds without output running %s" % (self.timeout, self.fake_command)
@@ -874,6 +1072,8 @@ class RunProcess:
     def kill(self, msg):
         # This may be called by the timeout, or when the user has decided to
         # abort this build.
+        # Keep reading the output, or the process's end would not be seen
+        self._unregisterProducer()
         self._sendBuffers()
         self._cancelTimers()
         msg += ", attempting to kill"
@@ -36,5 +36,11 @@ class FakeSlaveBuilder:
             print "FakeSlaveBuilder.sendUpdate", data
         self.updates.append(data)
 
+    def registerUpdateProducer(self, producer):
+        pass
+
+    def unregisterUpdateProducer(self, producer):
+        pass
+
     def show(self):
         return pprint.pformat(self.updates)
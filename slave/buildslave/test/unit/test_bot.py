@@ -16,6 +16,7 @@
 import mock
 import os
 import shutil
+import zlib
 
 from twisted.internet import defer
 from twisted.internet import reactor
@@ -291,6 +292,35 @@ class TestSlaveBuilder(command.CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_startCommand_update_compression(self):
+        st = FakeStep()
+        self.patch_runprocess(
+            Expect(['echo', 'hello'], os.path.join(self.basedir, 'sb', 'workdir'))
+            + {'stdout': 'hello\n'} + {'stdout': 'hello\n'} + {'rc': 0}
+            + 0,
+        )
+
+        d = self.sb.callRemote("startCommand", FakeRemote(st), "13", "shell",
+                               dict(command=['echo', 'hello'],
+                                    workdir='workdir',
+                                    update_compression='zlib'))
+        d.addCallback(lambda _: st.wait_for_finish())
+
+        def check(_):
+            updates = [a[1][0][0] for a in st.actions if a[0] == 'update']
+            self.assertEqual([u.get('compressed') for u in updates],
+                             [['stdout'], ['stdout'], None, None])
+            # the second string is compressed against the first
+            decompressor = zlib.decompressobj()
+            self.assertEqual(
+                [decompressor.decompress(u['stdout']) for u in updates[:2]],
+                ['hello\n', 'hello\n'])
+            self.assertTrue(len(updates[1]['stdout'])
+                            < len(updates[0]['stdout']))
+            self.assertEqual(updates[2], {'rc': 0})
+        d.addCallback(check)
+        return d
+
     def test_startCommand_interruptCommand(self):
         # set up a fake step to receive updates
         st = FakeStep()
@@ -381,6 +411,138 @@ class TestSlaveBuilder(command.CommandTestMixin, unittest.TestCase):
         return d
 
 
+class TestSlaveBuilderUpdates(unittest.TestCase):
+
+    def setUp(self):
+        self.sb = bot.SlaveBuilder('sb')
+        self.sb.startService()
+        self.sb._reactor = self.clock = task.Clock()
+        self.sb.maxUnackedBatches = 2
+        self.sb.updateBatchSize = 100
+        self.calls = []
+        self.sb.remoteStep = mock.Mock(name='remoteStep')
+        self.sb.remoteStep.callRemote = self.callRemote
+        self.producer = mock.Mock(name='producer')
+        self.sb.registerUpdateProducer(self.producer)
+
+    def callRemote(self, method, *args):
+        d = defer.Deferred()
+        self.calls.append((method, args, d))
+        return d
+
+    def ack(self, i=0):
+        self.calls[i][2].callback(0)
+
+    def assertCalls(self, expected):
+        self.assertEqual([(method, args) for method, args, d in self.calls],
+                         expected)
+
+    def test_first_update_immediate(self):
+        self.sb.sendUpdate({'stdout': 'hello'})
+        self.assertCalls([('update', ([[{'stdout': 'hello'}, 0]],))])
+
+    def test_batched_until_ack(self):
+        self.sb.sendUpdate({'stdout': 'a'})
+        self.sb.sendUpdate({'stdout': 'b'})
+        self.sb.sendUpdate({'rc': 0})
+        self.assertEqual(len(self.calls), 1)
+        self.ack()
+        self.assertCalls([
+            ('update', ([[{'stdout': 'a'}, 0]],)),
+            ('update', ([[{'stdout': 'b'}, 0], [{'rc': 0}, 0]],)),
+        ])
+
+    def test_batch_size(self):
+        self.sb.sendUpdate({'stdout': 'a'})
+        self.sb.sendUpdate({'stdout': 'b' * 60})
+        self.assertEqual(len(self.calls), 1)
+        self.sb.sendUpdate({'log': ('l', 'c' * 60)})
+        self.assertCalls([
+            ('update', ([[{'stdout': 'a'}, 0]],)),
+            ('update', ([[{'stdout': 'b' * 60}, 0],
+                         [{'log': ('l', 'c' * 60)}, 0]],)),
+        ])
+
+    def test_batch_delay(self):
+        self.sb.sendUpdate({'stdout': 'a'})
+        self.sb.sendUpdate({'stdout': 'b'})
+        self.clock.advance(self.sb.updateBatchDelay)
+        self.assertCalls([
+            ('update', ([[{'stdout': 'a'}, 0]],)),
+            ('update', ([[{'stdout': 'b'}, 0]],)),
+        ])
+
+    def test_window(self):
+        self.sb.sendUpdate({'stdout': 'a'})
+        self.assertFalse(self.producer.pauseProducing.called)
+        self.sb.sendUpdate({'stdout': 'b' * 100})
+        self.producer.pauseProducing.assert_called_with()
+        # window is full, so this waits for an ack, even if it is large
+        self.sb.sendUpdate({'stdout': 'c' * 100})
+        self.clock.advance(self.sb.updateBatchDelay)
+        self.assertEqual(len(self.calls), 2)
+
+        # a producer registered now is paused, too
+        producer = mock.Mock(name='producer2')
+        self.sb.registerUpdateProducer(producer)
+        producer.pauseProducing.assert_called_with()
+
+        self.ack(0)
+        self.assertEqual(len(self.calls), 3)
+        self.assertFalse(self.producer.resumeProducing.called)
+        self.ack(1)
+        self.producer.resumeProducing.assert_called_with()
+        producer.resumeProducing.assert_called_with()
+
+    def test_compressed(self):
+        self.sb.updateCompressor = zlib.compressobj()
+        self.sb.sendUpdate({'header': 'headers', 'stdout': 'out',
+                            'stderr': u'unicode'})
+        self.sb.sendUpdate({'log': ('l', 'log data'), 'rc': 0})
+        self.ack()
+        (data1, _), (data2, _) = [u for method, args, d in self.calls
+                                  for u in args[0]]
+        self.assertEqual(data1['compressed'], ['stdout', 'header'])
+        self.assertEqual(data1['stderr'], u'unicode')
+        self.assertEqual(data2['compressed'], ['log'])
+        self.assertEqual(data2['rc'], 0)
+        decompressor = zlib.decompressobj()
+        self.assertEqual([decompressor.decompress(data1['stdout']),
+                          decompressor.decompress(data1['header']),
+                          decompressor.decompress(data2['log'][1])],
+                         ['out', 'headers', 'log data'])
+        self.assertEqual(data2['log'][0], 'l')
+
+    def test_ack_failure(self):
+        self.patch(log, 'err', lambda f: None)
+        self.sb.sendUpdate({'stdout': 'a'})
+        self.sb.sendUpdate({'stdout': 'b'})
+        self.calls[0][2].errback(failure.Failure(RuntimeError('oops')))
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.sb.unackedBatches, 1)
+
+    def test_complete_after_updates(self):
+        self.sb.sendUpdate({'stdout': 'a'})
+        self.sb.sendUpdate({'rc': 0})
+        self.sb.commandComplete(None)
+        self.assertEqual(len(self.calls), 1)
+        self.ack()
+        self.assertCalls([
+            ('update', ([[{'stdout': 'a'}, 0]],)),
+            ('update', ([[{'rc': 0}, 0]],)),
+            ('complete', (None,)),
+        ])
+        self.assertEqual(self.sb.remoteStep, None)
+
+    def test_lostRemoteStep(self):
+        self.sb.sendUpdate({'stdout': 'a'})
+        self.sb.sendUpdate({'stdout': 'b'})
+        self.sb.lostRemoteStep(None)
+        self.clock.advance(self.sb.updateBatchDelay)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.sb.pendingUpdates, [])
+
+
 class TestBotFactory(unittest.TestCase):
 
     def setUp(self):
@@ -43,9 +43,13 @@ class FakeMasterMethods(object):
         self.count_writes = False
         self.keep_data = False
         self.write_out_of_space_at = None
+        self.writes_in_flight = 0
+        self.max_writes_in_flight = 0
 
         self.delay_read = False
         self.count_reads = False
+        self.reverse_reads = None
+        self.pending_reads = []
 
         self.unpack_fail = False
 
@@ -69,7 +73,14 @@ class FakeMasterMethods(object):
             self.data += data
 
         if self.delay_write:
+            self.writes_in_flight += 1
+            self.max_writes_in_flight = max(self.max_writes_in_flight,
+                                            self.writes_in_flight)
             d = defer.Deferred()
+
+            @d.addCallback
+            def written(_):
+                self.writes_in_flight -= 1
             reactor.callLater(0.01, d.callback, None)
             return d
 
@@ -80,6 +91,17 @@ class FakeMasterMethods(object):
             self.add_update('read(s)')
             self.read = True
 
+        if self.reverse_reads:
+            # answer each batch of reverse_reads reads in reverse order
+            slice, self.data = self.data[:length], self.data[length:]
+            d = defer.Deferred()
+            self.pending_reads.append((d, slice))
+            if len(self.pending_reads) == self.reverse_reads:
+                pending, self.pending_reads = self.pending_reads, []
+                for read_d, read_slice in reversed(pending):
+                    read_d.callback(read_slice)
+            return d
+
         if not self.data:
             return ''
 
@@ -280,6 +302,61 @@ class TestUploadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_window(self):
+        self.fakemaster.count_writes = True    # get actual byte counts
+        self.fakemaster.keep_data = True
+        self.fakemaster.delay_write = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=64,
+            keepstamp=False,
+            window=3,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                {'header': 'sending %s' % self.datafile},
+                'write 64', 'write 64', 'write 52', 'close',
+                {'rc': 0}
+            ])
+            self.assertEqual(self.fakemaster.max_writes_in_flight, 3)
+            self.assertEqual(self.fakemaster.data,
+                             "this is some data\n" * 10)
+        d.addCallback(check)
+        return d
+
+    def test_window_out_of_space(self):
+        self.fakemaster.write_out_of_space_at = 70
+        self.fakemaster.count_writes = True    # get actual byte counts
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=64,
+            keepstamp=False,
+            window=4,
+        ))
+
+        d = self.run_command()
+        self.assertFailure(d, RuntimeError)
+
+        def check(_):
+            self.assertUpdates([
+                {'header': 'sending %s' % self.datafile},
+                'write 64', 'close',
+                {'rc': 1}
+            ])
+        d.addCallback(check)
+        return d
+
 
 class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
 
@@ -374,10 +451,86 @@ class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
 
         return d
 
+    def test_streamed(self):
+        self.patch(transfer._TarStream, 'chunksize', 100)
+        self.fakemaster.keep_data = True
+        self.fakemaster.count_writes = True
+        open(os.path.join(self.datadir, "cc"), "wb").write(os.urandom(5000))
+
+        self.make_command(transfer.SlaveDirectoryUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=512,
+            compress='gz',
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            f = StringIO.StringIO(self.fakemaster.data)
+            a = tarfile.open(fileobj=f, mode='r|gz')
+            contents = dict((m.name, a.extractfile(m).read())
+                            for m in a if m.isreg())
+            self.assertEqual(contents, {
+                'aa': "lots of a" * 100,
+                'bb': "and a little b" * 17,
+                'cc': open(os.path.join(self.datadir, "cc"), "rb").read(),
+            })
+        d.addCallback(check)
+        return d
+
     # this is just a subclass of SlaveUpload, so the remaining permutations
     # are already tested
 
 
+class TestTarStream(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = os.path.abspath('tarstream')
+        if os.path.exists(self.datadir):
+            shutil.rmtree(self.datadir)
+        os.makedirs(os.path.join(self.datadir, 'sub'))
+        for name in 'abc':
+            open(os.path.join(self.datadir, 'sub', name), "wb").write(
+                name * 100000)
+
+    def tearDown(self):
+        if os.path.exists(self.datadir):
+            shutil.rmtree(self.datadir)
+
+    def test_lazy(self):
+        self.patch(transfer._TarStream, 'chunksize', 1000)
+        stream = transfer._TarStream(self.datadir, None)
+
+        # reading the first block doesn't archive the whole directory; the
+        # tarfile itself buffers a record of 10kB
+        data = [stream.read(1024)]
+        self.assertTrue(stream.buffered < 20000)
+        self.assertNotEqual(stream.members, None)
+
+        while data[-1]:
+            data.append(stream.read(1024))
+        stream.close()
+
+        a = tarfile.open(fileobj=StringIO.StringIO(''.join(data)))
+        self.assertEqual(sorted(m.name for m in a.getmembers()),
+                         ['', 'sub', 'sub/a', 'sub/b', 'sub/c'])
+        self.assertEqual(a.extractfile('sub/b').read(), 'b' * 100000)
+
+    def test_missing(self):
+        self.assertRaises(OSError, transfer._TarStream,
+                          os.path.join(self.datadir, 'nosuch'), None)
+
+    def test_close_early(self):
+        stream = transfer._TarStream(self.datadir, 'bz2')
+        stream.read(100)
+        stream.close()
+        self.assertEqual(stream.members, None)
+
+
 class TestDownloadFile(CommandTestMixin, unittest.TestCase):
 
     def setUp(self):
@@ -534,3 +687,57 @@ class TestDownloadFile(CommandTestMixin, unittest.TestCase):
             ])
         dl.addCallback(check)
         return dl
+
+    def test_window(self):
+        self.fakemaster.count_reads = True    # get actual byte counts
+        self.fakemaster.reverse_reads = 3
+        self.fakemaster.data = test_data = '0123456789'
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=2,
+            mode=None,
+            window=3,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            # the replies to each batch of three reads arrive in reverse
+            # order, but the data is still written in order
+            self.assertUpdates(['read 2'] * 6 + ['close', {'rc': 0}])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data)
+        d.addCallback(check)
+        return d
+
+    def test_window_truncated(self):
+        self.fakemaster.count_reads = True    # get actual byte counts
+        self.fakemaster.data = test_data = 'tenchars--' * 10
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=50,
+            blocksize=32,
+            mode=None,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                'read 32', 'read 18', 'close',
+                {'rc': 1,
+                 'stderr': "Maximum filesize reached, truncating file '%s'"
+                 % os.path.join(self.basedir, '.', 'data')}
+            ])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data[:50])
+        d.addCallback(check)
+        return d
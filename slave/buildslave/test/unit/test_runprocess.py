@@ -342,6 +342,28 @@ class TestRunProcess(BasedirMixin, unittest.TestCase):
         clock.advance(6)  # should knock out maxTime
         return d
 
+    def testCommandTimeoutPaused(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        producers = []
+        b.registerUpdateProducer = producers.append
+        s = runprocess.RunProcess(b, sleepCommand(10), self.basedir, timeout=5)
+        clock = task.Clock()
+        s._reactor = clock
+        d = s.start()
+        self.assertEqual(producers, [s])
+
+        # while the master is not keeping up, the process is not timed out
+        s.pauseProducing()
+        clock.advance(6)
+        self.failUnless({'rc': FATAL_RC} not in b.updates, b.show())
+        s.resumeProducing()
+
+        def check(ign):
+            self.failUnless({'rc': FATAL_RC} in b.updates, b.show())
+        d.addCallback(check)
+        clock.advance(6)
+        return d
+
     @compat.skipUnlessPlatformIs("posix")
     def test_stdin_closed(self):
         b = FakeSlaveBuilder(False, self.basedir)
@@ -825,3 +847,123 @@ class TestLogFileWatcher(BasedirMixin, unittest.TestCase):
         st = lf.statFile()
         self.assertEqual(st and st[2], 2, "statfile.log exists and size is correct")
         os.remove('statfile.log')
+
+
+class FakeLogfileCommand(object):
+
+    def __init__(self):
+        self.data = []
+        self.waiting = None
+
+    def addLogfile(self, name, data):
+        self.data.append((name, data))
+        if self.waiting:
+            # fire outside of the watcher's poll, which may read more
+            d, self.waiting = self.waiting, None
+            reactor.callLater(0, d.callback, None)
+
+    def waitForData(self):
+        self.waiting = defer.Deferred()
+        return self.waiting
+
+
+class TestLogFileWatcherReading(BasedirMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.setUpBasedir()
+        os.mkdir(self.basedir)
+        self.logfile = os.path.join(self.basedir, 'test.log')
+        self.command = FakeLogfileCommand()
+
+    def tearDown(self):
+        self.tearDownBasedir()
+
+    def makeWatcher(self, logfile=None):
+        lf = runprocess.LogFileWatcher(self.command, 'test',
+                                       logfile or self.logfile)
+        lf.poller.clock = self.clock = task.Clock()
+        return lf
+
+    def writeLog(self, data, logfile=None):
+        f = open(logfile or self.logfile, 'ab')
+        f.write(data)
+        f.close()
+
+    def test_poll_adaptive_read_size(self):
+        lf = self.makeWatcher()
+        self.writeLog('x' * (100 * 1024))
+        lf.poll()
+        self.assertEqual([len(data) for name, data in self.command.data],
+                         [16 * 1024, 32 * 1024, 52 * 1024])
+        self.assertEqual(lf.readSize, 32 * 1024)
+        lf.stop()
+
+    def test_poll_without_inotify(self):
+        self.patch(runprocess, 'getLogFileNotifier', lambda: None)
+        lf = self.makeWatcher()
+        lf.start()
+        self.assertTrue(lf.poller.running)
+        self.writeLog('hello\n')
+        self.clock.advance(runprocess.LogFileWatcher.POLL_INTERVAL)
+        self.assertEqual(self.command.data, [('test', 'hello\n')])
+        lf.stop()
+        self.assertFalse(lf.poller.running)
+
+
+class TestLogFileWatcherNotify(TestLogFileWatcherReading):
+
+    if runprocess.inotify is None:
+        skip = "inotify is not available"
+
+    def tearDown(self):
+        self.assertEqual(runprocess._logFileNotifier, None)
+        TestLogFileWatcherReading.tearDown(self)
+
+    @defer.inlineCallbacks
+    def test_notify(self):
+        lf = self.makeWatcher()
+        lf.start()
+        self.assertFalse(lf.poller.running)
+        self.assertNotEqual(lf.notifier, None)
+
+        d = self.command.waitForData()
+        self.writeLog('hello\n')
+        yield d
+        d = self.command.waitForData()
+        self.writeLog('world\n')
+        yield d
+        self.assertEqual(self.command.data,
+                         [('test', 'hello\n'), ('test', 'world\n')])
+        lf.stop()
+
+    @defer.inlineCallbacks
+    def test_notify_missing_directory(self):
+        logfile = os.path.join(self.basedir, 'sub', 'test.log')
+        lf = self.makeWatcher(logfile)
+        lf.start()
+        self.assertTrue(lf.poller.running)
+
+        # once the directory exists, the watcher switches to notifications
+        os.mkdir(os.path.join(self.basedir, 'sub'))
+        self.clock.advance(runprocess.LogFileWatcher.POLL_INTERVAL)
+        self.assertFalse(lf.poller.running)
+
+        d = self.command.waitForData()
+        self.writeLog('hello\n', logfile)
+        yield d
+        self.assertEqual(self.command.data, [('test', 'hello\n')])
+        lf.stop()
+
+    def test_notify_shared_directory(self):
+        lf1 = self.makeWatcher()
+        lf2 = self.makeWatcher(os.path.join(self.basedir, 'other.log'))
+        lf1.start()
+        lf2.start()
+        notifier = runprocess._logFileNotifier
+        self.assertEqual(notifier.watchers,
+                         {os.path.abspath(self.basedir): [lf1, lf2]})
+        lf1.stop()
+        self.assertEqual(notifier.watchers,
+                         {os.path.abspath(self.basedir): [lf2]})
+        lf2.stop()
+        self.assertEqual(notifier.watchers, {})